@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+截图归档
+主要功能：
+1. 截图线程只把帧放入有界队列（满时丢弃并计数），不在热路径上编码和写盘
+2. 后台线程按灰度缩略图去掉与上一帧几乎相同的帧，压缩后追加到分段文件
+3. 计划和各阶段耗时作为独立记录追加到同一分段，按帧编号关联
+4. 分段按大小轮转，总大小超过上限时删除最旧的分段
+5. ArchiveReader 用 mmap 随机读取，索引为定长记录，回放和基准无需逐个打开、解码文件
+"""
+
+import io
+import json
+import mmap
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from frame import Frame, encode_image
+from metrics import metrics
+
+# 索引中的一条记录：数据在分段文件中的位置、长度、帧编号、类型和采集时间
+INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"),
+    ("length", "<u4"),
+    ("frame_id", "<u8"),
+    ("kind", "u1"),
+    ("captured_at", "<f8"),
+])
+
+KIND_FRAME = 1  # 数据为编码后的截图
+KIND_PLAN = 2  # 数据为 JSON：计划、各阶段耗时、token
+
+SEGMENT_PREFIX = "segment_"
+
+# 去重比较用的灰度缩略图尺寸，足以分辨单词框的变化
+THUMB_SIZE = (160, 90)
+
+
+def is_archive(directory: Path) -> bool:
+    """
+    判断目录是否为截图归档
+
+    Args:
+        directory (Path): 目录
+
+    Returns:
+        bool: 目录中是否有归档分段
+    """
+    return any(directory.glob(f"{SEGMENT_PREFIX}*.idx"))
+
+
+def _segments(directory: Path) -> List[Path]:
+    """按编号排序的分段数据文件"""
+    return sorted(directory.glob(f"{SEGMENT_PREFIX}*.dat"))
+
+
+class ArchiveWriter:
+    """
+    截图归档写入器
+
+    submit / submit_plan 只入队，编码、去重和写盘都在后台线程中进行。
+    """
+
+    def __init__(self, directory: Optional[str] = None,
+                 image_format: Optional[str] = None,
+                 image_quality: int = 90,
+                 segment_mb: Optional[float] = None,
+                 max_mb: Optional[float] = None,
+                 dedupe_threshold: Optional[float] = None,
+                 queue_size: int = 32):
+        """
+        初始化写入器
+
+        Args:
+            directory (Optional[str]): 归档目录，默认读取 ARCHIVE_DIR
+            image_format (Optional[str]): 压缩格式 png/webp/jpeg，默认读取 ARCHIVE_FORMAT
+            image_quality (int): 有损格式的质量
+            segment_mb (Optional[float]): 单个分段的大小上限（MB），默认读取 ARCHIVE_SEGMENT_MB
+            max_mb (Optional[float]): 归档总大小上限（MB），默认读取 ARCHIVE_MAX_MB
+            dedupe_threshold (Optional[float]): 与上一帧缩略图的最大像素差不超过该值（0~255）时视为重复，
+                负数表示不去重，默认读取 ARCHIVE_DEDUPE
+            queue_size (int): 待写入队列的长度
+        """
+        self.directory = Path(directory or os.getenv('ARCHIVE_DIR', 'screenshots'))
+        self.image_format = image_format or os.getenv('ARCHIVE_FORMAT', 'png')
+        self.image_quality = image_quality
+        self.segment_bytes = int((segment_mb or float(os.getenv('ARCHIVE_SEGMENT_MB', '64'))) * 1024 * 1024)
+        self.max_bytes = int((max_mb or float(os.getenv('ARCHIVE_MAX_MB', '512'))) * 1024 * 1024)
+        if dedupe_threshold is None:
+            dedupe_threshold = float(os.getenv('ARCHIVE_DEDUPE', '8'))
+        self.dedupe_threshold = dedupe_threshold
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._queue: "queue.Queue[Optional[Tuple]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+        # 续写已有归档：帧编号和分段编号都接着往后
+        existing = _segments(self.directory)
+        self._segment_index = int(existing[-1].stem[len(SEGMENT_PREFIX):]) + 1 if existing else 0
+        self._next_id = 0
+        for path in existing:
+            index = np.fromfile(path.with_suffix(".idx"), dtype=INDEX_DTYPE)
+            if len(index):
+                self._next_id = max(self._next_id, int(index["frame_id"].max()) + 1)
+        self._data = None
+        self._index = None
+        self._size = 0
+
+        # 去重：被去掉的帧的计划记到保留下来的那一帧上
+        self._last_thumb: Optional[np.ndarray] = None
+        self._last_kept: Optional[int] = None
+        self._aliases: Dict[int, int] = {}
+
+        # 统计
+        self.submitted = 0
+        self.queue_full = 0
+        self.written = 0
+        self.deduped = 0
+        self.plans = 0
+        self.bytes_written = 0
+        self.segments_removed = 0
+        self.encode_seconds = 0.0
+
+    def start(self) -> None:
+        """启动写入线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """写完队列中剩余的记录后停止"""
+        if self._thread:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._close_segment()
+
+    def submit(self, frame: Frame) -> bool:
+        """
+        提交一帧截图（不阻塞），入队后为其分配归档编号 frame.archive_id
+
+        Args:
+            frame (Frame): 截图帧
+
+        Returns:
+            bool: 是否已入队，队列满时丢弃
+        """
+        with self._lock:
+            frame.archive_id = self._next_id
+            self._next_id += 1
+        self.submitted += 1
+        image = frame.image if frame.image is not None else frame.get_image()
+        try:
+            self._queue.put_nowait(("frame", frame.archive_id, frame.captured_at, image))
+            return True
+        except queue.Full:
+            # 截图已丢弃，它的计划也不再归档
+            frame.archive_id = None
+            self.queue_full += 1
+            metrics.incr("archive_queue_full")
+            return False
+
+    def submit_plan(self, frame: Frame) -> bool:
+        """
+        提交一帧的计划和各阶段耗时（不阻塞），与已提交的截图按编号关联
+
+        Args:
+            frame (Frame): 已调用过 submit 的截图帧
+
+        Returns:
+            bool: 是否已入队
+        """
+        if frame.archive_id is None:
+            return False
+        record = {"plan": frame.plan, "timings": frame.timings, "tokens": frame.tokens, "detail": frame.detail}
+        try:
+            self._queue.put_nowait(("plan", frame.archive_id, frame.captured_at, record))
+            return True
+        except queue.Full:
+            self.queue_full += 1
+            metrics.incr("archive_queue_full")
+            return False
+
+    def _worker(self) -> None:
+        """写入线程"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            try:
+                kind, frame_id, captured_at, payload = item
+                if kind == "frame":
+                    self._write_frame(frame_id, captured_at, payload)
+                else:
+                    self._write_plan(frame_id, captured_at, payload)
+            except Exception as e:
+                print(f"截图归档失败: {e}")
+
+    def _write_frame(self, frame_id: int, captured_at: float, image: Image.Image) -> None:
+        """去重、压缩并追加一帧"""
+        # 单词变化只占画面很小的面积，按最大差异而不是平均差异判断
+        thumb = np.asarray(image.convert("L").resize(THUMB_SIZE, Image.BILINEAR), dtype=np.int16)
+        if (self.dedupe_threshold >= 0 and self._last_thumb is not None and self._last_kept is not None
+                and thumb.shape == self._last_thumb.shape
+                and np.abs(thumb - self._last_thumb).max() <= self.dedupe_threshold):
+            self.deduped += 1
+            self._aliases[frame_id] = self._last_kept
+            # 只需要最近几帧的映射，计划总是在截图之后不久提交
+            if len(self._aliases) > 256:
+                self._aliases.pop(next(iter(self._aliases)))
+            metrics.incr("archive_deduped")
+            return
+        self._last_thumb = thumb
+        self._last_kept = frame_id
+
+        start = time.perf_counter()
+        data, _ = encode_image(image, self.image_format, self.image_quality)
+        self.encode_seconds += time.perf_counter() - start
+        self._append(KIND_FRAME, frame_id, captured_at, data)
+        self.written += 1
+
+    def _write_plan(self, frame_id: int, captured_at: float, record: Dict[str, Any]) -> None:
+        """追加一帧的计划记录"""
+        frame_id = self._aliases.get(frame_id, frame_id)
+        data = json.dumps(record, ensure_ascii=False).encode("utf-8")
+        self._append(KIND_PLAN, frame_id, captured_at, data)
+        self.plans += 1
+
+    def _append(self, kind: int, frame_id: int, captured_at: float, data: bytes) -> None:
+        """追加一条记录，必要时轮转分段；先写数据再写索引，索引不会指向未写完的数据"""
+        if self._data is None or self._size + len(data) > self.segment_bytes:
+            self._open_segment()
+        entry = np.zeros(1, dtype=INDEX_DTYPE)
+        entry[0] = (self._size, len(data), frame_id, kind, captured_at)
+        self._data.write(data)
+        self._data.flush()
+        self._index.write(entry.tobytes())
+        self._index.flush()
+        self._size += len(data)
+        self.bytes_written += len(data)
+
+    def _open_segment(self) -> None:
+        """关闭当前分段并新建下一个，删除超出总大小上限的旧分段"""
+        self._close_segment()
+        path = self.directory / f"{SEGMENT_PREFIX}{self._segment_index:06d}.dat"
+        self._segment_index += 1
+        self._data = open(path, "ab")
+        self._index = open(path.with_suffix(".idx"), "ab")
+        self._size = 0
+
+        segments = _segments(self.directory)
+        total = sum(segment.stat().st_size for segment in segments)
+        for segment in segments[:-1]:
+            if total + self.segment_bytes <= self.max_bytes:
+                break
+            total -= segment.stat().st_size
+            segment.unlink()
+            segment.with_suffix(".idx").unlink(missing_ok=True)
+            self.segments_removed += 1
+
+    def _close_segment(self) -> None:
+        """关闭当前分段"""
+        if self._data:
+            self._data.close()
+            self._index.close()
+            self._data = self._index = None
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 提交、写入、去重和丢弃的帧数，写入字节数和编码耗时
+        """
+        return (
+            f"提交 {self.submitted}, 写入 {self.written}, 去重 {self.deduped}, 队列满丢弃 {self.queue_full}, "
+            f"计划 {self.plans}, {self.bytes_written / 1024 / 1024:.1f}MB, "
+            f"删除旧分段 {self.segments_removed}, 编码 {self.encode_seconds * 1000:.0f}ms"
+        )
+
+
+class ArchiveReader:
+    """
+    截图归档读取器
+
+    每个分段 mmap 一次，索引一次性读入 NumPy 数组；读取某一帧只是切片，
+    解码在需要图像时才进行。
+    """
+
+    def __init__(self, directory: Path):
+        """
+        打开归档
+
+        Args:
+            directory (Path): 归档目录
+
+        Raises:
+            ValueError: 目录中没有归档分段
+        """
+        self.directory = Path(directory)
+        self._files = []
+        self._maps: List[mmap.mmap] = []
+        frames: List[Tuple[int, int, int, int, float]] = []
+        self._plans: Dict[int, Tuple[int, int, int]] = {}
+        for path in _segments(self.directory):
+            index = np.fromfile(path.with_suffix(".idx"), dtype=INDEX_DTYPE)
+            if not len(index) or path.stat().st_size == 0:
+                continue
+            handle = open(path, "rb")
+            segment = len(self._maps)
+            self._files.append(handle)
+            self._maps.append(mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ))
+            for offset, length, frame_id, kind, captured_at in index.tolist():
+                if kind == KIND_FRAME:
+                    frames.append((segment, offset, length, frame_id, captured_at))
+                elif kind == KIND_PLAN:
+                    # 同一帧有多个计划时（如级联纠正）保留最后一个
+                    self._plans[frame_id] = (segment, offset, length)
+        if not frames:
+            raise ValueError(f"目录中没有归档的截图: {self.directory}")
+        self._frames = frames
+
+    def __len__(self) -> int:
+        return len(self._frames)
+
+    def _slice(self, segment: int, offset: int, length: int) -> memoryview:
+        return memoryview(self._maps[segment])[offset:offset + length]
+
+    def frame_id(self, index: int) -> int:
+        """第 index 帧的归档编号"""
+        return self._frames[index][3]
+
+    def captured_at(self, index: int) -> float:
+        """第 index 帧的采集时间"""
+        return self._frames[index][4]
+
+    def data(self, index: int) -> memoryview:
+        """
+        读取第 index 帧的编码数据（mmap 切片，不拷贝）
+
+        Args:
+            index (int): 帧序号
+
+        Returns:
+            memoryview: 编码后的截图
+        """
+        segment, offset, length, _, _ = self._frames[index]
+        return self._slice(segment, offset, length)
+
+    def image(self, index: int) -> Image.Image:
+        """
+        解码第 index 帧
+
+        Args:
+            index (int): 帧序号
+
+        Returns:
+            Image.Image: RGB 图像
+        """
+        # 压缩数据只有几百 KB，拷贝一次交给 PIL，不持有 mmap 的引用
+        image = Image.open(io.BytesIO(self.data(index))).convert("RGB")
+        image.load()
+        return image
+
+    def record(self, index: int) -> Optional[Dict[str, Any]]:
+        """
+        读取第 index 帧的计划记录
+
+        Args:
+            index (int): 帧序号
+
+        Returns:
+            Optional[Dict[str, Any]]: {"plan", "timings", "tokens", "detail"}，没有计划时为 None
+        """
+        location = self._plans.get(self.frame_id(index))
+        if location is None:
+            return None
+        return json.loads(bytes(self._slice(*location)))
+
+    def plans(self) -> List[Dict[str, Any]]:
+        """
+        按帧顺序列出全部计划（可作为 mock_openai 的预置计划）
+
+        Returns:
+            List[Dict[str, Any]]: 模型返回的计划 JSON
+        """
+        records = (self.record(index) for index in range(len(self)))
+        return [record["plan"] for record in records if record and record.get("plan")]
+
+    def __iter__(self) -> Iterator[Image.Image]:
+        for index in range(len(self)):
+            yield self.image(index)
+
+    def close(self) -> None:
+        """关闭 mmap 和文件"""
+        for mapped in self._maps:
+            mapped.close()
+        for handle in self._files:
+            handle.close()
+        self._maps, self._files = [], []
+
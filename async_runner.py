@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+异步流水线运行器
+主要功能：
+1. 推理进行中继续截图，截图、推理、键盘输入三者重叠执行
+2. 限制同时进行的规划请求数量
+3. 根据最近一次计划返回的耗时安排下一次截图，取代固定的 2 秒等待
+"""
+
+import asyncio
+import os
+import time
+from typing import Optional
+
+from cascade import CascadePlanner
+from change_detector import FrameChange, FrameChangeDetector
+from frame import Frame, format_timings
+from game_state import GameStateTracker
+from game_window import GameWindow
+from http_session import tracker
+from metrics import metrics
+from plan import Plan, PlanStep
+from recipes import MacroEngine
+from resilience import callers
+from planner import GamePlanner
+from shard_planner import ShardedPlanner
+from verifier import WordVerifier
+from word_detector import LocalFastPath
+
+
+class AsyncAgentRunner:
+    """
+    异步智能体运行器
+
+    截图在线程池中执行，规划请求使用异步 OpenAI 客户端并发发送，
+    键盘输入仍由 GameWindow 的键盘线程负责。
+    """
+
+    def __init__(self, game_window: GameWindow, planner: GamePlanner,
+                 detector: Optional[FrameChangeDetector] = None,
+                 fast_path: Optional[LocalFastPath] = None,
+                 stream: bool = False,
+                 state: Optional[GameStateTracker] = None,
+                 macros: Optional[MacroEngine] = None,
+                 sharded: Optional[ShardedPlanner] = None,
+                 cascade: Optional[CascadePlanner] = None,
+                 verifier: Optional[WordVerifier] = None,
+                 max_concurrency: Optional[int] = None,
+                 min_interval: float = 0.2,
+                 max_interval: float = 2.0,
+                 report_interval: float = 30.0):
+        """
+        初始化运行器
+
+        Args:
+            game_window (GameWindow): 游戏窗口控制器
+            planner (GamePlanner): 任务规划器（整个运行期间复用）
+            detector (Optional[FrameChangeDetector]): 帧变化检测器，为 None 时每帧都分析
+            fast_path (Optional[LocalFastPath]): 本地高亮单词快速路径
+            stream (bool): 是否使用流式规划，步骤解析完成后立即加入输入队列
+            state (Optional[GameStateTracker]): 跨帧游戏状态，为 None 时每帧独立分析
+            macros (Optional[MacroEngine]): 菜谱宏引擎，为 None 时计划中的单词全部直接输入
+            sharded (Optional[ShardedPlanner]): 区域分片规划器，设置后代替整图请求（不支持流式）
+            cascade (Optional[CascadePlanner]): 快慢模型级联规划器，设置后代替整图请求（不支持流式）
+            verifier (Optional[WordVerifier]): 输入后校验器，为 None 时不校验单词是否生效
+            max_concurrency (Optional[int]): 同时进行的规划请求数，默认读取 PLANNER_CONCURRENCY
+            min_interval (float): 两次截图之间的最短间隔（秒）
+            max_interval (float): 两次截图之间的最长间隔（秒）
+            report_interval (float): 输出吞吐统计的间隔（秒）
+        """
+        self.game_window = game_window
+        self.planner = planner
+        self.detector = detector
+        self.fast_path = fast_path
+        self.stream = stream
+        self.state = state
+        self.macros = macros
+        self.sharded = sharded
+        self.cascade = cascade
+        self.verifier = verifier
+        self.max_concurrency = max_concurrency or int(os.getenv('PLANNER_CONCURRENCY', '2'))
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.report_interval = report_interval
+
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._plan_landed = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+        self._running = False
+
+        # 计划延迟的指数滑动平均，用于安排下一次截图
+        self.latency_ema: Optional[float] = None
+        self.latency_alpha = 0.3
+
+        # 帧序号：丢弃比已应用计划更旧的帧产生的计划
+        self._next_seq = 0
+        self._applied_seq = -1
+
+        # 统计
+        self.started_at = 0.0
+        self.frames_captured = 0
+        self.plans_applied = 0
+        self.plans_dropped = 0
+        self.words_enqueued = 0
+
+    def capture_interval(self) -> float:
+        """
+        计算下一次截图前的等待时间
+
+        让 N 个并发请求错开发出，使计划大约每 latency / N 秒返回一次。
+
+        Returns:
+            float: 等待时间（秒）
+        """
+        if self.latency_ema is None:
+            return self.min_interval
+        interval = self.latency_ema / self.max_concurrency
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    async def run(self) -> None:
+        """运行截图 → 推理 → 输入流水线，直到被取消"""
+        self._running = True
+        self.started_at = time.perf_counter()
+        reporter = asyncio.create_task(self._report_loop())
+        try:
+            while self._running:
+                # 等待空闲的规划槽位
+                await self._slots.acquire()
+                frame = await asyncio.to_thread(self.game_window.take_screenshot)
+                if not frame:
+                    print("获取截图失败")
+                    self._slots.release()
+                    await asyncio.sleep(self.max_interval)
+                    continue
+
+                self.frames_captured += 1
+                seq = self._next_seq
+                self._next_seq += 1
+
+                if self.state:
+                    # 烹饪完成的工位直接在本地取出成品
+                    pickups = self.state.due_pickups(self.macros.active_words() if self.macros else ())
+                    if pickups:
+                        print(f"烹饪完成，取出成品: {pickups}")
+                        self.game_window.add_input_words(pickups, frame,
+                                                         priorities={word: "cook" for word in pickups})
+
+                change = None
+                if self.detector:
+                    change = await asyncio.to_thread(self.detector.check, frame)
+                    if not self.detector.should_analyze(change):
+                        self._slots.release()
+                        await asyncio.sleep(self.capture_interval())
+                        continue
+
+                if self.fast_path:
+                    changed = change.changed_regions if change else None
+                    local = await asyncio.to_thread(self.fast_path.plan, frame, changed)
+                    if local.inputs:
+                        print(f"本地快速路径输入: {local.inputs}")
+                        if self.verifier:
+                            self.verifier.expect([PlanStep(word, priority=local.priorities.get(word))
+                                                  for word in local.inputs])
+                        self.game_window.add_input_words(local.inputs, frame,
+                                                         priorities=local.priorities)
+                    if not local.needs_llm:
+                        self._slots.release()
+                        await asyncio.sleep(self.capture_interval())
+                        continue
+
+                if self.macros and change and self.macros.explains(change.changed_regions):
+                    print("画面变化来自正在执行的菜谱宏，跳过分析")
+                    self._slots.release()
+                    await asyncio.sleep(self.capture_interval())
+                    continue
+
+                if change:
+                    cached = self.detector.cache.get(change.key)
+                    if cached is not None:
+                        print("画面与已知状态相同，复用缓存计划")
+                        self._slots.release()
+                        self._apply(seq, cached, frame)
+                        await asyncio.sleep(self.capture_interval())
+                        continue
+
+                if not self.planner.available:
+                    # 模型接口熔断中：本地快速路径已经执行，不再请求模型
+                    print("模型接口熔断中，仅执行本地操作")
+                    self._slots.release()
+                    await asyncio.sleep(self.max_interval)
+                    continue
+
+                task = asyncio.create_task(self._plan(seq, frame, change))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+                # 最近一次计划返回后或到达间隔时立即进行下一次截图
+                self._plan_landed.clear()
+                try:
+                    await asyncio.wait_for(self._plan_landed.wait(), timeout=self.capture_interval())
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._running = False
+            reporter.cancel()
+            for task in list(self._tasks):
+                task.cancel()
+            await asyncio.gather(*self._tasks, reporter, return_exceptions=True)
+            self.report()
+
+    def stop(self) -> None:
+        """请求停止运行"""
+        self._running = False
+
+    async def _plan(self, seq: int, frame: Frame, change: Optional[FrameChange] = None) -> None:
+        """
+        分析一帧并把结果加入输入队列
+
+        Args:
+            seq (int): 帧序号
+            frame (Frame): 截图帧
+            change (Optional[FrameChange]): 该帧的变化检测结果，用于缓存计划
+        """
+        start = time.perf_counter()
+        self.game_window.mark_plan_start(frame.captured_at)
+        regions = change.changed_regions if change else None
+        context, sent = None, None
+        if self.state:
+            context, sent = self.state.prompt_context(regions)
+        try:
+            if self.sharded:
+                plan = await self.sharded.analyze_screenshot_async(frame, context, regions)
+            elif self.cascade:
+                plan = await self.cascade.analyze_screenshot_async(
+                    frame, context, seq, lambda strong: self._correct(strong, frame, change))
+            elif self.stream:
+                plan = await self.planner.analyze_screenshot_stream_async(
+                    frame, lambda word: self._apply_streamed(seq, word, frame), context, regions)
+            else:
+                plan = await self.planner.analyze_screenshot_async(frame, context, regions)
+        except Exception as e:
+            print(f"规划请求失败: {e}")
+            return
+        finally:
+            self._slots.release()
+
+        latency = time.perf_counter() - start
+        if self.latency_ema is None:
+            self.latency_ema = latency
+        else:
+            self.latency_ema += self.latency_alpha * (latency - self.latency_ema)
+        print(f"本轮耗时: {format_timings(frame.timings)}")
+        self.game_window.preprocessor.report_result(frame.detail, plan is not None and bool(plan.steps))
+        self.game_window.archive_plan(frame)
+
+        if plan is None:
+            print("分析截图失败")
+            return
+
+        if self.state:
+            self.state.commit_context(sent)
+            self.state.update_plan(plan, frame.captured_at)
+        if change and self.detector:
+            self.detector.cache.put(change.key, plan)
+        if self.fast_path:
+            self.fast_path.remember_plan(plan)
+        if self.macros and seq >= self._applied_seq:
+            plan = self.planner.execute_plan(plan, self.macros, frame.captured_at)
+        if self.stream and not (self.sharded or self.cascade):
+            if seq >= self._applied_seq:
+                # 完整计划已知，再取消旧计划中不再需要的单词
+                self.game_window.supersede_input_words(plan.inputs, seq)
+                self.plans_applied += 1
+                self._plan_landed.set()
+        elif self._apply(seq, plan, frame):
+            self._plan_landed.set()
+        if self.cascade:
+            # 快速计划已写入，之后强模型的纠正才不会被覆盖
+            self.cascade.commit(seq)
+
+    def _correct(self, plan: Plan, frame: Frame, change: Optional[FrameChange] = None) -> None:
+        """
+        强模型纠正快速计划后，用强模型的计划更新游戏状态和计划缓存
+
+        Args:
+            plan (Plan): 强模型的计划
+            frame (Frame): 截图帧
+            change (Optional[FrameChange]): 该帧的变化检测结果
+        """
+        if self.state:
+            self.state.update_plan(plan, frame.captured_at)
+        if change and self.detector:
+            self.detector.cache.put(change.key, plan)
+
+    def _apply_streamed(self, seq: int, word: str, frame: Frame) -> None:
+        """
+        流式模式下把刚解析出的单词加入输入队列
+
+        Args:
+            seq (int): 产生该单词的帧序号
+            word (str): 单词
+            frame (Frame): 产生该单词的截图帧
+        """
+        if seq < self._applied_seq:
+            return
+        self._applied_seq = seq
+        self.words_enqueued += 1
+        if self.verifier:
+            self.verifier.expect([PlanStep(word)])
+        self.game_window.add_input_words([word], frame, generation=seq, supersede=False)
+
+    def _apply(self, seq: int, plan: Plan, frame: Frame) -> bool:
+        """
+        将计划加入输入队列，旧帧产生的计划会被丢弃
+
+        帧序号同时作为计划代数，新计划会取消队列中旧计划不再需要的单词。
+
+        Args:
+            seq (int): 产生计划的帧序号
+            plan (Plan): 计划
+            frame (Frame): 产生计划的截图帧
+
+        Returns:
+            bool: 是否已加入队列
+        """
+        # 较新的帧已经给出计划时，旧帧的计划已过时
+        if seq < self._applied_seq:
+            self.plans_dropped += 1
+            metrics.incr("stale_plans_dropped")
+            print(f"丢弃过时计划 (帧 {seq} < {self._applied_seq}): {plan.inputs}")
+            return False
+
+        self._applied_seq = seq
+        self.plans_applied += 1
+        inputs = [word for word in plan.inputs if not (self.macros and self.macros.owns(word))]
+        self.words_enqueued += len(inputs)
+        print(f"添加输入队列: {inputs}")
+        if self.verifier:
+            self.verifier.expect([step for step in plan.steps if step.word in inputs])
+        self.game_window.add_input_words(inputs, frame, generation=seq, priorities=plan.priorities)
+        return True
+
+    async def _report_loop(self) -> None:
+        """定期输出吞吐统计"""
+        while True:
+            await asyncio.sleep(self.report_interval)
+            self.report()
+
+    def report(self) -> None:
+        """输出吞吐统计（每分钟动作数等）"""
+        elapsed = time.perf_counter() - self.started_at
+        if elapsed <= 0:
+            return
+        minutes = elapsed / 60
+        latency = f"{self.latency_ema * 1000:.0f}ms" if self.latency_ema else "-"
+        print(
+            f"[统计] 运行 {elapsed:.0f}s, 截图 {self.frames_captured}, "
+            f"计划 {self.plans_applied} (丢弃 {self.plans_dropped}), "
+            f"入队单词 {self.words_enqueued}, "
+            f"每分钟动作数 {self.game_window.typed_word_count / minutes:.1f}, "
+            f"平均规划延迟 {latency}"
+        )
+        if self.detector:
+            print(f"[变化检测] {self.detector.report()}")
+        if self.fast_path:
+            print(f"[本地快速路径] {self.fast_path.report()}")
+        if self.sharded:
+            print(f"[分片] {self.sharded.report()}")
+        if self.cascade:
+            print(f"[级联] {self.cascade.report()}")
+        if self.verifier:
+            print(f"[输入校验] {self.verifier.report()}")
+        if self.game_window.preprocessor.config.detail == "adaptive":
+            print(f"[预处理] {self.game_window.preprocessor.report()}")
+        for caller in callers():
+            print(f"[请求] {caller.report()}")
+        print(f"[连接] {tracker.report()}")
+        print(f"[提示词] {self.planner.prompts.report()}")
+        print(f"[首键延迟] {self.game_window.first_keystroke_report()}")
+
+
+async def run_async(game_window: GameWindow,
+                    detector: Optional[FrameChangeDetector] = None,
+                    fast_path: Optional[LocalFastPath] = None,
+                    stream: bool = False,
+                    state: Optional[GameStateTracker] = None,
+                    macros: Optional[MacroEngine] = None,
+                    sharded: Optional[ShardedPlanner] = None,
+                    cascade: Optional[CascadePlanner] = None,
+                    planner: Optional[GamePlanner] = None,
+                    verifier: Optional[WordVerifier] = None) -> None:
+    """
+    使用异步流水线运行智能体
+
+    Args:
+        game_window (GameWindow): 已启动键盘线程的游戏窗口控制器
+        detector (Optional[FrameChangeDetector]): 帧变化检测器
+        fast_path (Optional[LocalFastPath]): 本地高亮单词快速路径
+        stream (bool): 是否使用流式规划
+        state (Optional[GameStateTracker]): 跨帧游戏状态
+        macros (Optional[MacroEngine]): 菜谱宏引擎
+        sharded (Optional[ShardedPlanner]): 区域分片规划器
+        cascade (Optional[CascadePlanner]): 快慢模型级联规划器
+        planner (Optional[GamePlanner]): 已创建（并预热）的任务规划器，默认新建
+        verifier (Optional[WordVerifier]): 已启动的输入后校验器
+    """
+    planner = planner or GamePlanner()
+    runner = AsyncAgentRunner(game_window, planner, detector, fast_path, stream, state, macros, sharded,
+                              cascade, verifier)
+    await runner.run()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+多智能体吞吐扩展基准
+
+依次运行 1..N 个智能体（线程模式，每个智能体回放同一组截图、使用只计数的键盘输出），
+共享同一个规划池和限额，输出每个智能体数下的总体与平均每秒动作数、请求数、排队时间和限额等待时间，
+观察增加智能体时吞吐如何变化、何时被 RPM/TPM 限额或并发槽位卡住。
+
+用法:
+    python bench_agents.py <截图目录> [--max-agents 4] [--duration 20] [--workers 4]
+                           [--rpm 120] [--tpm 200000] [--latency 1.0] [--jitter 0.2]
+                           [--key-delay 0.01] [--real-api] [--output result.json]
+
+默认使用 mock_openai 本地服务；为了让每一帧都经过规划池，基准中默认关闭变化检测、
+本地快速路径、菜谱宏和预热（可用环境变量覆盖）。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Any, Dict
+
+from metrics import metrics
+from mock_openai import MockConfig, load_plans, start_mock_server
+from replay_bench import NullKeyboard, ReplaySource
+
+
+def run_scaling(frame_dir: Path, max_agents: int, duration: float, workers: int,
+                rpm: float, tpm: float, key_delay: float = 0.0) -> Dict[str, Any]:
+    """
+    依次运行 1..max_agents 个智能体
+
+    Args:
+        frame_dir (Path): 截图目录
+        max_agents (int): 最多的智能体数
+        duration (float): 每组的运行时间（秒）
+        workers (int): 规划池同时进行的请求数
+        rpm (float): 每分钟请求数上限，0 表示不限制
+        tpm (float): 每分钟 token 数上限，0 表示不限制
+        key_delay (float): 模拟每次按键的耗时（秒）
+
+    Returns:
+        Dict[str, Any]: 每个智能体数下的规划池统计
+    """
+    # 在环境变量设置完成后再导入，保证规划器指向本地服务
+    from game_window import GameWindow
+    from multi_agent import AgentSpec, PlannerPool, run_agents
+
+    def window_factory(spec: AgentSpec) -> GameWindow:
+        return GameWindow(spec.window_title, frame_source=ReplaySource(frame_dir),
+                          keyboard_writer=NullKeyboard(key_delay), use_imgur=False, save_screenshots=False)
+
+    results: Dict[str, Any] = {}
+    for count in range(1, max_agents + 1):
+        metrics.reset()
+        pool = PlannerPool(workers, rpm, tpm)
+        specs = [AgentSpec(f"agent{index}") for index in range(count)]
+        run_agents(specs, pool, "thread", duration, window_factory)
+        summary = pool.summary()
+        summary["actions_per_s_per_agent"] = summary["actions_per_s"] / count
+        results[str(count)] = summary
+    return results
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="多智能体吞吐扩展基准")
+    parser.add_argument("frames", help="录制的截图目录")
+    parser.add_argument("--max-agents", type=int, default=4, help="最多的智能体数")
+    parser.add_argument("--duration", type=float, default=20.0, help="每组的运行时间（秒）")
+    parser.add_argument("--workers", type=int, default=4, help="规划池同时进行的请求数")
+    parser.add_argument("--rpm", type=float, default=0.0, help="每分钟请求数上限，0 表示不限制")
+    parser.add_argument("--tpm", type=float, default=0.0, help="每分钟 token 数上限，0 表示不限制")
+    parser.add_argument("--latency", type=float, default=1.0, help="模拟模型的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="模拟模型的延迟抖动（秒）")
+    parser.add_argument("--plans", help="模拟模型返回的预置计划 JSON 文件")
+    parser.add_argument("--key-delay", type=float, default=0.0, help="模拟每次按键的耗时（秒）")
+    parser.add_argument("--real-api", action="store_true", help="使用真实 OpenAI 接口而不是本地模拟服务")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--verbose", action="store_true", help="保留智能体日志输出")
+    args = parser.parse_args()
+
+    try:
+        server = None
+        if not args.real_api:
+            mock = MockConfig(load_plans(args.plans), args.latency, args.jitter, seed=0)
+            server = start_mock_server(mock)
+            os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+            os.environ.setdefault("OPENAI_API_KEY", "mock")
+        os.environ["CAPTURE_FPS"] = "0"
+        for name in ("CHANGE_DETECTION", "LOCAL_FASTPATH", "MACROS", "PLANNER_WARMUP"):
+            os.environ.setdefault(name, "0")
+
+        log = None if args.verbose else io.StringIO()
+        with contextlib.redirect_stdout(log) if log else contextlib.nullcontext():
+            results = run_scaling(Path(args.frames), args.max_agents, args.duration, args.workers,
+                                  args.rpm, args.tpm, args.key_delay)
+        if server:
+            server.shutdown()
+
+        for count, summary in results.items():
+            print(f"智能体 {count}: 总体每秒动作数 {summary['actions_per_s']:.2f}, "
+                  f"平均每个 {summary['actions_per_s_per_agent']:.2f}, 请求 {summary['requests']}, "
+                  f"限额等待 {summary['throttled_s']:.1f}s", file=sys.stderr)
+
+        output = json.dumps({"results": results, "config": vars(args)}, ensure_ascii=False, indent=2)
+        if args.output:
+            Path(args.output).write_text(output, encoding="utf-8")
+            print(f"结果已写入: {args.output}", file=sys.stderr)
+        else:
+            print(output)
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+截图归档基准测试
+
+对比两种保存截图的方式在截图热路径上的耗时，以及回放时的读取耗时：
+- sync：原来的做法，每帧在截图线程中编码并写成单独的文件
+- archive：ArchiveWriter.submit 只入队，去重、编码、写盘在后台线程中进行；回放时 ArchiveReader 用 mmap 读取
+
+用法:
+    python bench_archive.py <截图目录> [--frames 200] [--interval 0.1] [--format png]
+                            [--segment-mb 8] [--max-mb 64] [--output result.json]
+
+截图目录中的图片按顺序循环提交，--interval 为两次截图的间隔（秒），模拟后台采集的帧率。
+"""
+
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from archive import ArchiveReader, ArchiveWriter
+from frame import Frame, encode_image
+from metrics import percentiles
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="截图归档基准测试")
+    parser.add_argument("frame_dir", help="截图目录")
+    parser.add_argument("--frames", type=int, default=200, help="提交的帧数")
+    parser.add_argument("--interval", type=float, default=0.1, help="两次截图的间隔（秒）")
+    parser.add_argument("--format", default="png", help="压缩格式 png/webp/jpeg")
+    parser.add_argument("--segment-mb", type=float, default=8.0, help="单个分段的大小上限（MB）")
+    parser.add_argument("--max-mb", type=float, default=64.0, help="归档总大小上限（MB）")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    try:
+        paths = sorted(p for p in Path(args.frame_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        if not paths:
+            print(f"目录中没有截图: {args.frame_dir}")
+            sys.exit(1)
+        images = []
+        for path in paths:
+            image = Image.open(path).convert("RGB")
+            image.load()
+            images.append(image)
+
+        with tempfile.TemporaryDirectory() as workdir:
+            sync_dir = Path(workdir) / "sync"
+            sync_dir.mkdir()
+            archive_dir = Path(workdir) / "archive"
+
+            # sync：编码和写文件都在截图线程中
+            sync_costs = []
+            for index in range(args.frames):
+                start = time.perf_counter()
+                data, _ = encode_image(images[index % len(images)], args.format)
+                (sync_dir / f"game_{index:06d}.{args.format}").write_bytes(data)
+                sync_costs.append(time.perf_counter() - start)
+                time.sleep(max(0.0, args.interval - sync_costs[-1]))
+            sync_bytes = sum(path.stat().st_size for path in sync_dir.iterdir())
+
+            # archive：截图线程只入队
+            writer = ArchiveWriter(str(archive_dir), image_format=args.format,
+                                   segment_mb=args.segment_mb, max_mb=args.max_mb)
+            writer.start()
+            submit_costs = []
+            for index in range(args.frames):
+                frame = Frame(data=b"", mime_type="", width=0, height=0, image=images[index % len(images)])
+                start = time.perf_counter()
+                writer.submit(frame)
+                submit_costs.append(time.perf_counter() - start)
+                time.sleep(args.interval)
+            start = time.perf_counter()
+            writer.stop()
+            drain = time.perf_counter() - start
+            archive_bytes = sum(path.stat().st_size for path in archive_dir.iterdir())
+
+            # 回放读取：逐个打开文件 vs mmap
+            file_costs = []
+            for path in sorted(sync_dir.iterdir()):
+                start = time.perf_counter()
+                image = Image.open(path).convert("RGB")
+                image.load()
+                file_costs.append(time.perf_counter() - start)
+
+            open_start = time.perf_counter()
+            reader = ArchiveReader(archive_dir)
+            open_seconds = time.perf_counter() - open_start
+            mmap_costs = []
+            raw_costs = []
+            for index in range(len(reader)):
+                start = time.perf_counter()
+                reader.image(index)
+                mmap_costs.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                len(reader.data(index))
+                raw_costs.append(time.perf_counter() - start)
+            frames_kept = len(reader)
+            reader.close()
+
+        result = {
+            "frames": args.frames,
+            "hot_path_ms": {"sync": percentiles(sync_costs), "archive": percentiles(submit_costs)},
+            "archive": {
+                "written": writer.written,
+                "deduped": writer.deduped,
+                "queue_full": writer.queue_full,
+                "segments_removed": writer.segments_removed,
+                "frames_kept": frames_kept,
+                "encode_ms": writer.encode_seconds * 1000,
+                "drain_ms": drain * 1000,
+            },
+            "disk_mb": {"sync": sync_bytes / 1024 / 1024, "archive": archive_bytes / 1024 / 1024},
+            "read_ms": {
+                "file_decode": percentiles(file_costs),
+                "mmap_decode": percentiles(mmap_costs),
+                "mmap_raw": percentiles(raw_costs),
+                "archive_open": open_seconds * 1000,
+            },
+            "config": vars(args),
+        }
+        hot = result["hot_path_ms"]
+        print(f"截图热路径 p95: sync {hot['sync'].get('p95', 0):.2f}ms, "
+              f"archive {hot['archive'].get('p95', 0):.3f}ms; "
+              f"磁盘 {result['disk_mb']['sync']:.1f}MB → {result['disk_mb']['archive']:.1f}MB "
+              f"(去重 {writer.deduped}, 丢弃 {writer.queue_full})", file=sys.stderr)
+
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.output:
+            Path(args.output).write_text(output, encoding="utf-8")
+            print(f"结果已写入: {args.output}", file=sys.stderr)
+        else:
+            print(output)
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
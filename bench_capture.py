@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+屏幕采集基准测试
+
+对比当前路径（pyautogui.screenshot + PNG 编码）与可插拔采集后端写入环形缓冲的
+采集帧率和每帧内存分配。建议在 Xvfb 下运行：
+
+    xvfb-run -s "-screen 0 1280x720x24" python bench_capture.py [帧数] [宽] [高]
+
+每帧分配量由 tracemalloc 统计，只包含经过 Python 分配器的内存（含 NumPy），
+PIL 内部的图像缓冲不计入，因此当前路径的实际分配量更高。
+"""
+
+import io
+import sys
+import time
+import tracemalloc
+
+from capture import BACKENDS, FrameRingBuffer
+
+
+def bench_current(region: tuple, frames: int) -> tuple:
+    """
+    测试当前路径：每帧 pyautogui 截图并编码为 PNG
+
+    Args:
+        region (tuple): (left, top, width, height)
+        frames (int): 采集帧数
+
+    Returns:
+        tuple: (帧率, 每帧分配字节数)
+    """
+    import pyautogui
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    for _ in range(frames):
+        screenshot = pyautogui.screenshot(region=region)
+        buffer = io.BytesIO()
+        screenshot.save(buffer, format="PNG")
+    elapsed = time.perf_counter() - start
+    # 每帧的缓冲在下一帧前释放，峰值约等于单帧分配量
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return frames / elapsed, peak
+
+
+def bench_backend(name: str, region: tuple, frames: int) -> tuple:
+    """
+    测试采集后端：原地写入预分配的环形缓冲
+
+    Args:
+        name (str): 后端名称
+        region (tuple): (left, top, width, height)
+        frames (int): 采集帧数
+
+    Returns:
+        tuple: (帧率, 每帧新增分配字节数)
+    """
+    backend = BACKENDS[name]()
+    ring = FrameRingBuffer(4)
+
+    # 预热：分配环形缓冲并建立共享内存段
+    for _ in range(ring.size):
+        index, buffer = ring.acquire_slot(region)
+        backend.grab(region, buffer)
+        ring.commit(index, region, time.time())
+
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    start = time.perf_counter()
+    for _ in range(frames):
+        index, buffer = ring.acquire_slot(region)
+        backend.grab(region, buffer)
+        ring.commit(index, region, time.time())
+    elapsed = time.perf_counter() - start
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    backend.close()
+
+    grown = sum(stat.size_diff for stat in snapshot.compare_to(baseline, "filename") if stat.size_diff > 0)
+    return frames / elapsed, grown / frames
+
+
+def main():
+    """主函数"""
+    try:
+        frames = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+        width = int(sys.argv[2]) if len(sys.argv) > 2 else 1280
+        height = int(sys.argv[3]) if len(sys.argv) > 3 else 720
+        region = (0, 0, width, height)
+
+        print(f"采集区域 {width}x{height}, 每项 {frames} 帧")
+        results = {}
+        try:
+            results["pyautogui+png (当前)"] = bench_current(region, frames)
+        except Exception as e:
+            print(f"当前路径测试失败: {e}")
+        for name in BACKENDS:
+            try:
+                results[f"{name} -> 环形缓冲"] = bench_backend(name, region, frames)
+            except Exception as e:
+                print(f"后端 {name} 测试失败: {e}")
+
+        for label, (fps, per_frame) in results.items():
+            print(f"{label:24s} {fps:7.1f} FPS  每帧分配 {per_frame / 1024:9.1f} KB")
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+截图预处理基准测试
+
+对录制的截图逐一尝试多组预处理配置（缩放、减色、编码格式和质量、detail），输出每组的：
+- 编码后的字节数和估算的图像 token 数
+- 预处理 + 编码耗时
+- 单词提取准确率：解码处理后的图像，放大回原尺寸后用本地检测器检测，与 labels.json 比对
+- 可选（--model）：实际调用规划器，统计 prompt token、推理延迟和计划中单词的召回率
+
+用法:
+    python bench_preprocess.py <截图目录> [--ocr] [--model] [--settings png-full,webp-1024-q80]
+                               [--output result.json]
+
+截图目录中的 labels.json 格式与 bench_word_detector.py 相同：
+    {"game_1.png": [{"box": [left, top, right, bottom], "text": "rail"}, ...]}
+--model 使用 .env 中的 OpenAI 配置（可指向 mock_openai.py 启动的本地服务，但模拟服务不看图，
+召回率没有意义）。
+"""
+
+import argparse
+import io
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from frame import Frame, encode_image
+from metrics import metrics, percentiles
+from preprocess import PreprocessConfig, Preprocessor, estimate_image_tokens
+from word_detector import WordBox, WordDetector
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+# 预置配置：名称 -> (预处理配置, 编码格式, 质量)
+SETTINGS: Dict[str, Tuple[PreprocessConfig, str, int]] = {
+    "png-full": (PreprocessConfig(), "png", 85),
+    "png-1280": (PreprocessConfig(max_width=1280), "png", 85),
+    "png-1024-64colors": (PreprocessConfig(max_width=1024, colors=64), "png", 85),
+    "jpeg-1024-q80": (PreprocessConfig(max_width=1024), "jpeg", 80),
+    "webp-1024-q80": (PreprocessConfig(max_width=1024), "webp", 80),
+    "webp-768-q70": (PreprocessConfig(max_width=768), "webp", 70),
+    "webp-768-q70-low": (PreprocessConfig(max_width=768, detail="low"), "webp", 70),
+    "jpeg-512-low": (PreprocessConfig(max_width=512, detail="low"), "jpeg", 75),
+}
+
+
+def match_boxes(boxes: List[WordBox], expected: List[WordBox],
+                check_text: bool) -> Tuple[int, int, int, int]:
+    """
+    按交并比贪心匹配检测框和标注框
+
+    Args:
+        boxes (List[WordBox]): 检测结果（原图坐标）
+        expected (List[WordBox]): 标注
+        check_text (bool): 是否比较 OCR 文本
+
+    Returns:
+        Tuple[int, int, int, int]: (TP, FP, FN, 文本正确数)
+    """
+    unmatched = list(expected)
+    true_positive = false_positive = text_correct = 0
+    for box in boxes:
+        best = max(unmatched, key=box.iou, default=None)
+        if best is not None and box.iou(best) >= 0.5:
+            unmatched.remove(best)
+            true_positive += 1
+            if check_text and best.text:
+                text_correct += int(box.text == best.text)
+        else:
+            false_positive += 1
+    return true_positive, false_positive, len(unmatched), text_correct
+
+
+def detect_processed(detector: WordDetector, data: bytes, config: PreprocessConfig,
+                     original: Image.Image) -> List[WordBox]:
+    """
+    在处理后的图像上检测单词，并换算回原图坐标
+
+    处理后的图像先放大回裁剪区域的原始尺寸，检测器的尺寸阈值按原图像素设置。
+
+    Args:
+        detector (WordDetector): 检测器
+        data (bytes): 编码后的图像
+        config (PreprocessConfig): 预处理配置
+        original (Image.Image): 原始截图
+
+    Returns:
+        List[WordBox]: 原图坐标的单词框
+    """
+    left = top = 0
+    right, bottom = original.size
+    if config.crop:
+        crop_left, crop_top, crop_right, crop_bottom = config.crop
+        left, top = int(crop_left * original.width), int(crop_top * original.height)
+        right, bottom = int(crop_right * original.width), int(crop_bottom * original.height)
+
+    decoded = Image.open(io.BytesIO(data)).convert("RGB")
+    if decoded.size != (right - left, bottom - top):
+        decoded = decoded.resize((right - left, bottom - top), Image.BILINEAR)
+    boxes = detector.detect(decoded)
+    for box in boxes:
+        box.left, box.right = box.left + left, box.right + left
+        box.top, box.bottom = box.top + top, box.bottom + top
+    return boxes
+
+
+def run_setting(name: str, paths: List[Path], labels: Dict[str, List[Dict[str, Any]]],
+                detector: WordDetector, planner: Optional[Any] = None) -> Dict[str, Any]:
+    """
+    测试一组配置
+
+    Args:
+        name (str): 配置名，见 SETTINGS
+        paths (List[Path]): 截图
+        labels (Dict[str, List[Dict[str, Any]]]): 标注
+        detector (WordDetector): 本地检测器
+        planner (Optional[GamePlanner]): 设置时实际调用模型
+
+    Returns:
+        Dict[str, Any]: 字节数、token、耗时和准确率
+    """
+    config, image_format, quality = SETTINGS[name]
+    preprocessor = Preprocessor(config)
+    sizes, tokens, durations = [], [], []
+    true_positive = false_positive = false_negative = text_correct = 0
+    model_latencies, prompt_tokens = [], []
+    words_found = words_expected = 0
+
+    for path in paths:
+        original = Image.open(path).convert("RGB")
+        original.load()
+
+        start = time.perf_counter()
+        processed = preprocessor.process(original)
+        data, mime_type = encode_image(processed, image_format, quality)
+        durations.append(time.perf_counter() - start)
+
+        detail = preprocessor.choose_detail(processed.width, processed.height)
+        sizes.append(len(data))
+        tokens.append(estimate_image_tokens(processed.width, processed.height, detail))
+
+        expected = [WordBox(*item["box"], region="", text=item.get("text"))
+                    for item in labels.get(path.name, [])]
+        if expected:
+            boxes = detect_processed(detector, data, config, original)
+            if detector.use_ocr:
+                decoded = Image.open(io.BytesIO(data)).convert("RGB").resize(original.size)
+                for box in boxes:
+                    box.text = detector.read_text(decoded, box)
+            tp, fp, fn, correct = match_boxes(boxes, expected, detector.use_ocr)
+            true_positive += tp
+            false_positive += fp
+            false_negative += fn
+            text_correct += correct
+
+        if planner is not None:
+            frame = Frame(data=data, mime_type=mime_type, width=processed.width,
+                          height=processed.height, image=processed, detail=detail)
+            before = metrics.counters.get("tokens_prompt", 0)
+            request_start = time.perf_counter()
+            plan = planner.analyze_screenshot(frame)
+            model_latencies.append(time.perf_counter() - request_start)
+            prompt_tokens.append(metrics.counters.get("tokens_prompt", 0) - before)
+            texts = {box.text for box in expected if box.text}
+            words_expected += len(texts)
+            words_found += len(texts & set(plan.inputs if plan is not None else []))
+
+    result: Dict[str, Any] = {
+        "format": image_format,
+        "quality": quality,
+        "max_width": config.max_width,
+        "colors": config.colors,
+        "detail": config.detail,
+        "bytes_mean": sum(sizes) / len(sizes),
+        "tokens_mean": sum(tokens) / len(tokens),
+        "preprocess_encode_ms": percentiles(durations),
+    }
+    if labels:
+        result["precision"] = true_positive / max(true_positive + false_positive, 1)
+        result["recall"] = true_positive / max(true_positive + false_negative, 1)
+        if detector.use_ocr:
+            result["ocr_accuracy"] = text_correct / max(true_positive, 1)
+    if planner is not None:
+        result["model_ms"] = percentiles(model_latencies)
+        result["prompt_tokens_mean"] = sum(prompt_tokens) / max(len(prompt_tokens), 1)
+        if words_expected:
+            result["plan_word_recall"] = words_found / words_expected
+    return result
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="截图预处理基准测试")
+    parser.add_argument("frames", help="录制的截图目录")
+    parser.add_argument("--settings", help=f"逗号分隔的配置名，默认全部：{','.join(SETTINGS)}")
+    parser.add_argument("--ocr", action="store_true", help="同时统计 OCR 准确率（需要 pytesseract）")
+    parser.add_argument("--model", action="store_true", help="实际调用规划器，统计 token、延迟和单词召回率")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    try:
+        frame_dir = Path(args.frames)
+        paths = sorted(p for p in frame_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        if not paths:
+            print(f"目录中没有截图: {frame_dir}")
+            sys.exit(1)
+        labels = {}
+        labels_path = frame_dir / "labels.json"
+        if labels_path.exists():
+            labels = json.loads(labels_path.read_text(encoding="utf-8"))
+        else:
+            print("未找到 labels.json，不输出准确率")
+
+        names = args.settings.split(",") if args.settings else list(SETTINGS)
+        unknown = [name for name in names if name not in SETTINGS]
+        if unknown:
+            print(f"未知配置: {unknown}")
+            sys.exit(1)
+
+        planner = None
+        if args.model:
+            from planner import GamePlanner
+            planner = GamePlanner()
+
+        detector = WordDetector(use_ocr=args.ocr)
+        results = {}
+        for name in names:
+            results[name] = result = run_setting(name, paths, labels, detector, planner)
+            line = (f"{name:<20} {result['bytes_mean'] / 1024:7.1f} KB  "
+                    f"{result['tokens_mean']:5.0f} tok  "
+                    f"{result['preprocess_encode_ms']['p50']:6.1f}ms")
+            if "recall" in result:
+                line += f"  召回率 {result['recall']:.0%}"
+            if "plan_word_recall" in result:
+                line += f"  计划召回率 {result['plan_word_recall']:.0%}"
+            if "model_ms" in result:
+                line += f"  模型 p50 {result['model_ms']['p50']:.0f}ms"
+            print(line, file=sys.stderr)
+
+        text = json.dumps(results, ensure_ascii=False, indent=2)
+        if args.output:
+            Path(args.output).write_text(text, encoding="utf-8")
+            print(f"结果已写入: {args.output}", file=sys.stderr)
+        else:
+            print(text)
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
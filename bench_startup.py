@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+启动耗时基准测试
+
+每个样本在新的子进程中运行，排除已导入模块和已建立连接的影响：
+- imports：导入 chef（全部模块）的耗时，pyautogui、pywinctl、openai 推迟到首次使用后不再计入
+- cold / warm：从进程启动到第一次按键。画面来自 simulator，模型接口为 mock_openai（返回标准答案），
+  warm 在第一帧之前调用 GameWindow.warm_up 和 GamePlanner.warm_up（即 WARM_START=1、PLANNER_WARMUP=1），
+  分别统计启动各阶段和首帧截图到首次按键的延迟
+
+用法:
+    python bench_startup.py [--runs 5] [--latency 0.3] [--output result.json]
+"""
+
+# 子进程模式下作为第一个导入，记录启动耗时的起点
+from startup import StartupTimer
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from metrics import percentiles
+
+
+def run_child(mode: str) -> Dict[str, Any]:
+    """
+    子进程：启动到第一次按键
+
+    Args:
+        mode (str): imports / cold / warm
+
+    Returns:
+        Dict[str, Any]: 各阶段耗时（毫秒）和首键延迟（毫秒）
+    """
+    timer = StartupTimer()
+    if mode == "imports":
+        import chef  # noqa: F401
+        timer.mark("imports")
+        return {"phases_ms": {name: seconds * 1000 for name, seconds in timer.phases.items()}}
+
+    from game_window import GameWindow
+    from planner import GamePlanner
+    from simulator import ShiftSimulator, SimClock, SimConfig
+    timer.mark("imports")
+
+    # 离散时钟，先推进几秒让第一位顾客到达
+    sim = ShiftSimulator(SimConfig(), SimClock(speed=0), seed=0)
+    sim.clock.advance(3.0)
+    window = GameWindow(frame_source=sim.render, keyboard_writer=sim.keyboard, use_imgur=False,
+                        save_screenshots=False, capture_fps=0)
+    planner = GamePlanner("fast")
+    timer.mark("setup")
+    if mode == "warm":
+        window.warm_up()
+        planner.warm_up()
+        timer.mark("warmup")
+
+    window.start_keyboard_thread()
+    try:
+        frame = window.take_screenshot()
+        window.mark_plan_start(frame.captured_at)
+        plan = planner.analyze_screenshot(frame)
+        if plan is None:
+            raise RuntimeError("规划失败")
+        window.add_input_words(plan.inputs, frame, 1, priorities=plan.priorities)
+        deadline = time.time() + 10.0
+        while not window.executor.first_keystroke_latencies and time.time() < deadline:
+            time.sleep(0.001)
+        timer.mark("first_keystroke")
+    finally:
+        window.stop_keyboard_thread()
+    latencies = window.executor.first_keystroke_latencies
+    return {
+        "phases_ms": {name: seconds * 1000 for name, seconds in timer.phases.items()},
+        "total_ms": timer.total * 1000,
+        "first_keystroke_ms": latencies[0] * 1000 if latencies else None,
+    }
+
+
+def sample(mode: str, env: Dict[str, str]) -> Dict[str, Any]:
+    """在新的子进程中运行一个样本，并统计子进程的总耗时（含解释器启动）"""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, __file__, "--child", mode], env=env,
+                               capture_output=True, text=True, check=True)
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总同一模式的多个样本"""
+    phases = sorted({name for item in samples for name in item["phases_ms"]})
+    summary = {
+        "phases_ms": {name: percentiles([item["phases_ms"].get(name, 0.0) for item in samples], scale=1.0)
+                      for name in phases},
+        "process_ms": percentiles([item["process_ms"] for item in samples], scale=1.0),
+    }
+    if "first_keystroke_ms" in samples[0]:
+        summary["first_keystroke_ms"] = percentiles(
+            [item["first_keystroke_ms"] for item in samples if item["first_keystroke_ms"] is not None], scale=1.0)
+        summary["total_ms"] = percentiles([item["total_ms"] for item in samples], scale=1.0)
+    return summary
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="启动耗时基准测试")
+    parser.add_argument("--runs", type=int, default=5, help="每种模式的样本数")
+    parser.add_argument("--latency", type=float, default=0.3, help="模拟服务的延迟（秒）")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--child", choices=("imports", "cold", "warm"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        # 子进程：只在最后一行输出 JSON，其余日志丢弃
+        import contextlib
+        import io
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_child(args.child)
+        print(json.dumps(result))
+        return
+
+    try:
+        from mock_openai import MockConfig, start_mock_server
+        from simulator import ShiftSimulator, SimClock, SimConfig
+        # 模拟服务返回标准答案：子进程中的模拟器与这里的种子和时刻相同
+        reference = ShiftSimulator(SimConfig(), SimClock(speed=0), seed=0)
+        reference.clock.advance(3.0)
+        server = start_mock_server(MockConfig(latency=args.latency, plan_source=reference.oracle_plan))
+        env = dict(os.environ)
+        env.update({
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{server.server_port}/v1",
+            "OPENAI_API_KEY": env.get("OPENAI_API_KEY", "mock"),
+            "PLANNER_MODE": "fast",
+            "CAPTURE_FPS": "0",
+        })
+
+        result = {}
+        for mode in ("imports", "cold", "warm"):
+            result[mode] = summarize([sample(mode, env) for _ in range(args.runs)])
+        server.shutdown()
+        result["config"] = vars(args)
+
+        cold, warm = result["cold"], result["warm"]
+        print(f"导入 p50 {result['imports']['phases_ms']['imports']['p50']:.0f}ms; "
+              f"首键延迟 p50: cold {cold['first_keystroke_ms'].get('p50', 0):.0f}ms, "
+              f"warm {warm['first_keystroke_ms'].get('p50', 0):.0f}ms", file=sys.stderr)
+
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.output:
+            Path(args.output).write_text(output, encoding="utf-8")
+            print(f"结果已写入: {args.output}", file=sys.stderr)
+        else:
+            print(output)
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
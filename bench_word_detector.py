@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+本地高亮单词检测器基准测试
+
+用法:
+    python bench_word_detector.py <截图目录> [--ocr]
+
+截图目录中可放置 labels.json 作为标注，格式：
+    {"game_1.png": [{"box": [left, top, right, bottom], "text": "rail"}, ...]}
+有标注时额外输出精确率、召回率和 OCR 准确率。
+"""
+
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from word_detector import WordBox, WordDetector
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+
+def main():
+    """主函数"""
+    try:
+        if len(sys.argv) < 2:
+            print(__doc__)
+            sys.exit(1)
+
+        frame_dir = Path(sys.argv[1])
+        detector = WordDetector(use_ocr=True if "--ocr" in sys.argv else False)
+
+        labels = {}
+        labels_path = frame_dir / "labels.json"
+        if labels_path.exists():
+            labels = json.loads(labels_path.read_text(encoding="utf-8"))
+
+        paths = sorted(p for p in frame_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+        if not paths:
+            print(f"目录中没有截图: {frame_dir}")
+            sys.exit(1)
+
+        durations = []
+        true_positive = false_positive = false_negative = 0
+        text_correct = text_total = 0
+        for path in paths:
+            image = Image.open(path)
+            image.load()
+
+            start = time.perf_counter()
+            boxes = detector.detect(image)
+            durations.append(time.perf_counter() - start)
+
+            if path.name not in labels:
+                continue
+
+            # 按交并比贪心匹配标注框
+            expected = [WordBox(*item["box"], region="", text=item.get("text"))
+                        for item in labels[path.name]]
+            unmatched = list(expected)
+            for box in boxes:
+                best = max(unmatched, key=box.iou, default=None)
+                if best is not None and box.iou(best) >= 0.5:
+                    unmatched.remove(best)
+                    true_positive += 1
+                    if detector.use_ocr and best.text:
+                        text_total += 1
+                        text_correct += int(box.text == best.text)
+                else:
+                    false_positive += 1
+            false_negative += len(unmatched)
+
+        durations_ms = sorted(d * 1000 for d in durations)
+        p95 = durations_ms[min(len(durations_ms) - 1, int(len(durations_ms) * 0.95))]
+        print(f"帧数: {len(paths)}")
+        print(f"检测耗时: 平均 {statistics.mean(durations_ms):.1f}ms, "
+              f"p50 {statistics.median(durations_ms):.1f}ms, p95 {p95:.1f}ms")
+
+        if labels:
+            precision = true_positive / max(true_positive + false_positive, 1)
+            recall = true_positive / max(true_positive + false_negative, 1)
+            print(f"精确率: {precision:.1%}, 召回率: {recall:.1%} "
+                  f"(TP={true_positive}, FP={false_positive}, FN={false_negative})")
+            if text_total:
+                print(f"OCR 准确率: {text_correct / text_total:.1%} ({text_correct}/{text_total})")
+        else:
+            print("未找到 labels.json，只输出速度")
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+屏幕采集后端
+主要功能：
+1. 可插拔的采集后端：mss（Linux 下使用 MIT-SHM/XShm）和 pyautogui 回退
+2. 预分配的 NumPy 帧缓冲，采集时原地写入，不为每帧分配内存
+3. 后台采集线程按设定帧率持续填充固定大小的环形缓冲
+4. 消费者（规划器、变化检测、校验器）无拷贝读取最新一帧
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+Region = Tuple[int, int, int, int]  # (left, top, width, height)
+
+
+class CaptureBackend:
+    """采集后端基类"""
+
+    name = "base"
+
+    def grab(self, region: Region, out: np.ndarray) -> np.ndarray:
+        """
+        采集屏幕区域并写入预分配的缓冲
+
+        Args:
+            region (Region): (left, top, width, height)
+            out (np.ndarray): 形状为 (height, width, 3) 的 uint8 RGB 缓冲
+
+        Returns:
+            np.ndarray: 写入后的 out
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """释放后端资源"""
+
+
+class MssBackend(CaptureBackend):
+    """
+    基于 mss 的采集后端
+
+    mss 在 Linux/X11 上使用 XShmGetImage，避免经由 X 协议传输整幅图像。
+    mss 实例不能跨线程共享，因此每个线程单独创建。
+    """
+
+    name = "mss"
+
+    def __init__(self):
+        import mss  # 可选依赖，仅在使用该后端时导入
+        self._mss = mss
+        self._local = threading.local()
+
+    def _sct(self):
+        sct = getattr(self._local, "sct", None)
+        if sct is None:
+            sct = self._mss.mss()
+            self._local.sct = sct
+        return sct
+
+    def grab(self, region: Region, out: np.ndarray) -> np.ndarray:
+        left, top, width, height = region
+        shot = self._sct().grab({"left": left, "top": top, "width": width, "height": height})
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(height, width, 4)
+        # 逐通道写入，避免 BGRA -> RGB 转换产生临时数组
+        out[..., 0] = bgra[..., 2]
+        out[..., 1] = bgra[..., 1]
+        out[..., 2] = bgra[..., 0]
+        return out
+
+    def close(self) -> None:
+        sct = getattr(self._local, "sct", None)
+        if sct is not None:
+            sct.close()
+            self._local.sct = None
+
+
+class PyAutoGuiBackend(CaptureBackend):
+    """基于 pyautogui.screenshot 的回退后端"""
+
+    name = "pyautogui"
+
+    def grab(self, region: Region, out: np.ndarray) -> np.ndarray:
+        import pyautogui
+        screenshot = pyautogui.screenshot(region=region)
+        out[...] = np.asarray(screenshot.convert("RGB"))
+        return out
+
+
+BACKENDS = {
+    "mss": MssBackend,
+    "pyautogui": PyAutoGuiBackend,
+}
+
+
+def create_backend(name: str = "auto") -> CaptureBackend:
+    """
+    创建采集后端
+
+    Args:
+        name (str): 后端名称，auto 时优先使用 mss，不可用则回退到 pyautogui
+
+    Returns:
+        CaptureBackend: 采集后端
+    """
+    if name != "auto":
+        if name not in BACKENDS:
+            raise ValueError(f"不支持的采集后端: {name}")
+        return BACKENDS[name]()
+    try:
+        return MssBackend()
+    except ImportError:
+        print("未安装 mss，使用 pyautogui 采集")
+        return PyAutoGuiBackend()
+
+
+@dataclass
+class RingFrame:
+    """环形缓冲中的一帧（只读视图）"""
+
+    seq: int  # 帧序号，单调递增
+    captured_at: float  # 采集时间（time.time）
+    region: Region
+    pixels: np.ndarray  # (height, width, 3) RGB 只读视图，指向环形缓冲内部
+
+
+class FrameRingBuffer:
+    """
+    固定大小的帧环形缓冲
+
+    所有槽位预先分配，写入方原地覆盖最旧的槽位；读取方拿到的是只读视图，
+    在被覆盖前（约 size - 1 个采集周期）可安全使用，需要长期保留时自行 copy()。
+    """
+
+    def __init__(self, size: int = 4):
+        """
+        初始化环形缓冲
+
+        Args:
+            size (int): 槽位数量，至少为 2
+        """
+        self.size = max(2, size)
+        self._slots: List[np.ndarray] = []
+        self._meta: List[Optional[RingFrame]] = [None] * self.size
+        self._shape: Optional[Tuple[int, int]] = None
+        self._next = 0
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._updated = threading.Condition(self._lock)
+
+    def _ensure_shape(self, width: int, height: int) -> None:
+        """窗口尺寸变化时重新分配槽位（调用方持有锁）"""
+        if self._shape == (width, height):
+            return
+        self._slots = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(self.size)]
+        self._meta = [None] * self.size
+        self._shape = (width, height)
+
+    def acquire_slot(self, region: Region) -> Tuple[int, np.ndarray]:
+        """
+        获取下一个可写入的槽位
+
+        Args:
+            region (Region): 即将采集的区域，用于确定缓冲尺寸
+
+        Returns:
+            Tuple[int, np.ndarray]: (槽位下标, 可写缓冲)
+        """
+        _, _, width, height = region
+        with self._lock:
+            self._ensure_shape(width, height)
+            index = self._next
+            self._next = (self._next + 1) % self.size
+            return index, self._slots[index]
+
+    def commit(self, index: int, region: Region, captured_at: float) -> RingFrame:
+        """
+        提交写入完成的槽位
+
+        Args:
+            index (int): 槽位下标
+            region (Region): 采集区域
+            captured_at (float): 采集时间
+
+        Returns:
+            RingFrame: 新的一帧
+        """
+        with self._lock:
+            view = self._slots[index].view()
+            view.flags.writeable = False
+            self._seq += 1
+            frame = RingFrame(self._seq, captured_at, region, view)
+            self._meta[index] = frame
+            self._updated.notify_all()
+            return frame
+
+    def latest(self) -> Optional[RingFrame]:
+        """
+        获取最新一帧，不拷贝像素
+
+        Returns:
+            Optional[RingFrame]: 最新一帧，缓冲为空时返回 None
+        """
+        with self._lock:
+            frames = [meta for meta in self._meta if meta is not None]
+            return max(frames, key=lambda meta: meta.seq) if frames else None
+
+    def wait_newer(self, seq: int, timeout: Optional[float] = None) -> Optional[RingFrame]:
+        """
+        等待比 seq 更新的一帧
+
+        Args:
+            seq (int): 已读取的帧序号
+            timeout (Optional[float]): 最长等待时间
+
+        Returns:
+            Optional[RingFrame]: 新的一帧，超时返回 None
+        """
+        with self._updated:
+            if not self._updated.wait_for(lambda: self._seq > seq, timeout):
+                return None
+        return self.latest()
+
+
+class CaptureThread:
+    """
+    后台采集线程
+    按设定帧率采集游戏窗口并写入环形缓冲
+    """
+
+    def __init__(self, backend: CaptureBackend, get_region: Callable[[], Optional[Region]],
+                 fps: float = 10.0, buffer_size: int = 4):
+        """
+        初始化采集线程
+
+        Args:
+            backend (CaptureBackend): 采集后端
+            get_region (Callable[[], Optional[Region]]): 获取窗口区域的函数
+            fps (float): 目标帧率
+            buffer_size (int): 环形缓冲槽位数量
+        """
+        self.backend = backend
+        self.get_region = get_region
+        self.fps = fps
+        self.ring = FrameRingBuffer(buffer_size)
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+        # 统计
+        self.frames = 0
+        self.errors = 0
+        self.grab_seconds = 0.0
+        self.started_at = 0.0
+
+    def start(self) -> None:
+        """启动采集线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self.started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        print(f"采集线程已启动 ({self.backend.name}, {self.fps} FPS)")
+
+    def stop(self) -> None:
+        """停止采集线程"""
+        self._running = False
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+            print(f"采集线程已停止: {self.report()}")
+
+    @property
+    def running(self) -> bool:
+        return bool(self._thread and self._thread.is_alive())
+
+    def _run(self) -> None:
+        """采集循环"""
+        period = 1.0 / self.fps if self.fps > 0 else 0.0
+        next_tick = time.perf_counter()
+        try:
+            while self._running:
+                region = self.get_region()
+                if region:
+                    try:
+                        start = time.perf_counter()
+                        index, buffer = self.ring.acquire_slot(region)
+                        captured_at = time.time()
+                        self.backend.grab(region, buffer)
+                        self.ring.commit(index, region, captured_at)
+                        self.grab_seconds += time.perf_counter() - start
+                        self.frames += 1
+                    except Exception as e:
+                        self.errors += 1
+                        print(f"采集失败: {e}")
+
+                next_tick += period
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # 采集跟不上目标帧率时不累积欠账
+                    next_tick = time.perf_counter()
+        finally:
+            self.backend.close()
+
+    def latest(self) -> Optional[RingFrame]:
+        """获取最新一帧（无拷贝）"""
+        return self.ring.latest()
+
+    def report(self) -> str:
+        """
+        生成采集统计
+
+        Returns:
+            str: 实际帧率、平均采集耗时和错误数
+        """
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        fps = self.frames / elapsed if elapsed > 0 else 0.0
+        grab_ms = self.grab_seconds / self.frames * 1000 if self.frames else 0.0
+        return f"帧 {self.frames}, 实际 {fps:.1f} FPS, 平均采集 {grab_ms:.1f}ms, 错误 {self.errors}"
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+快慢模型级联规划
+主要功能：
+1. 快速（便宜）模型先给出计划，单词立即加入输入队列
+2. 强模型对全部或按比例抽样的帧并发分析，结果返回后与快速计划比较
+3. 两者不一致时取消快速计划中被否定、尚未输入的单词，补充遗漏的单词
+4. 统计各层延迟、不一致率和节省的等待时间
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from frame import Frame
+from metrics import metrics, percentiles
+from plan import Plan
+from planner import GamePlanner
+
+if TYPE_CHECKING:  # 避免规划器依赖 pyautogui
+    from keyboard_executor import KeyboardExecutor
+
+# 强模型确认后的回调，参数为强模型的计划（用于更新游戏状态、计划缓存等）
+CorrectionCallback = Callable[[Plan], None]
+
+
+@dataclass
+class Correction:
+    """强模型对一帧快速计划的纠正"""
+
+    generation: Optional[int]
+    cancelled: List[str]  # 快速计划中被否定、已从队列取消的单词
+    typed: List[str]  # 快速计划中被否定、但已经输入（或已出队）的单词
+    added: List[str]  # 强模型补充的单词
+
+
+class CascadePlanner:
+    """
+    快慢模型级联规划器
+
+    两层都是 GamePlanner，只是模型不同；强模型的请求与快速模型同时发出，
+    不阻塞快速计划的返回。
+    """
+
+    def __init__(self, executor: "KeyboardExecutor",
+                 fast: Optional[GamePlanner] = None,
+                 strong: Optional[GamePlanner] = None,
+                 verify_rate: Optional[float] = None,
+                 seed: Optional[int] = None):
+        """
+        初始化级联规划器
+
+        Args:
+            executor (KeyboardExecutor): 键盘执行器，用于取消和补充单词
+            fast (Optional[GamePlanner]): 快速层，默认使用 CASCADE_FAST_MODEL（gpt-4o-mini）
+            strong (Optional[GamePlanner]): 强模型层，默认使用 PLANNER_MODEL
+            verify_rate (Optional[float]): 由强模型确认的帧比例（0~1），默认读取 CASCADE_VERIFY_RATE
+            seed (Optional[int]): 抽样的随机种子
+        """
+        self.executor = executor
+        self.fast = fast or GamePlanner(model=os.getenv('CASCADE_FAST_MODEL', 'gpt-4o-mini'))
+        self.strong = strong or GamePlanner()
+        if verify_rate is None:
+            verify_rate = float(os.getenv('CASCADE_VERIFY_RATE', '1'))
+        self.verify_rate = verify_rate
+        self._random = random.Random(seed)
+        self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cascade")
+        self._pending: set = set()  # 未完成的强模型请求（Future 或 asyncio.Task）
+        self._uncommitted: Dict[Optional[int], Callable[[], None]] = {}  # 计划代数 -> 开始确认
+        self._lock = threading.Lock()
+
+        # 统计
+        self.frames = 0
+        self.verified = 0
+        self.disagreements = 0
+        self.words_cancelled = 0
+        self.words_typed_wrong = 0
+        self.words_added = 0
+        self.fast_latencies: List[float] = []
+        self.strong_latencies: List[float] = []
+        self.savings: List[float] = []  # 每个已确认帧上，快速计划比强模型计划提前的时间
+
+    def _should_verify(self) -> bool:
+        """按 verify_rate 抽样决定本帧是否由强模型确认"""
+        self.frames += 1
+        return self.verify_rate >= 1 or self._random.random() < self.verify_rate
+
+    def _track(self, request) -> None:
+        """记录未完成的强模型请求"""
+        with self._lock:
+            self._pending.add(request)
+        request.add_done_callback(self._untrack)
+
+    def _untrack(self, request) -> None:
+        with self._lock:
+            self._pending.discard(request)
+
+    def _defer(self, plan: Optional[Plan], generation: Optional[int], start: Callable[[], None]) -> None:
+        """快速计划需要等调用方 commit 后才开始确认；快速模型失败时没有需要等待的写入，立即开始"""
+        if plan is None:
+            start()
+            return
+        with self._lock:
+            self._uncommitted[generation] = start
+
+    def commit(self, generation: Optional[int]) -> None:
+        """
+        调用方已把快速计划写入游戏状态、计划缓存和输入队列后调用，之后才比较强模型的计划
+
+        强模型先返回时若立即纠正，调用方随后写入的快速计划会覆盖纠正结果，
+        被否定的单词也会在取消之后才加入队列。
+
+        Args:
+            generation (Optional[int]): analyze_screenshot 使用的计划代数
+        """
+        with self._lock:
+            start = self._uncommitted.pop(generation, None)
+        if start:
+            start()
+
+    def _run_strong(self, frame: Frame, context: Optional[str]) -> Tuple[Optional[Plan], float]:
+        """在线程池中请求强模型，返回计划和耗时"""
+        start = time.perf_counter()
+        plan = self.strong.analyze_screenshot(frame, context)
+        return plan, time.perf_counter() - start
+
+    def analyze_screenshot(self, frame: Frame, context: Optional[str] = None,
+                           generation: Optional[int] = None,
+                           on_correction: Optional[CorrectionCallback] = None) -> Optional[Plan]:
+        """
+        快速模型给出计划后立即返回，强模型在后台确认
+
+        Args:
+            frame (Frame): 截图帧
+            context (Optional[str]): 游戏状态增量
+            generation (Optional[int]): 快速计划入队时使用的计划代数，纠正时使用同一代数
+            on_correction (Optional[CorrectionCallback]): 强模型与快速计划不一致时调用
+
+        Returns:
+            Optional[Plan]: 快速模型的计划，调用方处理完后需调用 commit(generation)；
+                快速模型失败时返回 None（若有确认请求，由其补充单词）
+        """
+        strong: Optional[Future] = None
+        if self._should_verify():
+            # 强模型使用帧的副本，避免覆盖快速计划记录在帧上的步骤和耗时
+            strong = self._pool.submit(self._run_strong, replace(frame, timings={}, steps=[]), context)
+            self._track(strong)
+
+        start = time.perf_counter()
+        plan = self.fast.analyze_screenshot(frame, context)
+        fast_latency = time.perf_counter() - start
+        self.fast_latencies.append(fast_latency)
+        metrics.observe("cascade_fast", fast_latency, model=self.fast.model)
+
+        if strong is not None:
+            def verify(future: Future) -> None:
+                try:
+                    strong_plan, strong_latency = future.result()
+                except Exception as e:
+                    print(f"强模型确认失败: {e}")
+                    return
+                self._verify(frame, plan, strong_plan, strong_latency, fast_latency, generation, on_correction)
+            self._defer(plan, generation, lambda: strong.add_done_callback(verify))
+        return plan
+
+    async def analyze_screenshot_async(self, frame: Frame, context: Optional[str] = None,
+                                       generation: Optional[int] = None,
+                                       on_correction: Optional[CorrectionCallback] = None) -> Optional[Plan]:
+        """
+        异步版本：快速模型给出计划后立即返回，强模型作为后台任务确认
+
+        Args:
+            frame (Frame): 截图帧
+            context (Optional[str]): 游戏状态增量
+            generation (Optional[int]): 快速计划入队时使用的计划代数
+            on_correction (Optional[CorrectionCallback]): 强模型与快速计划不一致时调用
+
+        Returns:
+            Optional[Plan]: 快速模型的计划，调用方处理完后需调用 commit(generation)
+        """
+        strong: Optional[asyncio.Task] = None
+        if self._should_verify():
+            async def run_strong() -> Tuple[Optional[Plan], float]:
+                start = time.perf_counter()
+                strong_plan = await self.strong.analyze_screenshot_async(
+                    replace(frame, timings={}, steps=[]), context)
+                return strong_plan, time.perf_counter() - start
+            strong = asyncio.create_task(run_strong())
+            self._track(strong)
+
+        start = time.perf_counter()
+        plan = await self.fast.analyze_screenshot_async(frame, context)
+        fast_latency = time.perf_counter() - start
+        self.fast_latencies.append(fast_latency)
+        metrics.observe("cascade_fast", fast_latency, model=self.fast.model)
+
+        if strong is not None:
+            def verify(task: asyncio.Task) -> None:
+                if task.cancelled() or task.exception() is not None:
+                    print(f"强模型确认失败: {None if task.cancelled() else task.exception()}")
+                    return
+                strong_plan, strong_latency = task.result()
+                self._verify(frame, plan, strong_plan, strong_latency, fast_latency, generation, on_correction)
+            self._defer(plan, generation, lambda: strong.add_done_callback(verify))
+        return plan
+
+    def _verify(self, frame: Frame, fast_plan: Optional[Plan], strong_plan: Optional[Plan],
+                strong_latency: float, fast_latency: float, generation: Optional[int],
+                on_correction: Optional[CorrectionCallback]) -> Optional[Correction]:
+        """
+        比较两层的计划，不一致时纠正输入队列
+
+        Args:
+            frame (Frame): 截图帧
+            fast_plan (Optional[Plan]): 快速模型的计划
+            strong_plan (Optional[Plan]): 强模型的计划
+            strong_latency (float): 强模型耗时（秒）
+            fast_latency (float): 快速模型耗时（秒）
+            generation (Optional[int]): 快速计划的计划代数
+            on_correction (Optional[CorrectionCallback]): 纠正后调用
+
+        Returns:
+            Optional[Correction]: 纠正内容，两者一致或强模型失败时返回 None
+        """
+        self.strong_latencies.append(strong_latency)
+        metrics.observe("cascade_strong", strong_latency, model=self.strong.model)
+        if strong_plan is None:
+            return None
+        self.verified += 1
+        metrics.incr("cascade_verified")
+        if fast_plan is not None:
+            self.savings.append(strong_latency - fast_latency)
+
+        fast_words = fast_plan.inputs if fast_plan is not None else []
+        strong_words = set(strong_plan.inputs)
+        if set(fast_words) == strong_words:
+            return None
+
+        self.disagreements += 1
+        metrics.incr("cascade_disagreements")
+        rejected = [word for word in fast_words if word not in strong_words]
+        queued = [word for word in rejected if word in self.executor.scheduler]
+        self.executor.cancel_words(rejected, generation)
+        added = [word for word in strong_plan.inputs if word not in fast_words]
+        if added:
+            self.executor.add_words(added, frame, generation, priorities=strong_plan.priorities)
+
+        correction = Correction(
+            generation=generation,
+            cancelled=queued,
+            typed=[word for word in rejected if word not in queued],
+            added=added,
+        )
+        self.words_cancelled += len(correction.cancelled)
+        self.words_typed_wrong += len(correction.typed)
+        self.words_added += len(added)
+        metrics.incr("cascade_words_cancelled", len(correction.cancelled))
+        metrics.incr("cascade_words_added", len(added))
+        print(f"强模型纠正快速计划: 取消 {correction.cancelled}, 已误输入 {correction.typed}, 补充 {added}")
+        if on_correction:
+            on_correction(strong_plan)
+        return correction
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待未完成的强模型请求（线程池中的请求）
+
+        Args:
+            timeout (Optional[float]): 最长等待时间
+
+        Returns:
+            bool: 是否全部完成
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while True:
+            with self._lock:
+                pending = [request for request in self._pending if isinstance(request, Future)]
+            if not pending:
+                return True
+            remaining = None if deadline is None else deadline - time.perf_counter()
+            if remaining is not None and remaining <= 0:
+                return False
+            pending[0].exception(timeout=remaining)
+
+    def close(self) -> None:
+        """关闭线程池，不等待未完成的确认"""
+        self._pool.shutdown(wait=False)
+
+    def summary(self) -> dict:
+        """
+        各层统计
+
+        Returns:
+            dict: 各层延迟分位数（毫秒）、不一致率和节省的等待时间
+        """
+        return {
+            "fast_model": self.fast.model,
+            "strong_model": self.strong.model,
+            "frames": self.frames,
+            "verified": self.verified,
+            "disagreement_rate": self.disagreements / self.verified if self.verified else 0.0,
+            "words_cancelled": self.words_cancelled,
+            "words_typed_wrong": self.words_typed_wrong,
+            "words_added": self.words_added,
+            "fast_ms": percentiles(self.fast_latencies),
+            "strong_ms": percentiles(self.strong_latencies),
+            "saved_ms": percentiles(self.savings),
+        }
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 确认帧数、不一致率、纠正的单词数以及各层延迟
+        """
+        summary = self.summary()
+        fast = summary["fast_ms"].get("p50", 0.0)
+        strong = summary["strong_ms"].get("p50", 0.0)
+        saved = summary["saved_ms"].get("mean", 0.0)
+        return (
+            f"帧 {self.frames}, 强模型确认 {self.verified}, 不一致 {self.disagreements} "
+            f"({summary['disagreement_rate']:.0%}), 取消 {self.words_cancelled}, "
+            f"已误输入 {self.words_typed_wrong}, 补充 {self.words_added}; "
+            f"{self.fast.model} p50 {fast:.0f}ms, {self.strong.model} p50 {strong:.0f}ms, "
+            f"平均提前 {saved:.0f}ms"
+        )
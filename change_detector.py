@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+帧变化检测器
+主要功能：
+1. 按屏幕区域对下采样灰度图做差分，判断哪些区域发生了变化
+2. 计算每个区域的感知哈希（dHash），作为计划缓存的键
+3. 画面未变化时跳过视觉模型调用，画面回到已知状态时复用缓存的计划
+4. 统计跳过率和缓存命中率
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from frame import Frame
+from metrics import metrics
+from regions import SCREEN_REGIONS, region_box
+
+
+@dataclass
+class FrameChange:
+    """一帧的变化检测结果"""
+
+    key: bytes  # 由各区域感知哈希拼接而成的帧哈希
+    changed_regions: List[str] = field(default_factory=list)  # 发生变化的区域
+    region_scores: Dict[str, float] = field(default_factory=dict)  # 各区域平均像素差
+
+    @property
+    def changed(self) -> bool:
+        """是否有区域发生变化"""
+        return bool(self.changed_regions)
+
+
+class PlanCache:
+    """
+    按帧哈希缓存计划的 LRU 缓存
+    """
+
+    def __init__(self, capacity: int = 128):
+        """
+        初始化缓存
+
+        Args:
+            capacity (int): 最多缓存的计划数量
+        """
+        self.capacity = capacity
+        self._entries: "OrderedDict[bytes, Any]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes) -> Optional[Any]:
+        """
+        查找缓存的计划
+
+        Args:
+            key (bytes): 帧哈希
+
+        Returns:
+            Optional[Any]: 缓存的计划，未命中时返回 None
+        """
+        plan = self._entries.get(key)
+        if plan is None:
+            self.misses += 1
+            metrics.incr("plan_cache_misses")
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        metrics.incr("plan_cache_hits")
+        return plan
+
+    def put(self, key: bytes, plan: Any) -> None:
+        """
+        缓存计划
+
+        Args:
+            key (bytes): 帧哈希
+            plan (Any): 计划
+        """
+        self._entries[key] = plan
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class FrameChangeDetector:
+    """
+    按区域检测相邻帧变化的检测器
+
+    整帧先缩放为小尺寸灰度图，再按 SCREEN_REGIONS 切片，
+    每个区域计算与上一帧的平均绝对差以及 dHash。
+    """
+
+    def __init__(self, diff_threshold: float = 6.0,
+                 sample_size: tuple = (192, 108),
+                 hash_size: int = 8,
+                 max_skips: int = 5,
+                 cache_capacity: int = 128):
+        """
+        初始化变化检测器
+
+        Args:
+            diff_threshold (float): 区域平均像素差（0~255）超过该值视为变化
+            sample_size (tuple): 下采样尺寸 (宽, 高)
+            hash_size (int): dHash 边长，每个区域产生 hash_size² 位
+            max_skips (int): 连续跳过的最大帧数，超过后强制重新分析
+            cache_capacity (int): 计划缓存容量
+        """
+        self.diff_threshold = diff_threshold
+        self.sample_size = sample_size
+        self.hash_size = hash_size
+        self.max_skips = max_skips
+        self.cache = PlanCache(cache_capacity)
+
+        self._previous: Optional[np.ndarray] = None
+        self._consecutive_skips = 0
+
+        # 统计
+        self.frames = 0
+        self.skipped = 0
+        self.analyzed = 0
+
+    def _downsample(self, frame: Frame) -> np.ndarray:
+        """
+        将帧缩放为小尺寸灰度数组
+
+        Args:
+            frame (Frame): 截图帧
+
+        Returns:
+            np.ndarray: float32 灰度数组，形状 (高, 宽)
+        """
+        if frame.pixels is not None:
+            # 直接对环形缓冲中的像素跨步采样，只分配小尺寸数组
+            height, width = frame.pixels.shape[:2]
+            step_x = max(1, width // self.sample_size[0])
+            step_y = max(1, height // self.sample_size[1])
+            sampled = frame.pixels[::step_y, ::step_x].astype(np.float32)
+            return sampled @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+        image = frame.get_image().convert("L").resize(self.sample_size, Image.BILINEAR)
+        return np.asarray(image, dtype=np.float32)
+
+    def _dhash(self, gray: np.ndarray) -> np.ndarray:
+        """
+        计算区域的差值哈希
+
+        Args:
+            gray (np.ndarray): 区域灰度数组
+
+        Returns:
+            np.ndarray: 长度为 hash_size² 的布尔数组
+        """
+        size = self.hash_size
+        image = Image.fromarray(gray.astype(np.uint8)).resize((size + 1, size), Image.BILINEAR)
+        pixels = np.asarray(image, dtype=np.int16)
+        return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+    def check(self, frame: Frame) -> FrameChange:
+        """
+        检测帧相对上一帧的变化
+
+        Args:
+            frame (Frame): 截图帧
+
+        Returns:
+            FrameChange: 变化检测结果
+        """
+        gray = self._downsample(frame)
+        height, width = gray.shape
+
+        bits = []
+        changed_regions = []
+        scores = {}
+        if self._previous is not None and self._previous.shape != gray.shape:
+            # 窗口尺寸变化，视为全部区域变化
+            self._previous = None
+        for name in SCREEN_REGIONS:
+            left, top, right, bottom = region_box(name, width, height)
+            region = gray[top:bottom, left:right]
+            bits.append(self._dhash(region))
+
+            if self._previous is None:
+                changed_regions.append(name)
+                continue
+            score = float(np.abs(region - self._previous[top:bottom, left:right]).mean())
+            scores[name] = score
+            if score > self.diff_threshold:
+                changed_regions.append(name)
+
+        self._previous = gray
+        key = np.packbits(np.concatenate(bits)).tobytes()
+        return FrameChange(key=key, changed_regions=changed_regions, region_scores=scores)
+
+    def should_analyze(self, change: FrameChange) -> bool:
+        """
+        判断是否需要调用视觉模型，并更新统计
+
+        画面无变化时跳过，但连续跳过 max_skips 帧后强制分析一次，
+        避免输入未生效时一直停滞。
+
+        Args:
+            change (FrameChange): 变化检测结果
+
+        Returns:
+            bool: 是否需要分析
+        """
+        self.frames += 1
+        if not change.changed and self._consecutive_skips < self.max_skips:
+            self._consecutive_skips += 1
+            self.skipped += 1
+            metrics.incr("frames_skipped")
+            return False
+        self._consecutive_skips = 0
+        self.analyzed += 1
+        return True
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 跳过率、缓存命中率等统计
+        """
+        frames = max(self.frames, 1)
+        lookups = max(self.cache.hits + self.cache.misses, 1)
+        return (
+            f"帧 {self.frames}, 跳过 {self.skipped} ({self.skipped / frames:.0%}), "
+            f"缓存命中 {self.cache.hits}/{lookups} ({self.cache.hits / lookups:.0%}), "
+            f"节省模型调用 {self.skipped + self.cache.hits}"
+        )
@@ -3,43 +3,233 @@
 Chef's Shift AI 自动操作程序
 """
 
+# 最先导入，记录启动耗时的起点
+from startup import StartupTimer
+
+import asyncio
+import os
 import sys
+import threading
 import time
 
+from change_detector import FrameChangeDetector
+from frame import format_timings
+from game_state import GameStateTracker
+from cascade import CascadePlanner
 from game_window import GameWindow
+from http_session import tracker
+from metrics import metrics
+from plan import PlanStep
 from planner import GamePlanner
+from recipes import MacroEngine
+from resilience import callers
+from shard_planner import ShardedPlanner
+from verifier import WordVerifier
+from word_detector import OCR_AVAILABLE, LocalFastPath
 
 def main():
     """主函数"""
+    startup = StartupTimer()
+    startup.mark("imports")
     try:
         # 创建游戏窗口实例
         game_window = GameWindow("The Chef's Shift")
+        startup.mark("window")
+        
+        # 性能追踪：TRACE_FILE 写入 JSONL，METRICS_PORT 开启 Prometheus 接口
+        metrics.configure_from_env()
         
-        # 启动键盘输入线程
+        # 启动键盘输入线程和后台采集线程
         game_window.start_keyboard_thread()
+        game_window.start_capture_thread()
+        
+        # 流式规划：每个步骤解析完成后立即加入输入队列（PLANNER_STREAM=1 开启）
+        stream = os.getenv('PLANNER_STREAM', '0').lower() in ('1', 'true', 'yes')
+        
+        # 帧变化检测：画面无变化时跳过模型调用（CHANGE_DETECTION=0 关闭）
+        detector = None
+        if os.getenv('CHANGE_DETECTION', '1').lower() in ('1', 'true', 'yes'):
+            detector = FrameChangeDetector()
+        
+        # 本地高亮单词快速路径：简单场景无需调用模型（LOCAL_FASTPATH=0 关闭，需要 pytesseract）
+        fast_path = None
+        if os.getenv('LOCAL_FASTPATH', '1').lower() in ('1', 'true', 'yes'):
+            if OCR_AVAILABLE:
+                fast_path = LocalFastPath()
+                game_window.executor.typed_callbacks.append(fast_path.record_typed)
+            else:
+                print("未安装 pytesseract，本地快速路径不可用")
+        
+        # 跨帧游戏状态：合并计划与实际输入，只把状态增量发送给模型（GAME_STATE=0 关闭）
+        state = None
+        if os.getenv('GAME_STATE', '1').lower() in ('1', 'true', 'yes'):
+            state = GameStateTracker()
+            game_window.executor.typed_callbacks.append(state.record_typed)
+        
+        # 菜谱宏：识别出的菜谱按定时宏执行，整道菜只调用一次模型（MACROS=0 关闭）
+        macros = None
+        if os.getenv('MACROS', '1').lower() in ('1', 'true', 'yes'):
+            macros = MacroEngine(game_window.executor)
+            macros.start()
+        
+        startup.mark("components")
+        
+        # 任务规划器整个运行期间复用：客户端、连接池和提示词只创建一次
+        planner = GamePlanner()
+        startup.mark("planner")
+        # 预热：窗口侧（导入 pyautogui、查找窗口、编码一帧）在后台线程中进行（WARM_START=0 关闭），
+        # 与规划器建立连接、预热提示词缓存（PLANNER_WARMUP=0 关闭）同时进行
+        window_warmup = None
+        if os.getenv('WARM_START', '1').lower() in ('1', 'true', 'yes'):
+            window_warmup = threading.Thread(target=game_window.warm_up, daemon=True)
+            window_warmup.start()
+        if os.getenv('PLANNER_WARMUP', '1').lower() in ('1', 'true', 'yes'):
+            planner.warm_up()
+        if window_warmup:
+            window_warmup.join()
+        startup.mark("warmup")
+        
+        # 区域分片：按屏幕区域裁剪并发调用模型，只分析变化的区域（PLANNER_SHARDS=1 开启，不支持流式）
+        sharded = None
+        if os.getenv('PLANNER_SHARDS', '0').lower() in ('1', 'true', 'yes'):
+            sharded = ShardedPlanner(planner)
+            game_window.executor.typed_callbacks.append(sharded.record_typed)
+        
+        # 快慢模型级联：快速模型的计划立即输入，强模型在后台确认并纠正队列（PLANNER_CASCADE=1 开启）
+        cascade = None
+        if os.getenv('PLANNER_CASCADE', '0').lower() in ('1', 'true', 'yes'):
+            cascade = CascadePlanner(game_window.executor, strong=planner)
+        
+        # 输入后校验：输入完成后检查单词框是否变化，未生效时立即重新输入（VERIFY_INPUT=1 开启）
+        verifier = None
+        if os.getenv('VERIFY_INPUT', '0').lower() in ('1', 'true', 'yes'):
+            verifier = WordVerifier(game_window.executor, game_window.sample_frame)
+            verifier.start()
+        startup.mark("components")
+        print(f"[启动] {startup.finish()}")
         
         try:
+            # CHEF_RUNNER=async 时使用异步流水线，截图、推理、输入重叠执行
+            if os.getenv('CHEF_RUNNER', 'sync').lower() == 'async':
+                from async_runner import run_async
+                asyncio.run(run_async(game_window, detector, fast_path, stream, state, macros, sharded,
+                                      cascade, planner, verifier))
+                return
+            
+            # 计划代数：新计划会取消旧计划中不再需要的单词
+            generation = 0
+            
             while True:
-                # 获取截图URL
-                image_url = game_window.take_screenshot()
-                if not image_url:
+                # 获取截图帧（内存中编码，不再写盘和上传）
+                frame = game_window.take_screenshot()
+                if not frame:
                     print("获取截图失败")
                     continue
                     
-                print(f"获取截图成功: {image_url}")
+                print(f"获取截图成功: {frame.describe()}")
+                
+                if state:
+                    # 烹饪完成的工位直接在本地取出成品
+                    pickups = state.due_pickups(macros.active_words() if macros else ())
+                    if pickups:
+                        print(f"烹饪完成，取出成品: {pickups}")
+                        game_window.add_input_words(pickups, frame, priorities={word: "cook" for word in pickups})
                 
-                # 创建任务规划器实例
-                planner = GamePlanner()
+                plan = None
+                change = None
+                streamed = False
+                if detector:
+                    change = detector.check(frame)
+                    if not detector.should_analyze(change):
+                        print("画面无变化，跳过分析")
+                        time.sleep(2)
+                        continue
                 
-                # 分析截图
-                inputs = planner.analyze_screenshot(image_url)
-                if not inputs:
-                    print("分析截图失败")
+                if fast_path:
+                    local = fast_path.plan(frame, change.changed_regions if change else None)
+                    if local.inputs:
+                        print(f"本地快速路径输入: {local.inputs}")
+                        if verifier:
+                            verifier.expect([PlanStep(word, priority=local.priorities.get(word))
+                                             for word in local.inputs])
+                        game_window.add_input_words(local.inputs, frame, priorities=local.priorities)
+                    if not local.needs_llm:
+                        time.sleep(2)
+                        continue
+                
+                if macros and change and macros.explains(change.changed_regions):
+                    print("画面变化来自正在执行的菜谱宏，跳过分析")
+                    time.sleep(2)
                     continue
                 
-                # 添加输入到队列
-                print(f"添加输入队列: {inputs}")
-                game_window.add_input_words(inputs)
+                if change:
+                    plan = detector.cache.get(change.key)
+                    if plan is not None:
+                        print("画面与已知状态相同，复用缓存计划")
+                
+                if plan is None and not planner.available:
+                    # 模型接口熔断中：本地快速路径已经执行，本轮不再请求模型
+                    print("模型接口熔断中，仅执行本地操作")
+                    time.sleep(2)
+                    continue
+                
+                generation += 1
+                if plan is None:
+                    # 分析截图，首键延迟从截图时刻开始计算
+                    game_window.mark_plan_start(frame.captured_at)
+                    regions = change.changed_regions if change else None
+                    context, sent = None, None
+                    if state:
+                        context, sent = state.prompt_context(regions)
+                    if sharded:
+                        plan = sharded.analyze_screenshot(frame, context, regions)
+                    elif cascade:
+                        def on_correction(strong, frame=frame, change=change):
+                            # 强模型的计划更准确，覆盖快速计划写入的状态和缓存
+                            if state:
+                                state.update_plan(strong, frame.captured_at)
+                            if change:
+                                detector.cache.put(change.key, strong)
+                        plan = cascade.analyze_screenshot(frame, context, generation, on_correction)
+                    elif stream:
+                        def on_word(word, frame=frame, generation=generation):
+                            if verifier:
+                                verifier.expect([PlanStep(word)])
+                            game_window.add_input_words([word], frame, generation, supersede=False)
+                        plan = planner.analyze_screenshot_stream(frame, on_word, context, regions)
+                        streamed = True
+                        if plan is not None:
+                            # 完整计划已知，再取消旧计划中不再需要的单词
+                            game_window.supersede_input_words(plan.inputs, generation)
+                    else:
+                        plan = planner.analyze_screenshot(frame, context, regions)
+                    print(f"本轮耗时: {format_timings(frame.timings)}")
+                    game_window.preprocessor.report_result(frame.detail, plan is not None and bool(plan.steps))
+                    game_window.archive_plan(frame)
+                    if plan is None:
+                        print("分析截图失败")
+                        continue
+                    if state:
+                        state.commit_context(sent)
+                        state.update_plan(plan, frame.captured_at)
+                    if change:
+                        detector.cache.put(change.key, plan)
+                    if fast_path:
+                        fast_path.remember_plan(plan)
+                    if macros:
+                        plan = planner.execute_plan(plan, macros, frame.captured_at)
+                
+                # 添加输入到队列（流式模式下已逐个加入，宏负责的单词由宏输入）
+                if not streamed:
+                    inputs = [word for word in plan.inputs if not (macros and macros.owns(word))]
+                    print(f"添加输入队列: {inputs}")
+                    if verifier:
+                        verifier.expect([step for step in plan.steps if step.word in inputs])
+                    game_window.add_input_words(inputs, frame, generation, priorities=plan.priorities)
+                if cascade:
+                    # 快速计划已写入，之后强模型的纠正才不会被覆盖
+                    cascade.commit(generation)
+                metrics.observe("tick", time.time() - frame.captured_at, generation=generation)
                 
                 # 等待一段时间再进行下一次截图
                 time.sleep(2)
@@ -47,8 +237,38 @@ def main():
         except KeyboardInterrupt:
             print("\n停止自动操作")
         finally:
-            # 停止键盘输入线程
+            if detector:
+                print(f"[变化检测] {detector.report()}")
+            if fast_path:
+                print(f"[本地快速路径] {fast_path.report()}")
+            if state:
+                print(f"[游戏状态] {state.report()}")
+                state.save()
+            if macros:
+                macros.stop()
+            if verifier:
+                print(f"[输入校验] {verifier.report()}")
+                verifier.stop()
+            if sharded:
+                print(f"[分片] {sharded.report()}")
+                sharded.close()
+            if cascade:
+                print(f"[级联] {cascade.report()}")
+                cascade.close()
+            if game_window.preprocessor.config.detail == "adaptive":
+                print(f"[预处理] {game_window.preprocessor.report()}")
+            for caller in callers():
+                print(f"[请求] {caller.report()}")
+            print(f"[连接] {tracker.report()}")
+            print(f"[提示词] {planner.prompts.report()}")
+            print(f"[首键延迟] {game_window.first_keystroke_report()}")
+            print(f"[窗口] {game_window.windows.report()}")
+            print(f"[指标] {metrics.report()}")
+            metrics.close()
+            # 停止键盘输入线程、后台采集线程和截图归档
             game_window.stop_keyboard_thread()
+            game_window.stop_capture_thread()
+            game_window.stop_archive()
             
     except Exception as e:
         print(f"发生错误: {e}")
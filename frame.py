@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+内存帧模块
+主要功能：
+1. 在内存中编码截图（PNG/JPEG/WebP）
+2. 生成 base64 data URL 直接发送给规划器
+3. 记录各阶段耗时
+"""
+
+import base64
+import io
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image
+
+# 支持的编码格式：名称 -> (PIL 格式, MIME 类型)
+IMAGE_FORMATS: Dict[str, Tuple[str, str]] = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "jpg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+@dataclass
+class Frame:
+    """
+    一帧游戏截图
+
+    截图只在内存中编码一次，之后可以直接转换为 data URL 发送给模型，
+    不再需要写磁盘和上传 imgur。
+    """
+
+    data: bytes  # 编码后的图片数据
+    mime_type: str  # MIME 类型，如 image/png
+    width: int  # 发送给模型的图像尺寸（预处理后）
+    height: int  # 发送给模型的图像尺寸（预处理后）
+    captured_at: float = field(default_factory=time.time)  # 截图时间戳
+    image: Optional[Image.Image] = None  # 原始图像（未编码）
+    pixels: Optional[Any] = None  # 后台采集环形缓冲中的只读 RGB 视图（np.ndarray，无拷贝）
+    url: Optional[str] = None  # imgur 回退模式下的公网 URL
+    timings: Dict[str, float] = field(default_factory=dict)  # 各阶段耗时（秒）
+    plan: Optional[Dict[str, Any]] = None  # 模型针对该帧返回的完整计划
+    steps: List[Dict[str, Any]] = field(default_factory=list)  # 已解析出的步骤（流式时逐个追加）
+    detail: str = "auto"  # 发送给模型时的图像细节级别 auto / low / high
+    tokens: int = 0  # 该帧的模型请求消耗的 token（输入 + 输出）
+    archive_id: Optional[int] = None  # 截图归档中的帧编号（未归档时为 None）
+
+    def get_image(self) -> Image.Image:
+        """
+        获取未编码的图像，必要时从编码数据解码
+
+        Returns:
+            Image.Image: 帧图像
+        """
+        if self.image is None:
+            self.image = Image.open(io.BytesIO(self.data))
+            self.image.load()
+        return self.image
+
+    def to_data_url(self) -> str:
+        """
+        转换为 base64 data URL
+
+        Returns:
+            str: data:<mime>;base64,<data>
+        """
+        encoded = base64.b64encode(self.data).decode("ascii")
+        return f"data:{self.mime_type};base64,{encoded}"
+
+    def image_url(self) -> str:
+        """
+        获取发送给模型的图片地址
+
+        Returns:
+            str: 如果已上传到 imgur 则返回公网 URL，否则返回 data URL
+        """
+        return self.url or self.to_data_url()
+
+    def describe(self) -> str:
+        """
+        生成便于日志输出的简短描述
+
+        Returns:
+            str: 帧的简短描述
+        """
+        source = self.url or f"inline {self.mime_type}"
+        detail = "" if self.detail == "auto" else f", detail={self.detail}"
+        return f"{source} ({self.width}x{self.height}, {len(self.data) / 1024:.1f} KB{detail})"
+
+
+def encode_image(image: Image.Image, image_format: str = "png",
+                 quality: int = 85) -> Tuple[bytes, str]:
+    """
+    在内存中编码图像
+
+    Args:
+        image (Image.Image): 要编码的图像
+        image_format (str): 编码格式，png/jpeg/webp
+        quality (int): JPEG/WebP 质量（1-100），PNG 忽略
+
+    Returns:
+        Tuple[bytes, str]: (编码后的数据, MIME 类型)
+    """
+    key = image_format.lower()
+    if key not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的图片格式: {image_format}")
+    pil_format, mime_type = IMAGE_FORMATS[key]
+
+    buffer = io.BytesIO()
+    if pil_format == "PNG":
+        image.save(buffer, format=pil_format, optimize=False)
+    else:
+        # JPEG 不支持透明通道
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(buffer, format=pil_format, quality=quality)
+    return buffer.getvalue(), mime_type
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    """
+    格式化各阶段耗时
+
+    Args:
+        timings (Dict[str, float]): 阶段名 -> 耗时（秒）
+
+    Returns:
+        str: 形如 "capture=35ms encode=12ms total=47ms"
+    """
+    parts = [f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items()]
+    parts.append(f"total={sum(timings.values()) * 1000:.0f}ms")
+    return " ".join(parts)
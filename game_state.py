@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+跨帧持久的游戏状态
+主要功能：
+1. 合并每次计划中的 words、order、cash、mouse 字段，以及键盘执行器实际输入过的单词
+2. 跟踪烤炉、油锅、面锅的烹饪计时，到时后在本地给出取出成品的单词；跟踪咖啡库存（0/1/2）
+3. 生成相对上一次请求的精简状态增量（加上变化区域），随截图一起发送给规划器
+4. 状态可查看、可序列化为 JSON，便于回放
+"""
+
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from plan import Plan, PlanStep
+
+# 各工位的烹饪时长（秒），按实际游戏节奏调整
+COOK_SECONDS: Dict[str, float] = {
+    "pizza": 8.0,
+    "fryer": 6.0,
+    "noodles": 6.0,
+}
+
+# 开始烹饪的动作中的关键词 -> 工位（把食材放入烤炉、锅、油锅）
+COOKER_ACTIONS: Dict[str, tuple] = {
+    "pizza": ("烘烤", "烤炉", "烤箱"),
+    "fryer": ("油锅",),
+    "noodles": ("煮面", "面锅", "下锅"),
+}
+
+# 放食材的动作
+INGREDIENT_KEYWORDS = ("食材", "原料", "配料")
+
+# 菜名 -> 工位，用于判断食材步骤或“开始烹饪xx”属于哪个工位
+DISH_KEYWORDS: Dict[str, tuple] = {
+    "pizza": ("披萨",),
+    "noodles": ("面",),
+    "fryer": ("炸", "薯条", "鸡"),
+}
+
+# 咖啡机旁的库存上限
+COFFEE_CAPACITY = 2
+
+# 这些动作表示把成品取出，而不是开始烹饪
+PICKUP_KEYWORDS = ("取", "放入成品")
+
+
+@dataclass
+class WordState:
+    """屏幕上出现过的一个单词"""
+
+    word: str
+    area: str = "other"
+    priority: Optional[str] = None
+    first_seen: float = 0.0  # 第一次出现在计划中的时间（time.time）
+    last_seen: float = 0.0  # 最近一次出现在计划中的时间
+    typed_at: Optional[float] = None  # 最近一次实际输入的时间
+    typed_count: int = 0
+
+
+@dataclass
+class CookTimer:
+    """一个正在烹饪的工位"""
+
+    word: str  # 开始烹饪时输入的工位单词，烹饪完成后再次输入即可取出
+    station: str
+    started_at: float
+    duration: float
+    requested: bool = False  # 是否已在本地加入取出成品的输入
+
+    @property
+    def remaining(self) -> float:
+        """剩余时间（秒），小于等于 0 表示已完成"""
+        return self.started_at + self.duration - time.time()
+
+    @property
+    def ready(self) -> bool:
+        return self.remaining <= 0
+
+
+def _dish_station(action: str) -> Optional[str]:
+    """按动作中的菜名判断工位，只用于已确定为食材或开始烹饪的步骤"""
+    for station, keywords in DISH_KEYWORDS.items():
+        if any(keyword in action for keyword in keywords):
+            return station
+    return None
+
+
+def cooker_stations(steps: Sequence[PlanStep]) -> Dict[str, str]:
+    """
+    找出计划中开始烹饪的工位单词（烤炉、锅、油锅）
+
+    工位单词是动作明确为放入烤炉/锅/油锅的步骤，或紧跟在某个工位的食材步骤之后的那一步。
+    食材步骤的动作同样带菜名（如“放面条食材”），因此不能按菜名判断一个步骤是不是工位单词。
+    只有详细模式的步骤带动作描述；快速模式下无法区分食材和工位，返回空。
+
+    Args:
+        steps (Sequence[PlanStep]): 计划步骤（按顺序）
+
+    Returns:
+        Dict[str, str]: 工位单词 -> 工位名，见 COOK_SECONDS
+    """
+    cookers: Dict[str, str] = {}
+    pending: Optional[str] = None  # 紧邻的前面若干食材步骤所属的工位，"" 表示工位未知
+    for step in steps:
+        if step.area != "food_station" or not step.action:
+            continue
+        action = step.action
+        if any(keyword in action for keyword in PICKUP_KEYWORDS):
+            pending = None
+            continue
+        if any(keyword in action for keyword in INGREDIENT_KEYWORDS):
+            pending = _dish_station(action) or pending or ""
+            continue
+        station = next((name for name, keywords in COOKER_ACTIONS.items()
+                        if any(keyword in action for keyword in keywords)), None)
+        if station is None and (pending is not None or "开始烹饪" in action):
+            station = pending or _dish_station(action)
+        if station:
+            cookers[step.word] = station
+        pending = None
+    return cookers
+
+
+class GameStateTracker:
+    """
+    跨帧持久的游戏状态
+
+    计划更新在主循环中进行，输入记录来自键盘线程，所有修改都持有同一把锁。
+    """
+
+    def __init__(self, word_ttl: float = 10.0, history_size: int = 50):
+        """
+        初始化状态
+
+        Args:
+            word_ttl (float): 单词连续多久未出现在计划中即视为已消失（秒）
+            history_size (int): 保留的最近输入记录条数
+        """
+        self.word_ttl = word_ttl
+        self.history_size = history_size
+        self.words: Dict[str, WordState] = {}
+        self.timers: Dict[str, CookTimer] = {}
+        self.order: Optional[str] = None
+        self.cash: Optional[str] = None
+        self.mouse = False
+        self.coffee_stock: Optional[int] = None  # 未知时为 None
+        self.typed: List[Dict[str, Any]] = []  # 最近实际输入的单词 [{"word", "at"}]
+        self.dishes = 0  # 从工位取出的成品数
+        self.version = 0
+        self.plans = 0
+
+        self._steps: Dict[str, PlanStep] = {}  # 最近计划中的步骤，用于判断输入的含义
+        self._cookers: Dict[str, str] = {}  # 最近计划中开始烹饪的工位单词 -> 工位
+        self._sent: Dict[str, Any] = {}  # 上一次发送给规划器的状态
+        self._lock = threading.RLock()
+
+        # 统计
+        self.context_requests = 0
+        self.context_chars = 0
+        self.local_pickups = 0
+
+    def update_plan(self, plan: Plan, frame_ts: Optional[float] = None) -> None:
+        """
+        合并一次计划
+
+        Args:
+            plan (Plan): 规划器返回的计划
+            frame_ts (Optional[float]): 产生计划的截图时间
+        """
+        now = frame_ts or time.time()
+        with self._lock:
+            self.plans += 1
+            seen = {}
+            for item in plan.raw.get("words", []):
+                if isinstance(item, dict) and item.get("text"):
+                    seen[item["text"]] = (item.get("area") or "other", None)
+            for step in plan.steps:
+                seen[step.word] = (step.area, step.priority)
+                self._steps[step.word] = step
+            self._cookers.update(cooker_stations(plan.steps))
+
+            for word, (area, priority) in seen.items():
+                state = self.words.get(word)
+                if state is None:
+                    state = self.words[word] = WordState(word=word, first_seen=now)
+                state.area = area
+                state.priority = priority or state.priority
+                state.last_seen = now
+
+            # 长时间未出现的单词已从屏幕上消失
+            for word in [w for w, s in self.words.items() if now - s.last_seen > self.word_ttl]:
+                del self.words[word]
+                self._steps.pop(word, None)
+                self._cookers.pop(word, None)
+
+            self.order = plan.raw.get("order", self.order)
+            self.cash = plan.raw.get("cash", self.cash)
+            self.mouse = plan.mouse
+            self.version += 1
+
+    def record_typed(self, word: str) -> None:
+        """
+        记录键盘执行器实际输入的单词（键盘线程回调）
+
+        工位单词第一次输入开始计时，计时中再次输入视为取出成品。
+
+        Args:
+            word (str): 已输入的单词
+        """
+        now = time.time()
+        with self._lock:
+            self.typed.append({"word": word, "at": now})
+            del self.typed[:-self.history_size]
+            state = self.words.get(word)
+            if state:
+                state.typed_at = now
+                state.typed_count += 1
+
+            timer = self.timers.pop(word, None)
+            if timer is not None:
+                self.dishes += 1
+            else:
+                step = self._steps.get(word)
+                station = self._cookers.get(word)
+                if station:
+                    self.timers[word] = CookTimer(word=word, station=station, started_at=now,
+                                                  duration=COOK_SECONDS[station])
+                elif step and step.area == "coffee_machine" and step.action:
+                    # 咖啡机单词制作一杯，咖啡种类单词取走一杯
+                    stock = self.coffee_stock or 0
+                    if any(keyword in step.action for keyword in PICKUP_KEYWORDS):
+                        self.coffee_stock = max(0, stock - 1)
+                    else:
+                        self.coffee_stock = min(COFFEE_CAPACITY, stock + 1)
+            if word == self.cash:
+                self.cash = None
+            if state and state.area == "mouse":
+                self.mouse = False
+            self.version += 1
+
+    def due_pickups(self, exclude: Iterable[str] = ()) -> List[str]:
+        """
+        已完成烹饪、尚未安排取出的工位单词
+
+        返回后即标记为已安排，不会重复返回。
+
+        Args:
+            exclude (Iterable[str]): 由其他组件（如菜谱宏）负责取出的单词
+
+        Returns:
+            List[str]: 需要再次输入的工位单词
+        """
+        with self._lock:
+            exclude = set(exclude)
+            due = [timer for timer in self.timers.values()
+                   if timer.ready and not timer.requested and timer.word not in exclude]
+            for timer in due:
+                timer.requested = True
+            self.local_pickups += len(due)
+            return [timer.word for timer in due]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        精简的状态快照（发送给模型的内容）
+
+        Returns:
+            Dict[str, Any]: 订单、收银词、老鼠、咖啡库存、烹饪中的工位、上一次请求以来输入的单词
+        """
+        with self._lock:
+            since = self._sent.get("_at", 0.0)
+            return {
+                "order": self.order,
+                "cash": self.cash,
+                "mouse": self.mouse,
+                "coffee": self.coffee_stock,
+                "cooking": {t.word: f"{t.station}:{max(0, round(t.remaining))}s" for t in self.timers.values()},
+                "typed": [entry["word"] for entry in self.typed if entry["at"] > since],
+            }
+
+    def prompt_context(self, changed_regions: Optional[Sequence[str]] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        生成相对上一次成功请求的状态增量，附加到规划请求中
+
+        增量在请求返回计划后才算已发送（commit_context）；请求失败、超时或被熔断拒绝时，
+        下一次请求仍会带上这些增量。
+
+        Args:
+            changed_regions (Optional[Sequence[str]]): 变化检测给出的变化区域
+
+        Returns:
+            Tuple[str, Dict[str, Any]]: 紧凑 JSON（只包含变化的字段，没有任何变化时为空字符串），
+                以及本次发送的状态，请求成功后传给 commit_context
+        """
+        with self._lock:
+            current = self.snapshot()
+            # 第一次发送时省略空字段；之后只发送变化的字段（包括变为空的字段）
+            delta = {key: value for key, value in current.items()
+                     if value != self._sent.get(key)
+                     and (key in self._sent or value not in (None, [], {}) and value is not False)}
+            if not current["typed"]:
+                delta.pop("typed", None)
+            if changed_regions:
+                delta["changed"] = list(changed_regions)
+            sent = dict(current, _at=time.time())
+            if not delta:
+                return "", sent
+            context = json.dumps(delta, ensure_ascii=False, separators=(",", ":"))
+            self.context_requests += 1
+            self.context_chars += len(context)
+            return context, sent
+
+    def commit_context(self, sent: Dict[str, Any]) -> None:
+        """
+        请求返回计划后调用，把 prompt_context 生成的状态记为已发送
+
+        并发请求乱序返回时，不会用较早的状态覆盖较新的状态。
+
+        Args:
+            sent (Dict[str, Any]): prompt_context 返回的状态
+        """
+        with self._lock:
+            if sent["_at"] > self._sent.get("_at", 0.0):
+                self._sent = sent
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        完整状态，可序列化为 JSON
+
+        Returns:
+            Dict[str, Any]: 全部单词、计时器、订单等
+        """
+        with self._lock:
+            return {
+                "version": self.version,
+                "plans": self.plans,
+                "order": self.order,
+                "cash": self.cash,
+                "mouse": self.mouse,
+                "coffee_stock": self.coffee_stock,
+                "dishes": self.dishes,
+                "words": {word: asdict(state) for word, state in self.words.items()},
+                "timers": {word: asdict(timer) for word, timer in self.timers.items()},
+                "typed": list(self.typed),
+            }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GameStateTracker":
+        """
+        从 to_dict 的结果恢复状态
+
+        Args:
+            data (Dict[str, Any]): 状态字典
+
+        Returns:
+            GameStateTracker: 状态
+        """
+        tracker = cls()
+        tracker.version = data.get("version", 0)
+        tracker.plans = data.get("plans", 0)
+        tracker.order = data.get("order")
+        tracker.cash = data.get("cash")
+        tracker.mouse = data.get("mouse", False)
+        tracker.coffee_stock = data.get("coffee_stock")
+        tracker.dishes = data.get("dishes", 0)
+        tracker.words = {word: WordState(**state) for word, state in data.get("words", {}).items()}
+        tracker.timers = {word: CookTimer(**timer) for word, timer in data.get("timers", {}).items()}
+        tracker.typed = list(data.get("typed", []))
+        return tracker
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        保存状态到 JSON 文件
+
+        Args:
+            path (Optional[str]): 文件路径，默认读取 GAME_STATE_FILE，未设置时不保存
+        """
+        path = path or os.getenv('GAME_STATE_FILE')
+        if path:
+            Path(path).write_text(json.dumps(self.to_dict(), ensure_ascii=False, indent=2),
+                                  encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str) -> "GameStateTracker":
+        """
+        从 JSON 文件加载状态
+
+        Args:
+            path (str): 文件路径
+
+        Returns:
+            GameStateTracker: 状态
+        """
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 计划数、跟踪的单词与工位、本地取出次数、状态增量大小
+        """
+        average = self.context_chars / self.context_requests if self.context_requests else 0.0
+        return (
+            f"计划 {self.plans}, 单词 {len(self.words)}, 烹饪中 {len(self.timers)}, "
+            f"成品 {self.dishes}, 本地取出 {self.local_pickups}, "
+            f"状态增量 {self.context_requests} 次 (平均 {average:.0f} 字符)"
+        )
@@ -2,23 +2,51 @@
 """
 游戏窗口控制器
 主要功能：
-1. 获取和控制游戏窗口
-2. 截图功能
-3. 上传图片到 imgur
+1. 获取和控制游戏窗口（句柄和几何信息缓存，窗口关闭、移动、缩放时失效）
+2. 截图功能（内存编码，直接以 data URL 发送）
+3. 上传图片到 imgur（可选回退）
 4. 键盘输入控制
+5. 启动预热：pyautogui、pywinctl、imgur 客户端都推迟到首次使用，warm_up 可提前完成首帧的一次性开销
 """
 
+import io
 import os
-import queue
-import threading
 import time
-from pathlib import Path
-from typing import Optional, Tuple, Set
+from typing import Any, Callable, Dict, Optional, Tuple
 
-import pyautogui
-import pywinctl as pwc
+import numpy as np
 from dotenv import load_dotenv
-from imgurpython import ImgurClient
+from PIL import Image
+
+from archive import ArchiveWriter
+from capture import CaptureThread, RingFrame, create_backend
+from frame import Frame, encode_image, format_timings
+from keyboard_executor import KeyboardExecutor, load_pyautogui, pyautogui_write
+from metrics import metrics
+from preprocess import PreprocessConfig, Preprocessor
+from window_cache import WindowCache
+
+
+# 可插拔的画面来源：返回一帧窗口图像，无画面时返回 None
+FrameSource = Callable[[], Optional[Image.Image]]
+
+
+class HeadlessWindow:
+    """
+    无界面运行时的窗口替身
+    
+    回放基准、模拟器等使用自定义画面来源时，不存在真实窗口，
+    由它提供 get_window() 所需的属性和方法。
+    """
+    
+    def __init__(self, title: str, width: int = 0, height: int = 0):
+        self.title = title
+        self.topleft = (0, 0)
+        self.size = (width, height)
+        self.isActive = True
+    
+    def activate(self) -> None:
+        """无界面时无需激活"""
 
 
 class GameWindow:
@@ -28,225 +56,389 @@ class GameWindow:
     负责管理游戏窗口的各种操作，包括：
     - 窗口查找和控制
     - 截图功能
-    - 图片上传
+    - 图片上传（可选）
     - 键盘输入
     """
     
-    def __init__(self, window_title: str = "The Chef's Shift"):
+    def __init__(self, window_title: str = "The Chef's Shift",
+                 image_format: Optional[str] = None,
+                 image_quality: Optional[int] = None,
+                 use_imgur: Optional[bool] = None,
+                 save_screenshots: Optional[bool] = None,
+                 capture_backend: Optional[str] = None,
+                 capture_fps: Optional[float] = None,
+                 frame_source: Optional[FrameSource] = None,
+                 keyboard_writer: Optional[Callable[[str, float], None]] = None,
+                 preprocess: Optional[PreprocessConfig] = None,
+                 probe_source: Optional[FrameSource] = None,
+                 archive_dir: Optional[str] = None):
         """
         初始化游戏窗口控制器
         
         Args:
             window_title (str): 要控制的窗口标题
+            image_format (Optional[str]): 截图编码格式 png/jpeg/webp，默认读取 FRAME_FORMAT
+            image_quality (Optional[int]): JPEG/WebP 质量，默认读取 FRAME_QUALITY
+            use_imgur (Optional[bool]): 是否上传到 imgur（回退模式），默认读取 USE_IMGUR
+            save_screenshots (Optional[bool]): 是否把截图写入截图归档，默认读取 SAVE_SCREENSHOTS
+            capture_backend (Optional[str]): 采集后端 auto/mss/pyautogui，默认读取 CAPTURE_BACKEND
+            capture_fps (Optional[float]): 后台采集帧率，0 表示不启用后台采集，默认读取 CAPTURE_FPS
+            frame_source (Optional[FrameSource]): 自定义画面来源（回放、模拟器），设置后不查找真实窗口
+            keyboard_writer (Optional[Callable[[str, float], None]]): 自定义按键输出，默认使用 pyautogui
+            preprocess (Optional[PreprocessConfig]): 发送前的裁剪、缩放、减色配置，默认读取 FRAME_* 环境变量
+            probe_source (Optional[FrameSource]): 无副作用的画面来源（如模拟器），供输入校验读取当前画面
+            archive_dir (Optional[str]): 截图归档目录，默认读取 ARCHIVE_DIR
         """
         # 加载环境变量
         load_dotenv()
         
-        # 获取 imgur 客户端配置
-        self.imgur_client_id = os.getenv('IMGUR_CLIENT_ID')
-        self.imgur_client_secret = os.getenv('IMGUR_CLIENT_SECRET')
-        
-        if not self.imgur_client_id or not self.imgur_client_secret:
-            raise ValueError("请在 .env 文件中设置 IMGUR_CLIENT_ID 和 IMGUR_CLIENT_SECRET")
+        # 截图编码配置
+        self.image_format = image_format or os.getenv('FRAME_FORMAT', 'png')
+        self.image_quality = image_quality or int(os.getenv('FRAME_QUALITY', '85'))
+        self.preprocessor = Preprocessor(preprocess)
         
-        # 初始化 imgur 客户端
-        self.imgur_client = ImgurClient(self.imgur_client_id, self.imgur_client_secret)
+        # imgur 仅作为可选回退
+        if use_imgur is None:
+            use_imgur = os.getenv('USE_IMGUR', '0').lower() in ('1', 'true', 'yes')
+        self.use_imgur = use_imgur
+        self._imgur_client = None
+        if self.use_imgur:
+            # 获取 imgur 客户端配置，客户端在第一次上传时才创建
+            self.imgur_client_id = os.getenv('IMGUR_CLIENT_ID')
+            self.imgur_client_secret = os.getenv('IMGUR_CLIENT_SECRET')
+            
+            if not self.imgur_client_id or not self.imgur_client_secret:
+                raise ValueError("请在 .env 文件中设置 IMGUR_CLIENT_ID 和 IMGUR_CLIENT_SECRET")
         
-        # 游戏窗口属性
+        # 游戏窗口属性：真实窗口的句柄和几何信息由 WindowCache 缓存，关闭、移动、缩放时失效
         self.window_title = window_title
-        self.game_window: Optional[pwc.Window] = None
+        self.game_window: Optional[HeadlessWindow] = None
+        self.windows = WindowCache(window_title)
         
-        # 创建 screenshots 目录
-        self.screenshot_dir = Path("screenshots")
-        self.screenshot_dir.mkdir(exist_ok=True)
+        # 截图默认只保存在内存中，调试时由后台线程写入截图归档（见 archive.py），不阻塞截图
+        if save_screenshots is None:
+            save_screenshots = os.getenv('SAVE_SCREENSHOTS', '0').lower() in ('1', 'true', 'yes')
+        self.save_screenshots = save_screenshots
+        self.archive: Optional[ArchiveWriter] = None
+        if self.save_screenshots:
+            self.archive = ArchiveWriter(archive_dir)
+            self.archive.start()
         
-        # 配置 pyautogui
-        pyautogui.FAILSAFE = False
+        # 后台采集：持续把窗口画面写入环形缓冲，截图时直接读取最新一帧
+        self.capture_backend = capture_backend or os.getenv('CAPTURE_BACKEND', 'auto')
+        if capture_fps is None:
+            capture_fps = float(os.getenv('CAPTURE_FPS', '10'))
+        self.capture_fps = capture_fps
+        self.capture_thread: Optional[CaptureThread] = None
         
-        # 键盘输入相关
-        self.input_queue = queue.Queue()  # 输入队列
-        self.current_queue_words: Set[str] = set()  # 当前队列中的单词集合
-        self.keyboard_thread = None  # 键盘输入线程
-        self.is_typing = False  # 键盘输入状态
-        self.typing_interval = 0.05  # 字母间隔时间（秒）
+        # 自定义画面来源：使用窗口替身，并且不启用后台采集
+        self.frame_source = frame_source
+        self.probe_source = probe_source
+        if frame_source:
+            self.game_window = HeadlessWindow(window_title)
+            self.capture_fps = 0
+        
+        # 键盘输入由独立的执行器负责（pyautogui 在第一次按键或预热时才导入）
+        self.keyboard_writer = keyboard_writer or pyautogui_write
+        self.executor = KeyboardExecutor(self.get_window, writer=self.keyboard_writer)
+
+    @property
+    def typed_word_count(self) -> int:
+        """已完成输入的单词数"""
+        return self.executor.typed_word_count
 
     def start_keyboard_thread(self) -> None:
         """
         启动键盘输入线程
         """
-        if self.keyboard_thread and self.keyboard_thread.is_alive():
-            return
-            
-        self.is_typing = True
-        self.keyboard_thread = threading.Thread(target=self._keyboard_worker, daemon=True)
-        self.keyboard_thread.start()
-        print("键盘输入线程已启动")
+        self.executor.start()
 
     def stop_keyboard_thread(self) -> None:
         """
         停止键盘输入线程
         """
-        self.is_typing = False
-        if self.keyboard_thread:
-            self.keyboard_thread.join()
-            print("键盘输入线程已停止")
+        self.executor.stop()
 
-    def _keyboard_worker(self) -> None:
+    def start_capture_thread(self) -> None:
         """
-        键盘输入工作线程
-        负责从队列中获取单词并模拟键盘输入
+        启动后台采集线程（CAPTURE_FPS 为 0 时不启动）
         """
-        while self.is_typing:
-            try:
-                # 非阻塞方式获取队列数据
-                word = self.input_queue.get_nowait()
-                
-                # 确保窗口处于激活状态
-                window = self.get_window()
-                if window:
-                    window.activate()
-                    time.sleep(0.1)  # 等待窗口激活
-                    
-                    # 逐字母输入
-                    for letter in word:
-                        if not self.is_typing:
-                            break
-                        pyautogui.write(letter)
-                        time.sleep(self.typing_interval)
-                    
-                # 从当前队列单词集合中移除
-                self.current_queue_words.remove(word)
-                self.input_queue.task_done()
-                print(f"完成输入单词: {word}")
-                
-            except queue.Empty:
-                # 队列为空时短暂休眠
-                time.sleep(0.1)
-                continue
-            except Exception as e:
-                print(f"键盘输入错误: {e}")
-                continue
+        if self.capture_fps <= 0:
+            return
+        if not self.capture_thread:
+            self.capture_thread = CaptureThread(
+                create_backend(self.capture_backend), self.get_window_geometry, self.capture_fps)
+        self.capture_thread.start()
 
-    def add_input_words(self, words: list[str]) -> None:
+    def warm_up(self) -> Dict[str, float]:
         """
-        添加输入单词到队列
+        预热首次截图到首次按键的路径
+        
+        提前导入 pyautogui、查找窗口并读取几何信息，再对一帧完成预处理和编码，
+        第一帧不再承担这些一次性开销。不消耗画面来源中的帧，也不写入截图归档。
+        
+        Returns:
+            Dict[str, float]: 各步骤耗时（秒）：input、window、encode
+        """
+        timings = {}
+        start = time.perf_counter()
+        sync_capture = not self.frame_source and self.capture_fps <= 0
+        if self.keyboard_writer is pyautogui_write or sync_capture:
+            load_pyautogui()
+        timings["input"] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        geometry = self.get_window_geometry()
+        timings["window"] = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        latest = self.latest_frame()
+        if latest:
+            image = Image.fromarray(latest.pixels)
+        elif sync_capture and geometry:
+            image = load_pyautogui().screenshot(region=geometry)
+        else:
+            width, height = geometry[2:] if geometry and geometry[2] and geometry[3] else (1280, 720)
+            image = Image.new("RGB", (width, height))
+        if self.preprocessor.config.enabled:
+            image = self.preprocessor.process(image)
+        encode_image(image, self.image_format, self.image_quality)
+        timings["encode"] = time.perf_counter() - start
+        
+        print(f"窗口预热完成: {format_timings(timings)}")
+        return timings
+
+    def stop_capture_thread(self) -> None:
+        """
+        停止后台采集线程
+        """
+        if self.capture_thread:
+            self.capture_thread.stop()
+
+    def archive_plan(self, frame: Frame) -> None:
+        """
+        把模型针对该帧返回的计划和各阶段耗时写入截图归档（未启用时忽略）
         
         Args:
-            words (list[str]): 要输入的单词列表
+            frame (Frame): 已完成规划的截图帧
         """
-        for word in words:
-            # 只对当前队列中的单词进行去重
-            if word not in self.current_queue_words:
-                self.current_queue_words.add(word)
-                self.input_queue.put(word)
-                print(f"添加单词到输入队列: {word}")
+        if self.archive:
+            self.archive.submit_plan(frame)
 
-    def clear_input_queue(self) -> None:
+    def stop_archive(self) -> None:
         """
-        清空输入队列和当前队列单词集合
+        写完剩余截图后停止截图归档
         """
-        while not self.input_queue.empty():
-            try:
-                self.input_queue.get_nowait()
-                self.input_queue.task_done()
-            except queue.Empty:
-                break
-        self.current_queue_words.clear()
-        print("输入队列已清空")
+        if self.archive:
+            self.archive.stop()
+            print(f"[截图归档] {self.archive.report()}")
+            self.archive = None
 
-    def get_window(self) -> Optional[pwc.Window]:
+    def latest_frame(self) -> Optional[RingFrame]:
         """
-        获取游戏窗口
+        获取后台采集的最新一帧（只读视图，不拷贝像素）
         
         Returns:
-            Optional[pwc.Window]: 窗口对象，如果未找到则返回 None
+            Optional[RingFrame]: 最新一帧，未启用后台采集时返回 None
         """
-        try:
-            if self.game_window:
-                return self.game_window
-
-            # 获取所有窗口
-            titles = pwc.getAllTitles()
-            
-            # 查找游戏窗口
-            for title in titles:
-                if self.window_title == title:
-                    print(f"找到游戏窗口: {title}")
-                    windows = pwc.getWindowsWithTitle(title)
-                    if windows:
-                        self.game_window = windows[0]
-                        return self.game_window
-            
-            print(f"未找到标题包含 '{self.window_title}' 的窗口")
-            print("当前可用窗口:")
-            for title in titles:
-                print(f"- {title}")
+        if not self.capture_thread or not self.capture_thread.running:
             return None
+        return self.capture_thread.latest()
+
+    def sample_frame(self) -> Optional[Tuple[float, np.ndarray]]:
+        """
+        读取当前画面，供输入校验使用（不编码、不触发截图）
+        
+        Returns:
+            Optional[Tuple[float, np.ndarray]]: (采集时间, RGB 像素)，没有可用画面时返回 None
+        """
+        if self.probe_source:
+            image = self.probe_source()
+            return (time.time(), np.asarray(image.convert("RGB"))) if image else None
+        latest = self.latest_frame()
+        return (latest.captured_at, latest.pixels) if latest else None
+
+    def mark_plan_start(self, started_at: Optional[float] = None) -> None:
+        """
+        标记一次规划的开始时间，用于统计首键延迟
+        
+        Args:
+            started_at (Optional[float]): 开始时间（time.time），默认为当前时间
+        """
+        self.executor.mark_plan_start(started_at)
+
+    def first_keystroke_report(self) -> str:
+        """
+        生成首键延迟统计
+        
+        Returns:
+            str: 首键延迟的次数、平均值和中位数
+        """
+        return self.executor.first_keystroke_report()
+
+    def add_input_words(self, words: list[str], frame: Optional[Frame] = None,
+                        generation: Optional[int] = None,
+                        priorities: Optional[Dict[str, str]] = None,
+                        supersede: bool = True) -> int:
+        """
+        添加输入单词到调度器
+        
+        Args:
+            words (list[str]): 要输入的单词列表
+            frame (Optional[Frame]): 产生这些单词的截图帧，用于判断优先级和过期
+            generation (Optional[int]): 计划代数，新计划会取消旧计划中不再需要的单词
+            priorities (Optional[Dict[str, str]]): 显式指定的优先级类别
+            supersede (bool): 是否立即取消旧计划的单词；流式规划逐个添加单词时为 False，
+                完整计划返回后调用 supersede_input_words
             
-        except Exception as e:
-            print(f"获取窗口失败: {e}")
-            return None
+        Returns:
+            int: 实际加入队列的单词数
+        """
+        return self.executor.add_words(words, frame, generation, priorities, supersede)
+
+    def supersede_input_words(self, words: list[str], generation: int) -> None:
+        """
+        流式计划完整返回后，取消旧计划中不在该计划里的单词
+
+        Args:
+            words (list[str]): 完整计划中的单词
+            generation (int): 计划代数
+        """
+        self.executor.supersede_words(words, generation)
+
+    def clear_input_queue(self) -> None:
+        """
+        清空输入调度器
+        """
+        self.executor.clear()
+
+    def get_window(self) -> Optional[Any]:
+        """
+        获取游戏窗口（缓存的句柄，窗口关闭后自动重新查找）
+        
+        Returns:
+            Optional[Any]: 窗口对象（pywinctl.Window 或无界面替身），如果未找到则返回 None
+        """
+        if self.game_window:
+            return self.game_window
+        return self.windows.get()
 
     def get_window_geometry(self) -> Optional[Tuple[int, int, int, int]]:
         """
-        获取窗口的几何信息
+        获取窗口的几何信息（缓存到窗口移动或缩放）
         
         Returns:
             Optional[Tuple[int, int, int, int]]: (left, top, width, height) 或 None
         """
-        window = self.get_window()
-        if not window:
-            return None
-            
-        left, top = window.topleft
-        width, height = window.size
-        
-        return (int(left), int(top), int(width), int(height))
+        if self.game_window:
+            left, top = self.game_window.topleft
+            width, height = self.game_window.size
+            return (int(left), int(top), int(width), int(height))
+        return self.windows.geometry()
 
-    def capture_window(self) -> Optional[str]:
+    def capture_window(self) -> Optional[Frame]:
         """
-        截取窗口图像并保存
+        截取窗口图像并在内存中编码
         
         Returns:
-            Optional[str]: 截图文件路径，如果失败则返回 None
+            Optional[Frame]: 截图帧，如果失败则返回 None
         """
         try:
-            geometry = self.get_window_geometry()
-            if not geometry:
-                return None
+            start = time.perf_counter()
+            
+            # 优先使用后台采集的最新一帧，跳过同步截图
+            latest = self.latest_frame()
+            pixels = None
+            source = "screenshot"
+            if self.frame_source:
+                source = "replay"
+                captured_at = time.time()
+                screenshot = self.frame_source()
+                if screenshot is None:
+                    return None
+                self.game_window.size = screenshot.size
+            elif latest and time.time() - latest.captured_at <= 2.0 / self.capture_fps:
+                source = "ring"
+                captured_at = latest.captured_at
+                pixels = latest.pixels
+                screenshot = Image.fromarray(pixels)
+            else:
+                geometry = self.get_window_geometry()
+                if not geometry:
+                    return None
+                    
+                left, top, width, height = geometry
+                region = (left, top, width, height)
                 
-            left, top, width, height = geometry
-            region = (left, top, width, height)
+                # 截图到内存
+                captured_at = time.time()
+                screenshot = load_pyautogui().screenshot(region=region)
+            captured = time.perf_counter()
+            timings = {"capture": captured - start}
+            metrics.observe("capture", timings["capture"], source=source)
+            
+            # 发送给模型的图像：裁剪、缩放、减色；本地检测仍使用原始截图
+            processed = screenshot
+            if self.preprocessor.config.enabled:
+                processed = self.preprocessor.process(screenshot)
+                timings["preprocess"] = time.perf_counter() - captured
+                metrics.observe("preprocess", timings["preprocess"], size=f"{processed.width}x{processed.height}")
             
-            print(f"窗口位置: left={left}, top={top}, width={width}, height={height}")
+            # 只编码一次
+            encode_start = time.perf_counter()
+            data, mime_type = encode_image(processed, self.image_format, self.image_quality)
+            timings["encode"] = time.perf_counter() - encode_start
+            metrics.observe("encode", timings["encode"], format=self.image_format, bytes=len(data))
             
-            # 生成截图文件名
-            timestamp = int(time.time())
-            screenshot_path = self.screenshot_dir / f"game_{timestamp}.png"
+            frame = Frame(
+                data=data,
+                mime_type=mime_type,
+                width=processed.width,
+                height=processed.height,
+                captured_at=captured_at,
+                image=screenshot,
+                pixels=pixels,
+                timings=timings,
+                detail=self.preprocessor.choose_detail(processed.width, processed.height),
+            )
             
-            # 截图并保存
-            screenshot = pyautogui.screenshot(region=region)
-            screenshot.save(str(screenshot_path))
+            if self.archive:
+                # 调试用：只入队，去重、压缩和写盘在归档线程中进行
+                self.archive.submit(frame)
             
-            print(f"截图已保存至: {screenshot_path}")
-            return str(screenshot_path)
+            return frame
             
         except Exception as e:
             print(f"截图失败: {e}")
+            # 窗口可能已关闭或重建，下次截图时重新查找
+            if not self.game_window:
+                self.windows.invalidate()
             return None
 
-    def upload_to_imgur(self, image_path: str) -> Optional[str]:
+    @property
+    def imgur_client(self) -> Optional[Any]:
+        """imgur 客户端，第一次上传时创建，未启用 imgur 时为 None"""
+        if self._imgur_client is None and self.use_imgur:
+            from imgurpython import ImgurClient
+            self._imgur_client = ImgurClient(self.imgur_client_id, self.imgur_client_secret)
+        return self._imgur_client
+
+    def upload_to_imgur(self, frame: Frame) -> Optional[str]:
         """
-        将图片上传到 imgur
+        将截图上传到 imgur（回退模式）
         
         Args:
-            image_path (str): 图片文件路径
+            frame (Frame): 截图帧
             
         Returns:
             Optional[str]: 图片URL，如果上传失败则返回 None
         """
+        if not self.imgur_client:
+            print("未启用 imgur 上传")
+            return None
+        
         try:
-            response = self.imgur_client.upload_from_path(image_path)
+            response = self.imgur_client.upload(io.BytesIO(frame.data))
             image_url = response['link']
             
             print(f"图片已上传: {image_url}")
@@ -256,12 +448,14 @@ class GameWindow:
             print(f"上传失败: {e}")
             return None
 
-    def take_screenshot(self) -> Optional[str]:
+    def take_screenshot(self) -> Optional[Frame]:
         """
-        执行截图操作并上传
+        执行截图操作
+        
+        默认直接返回内存中的帧；启用 imgur 回退时会额外上传并记录 URL。
         
         Returns:
-            Optional[str]: 上传后的图片URL，如果失败则返回 None
+            Optional[Frame]: 截图帧，如果失败则返回 None
         """
         window = self.get_window()
         if not window:
@@ -271,9 +465,18 @@ class GameWindow:
         window.activate()
         
         # 截图
-        screenshot_path = self.capture_window()
-        if not screenshot_path:
+        frame = self.capture_window()
+        if not frame:
             return None
-            
-        # 上传到 imgur
-        return self.upload_to_imgur(screenshot_path) 
\ No newline at end of file
+        
+        # 上传到 imgur（可选）
+        if self.use_imgur:
+            start = time.perf_counter()
+            frame.url = self.upload_to_imgur(frame)
+            frame.timings["upload"] = time.perf_counter() - start
+            metrics.observe("upload", frame.timings["upload"], ok=bool(frame.url))
+            if not frame.url:
+                return None
+        
+        print(f"截图耗时: {format_timings(frame.timings)}")
+        return frame
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+规划器共享的 HTTP 连接池
+主要功能：
+1. 进程内所有 OpenAI 客户端共用一个长连接池（可用时使用 HTTP/2 多路复用）
+2. 统计新建连接和复用连接的请求数，写入 metrics
+"""
+
+import os
+import threading
+from typing import Any, Optional, Set
+
+from metrics import metrics
+
+
+class ConnectionTracker:
+    """
+    按响应的底层网络流判断请求是否复用了已有连接
+    """
+
+    def __init__(self):
+        self._streams: Set[int] = set()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def record(self, response: Any) -> None:
+        """
+        记录一次响应使用的连接
+
+        Args:
+            response (httpx.Response): 响应
+        """
+        stream = response.extensions.get("network_stream")
+        if stream is None:
+            return
+        with self._lock:
+            # 连接关闭后 id 可能被复用，统计只用于观察趋势
+            reused = id(stream) in self._streams
+            self._streams.add(id(stream))
+            if reused:
+                self.reused += 1
+            else:
+                self.opened += 1
+        metrics.incr("http_connections_reused" if reused else "http_connections_opened")
+        metrics.gauge("http_version_2", float(response.http_version == "HTTP/2"))
+
+    async def record_async(self, response: Any) -> None:
+        """异步客户端的响应钩子"""
+        self.record(response)
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 新建连接数和复用率
+        """
+        total = self.opened + self.reused
+        rate = self.reused / total if total else 0.0
+        return f"新建连接 {self.opened}, 复用 {self.reused} ({rate:.0%})"
+
+
+tracker = ConnectionTracker()
+
+_sync_client: Optional[Any] = None
+_async_client: Optional[Any] = None
+_lock = threading.Lock()
+
+
+def _client_options() -> Optional[dict]:
+    """
+    共享客户端的参数：HTTP/2（需要 h2，PLANNER_HTTP2=0 关闭）、长连接数和空闲保持时间
+
+    Returns:
+        Optional[dict]: httpx 客户端参数，httpx 不可用时返回 None
+    """
+    try:
+        import httpx
+    except ImportError:
+        return None
+    http2 = os.getenv('PLANNER_HTTP2', '1').lower() in ('1', 'true', 'yes')
+    if http2:
+        try:
+            import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+        except ImportError:
+            print("未安装 h2（pip install httpx[http2]），使用 HTTP/1.1 长连接")
+            http2 = False
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(max_connections=8, max_keepalive_connections=8, keepalive_expiry=300),
+    }
+
+
+def sync_http_client() -> Optional[Any]:
+    """
+    进程内共享的同步 httpx 客户端，首次调用时创建
+
+    Returns:
+        Optional[httpx.Client]: 客户端；httpx 不可用时返回 None，由 OpenAI 使用默认客户端
+    """
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            options = _client_options()
+            if options is None:
+                return None
+            import httpx
+            _sync_client = httpx.Client(event_hooks={"response": [tracker.record]}, **options)
+        return _sync_client
+
+
+def async_http_client() -> Optional[Any]:
+    """
+    进程内共享的异步 httpx 客户端，首次调用时创建（只应在一个事件循环中使用）
+
+    Returns:
+        Optional[httpx.AsyncClient]: 客户端；httpx 不可用时返回 None
+    """
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            options = _client_options()
+            if options is None:
+                return None
+            import httpx
+            _async_client = httpx.AsyncClient(event_hooks={"response": [tracker.record_async]}, **options)
+        return _async_client
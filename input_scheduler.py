@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""
+输入调度器
+取代键盘执行器中的 FIFO 队列，主要功能：
+1. 每个单词带上产生它的计划代数和截图时间
+2. 按优先级排序：老鼠 > 黄色前缀 > 上菜 > 制作 > 收银
+3. 新计划到达时取消旧计划中不再需要的单词，超时的单词直接过期
+4. 更高优先级的单词到达时可抢占正在输入的单词
+5. 统计避免的无效按键数
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from frame import Frame
+from metrics import metrics
+
+# 优先级类别，数值越小越先输入
+PRIORITY_ORDER: Dict[str, int] = {
+    "rat": 0,
+    "yellow": 1,
+    "serve": 2,
+    "cook": 3,
+    "cashier": 4,
+}
+
+# 计划中的区域 -> 优先级类别
+AREA_PRIORITY: Dict[str, str] = {
+    "mouse": "rat",
+    "customer": "serve",
+    "cashier": "cashier",
+    "coffee_machine": "cook",
+    "food_station": "cook",
+}
+
+
+def classify_word(word: str, frame: Optional[Frame] = None) -> str:
+    """
+    根据模型计划判断单词的优先级类别
+
+    Args:
+        word (str): 单词
+        frame (Optional[Frame]): 产生该单词的截图帧，帧上记录了计划和步骤
+
+    Returns:
+        str: 优先级类别，见 PRIORITY_ORDER
+    """
+    if frame is None:
+        return "cook"
+
+    entries: List[Dict[str, Any]] = [step for step in frame.steps if step.get("input") == word]
+    if frame.plan:
+        entries += [item for item in frame.plan.get("words", []) if item.get("text") == word]
+
+    # 计划中已给出的优先级（快速模式由模型直接给出，详细模式按区域推断）
+    for entry in entries:
+        if entry.get("priority") in PRIORITY_ORDER:
+            return entry["priority"]
+
+    areas = {entry.get("area") for entry in entries}
+    if "mouse" in areas or (frame.plan and frame.plan.get("mouse") and len(word) == 2):
+        return "rat"
+    if any(entry.get("yellow") for entry in entries):
+        return "yellow"
+    for area in areas:
+        if area in AREA_PRIORITY:
+            return AREA_PRIORITY[area]
+    return "cook"
+
+
+@dataclass
+class ScheduledWord:
+    """调度器中的一个待输入单词"""
+
+    word: str
+    priority: str = "cook"
+    generation: Optional[int] = None  # 计划代数，None 表示不随计划更新而失效（如本地快速路径）
+    frame_ts: Optional[float] = None  # 产生该单词的截图时间（time.time）
+    enqueued_at: float = field(default_factory=time.perf_counter)
+    cancelled: bool = False
+
+    @property
+    def rank(self) -> int:
+        """优先级数值"""
+        return PRIORITY_ORDER.get(self.priority, PRIORITY_ORDER["cook"])
+
+
+class InputScheduler:
+    """
+    按优先级和计划代数调度输入单词
+
+    内部是一个带惰性删除的最小堆，取消的单词只做标记，出队时跳过。
+    """
+
+    def __init__(self, max_age: Optional[float] = None):
+        """
+        初始化调度器
+
+        Args:
+            max_age (Optional[float]): 单词从截图到输入允许的最长时间（秒），默认读取 WORD_MAX_AGE
+        """
+        self.max_age = max_age if max_age is not None else float(os.getenv('WORD_MAX_AGE', '6'))
+        self._heap: List[tuple] = []
+        self._queued: Dict[str, ScheduledWord] = {}  # 单词 -> 队列中的条目，用于去重
+        self._vetoed: Dict[str, Optional[int]] = {}  # 被纠正取消的单词 -> 计划代数，同一代数内不再接受
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.generation = -1  # 最新计划的代数
+        self.current: Optional[ScheduledWord] = None  # 正在输入的单词
+
+        # 统计
+        self.submitted = 0
+        self.typed = 0
+        self.cancelled = 0  # 被新计划取消
+        self.rejected = 0  # 计划本身已过时
+        self.expired = 0  # 超过 max_age
+        self.preempted = 0
+        self.saved_keystrokes = 0  # 避免的无效按键数
+
+    def submit(self, items: List[ScheduledWord], generation: Optional[int] = None,
+               supersede: bool = True) -> int:
+        """
+        提交一批单词
+
+        generation 比当前计划旧时整批丢弃；比当前计划新时，
+        队列中旧计划的单词若不在新计划里则取消。
+
+        Args:
+            items (List[ScheduledWord]): 待输入单词
+            generation (Optional[int]): 这批单词所属的计划代数，None 表示不参与代数管理
+            supersede (bool): 是否立即取消旧计划的单词；流式规划逐个提交单词时为 False，
+                完整计划返回后再调用 supersede
+
+        Returns:
+            int: 实际加入队列的单词数
+        """
+        with self._cond:
+            if generation is not None:
+                if generation < self.generation:
+                    self.rejected += len(items)
+                    metrics.incr("stale_words_rejected", len(items))
+                    self.saved_keystrokes += sum(len(item.word) for item in items)
+                    print(f"丢弃过时计划 (代数 {generation} < {self.generation})")
+                    return 0
+                if generation > self.generation and supersede:
+                    self._supersede(generation, {item.word for item in items})
+
+            accepted = 0
+            for item in items:
+                item.generation = generation if item.generation is None else item.generation
+                if item.word in self._vetoed and self._vetoed[item.word] in (None, item.generation):
+                    continue
+                if self.current is not None and item.word == self.current.word:
+                    # 正在输入：归入新的计划代数，不再重复加入队列
+                    self.current.generation = item.generation
+                    continue
+                queued = self._queued.get(item.word)
+                if queued is not None:
+                    # 已在队列中：更新为更新的计划代数和更高的优先级
+                    queued.generation = item.generation
+                    queued.frame_ts = item.frame_ts or queued.frame_ts
+                    if item.rank < queued.rank:
+                        queued.cancelled = True
+                        self._push(item)
+                    continue
+                self._push(item)
+                accepted += 1
+                print(f"添加单词到输入队列: {item.word} ({item.priority})")
+            self.submitted += accepted
+            self._cond.notify()
+            return accepted
+
+    def supersede(self, generation: int, words: List[str]) -> None:
+        """
+        完整计划已知后切换到新的计划代数（流式规划结束时调用），取消旧计划中不在该计划里的单词
+
+        Args:
+            generation (int): 计划代数
+            words (List[str]): 完整计划中的单词
+        """
+        with self._cond:
+            if generation > self.generation:
+                self._supersede(generation, set(words))
+
+    def _supersede(self, generation: int, keep: set) -> None:
+        """
+        切换到新的计划代数，取消旧计划中不再需要的单词
+
+        Args:
+            generation (int): 新计划代数
+            keep (set): 新计划中包含的单词
+        """
+        self.generation = generation
+        self._vetoed = {word: vetoed for word, vetoed in self._vetoed.items()
+                        if vetoed is not None and vetoed >= generation}
+        for word, item in list(self._queued.items()):
+            if item.generation is None or item.generation >= generation or word in keep:
+                continue
+            item.cancelled = True
+            del self._queued[word]
+            self.cancelled += 1
+            self.saved_keystrokes += len(word)
+            metrics.incr("stale_words_cancelled")
+            print(f"取消过时单词: {word}")
+
+    def cancel(self, words: List[str], generation: Optional[int] = None) -> int:
+        """
+        取消指定单词（例如被更强的模型否定），同一计划代数内之后再提交也不接受
+
+        Args:
+            words (List[str]): 要取消的单词
+            generation (Optional[int]): 只取消属于该计划代数的单词，None 表示不限代数
+
+        Returns:
+            int: 实际从队列中取消的单词数
+        """
+        with self._cond:
+            if generation is not None and generation < self.generation:
+                return 0
+            cancelled = 0
+            for word in words:
+                self._vetoed[word] = generation
+                item = self._queued.get(word)
+                if item is None or (generation is not None and item.generation != generation):
+                    continue
+                item.cancelled = True
+                del self._queued[word]
+                cancelled += 1
+                self.cancelled += 1
+                self.saved_keystrokes += len(word)
+                print(f"取消被纠正的单词: {word}")
+            return cancelled
+
+    def _push(self, item: ScheduledWord) -> None:
+        """将单词加入堆（调用方持有锁）"""
+        self._queued[item.word] = item
+        heapq.heappush(self._heap, (item.rank, next(self._counter), item))
+
+    def get(self, timeout: Optional[float] = None) -> Optional[ScheduledWord]:
+        """
+        阻塞取出优先级最高的有效单词
+
+        Args:
+            timeout (Optional[float]): 最长等待时间，None 表示一直等待
+
+        Returns:
+            Optional[ScheduledWord]: 单词，调度器关闭或超时时返回 None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                while self._heap:
+                    _, _, item = heapq.heappop(self._heap)
+                    if item.cancelled:
+                        continue
+                    self._queued.pop(item.word, None)
+                    if item.frame_ts is not None and time.time() - item.frame_ts > self.max_age:
+                        self.expired += 1
+                        metrics.incr("stale_words_expired")
+                        self.saved_keystrokes += len(item.word)
+                        print(f"单词已过期: {item.word}")
+                        continue
+                    self.current = item
+                    return item
+                if self._closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def should_preempt(self, item: ScheduledWord) -> bool:
+        """
+        判断正在输入的单词是否应被打断
+
+        Args:
+            item (ScheduledWord): 正在输入的单词
+
+        Returns:
+            bool: 有更高优先级的单词等待时返回 True
+        """
+        with self._cond:
+            for rank, _, queued in self._heap:
+                if not queued.cancelled and rank < item.rank:
+                    return True
+            return False
+
+    def preempt(self, item: ScheduledWord, typed_keys: int) -> None:
+        """
+        打断正在输入的单词并放回队列
+
+        Args:
+            item (ScheduledWord): 被打断的单词
+            typed_keys (int): 已经输入的按键数
+        """
+        with self._cond:
+            self.preempted += 1
+            self.current = None
+            if item.word not in self._queued:
+                self._push(item)
+        print(f"单词 {item.word} 在第 {typed_keys} 个字母处被抢占")
+
+    def done(self, item: ScheduledWord) -> None:
+        """
+        标记单词输入完成
+
+        Args:
+            item (ScheduledWord): 已输入的单词
+        """
+        with self._cond:
+            self.typed += 1
+            if self.current is item:
+                self.current = None
+
+    def clear(self) -> None:
+        """清空所有待输入单词"""
+        with self._cond:
+            for item in self._queued.values():
+                item.cancelled = True
+            self._queued.clear()
+            self._heap.clear()
+            self._vetoed.clear()
+
+    def close(self) -> None:
+        """关闭调度器，唤醒等待中的线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def reopen(self) -> None:
+        """重新开放调度器"""
+        with self._cond:
+            self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._queued
+
+    def pending(self, word: str) -> bool:
+        """
+        单词是否还会被输入：在队列中或正在输入
+
+        Args:
+            word (str): 单词
+
+        Returns:
+            bool: 在队列中或正在输入时返回 True
+        """
+        with self._cond:
+            return word in self._queued or (self.current is not None and self.current.word == word)
+
+    def report(self) -> str:
+        """
+        生成调度统计
+
+        Returns:
+            str: 提交、输入、取消、过期、抢占次数以及避免的按键数
+        """
+        return (
+            f"提交 {self.submitted}, 输入 {self.typed}, 取消 {self.cancelled}, "
+            f"丢弃 {self.rejected}, 过期 {self.expired}, 抢占 {self.preempted}, "
+            f"避免无效按键 {self.saved_keystrokes}"
+        )
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+低延迟键盘执行器
+主要功能：
+1. 阻塞等待输入调度器，取代 get_nowait() + sleep 轮询
+2. 只在窗口失去焦点时重新激活
+3. 连续输入整个单词，按键间隔默认固定为 TYPING_INTERVAL；开启输入校验（VERIFY_INPUT=1）时
+   按校验结果自适应到游戏能稳定接收的最快速度
+4. 有更高优先级的单词到达时抢占当前单词，并删除游戏中已输入的前缀
+5. 统计每秒单词数和排队等待时间
+"""
+
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional
+
+from frame import Frame
+from input_scheduler import InputScheduler, ScheduledWord, classify_word
+from metrics import metrics
+
+_pyautogui: Optional[Any] = None
+
+# 延迟统计只保留最近的样本，长时间运行时内存和统计耗时不随单词数增长
+LATENCY_WINDOW = 1024
+
+# 退格键：单词被抢占后用于删除游戏中已输入的前缀
+BACKSPACE = "\b"
+
+
+def load_pyautogui() -> Any:
+    """
+    导入 pyautogui 并关闭 FAILSAFE
+
+    导入时需要连接显示服务器，耗时较长；回放、模拟器等不发送真实按键的场景完全不需要它，
+    因此推迟到第一次截图或按键时，预热（GameWindow.warm_up）会提前调用。
+
+    Returns:
+        Any: pyautogui 模块
+    """
+    global _pyautogui
+    if _pyautogui is None:
+        import pyautogui
+        pyautogui.FAILSAFE = False
+        _pyautogui = pyautogui
+    return _pyautogui
+
+
+def pyautogui_write(word: str, interval: float) -> None:
+    """
+    使用 pyautogui 整词输入
+
+    Args:
+        word (str): 要输入的单词，全部为 BACKSPACE 时按相应次数的退格键
+        interval (float): 按键间隔（秒）
+    """
+    pyautogui = load_pyautogui()
+    # _pause=False 跳过 pyautogui.PAUSE 带来的额外 0.1 秒等待
+    if word and not word.strip(BACKSPACE):
+        pyautogui.press("backspace", presses=len(word), interval=interval, _pause=False)
+        return
+    pyautogui.write(word, interval=interval, _pause=False)
+
+
+class KeyboardExecutor:
+    """
+    键盘输入执行器
+
+    由独立线程从输入调度器中取出单词并输入到游戏窗口。
+    """
+
+    def __init__(self, get_window: Callable[[], Any],
+                 key_interval: Optional[float] = None,
+                 min_interval: float = 0.005,
+                 max_interval: float = 0.1,
+                 activate_delay: float = 0.05,
+                 writer: Callable[[str, float], None] = pyautogui_write):
+        """
+        初始化键盘执行器
+
+        Args:
+            get_window (Callable[[], Any]): 获取游戏窗口的函数，返回 None 表示未找到
+            key_interval (Optional[float]): 初始按键间隔（秒），默认读取 TYPING_INTERVAL
+            min_interval (float): 自适应时允许的最短按键间隔
+            max_interval (float): 自适应时允许的最长按键间隔
+            activate_delay (float): 重新激活窗口后等待的时间
+            writer (Callable[[str, float], None]): 实际发送按键的函数
+        """
+        self.get_window = get_window
+        self.key_interval = key_interval if key_interval is not None else float(os.getenv('TYPING_INTERVAL', '0.02'))
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.activate_delay = activate_delay
+        self.writer = writer
+
+        # 已确认会丢键的最大间隔，自适应时不再低于它
+        self._unreliable_interval = 0.0
+
+        self.scheduler = InputScheduler()
+        # 每个单词开始输入前调用，参数为单词（在键盘线程中执行，需尽快返回）
+        self.start_callbacks: list[Callable[[str], None]] = []
+        # 每个单词输入完成后调用，参数为单词（在键盘线程中执行，需尽快返回）
+        self.typed_callbacks: list[Callable[[str], None]] = []
+        self.keyboard_thread: Optional[threading.Thread] = None
+        self.is_typing = False
+
+        # 首键延迟
+        self._plan_started_at: Optional[float] = None
+        self.first_keystroke_latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)  # 最近的样本
+        self.first_keystroke_count = 0
+
+        # 统计
+        self.typed_word_count = 0
+        self.typed_key_count = 0
+        self.typing_seconds = 0.0
+        self.activations = 0
+        self.queue_waits: Deque[float] = deque(maxlen=LATENCY_WINDOW)  # 最近的样本
+        self.started_at = 0.0
+
+    def start(self) -> None:
+        """启动键盘输入线程"""
+        if self.keyboard_thread and self.keyboard_thread.is_alive():
+            return
+
+        self.is_typing = True
+        self.scheduler.reopen()
+        self.started_at = time.perf_counter()
+        self.keyboard_thread = threading.Thread(target=self._worker, daemon=True)
+        self.keyboard_thread.start()
+        print("键盘输入线程已启动")
+
+    def stop(self) -> None:
+        """停止键盘输入线程"""
+        self.is_typing = False
+        if self.keyboard_thread:
+            # 唤醒阻塞在调度器上的线程
+            self.scheduler.close()
+            self.keyboard_thread.join()
+            print("键盘输入线程已停止")
+            print(f"[键盘] {self.report()}")
+            print(f"[调度] {self.scheduler.report()}")
+
+    def _worker(self) -> None:
+        """
+        键盘输入工作线程
+        阻塞等待调度器中的单词并连续输入
+        """
+        while self.is_typing:
+            item = self.scheduler.get()
+            if item is None:
+                break
+            try:
+                wait = time.perf_counter() - item.enqueued_at
+                self.queue_waits.append(wait)
+                metrics.observe("queue_wait", wait, word=item.word, priority=item.priority)
+
+                window = self.get_window()
+                if window:
+                    self._ensure_focus(window)
+                    self._record_first_keystroke()
+                    for callback in self.start_callbacks:
+                        callback(item.word)
+
+                    start = time.perf_counter()
+                    typed = self._type(item)
+                    elapsed = time.perf_counter() - start
+                    self.typing_seconds += elapsed
+                    self.typed_key_count += typed
+                    metrics.observe("typing", elapsed, word=item.word, keys=typed)
+                    metrics.incr("keys_typed", typed)
+                    if typed < len(item.word):
+                        # 游戏中还留着已输入的前缀，先删除，避免与下一个单词拼在一起
+                        if typed:
+                            self.writer(BACKSPACE * typed, 0.0)
+                        self.scheduler.preempt(item, typed)
+                        continue
+                    self.typed_word_count += 1
+                    print(f"完成输入单词: {item.word}")
+                    for callback in self.typed_callbacks:
+                        callback(item.word)
+                self.scheduler.done(item)
+            except Exception as e:
+                print(f"键盘输入错误: {e}")
+                self.scheduler.done(item)
+
+    def _type(self, item: ScheduledWord) -> int:
+        """
+        输入一个单词
+
+        前半个单词逐个按键输入，每个按键之间检查是否需要抢占；
+        已输入一半以上时不再抢占，避免浪费已经按下的键，剩余部分整体交给 writer 输入。
+
+        Args:
+            item (ScheduledWord): 要输入的单词
+
+        Returns:
+            int: 实际输入的按键数，小于单词长度表示被抢占
+        """
+        word = item.word
+        index = 0
+        while index < len(word) / 2:
+            if not self.is_typing:
+                return index
+            if index and self.scheduler.should_preempt(item):
+                return index
+            self.writer(word[index], 0.0)
+            index += 1
+            time.sleep(self.key_interval)
+        if index < len(word):
+            self.writer(word[index:], self.key_interval)
+        return len(word)
+
+    def _ensure_focus(self, window: Any) -> None:
+        """
+        只在窗口失去焦点时重新激活
+
+        Args:
+            window (Any): 游戏窗口
+        """
+        try:
+            if window.isActive:
+                return
+        except Exception:
+            # 部分平台无法查询焦点，按未激活处理
+            pass
+        window.activate()
+        self.activations += 1
+        time.sleep(self.activate_delay)
+
+    def report_result(self, word: str, accepted: bool) -> None:
+        """
+        反馈单词是否被游戏接收，用于自适应按键间隔
+
+        唯一的反馈来源是输入后校验（verifier.WordVerifier，VERIFY_INPUT=1）；
+        未开启校验时不会调用，按键间隔保持为 TYPING_INTERVAL。
+        成功时逐步缩短间隔，失败时立即加倍并记住该间隔不可靠，
+        之后不再缩短到该间隔以下。
+
+        Args:
+            word (str): 已输入的单词
+            accepted (bool): 是否被游戏接收
+        """
+        if accepted:
+            faster = self.key_interval * 0.9
+            floor = max(self.min_interval, self._unreliable_interval * 1.1)
+            self.key_interval = max(floor, faster)
+        else:
+            self._unreliable_interval = max(self._unreliable_interval, self.key_interval)
+            self.key_interval = min(self.max_interval, self.key_interval * 2)
+            print(f"单词 {word} 未生效，按键间隔调整为 {self.key_interval * 1000:.0f}ms")
+
+    def add_words(self, words: list[str], frame: Optional[Frame] = None,
+                  generation: Optional[int] = None,
+                  priorities: Optional[Dict[str, str]] = None,
+                  supersede: bool = True) -> int:
+        """
+        添加输入单词到调度器
+
+        Args:
+            words (list[str]): 要输入的单词列表
+            frame (Optional[Frame]): 产生这些单词的截图帧，用于判断优先级和过期
+            generation (Optional[int]): 计划代数，新代数的计划会取消旧计划中不再需要的单词
+            priorities (Optional[Dict[str, str]]): 显式指定的优先级类别，单词 -> 类别
+            supersede (bool): 是否立即取消旧计划的单词，流式规划逐个添加时为 False，见 supersede_words
+
+        Returns:
+            int: 实际加入队列的单词数
+        """
+        now = time.perf_counter()
+        items = [
+            ScheduledWord(
+                word=word,
+                priority=(priorities or {}).get(word) or classify_word(word, frame),
+                frame_ts=frame.captured_at if frame else None,
+                enqueued_at=now,
+            )
+            for word in words
+        ]
+        return self.scheduler.submit(items, generation, supersede)
+
+    def supersede_words(self, words: list[str], generation: int) -> None:
+        """
+        流式计划完整返回后，取消旧计划中不在该计划里的单词
+
+        Args:
+            words (list[str]): 完整计划中的单词
+            generation (int): 计划代数
+        """
+        self.scheduler.supersede(generation, words)
+
+    def cancel_words(self, words: list[str], generation: Optional[int] = None) -> int:
+        """
+        取消队列中的单词（例如级联规划中被强模型否定的单词）
+
+        Args:
+            words (list[str]): 要取消的单词
+            generation (Optional[int]): 只取消属于该计划代数的单词，None 表示不限代数
+
+        Returns:
+            int: 实际取消的单词数
+        """
+        return self.scheduler.cancel(words, generation)
+
+    def wait_idle(self, timeout: Optional[float] = None, poll: float = 0.001) -> bool:
+        """
+        等待调度器中的单词全部输入完毕
+
+        Args:
+            timeout (Optional[float]): 最长等待时间，None 表示一直等待
+            poll (float): 检查间隔（秒）
+
+        Returns:
+            bool: 是否在超时前输入完毕
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        while len(self.scheduler) or self.scheduler.current is not None:
+            if deadline is not None and time.perf_counter() > deadline:
+                return False
+            time.sleep(poll)
+        return True
+
+    def clear(self) -> None:
+        """清空输入调度器"""
+        self.scheduler.clear()
+        print("输入队列已清空")
+
+    def mark_plan_start(self, started_at: Optional[float] = None) -> None:
+        """
+        标记一次规划的开始时间，用于统计首键延迟
+
+        Args:
+            started_at (Optional[float]): 开始时间（time.time），默认为当前时间
+        """
+        self._plan_started_at = started_at or time.time()
+
+    def _record_first_keystroke(self) -> None:
+        """记录从规划开始到第一次按键的延迟"""
+        if self._plan_started_at is None:
+            return
+        latency = time.time() - self._plan_started_at
+        self._plan_started_at = None
+        self.first_keystroke_latencies.append(latency)
+        self.first_keystroke_count += 1
+        metrics.observe("first_keystroke", latency)
+        print(f"首键延迟: {latency * 1000:.0f}ms")
+
+    def first_keystroke_report(self) -> str:
+        """
+        生成首键延迟统计
+
+        Returns:
+            str: 首键延迟的次数，以及最近样本的平均值和中位数
+        """
+        samples = sorted(self.first_keystroke_latencies)
+        if not samples:
+            return "暂无数据"
+        mean = sum(samples) / len(samples)
+        return (f"{self.first_keystroke_count} 次, 平均 {mean * 1000:.0f}ms, "
+                f"中位数 {samples[len(samples) // 2] * 1000:.0f}ms")
+
+    def report(self) -> str:
+        """
+        生成输入统计
+
+        Returns:
+            str: 每秒单词数、排队等待时间、窗口激活次数等
+        """
+        elapsed = time.perf_counter() - self.started_at if self.started_at else 0.0
+        words_per_sec = self.typed_word_count / elapsed if elapsed > 0 else 0.0
+        typing_rate = self.typed_word_count / self.typing_seconds if self.typing_seconds > 0 else 0.0
+        waits = sorted(self.queue_waits)
+        if waits:
+            p95 = waits[min(len(waits) - 1, int(len(waits) * 0.95))]
+            wait = (f"排队等待 平均 {statistics.mean(waits) * 1000:.0f}ms, "
+                    f"中位数 {statistics.median(waits) * 1000:.0f}ms, p95 {p95 * 1000:.0f}ms")
+        else:
+            wait = "排队等待 暂无数据"
+        return (
+            f"单词 {self.typed_word_count}, 每秒单词 {words_per_sec:.2f} "
+            f"(输入时 {typing_rate:.2f}), {wait}, "
+            f"窗口激活 {self.activations} 次, 按键间隔 {self.key_interval * 1000:.0f}ms"
+        )
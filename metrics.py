@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+轻量级性能指标与追踪
+主要功能：
+1. 计时片段（span）：窗口查找、截图、编码、上传、模型请求、JSON 解析、排队、输入等
+2. 滚动直方图（最近 N 个样本的分位数）和计数器（token 用量、缓存命中、过时单词等）
+3. 追踪事件批量写入 JSONL 文件，由后台线程定期刷新，热路径上只做内存追加
+4. 可选的本地 Prometheus 文本格式接口（/metrics）
+
+使用全局实例 metrics：
+    with metrics.span("capture"):
+        ...
+    metrics.incr("tokens_prompt", usage.prompt_tokens)
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional
+
+
+def percentiles(values: Iterable[float], scale: float = 1000.0) -> Dict[str, float]:
+    """
+    计算分位数
+
+    Args:
+        values (Iterable[float]): 样本（秒）
+        scale (float): 输出的缩放倍数，默认换算为毫秒
+
+    Returns:
+        Dict[str, float]: count、mean、p50、p95、p99、max
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))] * scale
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) * scale,
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1] * scale,
+    }
+
+
+class RollingHistogram:
+    """
+    滚动直方图
+    保留最近 window 个样本用于分位数，总数和总和累计全部样本。
+    """
+
+    def __init__(self, window: int = 1024):
+        self._samples: deque = deque(maxlen=window)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """记录一个样本（deque.append 本身是线程安全的）"""
+        self._samples.append(value)
+        self.count += 1
+        self.sum += value
+
+    def summary(self) -> Dict[str, float]:
+        """最近样本的分位数（毫秒）"""
+        return percentiles(list(self._samples))
+
+    def quantile(self, q: float) -> Optional[float]:
+        """
+        最近样本的分位数（秒）
+
+        Args:
+            q (float): 分位点，0~1
+
+        Returns:
+            Optional[float]: 分位数，无样本时返回 None
+        """
+        ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Span:
+    """计时片段，退出时记录耗时"""
+
+    __slots__ = ("metrics", "name", "attrs", "start", "duration")
+
+    def __init__(self, metrics: "Metrics", name: str, attrs: Dict[str, Any]):
+        self.metrics = metrics
+        self.name = name
+        self.attrs = attrs
+        self.start = 0.0
+        self.duration = 0.0
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.metrics.observe(self.name, self.duration, **self.attrs)
+
+
+class _NullSpan:
+    """指标关闭时使用的空片段"""
+
+    duration = 0.0
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Metrics:
+    """
+    指标注册表
+    """
+
+    def __init__(self, enabled: bool = True, window: int = 1024):
+        """
+        初始化指标注册表
+
+        Args:
+            enabled (bool): 是否启用；关闭时所有记录操作都是空操作
+            window (int): 滚动直方图保留的样本数
+        """
+        self.enabled = enabled
+        self.window = window
+        self.histograms: Dict[str, RollingHistogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        # JSONL 追踪
+        self._trace_file = None
+        self._pending: List[Dict[str, Any]] = []
+        self._flusher: Optional[threading.Thread] = None
+        self._flush_interval = 1.0
+        self._stop_flush = threading.Event()
+        self._write_lock = threading.Lock()  # 写文件与关闭文件互斥
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def configure_from_env(self) -> None:
+        """
+        按环境变量配置：
+        METRICS_ENABLED（默认 1）、TRACE_FILE（JSONL 路径）、METRICS_PORT（Prometheus 端口）
+        """
+        self.enabled = os.getenv('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes')
+        trace_path = os.getenv('TRACE_FILE')
+        if self.enabled and trace_path:
+            self.open_trace(trace_path)
+        port = int(os.getenv('METRICS_PORT', '0'))
+        if self.enabled and port:
+            self.start_http_server(port)
+
+    def span(self, name: str, **attrs: Any):
+        """
+        创建计时片段
+
+        Args:
+            name (str): 片段名
+            **attrs: 附加到追踪事件的属性
+
+        Returns:
+            Span: 上下文管理器
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, attrs)
+
+    def observe(self, name: str, seconds: float, **attrs: Any) -> None:
+        """
+        记录一次耗时
+
+        Args:
+            name (str): 指标名
+            seconds (float): 耗时（秒）
+            **attrs: 附加到追踪事件的属性
+        """
+        if not self.enabled:
+            return
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, RollingHistogram(self.window))
+        histogram.observe(seconds)
+        if self._trace_file is not None:
+            event = {"ts": time.time(), "span": name, "ms": round(seconds * 1000, 3)}
+            if attrs:
+                event.update(attrs)
+            with self._lock:
+                self._pending.append(event)
+
+    def incr(self, name: str, value: float = 1) -> None:
+        """
+        计数器累加
+
+        Args:
+            name (str): 计数器名
+            value (float): 增量
+        """
+        if not self.enabled or not value:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float) -> None:
+        """
+        设置瞬时值
+
+        Args:
+            name (str): 指标名
+            value (float): 当前值
+        """
+        if self.enabled:
+            self.gauges[name] = value
+
+    def open_trace(self, path: str) -> None:
+        """
+        打开 JSONL 追踪文件，并启动后台刷新线程
+
+        Args:
+            path (str): 追踪文件路径（追加写入）
+        """
+        self._trace_file = open(path, "a", encoding="utf-8")
+        self._stop_flush.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+        print(f"性能追踪写入: {path}")
+
+    def _flush_loop(self) -> None:
+        """后台定期写出追踪事件"""
+        while not self._stop_flush.wait(self._flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """把缓存的追踪事件写入文件"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        with self._write_lock:
+            if self._trace_file is None:
+                return
+            self._trace_file.write("".join(json.dumps(event, ensure_ascii=False) + "\n" for event in pending))
+            self._trace_file.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        当前指标快照
+
+        Returns:
+            Dict[str, Any]: histograms（毫秒分位数）、counters、gauges
+        """
+        with self._lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+        return {
+            "histograms": {name: h.summary() for name, h in histograms.items()},
+            "counters": counters,
+            "gauges": dict(self.gauges),
+        }
+
+    def prometheus_text(self) -> str:
+        """
+        生成 Prometheus 文本格式
+
+        Returns:
+            str: 直方图以 summary 形式输出（秒），计数器和瞬时值直接输出
+        """
+        lines = []
+        with self._lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+        for name, histogram in sorted(histograms.items()):
+            metric = f"chef_{name}_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for q in (0.5, 0.95, 0.99):
+                value = histogram.quantile(q)
+                if value is not None:
+                    lines.append(f'{metric}{{quantile="{q}"}} {value:.6f}')
+            lines.append(f"{metric}_sum {histogram.sum:.6f}")
+            lines.append(f"{metric}_count {histogram.count}")
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE chef_{name}_total counter")
+            lines.append(f"chef_{name}_total {value}")
+        for name, value in sorted(self.gauges.items()):
+            lines.append(f"# TYPE chef_{name} gauge")
+            lines.append(f"chef_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port: int, host: str = "127.0.0.1") -> None:
+        """
+        启动本地 Prometheus 文本接口
+
+        Args:
+            port (int): 监听端口
+            host (str): 监听地址，默认只监听本机
+        """
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        print(f"指标接口: http://{host}:{port}/metrics")
+
+    def report(self) -> str:
+        """
+        生成便于日志输出的摘要
+
+        Returns:
+            str: 每个片段的 p50/p95 和所有计数器
+        """
+        snapshot = self.snapshot()
+        parts = [
+            f"{name} p50={summary['p50']:.0f}ms p95={summary['p95']:.0f}ms"
+            for name, summary in snapshot["histograms"].items() if summary.get("count")
+        ]
+        parts += [f"{name}={value:g}" for name, value in snapshot["counters"].items()]
+        return ", ".join(parts) if parts else "暂无数据"
+
+    def reset(self) -> None:
+        """清空直方图、计数器和仪表（同一进程内多次运行基准时使用）"""
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+
+    def close(self) -> None:
+        """停止后台刷新线程，写出剩余事件并关闭追踪文件和指标接口"""
+        self._stop_flush.set()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        self.flush()
+        with self._write_lock:
+            if self._trace_file is not None:
+                trace_file, self._trace_file = self._trace_file, None
+                trace_file.close()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+# 全局指标实例
+metrics = Metrics()
@@ -0,0 +1,563 @@
+#!/usr/bin/env python3
+"""
+本地模拟 OpenAI chat.completions 接口
+主要功能：
+1. 返回预置的 JSON 计划，支持普通和流式（SSE）响应
+2. 可配置延迟和抖动，以及按输出 token 计的生成耗时，用于可重复的延迟基准测试
+3. 请求带 JSON Schema（快速模式）时返回只含 word/area/priority 的精简计划；
+   Schema 限定了 area 取值（区域分片）时只返回这些区域的步骤
+4. 按请求中的模型名模拟多个模型：各自的延迟和准确率（不准确时漏掉或写错单词）
+5. 可注入长尾延迟和服务端错误，用于测试超时、对冲和熔断
+6. 模拟提示词缓存：截图之前的消息前缀与之前的请求逐字节相同时，usage 中返回 cached_tokens
+7. 可由回调按当前局面给出计划（如模拟器的标准答案），用于闭环测试
+8. 通过 OPENAI_BASE_URL 让 GamePlanner 直接指向本服务
+
+用法:
+    python mock_openai.py --port 8765 --latency 1.5 --jitter 0.3 --plans plans.json
+                          [--model gpt-4o-mini:0.4:0.8 --model gpt-4o:1.5:1.0] [--plan-by-image]
+                          [--tail-rate 0.05 --tail-latency 5] [--error-rate 0.1]
+"""
+
+import argparse
+import base64
+import binascii
+import copy
+import io
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from PIL import Image
+
+from plan import Plan
+from preprocess import estimate_image_tokens
+
+# 默认计划，与 GamePlanner.system_prompt 中的返回格式一致
+DEFAULT_PLANS: List[Dict[str, Any]] = [
+    {
+        "description": "咖啡机附近有 coal 和 thread；收银台为 rail；没有老鼠。",
+        "words": [
+            {"text": "rail", "area": "cashier"},
+            {"text": "coal", "area": "coffee_machine"},
+            {"text": "thread", "area": "coffee_machine"},
+        ],
+        "cash": "rail",
+        "mouse": False,
+        "order": "咖啡",
+        "steps": [
+            {"action": "制作咖啡", "input": "thread", "area": "coffee_machine",
+             "reasoning": "咖啡库存为 0，需要先制作。"},
+            {"action": "取咖啡", "input": "coal", "area": "coffee_machine",
+             "reasoning": "咖啡制作完成后放入成品区。"},
+        ],
+    },
+    {
+        "description": "红地毯上有老鼠 ox；中央桌顾客可以上菜 steel。",
+        "words": [
+            {"text": "ox", "area": "mouse"},
+            {"text": "steel", "area": "customer"},
+        ],
+        "cash": "rail",
+        "mouse": True,
+        "order": "披萨",
+        "steps": [
+            {"action": "击退老鼠", "input": "ox", "area": "mouse", "reasoning": "有老鼠时优先击退。"},
+            {"action": "上菜", "input": "steel", "area": "customer", "reasoning": "桌子上方出现高亮词。"},
+        ],
+    },
+]
+
+
+class ModelProfile:
+    """一个模拟模型的延迟和准确率"""
+
+    def __init__(self, latency: float, accuracy: float = 1.0, jitter: float = 0.0):
+        """
+        Args:
+            latency (float): 平均总延迟（秒）
+            accuracy (float): 返回完全正确计划的概率（0~1）
+            jitter (float): 延迟的均匀抖动幅度（秒）
+        """
+        self.latency = latency
+        self.accuracy = accuracy
+        self.jitter = jitter
+
+
+def parse_model_profiles(specs: Optional[List[str]]) -> Dict[str, ModelProfile]:
+    """
+    解析命令行中的模型配置
+
+    Args:
+        specs (Optional[List[str]]): 形如 "gpt-4o-mini:0.4:0.8[:0.1]"（模型名:延迟:准确率[:抖动]）
+
+    Returns:
+        Dict[str, ModelProfile]: 模型名 -> 配置
+    """
+    profiles = {}
+    for spec in specs or []:
+        name, *values = spec.split(":")
+        numbers = [float(value) for value in values]
+        if not numbers:
+            raise ValueError(f"模型配置缺少延迟: {spec}")
+        profiles[name] = ModelProfile(*numbers[:1], *numbers[1:2], *numbers[2:3])
+    return profiles
+
+
+class MockConfig:
+    """模拟服务配置"""
+
+    def __init__(self, plans: Optional[List[Dict[str, Any]]] = None,
+                 latency: float = 1.0, jitter: float = 0.0,
+                 ttft_ratio: float = 0.3, seed: Optional[int] = None,
+                 token_latency: float = 0.0,
+                 models: Optional[Dict[str, ModelProfile]] = None,
+                 plan_by_image: bool = False,
+                 tail_rate: float = 0.0, tail_latency: float = 0.0,
+                 error_rate: float = 0.0,
+                 plan_source: Optional[Callable[[], Optional[Dict[str, Any]]]] = None):
+        """
+        初始化配置
+
+        Args:
+            plans (Optional[List[Dict[str, Any]]]): 依次返回的计划，默认使用 DEFAULT_PLANS
+            latency (float): 平均总延迟（秒）
+            jitter (float): 延迟的均匀抖动幅度（秒）
+            ttft_ratio (float): 流式响应中首个 token 占总延迟的比例
+            seed (Optional[int]): 随机种子，用于可重复的抖动
+            token_latency (float): 每个输出 token 额外的生成耗时（秒）
+            models (Optional[Dict[str, ModelProfile]]): 按模型名覆盖延迟并设置准确率
+            plan_by_image (bool): 按请求中的图像选择计划，同一帧的多次请求（如快慢两个模型）得到同一个计划
+            tail_rate (float): 请求落入长尾的概率
+            tail_latency (float): 长尾请求额外的延迟（秒）
+            error_rate (float): 返回 500 错误的概率
+            plan_source (Optional[Callable[[], Optional[Dict[str, Any]]]]): 按当前局面给出计划的回调
+                （如 simulator.ShiftSimulator.oracle_plan），返回 None 时使用预置计划
+        """
+        self.plans = plans or DEFAULT_PLANS
+        self.latency = latency
+        self.jitter = jitter
+        self.ttft_ratio = ttft_ratio
+        self.token_latency = token_latency
+        self.models = models or {}
+        self.plan_by_image = plan_by_image
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.plan_source = plan_source
+        self.random = random.Random(seed)
+        self._index = 0
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.wrong_plans = 0
+        self.tail_requests = 0
+        self.errors = 0
+        self._prefixes: set = set()
+        self.connections = 0  # 客户端建立的 TCP 连接数，与 requests 对比可看出连接复用
+
+    def next_plan(self, image_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        选择本次返回的计划
+
+        Args:
+            image_key (Optional[str]): 请求中第一张图像的 URL，plan_by_image 时用于选择计划
+
+        Returns:
+            Dict[str, Any]: 计划；设置了 plan_source 时返回其结果，否则按顺序轮流返回
+        """
+        if self.plan_source:
+            plan = self.plan_source()
+            if plan is not None:
+                with self._lock:
+                    self.requests += 1
+                return plan
+        with self._lock:
+            self.requests += 1
+            if self.plan_by_image and image_key:
+                return self.plans[zlib.crc32(image_key.encode("utf-8")) % len(self.plans)]
+            plan = self.plans[self._index % len(self.plans)]
+            self._index += 1
+            return plan
+
+    def degrade(self, plan: Dict[str, Any], model: str) -> Dict[str, Any]:
+        """
+        按模型准确率随机把计划改错：漏掉最后一步，或把第一步的单词写错
+
+        Args:
+            plan (Dict[str, Any]): 正确的计划
+            model (str): 请求的模型名
+
+        Returns:
+            Dict[str, Any]: 计划（可能是改错后的副本）
+        """
+        profile = self.models.get(model)
+        if profile is None or not plan.get("steps"):
+            return plan
+        with self._lock:
+            if self.random.random() < profile.accuracy:
+                return plan
+            self.wrong_plans += 1
+            drop = len(plan["steps"]) > 1 and self.random.random() < 0.5
+        plan = copy.deepcopy(plan)
+        if drop:
+            plan["steps"].pop()
+        else:
+            step = plan["steps"][0]
+            step["input"] = step["input"][::-1] + "x"
+        return plan
+
+    def sample_latency(self, completion_tokens: int = 0, model: Optional[str] = None) -> float:
+        """
+        采样一次请求的总延迟
+
+        Args:
+            completion_tokens (int): 输出 token 数
+            model (Optional[str]): 请求的模型名，配置了该模型时使用其延迟
+
+        Returns:
+            float: 总延迟（秒）
+        """
+        profile = self.models.get(model)
+        latency, jitter = (profile.latency, profile.jitter) if profile else (self.latency, self.jitter)
+        with self._lock:
+            base = max(0.0, latency + self.random.uniform(-jitter, jitter))
+            if self.tail_rate and self.random.random() < self.tail_rate:
+                self.tail_requests += 1
+                base += self.tail_latency
+        return base + completion_tokens * self.token_latency
+
+    def cached_tokens(self, prefix: str, tokens: int) -> int:
+        """
+        按 OpenAI 的规则模拟提示词缓存：前缀至少 1024 token，按 128 token 为单位命中
+
+        Args:
+            prefix (str): 请求中截图之前的内容（模型、输出格式和消息）
+            tokens (int): 前缀的 token 数
+
+        Returns:
+            int: 命中缓存的 token 数，首次出现的前缀为 0
+        """
+        if tokens < 1024:
+            return 0
+        key = zlib.crc32(prefix.encode("utf-8"))
+        with self._lock:
+            seen = key in self._prefixes
+            self._prefixes.add(key)
+        return tokens // 128 * 128 if seen else 0
+
+    def should_fail(self) -> bool:
+        """
+        按 error_rate 决定本次请求是否返回服务端错误
+
+        Returns:
+            bool: 是否返回 500
+        """
+        if not self.error_rate:
+            return False
+        with self._lock:
+            failed = self.random.random() < self.error_rate
+            self.errors += failed
+        return failed
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    """chat.completions 请求处理器"""
+
+    protocol_version = "HTTP/1.1"
+    config: MockConfig  # 由 start_mock_server 注入
+    prompt_tokens = 1000  # 当前请求的输入 token 估算
+    cached_tokens = 0  # 当前请求命中提示词缓存的 token 数
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # 基准测试时不输出访问日志
+        pass
+
+    def setup(self) -> None:
+        # 每个 TCP 连接创建一个处理器实例，长连接上的后续请求复用同一实例
+        super().setup()
+        with self.config._lock:
+            self.config.connections += 1
+
+    def do_POST(self) -> None:
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.config.should_fail():
+            self.send_error(500, "mock server error")
+            return
+        model = request.get("model", "mock")
+        plan = self.config.degrade(self.config.next_plan(self._image_key(request)), model)
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            # 快速模式：按 Schema 返回精简计划
+            plan = self._schema_plan(plan, response_format["json_schema"]["schema"])
+        content = json.dumps(plan, ensure_ascii=False)
+        self.prompt_tokens = self._prompt_tokens(request)
+        self.cached_tokens = self.config.cached_tokens(*self._prefix(request))
+        latency = self.config.sample_latency(self._usage(content)["completion_tokens"], model)
+
+        if request.get("stream"):
+            include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+            self._stream(model, content, latency, include_usage)
+        else:
+            time.sleep(latency)
+            self._send_json(self._completion(model, content))
+
+    @staticmethod
+    def _image_key(request: Dict[str, Any]) -> Optional[str]:
+        """请求中第一张图像的 URL"""
+        for message in request.get("messages", []):
+            content = message.get("content")
+            if isinstance(content, list):
+                for part in content:
+                    if part.get("type") == "image_url":
+                        return part["image_url"]["url"]
+        return None
+
+    @staticmethod
+    def _schema_plan(plan: Dict[str, Any], schema: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        按请求的 Schema 生成精简计划
+
+        Args:
+            plan (Dict[str, Any]): 预置的详细计划
+            schema (Dict[str, Any]): 请求中的 JSON Schema
+
+        Returns:
+            Dict[str, Any]: 精简计划；Schema 限定 area 取值时只保留这些区域，要求 order 时附带订单
+        """
+        fast = Plan.from_verbose(plan).to_fast_dict()
+        properties = schema.get("properties", {})
+        areas = properties["steps"]["items"]["properties"]["area"].get("enum")
+        if areas:
+            fast["steps"] = [step for step in fast["steps"] if step["area"] in areas]
+        if "order" in properties:
+            fast["order"] = plan.get("order") or ""
+        return fast
+
+    @staticmethod
+    def _prompt_tokens(request: Dict[str, Any]) -> int:
+        """
+        粗略估算输入 token：文本约 4 字节一个 token，data URL 图像按尺寸和 detail 估算
+
+        Args:
+            request (Dict[str, Any]): chat.completions 请求
+
+        Returns:
+            int: 输入 token 数
+        """
+        tokens = 0
+        for message in request.get("messages", []):
+            content = message.get("content")
+            parts = [{"type": "text", "text": content}] if isinstance(content, str) else content or []
+            for part in parts:
+                if part.get("type") == "text":
+                    tokens += len(part["text"].encode("utf-8")) // 4
+                elif part.get("type") == "image_url":
+                    image_url = part["image_url"]
+                    detail = image_url.get("detail", "high")
+                    try:
+                        encoded = image_url["url"].split(",", 1)[1]
+                        with Image.open(io.BytesIO(base64.b64decode(encoded))) as image:
+                            tokens += estimate_image_tokens(image.width, image.height, detail)
+                    except (IndexError, binascii.Error, OSError):
+                        # 远程 URL：按 1024x768 的 high detail 估算
+                        tokens += estimate_image_tokens(1024, 768, detail)
+        return tokens
+
+    @staticmethod
+    def _prefix(request: Dict[str, Any]) -> tuple:
+        """
+        请求中第一张图像之前的内容及其 token 数（文本约 4 字节一个 token）
+
+        Args:
+            request (Dict[str, Any]): chat.completions 请求
+
+        Returns:
+            tuple: (前缀的序列化文本, token 数)
+        """
+        parts: List[Any] = [request.get("model"), request.get("response_format")]
+        tokens = 0
+        for message in request.get("messages", []):
+            content = message.get("content")
+            items = [{"type": "text", "text": content}] if isinstance(content, str) else content or []
+            for item in items:
+                if item.get("type") != "text":
+                    return json.dumps(parts, ensure_ascii=False, sort_keys=True), tokens
+                parts.append([message.get("role"), item["text"]])
+                tokens += len(item["text"].encode("utf-8")) // 4
+        return json.dumps(parts, ensure_ascii=False, sort_keys=True), tokens
+
+    def _usage(self, content: str) -> Dict[str, Any]:
+        """粗略估算 token 用量（输出约 4 个字符一个 token）"""
+        prompt = self.prompt_tokens
+        completion = max(1, len(content) // 4)
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion,
+                "prompt_tokens_details": {"cached_tokens": self.cached_tokens}}
+
+    def _completion(self, model: str, content: str) -> Dict[str, Any]:
+        """构造非流式响应"""
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": self._usage(content),
+        }
+
+    def _send_json(self, body: Dict[str, Any]) -> None:
+        """发送 JSON 响应"""
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, model: str, content: str, latency: float, include_usage: bool = False) -> None:
+        """以 SSE 流式发送响应，首个 token 之后均匀发送其余内容"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+        pieces = [content[i:i + 8] for i in range(0, len(content), 8)]
+        ttft = latency * self.config.ttft_ratio
+        per_piece = (latency - ttft) / max(len(pieces), 1)
+        time.sleep(ttft)
+        for index, piece in enumerate(pieces):
+            if index:
+                time.sleep(per_piece)
+            self._send_event({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            })
+        self._send_event({
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        })
+        if include_usage:
+            # 与真实接口一致：最后一个事件不含 choices，只携带 usage
+            self._send_event({
+                "id": chunk_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [],
+                "usage": self._usage(content),
+            })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, body: Dict[str, Any]) -> None:
+        """发送一个 SSE 事件"""
+        self.wfile.write(f"data: {json.dumps(body, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+class QuietHTTPServer(ThreadingHTTPServer):
+    """客户端超时或取消对冲请求时会提前断开连接，不打印这类异常"""
+
+    def handle_error(self, request, client_address) -> None:
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_mock_server(config: MockConfig, host: str = "127.0.0.1",
+                      port: int = 0) -> ThreadingHTTPServer:
+    """
+    在后台线程启动模拟服务
+
+    Args:
+        config (MockConfig): 模拟服务配置
+        host (str): 监听地址
+        port (int): 监听端口，0 表示随机端口
+
+    Returns:
+        ThreadingHTTPServer: 服务实例，base URL 为 http://host:server.server_port/v1
+    """
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config})
+    server = QuietHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_plans(path: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """
+    从 JSON 文件或截图归档加载计划列表
+
+    Args:
+        path (Optional[str]): 文件路径，内容为计划对象或计划列表；
+            也可以是截图归档目录，按帧顺序使用录制时模型返回的计划
+
+    Returns:
+        Optional[List[Dict[str, Any]]]: 计划列表，未指定时返回 None
+    """
+    if not path:
+        return None
+    if Path(path).is_dir():
+        from archive import ArchiveReader
+        reader = ArchiveReader(Path(path))
+        try:
+            return reader.plans()
+        finally:
+            reader.close()
+    data = json.loads(Path(path).read_text(encoding="utf-8"))
+    return data if isinstance(data, list) else [data]
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="本地模拟 OpenAI chat.completions 接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0, help="平均总延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟抖动幅度（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="每个输出 token 的耗时（秒）")
+    parser.add_argument("--plans", help="预置计划 JSON 文件")
+    parser.add_argument("--model", action="append",
+                        help="模拟的模型：名称:延迟:准确率[:抖动]，可重复指定")
+    parser.add_argument("--plan-by-image", action="store_true", help="按图像选择计划，同一帧的请求返回同一计划")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="请求落入长尾的概率")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="长尾请求额外的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 错误的概率")
+    args = parser.parse_args()
+
+    config = MockConfig(load_plans(args.plans), args.latency, args.jitter,
+                        token_latency=args.token_latency, models=parse_model_profiles(args.model),
+                        plan_by_image=args.plan_by_image, tail_rate=args.tail_rate,
+                        tail_latency=args.tail_latency, error_rate=args.error_rate)
+    server = start_mock_server(config, args.host, args.port)
+    print(f"模拟服务已启动: http://{args.host}:{server.server_port}/v1")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n模拟服务已停止，共处理 {config.requests} 个请求，{config.connections} 个连接")
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,619 @@
+#!/usr/bin/env python3
+"""
+多窗口多智能体运行器
+主要功能：
+1. 同时驱动多个游戏实例，每个智能体一个 GameWindow，可运行在独立进程和独立 Xvfb 显示（DISPLAY）中
+2. 所有智能体共享一个规划池：限制同时进行的请求数，按令牌桶执行全局每分钟请求数（RPM）和 token 数（TPM）限制
+3. 排队的请求在智能体之间轮转放行，一个智能体请求再多也不会占满配额
+4. 输出每个智能体和总体的每秒动作数，观察增加智能体时吞吐的变化
+
+用法:
+    python multi_agent.py --agents 3 --displays :1,:2,:3 [--title "The Chef's Shift"]
+                          [--mode process|thread] [--workers 4] [--rpm 60] [--tpm 90000] [--duration 300]
+
+process 模式下每个智能体是独立进程（启动时设置各自的 DISPLAY），规划池运行在管理进程中；
+thread 模式下智能体是同一进程中的线程，共用当前 DISPLAY，只适合不同标题的窗口或无界面画面来源。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import itertools
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from multiprocessing.managers import BaseManager
+from typing import TYPE_CHECKING, Any, Callable, Collection, Deque, Dict, List, Optional, Union
+
+from frame import Frame
+from metrics import metrics, percentiles
+from plan import Plan
+from planner import GamePlanner
+
+if TYPE_CHECKING:  # 子进程设置 DISPLAY 之前不导入 pyautogui
+    from async_runner import AsyncAgentRunner
+    from game_window import GameWindow
+
+
+class TokenBucket:
+    """
+    令牌桶：按每分钟的速率补充，最多积累 burst 秒的量
+
+    速率为 0 时不限制。单次需求超过桶容量时，等桶满后放行并允许透支，
+    透支的部分由之后的补充抵扣。
+    """
+
+    def __init__(self, per_minute: float, burst: float = 10.0):
+        """
+        初始化令牌桶
+
+        Args:
+            per_minute (float): 每分钟补充量，0 表示不限制
+            burst (float): 桶容量对应的秒数
+        """
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def limited(self) -> bool:
+        """是否限制速率"""
+        return self.rate > 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """
+        计算取出指定数量前还需等待的时间（不取出）
+
+        Args:
+            amount (float): 需求量
+
+        Returns:
+            float: 等待时间（秒），0 表示可以立即取出
+        """
+        if not self.limited:
+            return 0.0
+        self._refill()
+        need = min(amount, self.capacity)
+        return 0.0 if self.level >= need else (need - self.level) / self.rate
+
+    def consume(self, amount: float) -> None:
+        """
+        取出指定数量，负数表示退还
+
+        Args:
+            amount (float): 数量
+        """
+        if not self.limited:
+            return
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+@dataclass
+class AgentStats:
+    """规划池中一个智能体的统计"""
+
+    estimate: float  # 每次请求 token 数的估计（按实际用量滑动平均）
+    requests: int = 0
+    tokens: int = 0
+    waits: Deque[float] = field(default_factory=lambda: deque(maxlen=1000))  # 排队时间（秒）
+    actions: int = 0  # 智能体上报的已输入单词数
+    elapsed: float = 0.0  # 智能体上报的运行时间（秒）
+
+
+class PlannerPool:
+    """
+    多个智能体共享的规划池
+
+    请求前调用 acquire 排队，放行后由调用方发出请求，结束后调用 release 上报实际 token 用量。
+    放行条件：轮到该智能体（在有排队请求的智能体之间轮转）、同时进行的请求数未满、
+    RPM 和 TPM 令牌桶都有余量。TPM 按估计值预扣，请求结束后按实际用量多退少补。
+    """
+
+    def __init__(self, workers: Optional[int] = None, rpm: Optional[float] = None,
+                 tpm: Optional[float] = None, burst: float = 10.0, default_tokens: int = 3000):
+        """
+        初始化规划池
+
+        Args:
+            workers (Optional[int]): 同时进行的请求数，默认读取 PLANNER_POOL_WORKERS
+            rpm (Optional[float]): 每分钟请求数上限，0 表示不限制，默认读取 PLANNER_RPM
+            tpm (Optional[float]): 每分钟 token 数上限，0 表示不限制，默认读取 PLANNER_TPM
+            burst (float): 令牌桶容量对应的秒数
+            default_tokens (int): 智能体第一次请求时的 token 估计
+        """
+        self.workers = workers or int(os.getenv('PLANNER_POOL_WORKERS', '4'))
+        self.rpm = TokenBucket(rpm if rpm is not None else float(os.getenv('PLANNER_RPM', '0')), burst)
+        self.tpm = TokenBucket(tpm if tpm is not None else float(os.getenv('PLANNER_TPM', '0')), burst)
+        self.default_tokens = default_tokens
+        self._cond = threading.Condition()
+        self._queues: Dict[str, Deque[int]] = {}
+        self._agents: Dict[str, AgentStats] = {}
+        self._order: List[str] = []
+        self._last = -1
+        self._tickets = itertools.count()
+        self.active = 0
+        self.throttled = 0.0  # 因 RPM/TPM 限制等待的总时间（秒）
+
+    def _register(self, agent: str) -> AgentStats:
+        if agent not in self._agents:
+            self._agents[agent] = AgentStats(estimate=self.default_tokens)
+            self._queues[agent] = deque()
+            self._order.append(agent)
+        return self._agents[agent]
+
+    def register(self, agent: str) -> None:
+        """
+        注册智能体（第一次 acquire 时也会自动注册）
+
+        Args:
+            agent (str): 智能体名称
+        """
+        with self._cond:
+            self._register(agent)
+
+    def _next_agent(self) -> Optional[str]:
+        """从上次放行的智能体之后开始，找到第一个有排队请求的智能体"""
+        count = len(self._order)
+        for step in range(1, count + 1):
+            agent = self._order[(self._last + step) % count]
+            if self._queues[agent]:
+                return agent
+        return None
+
+    def acquire(self, agent: str) -> float:
+        """
+        排队等待发出一次请求
+
+        Args:
+            agent (str): 智能体名称
+
+        Returns:
+            float: 本次请求预扣的 token 数，release 时原样传回
+        """
+        enqueued = time.monotonic()
+        with self._cond:
+            stats = self._register(agent)
+            queue = self._queues[agent]
+            ticket = next(self._tickets)
+            queue.append(ticket)
+            try:
+                while True:
+                    if self._next_agent() != agent or queue[0] != ticket or self.active >= self.workers:
+                        self._cond.wait()
+                        continue
+                    delay = max(self.rpm.delay(1), self.tpm.delay(stats.estimate))
+                    if delay <= 0:
+                        break
+                    # 配额不足：轮到的请求等待补充，其他请求继续排队
+                    throttle_start = time.monotonic()
+                    self._cond.wait(delay)
+                    self.throttled += time.monotonic() - throttle_start
+            except BaseException:
+                queue.remove(ticket)
+                self._cond.notify_all()
+                raise
+
+            queue.popleft()
+            self.active += 1
+            self._last = self._order.index(agent)
+            estimate = stats.estimate
+            self.rpm.consume(1)
+            self.tpm.consume(estimate)
+            wait = time.monotonic() - enqueued
+            stats.requests += 1
+            stats.waits.append(wait)
+            self._cond.notify_all()
+        metrics.observe("pool_wait", wait, agent=agent)
+        return estimate
+
+    def release(self, agent: str, estimate: float, tokens: int = 0) -> None:
+        """
+        请求结束，归还并发槽位，按实际用量修正 TPM 预扣
+
+        Args:
+            agent (str): 智能体名称
+            estimate (float): acquire 返回的预扣 token 数
+            tokens (int): 实际用量，0 表示未知（不修正）
+        """
+        with self._cond:
+            self.active -= 1
+            if tokens:
+                stats = self._agents[agent]
+                self.tpm.consume(tokens - estimate)
+                stats.tokens += tokens
+                stats.estimate += 0.3 * (tokens - stats.estimate)
+            self._cond.notify_all()
+        if tokens:
+            metrics.incr("pool_tokens", tokens)
+
+    def progress(self, agent: str, actions: int, elapsed: float) -> None:
+        """
+        智能体上报已输入单词数和运行时间，用于计算吞吐
+
+        Args:
+            agent (str): 智能体名称
+            actions (int): 已输入单词数
+            elapsed (float): 运行时间（秒）
+        """
+        with self._cond:
+            stats = self._register(agent)
+            stats.actions = actions
+            stats.elapsed = elapsed
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        统计数据
+
+        Returns:
+            Dict[str, Any]: 限额配置、总请求数和 token、因限额等待的时间、
+                每个智能体的请求数、token、排队时间分位数（毫秒）和每秒动作数，以及总体每秒动作数
+        """
+        with self._cond:
+            agents = {
+                name: {
+                    "requests": stats.requests,
+                    "tokens": stats.tokens,
+                    "wait_ms": percentiles(stats.waits),
+                    "actions": stats.actions,
+                    "elapsed_s": stats.elapsed,
+                    "actions_per_s": stats.actions / stats.elapsed if stats.elapsed else 0.0,
+                }
+                for name, stats in self._agents.items()
+            }
+            return {
+                "workers": self.workers,
+                "rpm": self.rpm.rate * 60,
+                "tpm": self.tpm.rate * 60,
+                "requests": sum(item["requests"] for item in agents.values()),
+                "tokens": sum(item["tokens"] for item in agents.values()),
+                "throttled_s": self.throttled,
+                "actions_per_s": sum(item["actions_per_s"] for item in agents.values()),
+                "agents": agents,
+            }
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 智能体数、请求数、token、限额等待时间和总体每秒动作数
+        """
+        summary = self.summary()
+        return (
+            f"智能体 {len(summary['agents'])}, 请求 {summary['requests']}, token {summary['tokens']}, "
+            f"限额等待 {summary['throttled_s']:.1f}s, 总体每秒动作数 {summary['actions_per_s']:.2f}"
+        )
+
+
+class PoolManager(BaseManager):
+    """在管理进程中运行规划池，供各智能体进程通过代理共享"""
+
+
+PoolManager.register("PlannerPool", PlannerPool)
+
+
+class PooledPlanner:
+    """
+    通过共享规划池发出请求的规划器
+
+    每个智能体一个，包装该智能体自己的 GamePlanner（提示词阶段等状态按智能体区分），
+    接口与 GamePlanner 相同，未覆盖的属性直接转发。
+
+    规划池每次放行按一个 HTTP 请求计入 RPM，因此关闭该规划器请求执行器的对冲和重试
+    （进程内同一模型共用执行器，多智能体进程中的规划器都经过规划池）；
+    失败的帧不在池外重试，由之后的帧重新排队请求。
+    """
+
+    def __init__(self, planner: GamePlanner, pool: PlannerPool, agent: str):
+        """
+        初始化
+
+        Args:
+            planner (GamePlanner): 该智能体的规划器
+            pool (PlannerPool): 共享规划池（或其进程间代理）
+            agent (str): 智能体名称
+        """
+        self.planner = planner
+        self.pool = pool
+        self.agent = agent
+        planner.requests.hedge = False
+        planner.requests.retries = 0
+        pool.register(agent)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.planner, name)
+
+    def _call(self, image: Union[Frame, str, None], call: Callable[[], Any]) -> Any:
+        """排队放行后发出请求，结束后上报该帧的实际 token 用量"""
+        estimate = self.pool.acquire(self.agent)
+        try:
+            return call()
+        finally:
+            tokens = image.tokens if isinstance(image, Frame) else 0
+            self.pool.release(self.agent, estimate, tokens)
+
+    def warm_up(self) -> bool:
+        """预热请求同样计入限额"""
+        return self._call(None, self.planner.warm_up)
+
+    def analyze_screenshot(self, image: Union[Frame, str], context: Optional[str] = None,
+                           regions: Optional[Collection[str]] = None) -> Optional[Plan]:
+        """见 GamePlanner.analyze_screenshot"""
+        return self._call(image, lambda: self.planner.analyze_screenshot(image, context, regions))
+
+    def analyze_screenshot_stream(self, image: Union[Frame, str], on_input: Callable[[str], None],
+                                  context: Optional[str] = None,
+                                  regions: Optional[Collection[str]] = None) -> Optional[Plan]:
+        """见 GamePlanner.analyze_screenshot_stream"""
+        return self._call(image, lambda: self.planner.analyze_screenshot_stream(image, on_input, context, regions))
+
+    async def analyze_screenshot_async(self, image: Union[Frame, str], context: Optional[str] = None,
+                                       regions: Optional[Collection[str]] = None) -> Optional[Plan]:
+        """
+        异步版本
+
+        共享的异步 HTTP 客户端只能在一个事件循环中使用，而线程模式下每个智能体有自己的事件循环，
+        因此在线程中执行同步请求。
+        """
+        return await asyncio.to_thread(self.analyze_screenshot, image, context, regions)
+
+    async def analyze_screenshot_stream_async(self, image: Union[Frame, str], on_input: Callable[[str], None],
+                                              context: Optional[str] = None,
+                                              regions: Optional[Collection[str]] = None) -> Optional[Plan]:
+        """异步流式版本，解析出的单词转回事件循环线程交给回调"""
+        loop = asyncio.get_running_loop()
+        return await asyncio.to_thread(
+            self.analyze_screenshot_stream, image,
+            lambda word: loop.call_soon_threadsafe(on_input, word), context, regions)
+
+
+@dataclass
+class AgentSpec:
+    """一个智能体要控制的游戏实例"""
+
+    name: str
+    window_title: str = "The Chef's Shift"
+    display: Optional[str] = None  # X 显示，如 :1；为 None 时使用当前 DISPLAY
+
+
+def build_runner(game_window: "GameWindow", planner: GamePlanner) -> "AsyncAgentRunner":
+    """
+    按与 chef.py 相同的环境变量为一个智能体创建异步运行器
+
+    分片和级联会让一帧产生多个请求，多智能体时不启用。
+
+    Args:
+        game_window (GameWindow): 该智能体的游戏窗口
+        planner (GamePlanner): 该智能体的规划器（多智能体时为 PooledPlanner）
+
+    Returns:
+        AsyncAgentRunner: 运行器
+    """
+    from async_runner import AsyncAgentRunner
+    from change_detector import FrameChangeDetector
+    from game_state import GameStateTracker
+    from recipes import MacroEngine
+    from verifier import WordVerifier
+    from word_detector import OCR_AVAILABLE, LocalFastPath
+
+    def enabled(name: str, default: str) -> bool:
+        return os.getenv(name, default).lower() in ('1', 'true', 'yes')
+
+    detector = FrameChangeDetector() if enabled('CHANGE_DETECTION', '1') else None
+    fast_path = None
+    if enabled('LOCAL_FASTPATH', '1'):
+        if OCR_AVAILABLE:
+            fast_path = LocalFastPath()
+            game_window.executor.typed_callbacks.append(fast_path.record_typed)
+        else:
+            print("未安装 pytesseract，本地快速路径不可用")
+    state = None
+    if enabled('GAME_STATE', '1'):
+        state = GameStateTracker()
+        game_window.executor.typed_callbacks.append(state.record_typed)
+    macros = None
+    if enabled('MACROS', '1'):
+        macros = MacroEngine(game_window.executor)
+        macros.start()
+    verifier = None
+    if enabled('VERIFY_INPUT', '0'):
+        verifier = WordVerifier(game_window.executor, game_window.sample_frame)
+        verifier.start()
+    return AsyncAgentRunner(game_window, planner, detector, fast_path, enabled('PLANNER_STREAM', '0'),
+                            state, macros, verifier=verifier)
+
+
+async def _drive(runner: "AsyncAgentRunner", pool: PlannerPool, agent: str, duration: float,
+                 stop: Optional[Any]) -> None:
+    """运行智能体，每秒上报吞吐，到达运行时间或收到停止信号时取消"""
+    task = asyncio.create_task(runner.run())
+    start = time.perf_counter()
+    try:
+        while not task.done():
+            await asyncio.wait({task}, timeout=1.0)
+            elapsed = time.perf_counter() - start
+            pool.progress(agent, runner.game_window.typed_word_count, elapsed)
+            if (duration and elapsed >= duration) or (stop is not None and stop.is_set()):
+                task.cancel()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        pool.progress(agent, runner.game_window.typed_word_count, time.perf_counter() - start)
+
+
+def run_agent(spec: AgentSpec, pool: PlannerPool, duration: float = 0.0, stop: Optional[Any] = None,
+              game_window: Optional["GameWindow"] = None) -> None:
+    """
+    运行一个智能体，直到到达运行时间、收到停止信号或被中断
+
+    Args:
+        spec (AgentSpec): 智能体配置
+        pool (PlannerPool): 共享规划池（或其进程间代理）
+        duration (float): 运行时间（秒），0 表示一直运行
+        stop (Optional[Event]): 停止信号（threading.Event 或 multiprocessing.Event）
+        game_window (Optional[GameWindow]): 已创建的游戏窗口（无界面画面来源等），默认按 spec 创建
+    """
+    if game_window is None:
+        from game_window import GameWindow
+        # 各智能体的截图归档分开存放
+        archive_dir = os.path.join(os.getenv('ARCHIVE_DIR', 'screenshots'), spec.name)
+        game_window = GameWindow(spec.window_title, archive_dir=archive_dir)
+    print(f"[{spec.name}] 窗口 '{spec.window_title}', DISPLAY={os.getenv('DISPLAY', '-')}")
+
+    planner = PooledPlanner(GamePlanner(), pool, spec.name)
+    # 窗口预热与规划器预热同时进行
+    window_warmup = None
+    if os.getenv('WARM_START', '1').lower() in ('1', 'true', 'yes'):
+        window_warmup = threading.Thread(target=game_window.warm_up, daemon=True)
+        window_warmup.start()
+    if os.getenv('PLANNER_WARMUP', '1').lower() in ('1', 'true', 'yes'):
+        planner.warm_up()
+    if window_warmup:
+        window_warmup.join()
+    runner = build_runner(game_window, planner)
+    game_window.start_keyboard_thread()
+    game_window.start_capture_thread()
+    try:
+        asyncio.run(_drive(runner, pool, spec.name, duration, stop))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if runner.macros:
+            runner.macros.stop()
+        if runner.verifier:
+            runner.verifier.stop()
+        if runner.state and os.getenv('GAME_STATE_FILE'):
+            runner.state.save(f"{os.getenv('GAME_STATE_FILE')}.{spec.name}")
+        game_window.stop_keyboard_thread()
+        game_window.stop_capture_thread()
+        game_window.stop_archive()
+
+
+@contextlib.contextmanager
+def _display(display: Optional[str]):
+    """临时设置 DISPLAY，子进程启动时继承"""
+    previous = os.environ.get('DISPLAY')
+    if display:
+        os.environ['DISPLAY'] = display
+    try:
+        yield
+    finally:
+        if previous is None:
+            os.environ.pop('DISPLAY', None)
+        else:
+            os.environ['DISPLAY'] = previous
+
+
+def run_agents(specs: List[AgentSpec], pool: PlannerPool, mode: str = "process", duration: float = 0.0,
+               window_factory: Optional[Callable[[AgentSpec], "GameWindow"]] = None) -> None:
+    """
+    同时运行多个智能体，Ctrl+C 或到达运行时间后全部停止
+
+    Args:
+        specs (List[AgentSpec]): 智能体配置
+        pool (PlannerPool): 共享规划池；process 模式下必须是 PoolManager 创建的代理
+        mode (str): process（每个智能体一个进程，各自的 DISPLAY）/ thread（同一进程中的线程）
+        duration (float): 运行时间（秒），0 表示一直运行
+        window_factory (Optional[Callable[[AgentSpec], GameWindow]]): thread 模式下创建游戏窗口，
+            默认按窗口标题查找真实窗口
+    """
+    if mode == "process":
+        context = multiprocessing.get_context("spawn")
+        stop = context.Event()
+        workers = []
+        for spec in specs:
+            # 子进程在启动时继承 DISPLAY，在其中导入的 pyautogui 连接到对应的显示
+            with _display(spec.display):
+                worker = context.Process(target=run_agent, args=(spec, pool, duration, stop), name=spec.name)
+                worker.start()
+            workers.append(worker)
+    else:
+        if any(spec.display for spec in specs):
+            print("thread 模式下所有智能体共用当前 DISPLAY，忽略 --displays")
+        stop = threading.Event()
+        workers = []
+        for spec in specs:
+            window = window_factory(spec) if window_factory else None
+            worker = threading.Thread(target=run_agent, args=(spec, pool, duration, stop, window),
+                                      name=spec.name, daemon=True)
+            worker.start()
+            workers.append(worker)
+
+    try:
+        for worker in workers:
+            while worker.is_alive():
+                worker.join(timeout=1.0)
+    except KeyboardInterrupt:
+        print("\n停止所有智能体")
+        stop.set()
+        for worker in workers:
+            worker.join(timeout=30)
+
+
+def print_summary(pool: PlannerPool) -> None:
+    """输出规划池和每个智能体的统计"""
+    summary = pool.summary()
+    for name, agent in summary["agents"].items():
+        wait = agent["wait_ms"].get("p50", 0.0)
+        print(f"[智能体] {name}: 请求 {agent['requests']}, token {agent['tokens']}, "
+              f"排队 p50 {wait:.0f}ms, 动作 {agent['actions']}, 每秒动作数 {agent['actions_per_s']:.2f}")
+    print(f"[规划池] {pool.report()}")
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="多窗口多智能体运行器")
+    parser.add_argument("--agents", type=int, default=2, help="智能体数量")
+    parser.add_argument("--title", default="The Chef's Shift", help="游戏窗口标题")
+    parser.add_argument("--displays", help="每个智能体的 X 显示，逗号分隔，如 :1,:2")
+    parser.add_argument("--mode", choices=("process", "thread"), default="process", help="智能体运行方式")
+    parser.add_argument("--workers", type=int, help="同时进行的请求数，默认读取 PLANNER_POOL_WORKERS")
+    parser.add_argument("--rpm", type=float, help="每分钟请求数上限，默认读取 PLANNER_RPM")
+    parser.add_argument("--tpm", type=float, help="每分钟 token 数上限，默认读取 PLANNER_TPM")
+    parser.add_argument("--duration", type=float, default=0.0, help="运行时间（秒），0 表示一直运行")
+    args = parser.parse_args()
+
+    try:
+        displays = args.displays.split(",") if args.displays else []
+        if displays and len(displays) != args.agents:
+            raise ValueError(f"--displays 需要 {args.agents} 个显示，实际 {len(displays)} 个")
+        specs = [AgentSpec(f"agent{index}", args.title, displays[index] if displays else None)
+                 for index in range(args.agents)]
+
+        manager = None
+        if args.mode == "process":
+            manager = PoolManager()
+            # Ctrl+C 只停止智能体，管理进程保留到输出统计之后
+            manager.start(signal.signal, (signal.SIGINT, signal.SIG_IGN))
+            pool = manager.PlannerPool(args.workers, args.rpm, args.tpm)
+        else:
+            pool = PlannerPool(args.workers, args.rpm, args.tpm)
+        try:
+            run_agents(specs, pool, args.mode, args.duration)
+            print_summary(pool)
+        finally:
+            if manager:
+                manager.shutdown()
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
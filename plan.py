@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+类型化的游戏计划
+主要功能：
+1. PlanStep / Plan 数据类，取代裸的单词列表
+2. 快速模式的最小 JSON Schema（word、area、priority），用于结构化输出
+3. 快速模式的严格校验，以及详细模式（带 description / reasoning）的兼容解析
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from input_scheduler import AREA_PRIORITY, PRIORITY_ORDER
+
+# 计划中的区域，与系统提示词中的区域划分一致
+AREAS = ("customer", "cashier", "coffee_machine", "food_station", "mouse", "other")
+
+# 快速模式的结构化输出 Schema（strict 模式要求列出全部字段并禁止额外字段）
+FAST_PLAN_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "steps": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "word": {"type": "string"},
+                    "area": {"type": "string", "enum": list(AREAS)},
+                    "priority": {"type": "string", "enum": list(PRIORITY_ORDER)},
+                },
+                "required": ["word", "area", "priority"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["steps"],
+    "additionalProperties": False,
+}
+
+# chat.completions 的 response_format 参数
+FAST_RESPONSE_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {"name": "chef_plan", "strict": True, "schema": FAST_PLAN_SCHEMA},
+}
+
+
+class PlanValidationError(ValueError):
+    """模型返回的计划不符合 Schema"""
+
+
+@dataclass
+class PlanStep:
+    """计划中的一步：输入一个单词"""
+
+    word: str
+    area: str = "other"
+    priority: Optional[str] = None  # 优先级类别，见 PRIORITY_ORDER；None 表示由调度器判断
+    yellow: bool = False  # 单词前缀是否为黄色字母
+    action: str = ""  # 仅详细模式
+    reasoning: str = ""  # 仅详细模式
+
+    @classmethod
+    def from_fast(cls, data: Any) -> "PlanStep":
+        """
+        严格解析快速模式的步骤
+
+        Args:
+            data (Any): 步骤对象
+
+        Returns:
+            PlanStep: 步骤
+
+        Raises:
+            PlanValidationError: 字段缺失、多余、类型或取值不合法
+        """
+        if not isinstance(data, dict):
+            raise PlanValidationError(f"步骤不是对象: {data!r}")
+        if set(data) != {"word", "area", "priority"}:
+            raise PlanValidationError(f"步骤字段不符合 Schema: {sorted(data)}")
+        word, area, priority = data["word"], data["area"], data["priority"]
+        if not isinstance(word, str) or not word or word != word.strip() or " " in word:
+            raise PlanValidationError(f"单词不合法: {word!r}")
+        if area not in AREAS:
+            raise PlanValidationError(f"未知区域: {area!r}")
+        if priority not in PRIORITY_ORDER:
+            raise PlanValidationError(f"未知优先级: {priority!r}")
+        return cls(word=word, area=area, priority=priority, yellow=priority == "yellow")
+
+    @classmethod
+    def from_verbose(cls, data: Any) -> "PlanStep":
+        """
+        解析详细模式的步骤（字段可选，缺失的优先级按区域推断）
+
+        Args:
+            data (Any): 包含 input、area、yellow、action、reasoning 的步骤对象
+
+        Returns:
+            PlanStep: 步骤
+
+        Raises:
+            PlanValidationError: 步骤不是对象或缺少 input 字段
+        """
+        if not isinstance(data, dict):
+            raise PlanValidationError(f"步骤不是对象: {data!r}")
+        word = data.get("input")
+        if not isinstance(word, str) or not word:
+            raise PlanValidationError(f"步骤缺少 input: {data!r}")
+        area = data.get("area") or "other"
+        yellow = bool(data.get("yellow"))
+        if area == "mouse":
+            priority = "rat"
+        elif yellow:
+            priority = "yellow"
+        else:
+            priority = AREA_PRIORITY.get(area)
+        return cls(word=word, area=area, priority=priority, yellow=yellow,
+                   action=data.get("action", ""), reasoning=data.get("reasoning", ""))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        转换为调度器使用的步骤字典（与详细模式的 steps 字段兼容）
+
+        Returns:
+            Dict[str, Any]: input、area、priority、yellow 等字段
+        """
+        step = {"input": self.word, "area": self.area, "priority": self.priority}
+        if self.yellow:
+            step["yellow"] = True
+        if self.action:
+            step["action"] = self.action
+        if self.reasoning:
+            step["reasoning"] = self.reasoning
+        return step
+
+
+@dataclass
+class Plan:
+    """模型针对一帧给出的计划"""
+
+    steps: List[PlanStep] = field(default_factory=list)
+    mode: str = "verbose"  # fast / verbose
+    description: str = ""  # 仅详细模式
+    raw: Dict[str, Any] = field(default_factory=dict)  # 模型返回的原始 JSON
+
+    @property
+    def inputs(self) -> List[str]:
+        """按顺序需要输入的单词"""
+        return [step.word for step in self.steps]
+
+    @property
+    def priorities(self) -> Dict[str, str]:
+        """单词 -> 优先级类别（只包含已确定优先级的单词）"""
+        return {step.word: step.priority for step in self.steps if step.priority}
+
+    @property
+    def mouse(self) -> bool:
+        """是否有老鼠"""
+        return bool(self.raw.get("mouse")) or any(step.area == "mouse" for step in self.steps)
+
+    @classmethod
+    def from_fast(cls, data: Any) -> "Plan":
+        """
+        严格解析快速模式的计划
+
+        Args:
+            data (Any): 已解码的 JSON
+
+        Returns:
+            Plan: 计划
+
+        Raises:
+            PlanValidationError: 不符合 FAST_PLAN_SCHEMA
+        """
+        if not isinstance(data, dict) or set(data) != {"steps"}:
+            raise PlanValidationError("计划必须是只包含 steps 的对象")
+        if not isinstance(data["steps"], list):
+            raise PlanValidationError("steps 必须是数组")
+        return cls(steps=[PlanStep.from_fast(step) for step in data["steps"]], mode="fast", raw=data)
+
+    @classmethod
+    def from_verbose(cls, data: Any) -> "Plan":
+        """
+        解析详细模式的计划
+
+        Args:
+            data (Any): 已解码的 JSON，包含 description、words、steps 等字段
+
+        Returns:
+            Plan: 计划
+
+        Raises:
+            PlanValidationError: 缺少 steps 或步骤不合法
+        """
+        if not isinstance(data, dict) or not isinstance(data.get("steps"), list):
+            raise PlanValidationError("计划缺少 steps 数组")
+        steps = [PlanStep.from_verbose(step) for step in data["steps"]]
+        return cls(steps=steps, mode="verbose", description=data.get("description", ""), raw=data)
+
+    @classmethod
+    def parse_fast(cls, content: str) -> "Plan":
+        """
+        解析快速模式的响应文本（整段必须是 JSON，不做截取）
+
+        Args:
+            content (str): 模型返回的文本
+
+        Returns:
+            Plan: 计划
+
+        Raises:
+            PlanValidationError: 不是合法 JSON 或不符合 Schema
+        """
+        try:
+            data = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise PlanValidationError(f"JSON 解析错误: {e}") from e
+        return cls.from_fast(data)
+
+    def to_fast_dict(self) -> Dict[str, Any]:
+        """
+        转换为快速模式的 JSON 结构
+
+        Returns:
+            Dict[str, Any]: {"steps": [{"word", "area", "priority"}]}
+        """
+        return {"steps": [
+            {"word": step.word, "area": step.area, "priority": step.priority or "cook"}
+            for step in self.steps
+        ]}
@@ -6,16 +6,38 @@ Chef's Shift AI 任务规划器
 
 import json
 import os
-from typing import Dict, List, Optional
+import time
+from typing import TYPE_CHECKING, Callable, Collection, Dict, List, Optional, Union
 
 from dotenv import load_dotenv
-from openai import OpenAI
+
+from frame import Frame
+from http_session import async_http_client, sync_http_client
+from metrics import metrics
+from plan import FAST_RESPONSE_FORMAT, Plan, PlanStep, PlanValidationError
+from prompts import PromptCompiler, monolithic_prompt
+from recipes import MacroEngine, compile_macros
+from resilience import RequestFailed, ResilientCaller, get_caller
+from stream_parser import StepStreamParser
+
+if TYPE_CHECKING:  # openai 导入较慢，首次请求时才导入
+    from openai import AsyncOpenAI, OpenAI
 
 class GamePlanner:
     """游戏任务规划器类"""
     
-    def __init__(self):
-        """初始化任务规划器"""
+    def __init__(self, mode: Optional[str] = None, model: Optional[str] = None,
+                 requests: Optional[ResilientCaller] = None):
+        """初始化任务规划器
+
+        Args:
+            mode (Optional[str]): fast（结构化输出，只返回单词）或 verbose（带推理，便于调试），
+                默认读取 PLANNER_MODE
+            model (Optional[str]): 视觉模型名，默认读取 PLANNER_MODEL（gpt-4o）
+            requests (Optional[ResilientCaller]): 请求执行器（超时、对冲、重试、熔断），
+                默认使用该模型共享的执行器
+        """
+        setup_start = time.perf_counter()
         # 加载环境变量
         load_dotenv()
         
@@ -24,208 +46,473 @@ class GamePlanner:
         if not openai_api_key:
             raise ValueError("请在 .env 文件中设置 OPENAI_API_KEY")
         
-        # 初始化 OpenAI 客户端
-        self.client = OpenAI()
+        # OpenAI 客户端在第一次请求（或预热）时创建：共用进程内的长连接池，重试由 ResilientCaller 负责
+        self._client: Optional["OpenAI"] = None
+        self._async_client: Optional["AsyncOpenAI"] = None
+        self.model = model or os.getenv('PLANNER_MODEL', 'gpt-4o')
+        self.requests = requests or get_caller(self.model)
+        self.mode = (mode or os.getenv('PLANNER_MODE', 'verbose')).lower()
+        if self.mode not in ('fast', 'verbose'):
+            raise ValueError(f"未知的规划模式: {self.mode}")
+        # 快速模式的输出只有单词列表，不需要 1000 个 token
+        self.max_tokens = 200 if self.mode == 'fast' else 1000
         
-        # 系统提示词
-        self.system_prompt = """你是一个《The Chef’s Shift》游戏的智能助手，负责根据游戏截图识别状态并提供操作计划。
-
-⸻
-
-🎮 游戏规则与界面说明：
-1. 玩家完全通过打字来进行游戏，包括开始游戏、制作食物、处理订单、收款等。所有操作都依赖输入屏幕上显示的单词。单词可能包含大小写字母和特殊字符（如 -、?、! 等）。
-2. 游戏控制界面通过打字如 start、retry、done 来进行控制。
-3. 玩家需要打的单词只与屏幕显示内容相关，不与食物名称或动作名称相关。
-4. 只有高亮显示的单词可以输入：深棕色底、白色字体。灰色或其他样式的单词不可输入。
-5. 每种食物有特定的制作步骤，输入指定位置的单词即可完成对应步骤。
-6. 玩家控制的是厨师，厨师穿着白色厨师服、红色围裙、戴着厨师帽。
-7. 屏幕结构说明：
-• 左上：为成品区，放置准备好的食物（带编号）
-• 中上偏左：甜品区，输入单词即完成
-• 中上偏中：咖啡机，右侧显示咖啡及其当前可用数量
-• 中偏左：收银台（烤炉和咖啡机之间）
-• 左下：炸物区（左侧原料 → 右侧油锅）
-• 下方：面条区（左侧食材 → 右侧锅）
-• 左侧边：披萨区（自下而上放料，顶部为烤箱）
-• 屏幕右、中、右上方：顾客桌位，靠近中央偏上有中央桌
-• 相对位置：咖啡区位于面条区上方，收银台位于烤炉和甜品区下方，甜品区和中央桌靠窗，甜品区位于中央桌左侧
-
-⸻
-
-👨‍🍳 食物制作说明：
-• 甜品区：输入甜品区的单词即可制作甜品，立即放入左上角的成品区
-• 咖啡区：
-- 咖啡机右侧是制作好的咖啡
-- 制作好的咖啡上方的数字（0/1/2）表示当前库存数量
-- 输入咖啡机上的单词可以制作咖啡，库存会增加
-- 有顾客点咖啡时，输入制作好的咖啡上方的单词（即咖啡种类，不是咖啡机），可以将其放入成品区
-- 有库存可以满足客户的时候不需要制作咖啡，只需将其放入成品区
-• 面条区：先输入左侧的面条食材单词，然后输入右侧锅上的单词烹饪
-- 烹饪完毕后再次输入锅的单词，即可将成品放入左上角成品区
-• 炸物区：先输入原料区单词，再输入炸锅上的单词进行烹饪
-- 炸好之后再次输入炸锅单词即可放入成品区
-• 披萨区：从下往上依次选择四种食材输入，最后输入烤炉上的单词烘烤
-- 烤好后再次输入烤炉单词将披萨放入成品区
-
-⸻
-
-👥 顾客服务流程：分为“堂食顾客”与“打包顾客”两类
-
-🍽️ 堂食顾客（坐在桌边）
-• 顾客固定坐在桌子旁，面对桌子（屏幕右侧或中央）
-• 订单图标（食物）和后续高亮单词显示在顾客面对的桌子上方，而不是顾客头上
-• 服务流程：
-1. 顾客桌上方出现食物图标 → 表示下单（不可输入）
-2. 食物制作完成后，桌子上方出现高亮词 → 输入该词完成上菜
-3. 上菜完成后，顾客离开桌子，前往收银台排队
-4. 顾客头顶出现钞票图标 → 可以输入收银台上的高亮单词完成付款
-
-🛍️ 打包顾客（站在收银台前）
-• 直接出现在收银台前，通常是独立角色
-• 订单图标和高亮词都显示在其头顶上方
-• 服务流程：
-1. 顾客头顶显示食物图标 → 表示下单（不可输入）
-2. 食物准备好后，顾客头顶出现高亮词 → 输入该词完成交付
-3. 顾客头顶出现钞票图标 → 可以输入收银台高亮词完成付款
-
-🚫 特别注意
-• 顾客头上方显示高亮词的 → 打包顾客的上菜词
-• 桌子上方显示高亮词的 → 堂食顾客的上菜词
-• 收银台上的高亮词始终存在，但只能在客户头顶显示钞票图标时才能输入
-• 所有单词都显示在物品或者顾客正上方，如果有很大的左右偏移，不能认为在上方
-• 甜品有三种、咖啡有两种、面食和炸物各有两种，需要仔细鉴别客户下单的菜品和厨房制作区的菜品和成品区的菜品
-• 注意区分高亮词和灰色的词。只有高亮词可以输入
-• 注意有些高亮词前面有字母是黄色的，优先输入这个词，再进行别的动作
-
-⸻
-
-⚠️ 收银规则（必须严格遵守）：
-• 收银台的单词始终是高亮的
-• 只有当顾客头顶出现钞票图标时，才可以输入收银台单词
-• 若收银台前顾客仍显示食物图标或高亮词，则尚未进入付款阶段，不可收银！
-
-⸻
-
-🐭 老鼠机制：
-• 红地毯区域可能出现老鼠
-• 老鼠头顶显示一个高亮的两字母单词，输入该词可击退老鼠
-• 有老鼠时优先击退老鼠
-
-⸻
-
-⛓️ 请使用 Chain-of-Thought 风格进行推理
-
-你必须分析当前状态后再执行动作。在每个 “steps” 项中加入 “reasoning” 字段，说明：
-• 为什么选择此操作
-• 为什么不是收银或其他词
-• 特别说明为什么不能输入某些高亮词（例如收银台、机器）
-
-⸻
-
-🧭 区域判断说明（用于词分类）：
-
-返回的所有单词需按照位置归类为以下区域：
-
-区域名称    判断标准
-“customer”  顾客头像上方出现的高亮词，用于上菜
-“cashier”   屏幕中偏左收银台区域，靠近中部通道
-“coffee_machine”    咖啡机周围，通常伴随数字（如 0、1）
-“food_station”  食材区域（披萨、锅、油锅等）
-“other” 无法归类或位置模糊
-
-⸻
-
-✅ JSON 返回格式示例：
-
-{
-    “description”: “左上角有已完成的披萨；中央桌有一个顾客头顶显示高亮词 ‘rail’，但该词位于收银台，不是上菜词；咖啡机附近有 ‘coal’ 和 ‘thread’；没有老鼠；无客户头顶钞票图标；应开始制作订单。”,
-    “words”: [
-        { “text”: “rail”, “area”: “cashier” },
-        { “text”: “coal”, “area”: “coffee_machine” },
-        { “text”: “thread”, “area”: “coffee_machine” },
-        { “text”: “steel”, “area”: “food_station” }
-    ],
-    “cash”: “rail”,
-    “mouse”: false,
-    “order”: “披萨”,
-    “steps”: [
-        {
-        “action”: “制作咖啡”,
-        “input”: “thread”,
-        “reasoning”: “thread 位于咖啡机区域，当前咖啡数量为 1，可制作一杯；顾客头顶未出现高亮词，因此尚未可上菜；收银台上的 ‘rail’ 不是上菜词，也未到付款阶段。”
-        }
-    ]
-}"""
+        # 系统提示词：按游戏阶段和有活动的区域从规则模块编译（PROMPT_COMPILER=1 开启）
+        self.prompts = PromptCompiler(self.mode)
+        # 完整提示词，详细模式带推理过程，快速模式只返回需要输入的单词
+        self.system_prompt = monolithic_prompt('verbose')
+        self.fast_prompt = monolithic_prompt('fast')
+        metrics.observe("planner_setup", time.perf_counter() - setup_start, model=self.model)
+
+    @property
+    def client(self) -> "OpenAI":
+        """同步 OpenAI 客户端，首次使用时导入 openai 并创建"""
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(max_retries=0, http_client=sync_http_client())
+        return self._client
+
+    @property
+    def async_client(self) -> "AsyncOpenAI":
+        """异步 OpenAI 客户端，首次使用时创建"""
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+            self._async_client = AsyncOpenAI(max_retries=0, http_client=async_http_client())
+        return self._async_client
+
+    @property
+    def available(self) -> bool:
+        """模型接口是否可用（未熔断）；不可用时调用方应只执行本地操作"""
+        return self.requests.breaker.available()
+
+    def _resolve_image(self, image: Union[Frame, str]) -> Dict[str, str]:
+        """获取发送给模型的图片地址并打印日志。
 
-    def analyze_screenshot(self, image_url: str) -> Optional[any]:
-        """分析游戏截图并返回游戏计划。
+        Args:
+            image (Union[Frame, str]): 内存中的截图帧，或图片的 URL
+
+        Returns:
+            Dict[str, str]: image_url 字段，包含 url（图片 URL 或 data URL），
+                帧指定了 detail 时还包含 detail
+        """
+        if isinstance(image, Frame):
+            print(f"\n使用图片: {image.describe()}")
+            image_url = {"url": image.image_url()}
+            if image.detail != "auto":
+                image_url["detail"] = image.detail
+            return image_url
+        print(f"\n使用图片: {image}")
+        return {"url": image}
+
+    def _prefix_messages(self, regions: Optional[Collection[str]] = None, record: bool = True) -> List[Dict]:
+        """构造消息中不随帧变化的前缀：系统提示词和固定的指令文本。
+
+        同一阶段、同一组规则模块的前缀逐字节相同，服务端可以缓存（提示词缓存按前缀匹配），
+        截图和状态增量等变化的内容都放在前缀之后。
 
         Args:
-            image_url (str): 图片的 URL
+            regions (Optional[Collection[str]]): 本帧有变化的区域，用于选择规则模块
+            record (bool): 是否计入提示词 token 统计
 
         Returns:
-            Optional[any]: 游戏计划，如果分析失败则返回 None
-        """
-        print(f"\n使用图片: {image_url}")
-
-        response = self.client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": self.system_prompt
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "请分析这个游戏截图，告诉我当前的订单状态，并给出具体的操作步骤。"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": image_url}
-                        }
-                    ]
-                }
-            ],
-            max_tokens=1000,
-            temperature=0
-        )
+            List[Dict]: 系统消息和只含指令文本的用户消息
+        """
+        compiled = self.prompts.compile(regions, record)
+        if record:
+            print(f"系统提示词: {compiled.describe()}")
+        if self.mode == 'fast':
+            text = "请给出现在需要输入的单词。"
+        else:
+            text = "请分析这个游戏截图，告诉我当前的订单状态，并给出具体的操作步骤。"
+        prompt = compiled.text
+        return [
+            {
+                "role": "system",
+                "content": prompt
+            },
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": text
+                    }
+                ]
+            }
+        ]
+
+    def _build_messages(self, image_url: Dict[str, str], context: Optional[str] = None,
+                        regions: Optional[Collection[str]] = None) -> List[Dict]:
+        """构造发送给模型的消息列表。
+
+        Args:
+            image_url (Dict[str, str]): image_url 字段，见 _resolve_image
+            context (Optional[str]): 上一次请求以来的游戏状态增量（JSON），附加在截图后
+            regions (Optional[Collection[str]]): 本帧有变化的区域
+
+        Returns:
+            List[Dict]: chat.completions 消息列表
+        """
+        messages = self._prefix_messages(regions)
+        content = messages[-1]["content"]
+        content.append({"type": "image_url", "image_url": image_url})
+        if context:
+            content.append({"type": "text", "text": f"上一轮以来的已知状态变化：{context}"})
+        return messages
+
+    def _request_kwargs(self, image_url: Dict[str, str], context: Optional[str] = None,
+                        regions: Optional[Collection[str]] = None) -> Dict:
+        """构造 chat.completions 请求参数，快速模式下附带 JSON Schema。
+
+        Args:
+            image_url (Dict[str, str]): image_url 字段，见 _resolve_image
+            context (Optional[str]): 游戏状态增量
+            regions (Optional[Collection[str]]): 本帧有变化的区域
+
+        Returns:
+            Dict: 请求参数
+        """
+        kwargs = {
+            "model": self.model,
+            "messages": self._build_messages(image_url, context, regions),
+            "max_tokens": self.max_tokens,
+            "temperature": 0,
+        }
+        if self.mode == 'fast':
+            kwargs["response_format"] = FAST_RESPONSE_FORMAT
+        return kwargs
+
+    def _parse_response(self, content: Optional[str],
+                        image: Union[Frame, str, None] = None) -> Optional[Plan]:
+        """从模型响应中解析出计划。
 
+        快速模式整段响应必须符合 Schema；详细模式从文本中截取 JSON 部分。
+
+        Args:
+            content (Optional[str]): 模型返回的文本，拒绝回答时为 None
+            image (Union[Frame, str, None]): 对应的截图帧，解析出的计划会记录在帧上
+
+        Returns:
+            Optional[Plan]: 计划，如果解析失败则返回 None
+        """
         print("\nGPT 响应:")
-        content = response.choices[0].message.content
         print(content)
+        if content is None:
+            # 结构化输出被拒绝时 content 为空
+            print("模型未返回内容")
+            metrics.incr("parse_errors")
+            return None
 
         try:
-            # 尝试在响应中找到 JSON 部分
-            json_start = content.find('{')
-            json_end = content.rfind('}') + 1
-            if json_start != -1 and json_end != -1:
-                json_str = content[json_start:json_end]
-                plan = json.loads(json_str)
-                # 取得所有input
-                inputs = [step['input'] for step in plan['steps']]
-                return inputs
-            else:
-                print("未找到 JSON 数据")
-                return None
+            with metrics.span("json_parse", chars=len(content), mode=self.mode):
+                if self.mode == 'fast':
+                    plan = Plan.parse_fast(content)
+                else:
+                    # 尝试在响应中找到 JSON 部分
+                    json_start = content.find('{')
+                    json_end = content.rfind('}') + 1
+                    if json_start == -1 or json_end == 0:
+                        print("未找到 JSON 数据")
+                        return None
+                    plan = Plan.from_verbose(json.loads(content[json_start:json_end]))
         except json.JSONDecodeError as e:
             print(f"JSON 解析错误: {e}")
+            metrics.incr("parse_errors")
+            return None
+        except PlanValidationError as e:
+            print(f"计划格式错误: {e}")
+            metrics.incr("parse_errors")
             return None
         except Exception as e:
-            print(f"分析截图时发生错误: {e}")
+            print(f"解析响应失败: {e}")
+            metrics.incr("parse_errors")
             return None
 
-    def execute_plan(self, plan: Dict) -> bool:
+        self.prompts.observe_plan(plan.inputs)
+        if isinstance(image, Frame):
+            image.plan = plan.raw
+            image.steps = [step.to_dict() for step in plan.steps]
+        return plan
+
+    def _record_request(self, image: Union[Frame, str], start: float, usage=None,
+                        first_token: Optional[float] = None, stream: bool = False) -> None:
+        """记录一次模型请求的耗时和 token 用量。
+
+        Args:
+            image (Union[Frame, str]): 截图帧，推理耗时会记录在帧上
+            start (float): 请求开始时间（perf_counter）
+            usage: 响应中的 usage 对象，可能为 None
+            first_token (Optional[float]): 收到首个 token 的时间（perf_counter），仅流式请求
+            stream (bool): 是否为流式请求
+        """
+        elapsed = time.perf_counter() - start
+        if isinstance(image, Frame):
+            image.timings["inference"] = elapsed
+        metrics.observe("model_request", elapsed, model=self.model, mode=self.mode, stream=stream)
+        if first_token is not None:
+            metrics.observe("model_ttft", first_token - start, model=self.model)
+        metrics.incr("model_requests")
+        if usage is not None:
+            if isinstance(image, Frame):
+                image.tokens += (usage.prompt_tokens or 0) + (usage.completion_tokens or 0)
+            metrics.incr("tokens_prompt", usage.prompt_tokens or 0)
+            metrics.incr("tokens_completion", usage.completion_tokens or 0)
+            details = getattr(usage, "prompt_tokens_details", None)
+            metrics.incr("tokens_cached", getattr(details, "cached_tokens", None) or 0)
+
+    def warm_up(self) -> bool:
+        """建立连接并预热提示词缓存。
+
+        发送与正式请求前缀相同、不带截图的 1 token 请求，启动时调用一次，
+        使第一帧不用等待 TLS 握手，系统提示词也已进入服务端缓存。
+
+        Returns:
+            bool: 是否成功
+        """
+        kwargs = {
+            "model": self.model,
+            "messages": self._prefix_messages(record=False),
+            "max_tokens": 1,
+            "temperature": 0,
+        }
+        if self.mode == 'fast':
+            kwargs["response_format"] = FAST_RESPONSE_FORMAT
+        start = time.perf_counter()
+        try:
+            self.client.chat.completions.create(**kwargs, timeout=self.requests.timeout)
+        except Exception as e:
+            print(f"预热请求失败: {e}")
+            return False
+        elapsed = time.perf_counter() - start
+        metrics.observe("planner_warmup", elapsed, model=self.model)
+        print(f"规划器预热完成: {elapsed * 1000:.0f}ms")
+        return True
+
+    def analyze_screenshot(self, image: Union[Frame, str],
+                           context: Optional[str] = None,
+                           regions: Optional[Collection[str]] = None) -> Optional[Plan]:
+        """分析游戏截图并返回游戏计划。
+
+        Args:
+            image (Union[Frame, str]): 内存中的截图帧，或图片的 URL
+            context (Optional[str]): 游戏状态增量，见 GameStateTracker.prompt_context
+            regions (Optional[Collection[str]]): 本帧有变化的区域，用于编译系统提示词
+
+        Returns:
+            Optional[Plan]: 游戏计划，如果分析失败则返回 None
+        """
+        image_url = self._resolve_image(image)
+        kwargs = self._request_kwargs(image_url, context, regions)
+
+        start = time.perf_counter()
+        try:
+            response = self.requests.call(
+                lambda timeout: self.client.chat.completions.create(**kwargs, timeout=timeout))
+        except RequestFailed as e:
+            print(f"模型请求失败: {e}")
+            return None
+
+        self._record_request(image, start, response.usage)
+
+        return self._parse_response(response.choices[0].message.content, image)
+
+    async def analyze_screenshot_async(self, image: Union[Frame, str],
+                                       context: Optional[str] = None,
+                                       regions: Optional[Collection[str]] = None) -> Optional[Plan]:
+        """异步分析游戏截图，供流水线运行器并发调用。
+
+        Args:
+            image (Union[Frame, str]): 内存中的截图帧，或图片的 URL
+            context (Optional[str]): 游戏状态增量，见 GameStateTracker.prompt_context
+            regions (Optional[Collection[str]]): 本帧有变化的区域，用于编译系统提示词
+
+        Returns:
+            Optional[Plan]: 游戏计划，如果分析失败则返回 None
+        """
+        image_url = self._resolve_image(image)
+        kwargs = self._request_kwargs(image_url, context, regions)
+
+        start = time.perf_counter()
+        try:
+            response = await self.requests.call_async(
+                lambda timeout: self.async_client.chat.completions.create(**kwargs, timeout=timeout))
+        except RequestFailed as e:
+            print(f"模型请求失败: {e}")
+            return None
+
+        self._record_request(image, start, response.usage)
+
+        return self._parse_response(response.choices[0].message.content, image)
+
+    def _handle_stream_delta(self, image: Union[Frame, str], parser: StepStreamParser,
+                             delta: Optional[str], steps: List[PlanStep],
+                             on_input: Callable[[str], None], start: float) -> None:
+        """处理一段流式输出，把新闭合步骤中的单词立即交给回调。
+
+        Args:
+            image (Union[Frame, str]): 截图帧，新步骤会追加到帧上
+            parser (StepStreamParser): 增量解析器
+            delta (Optional[str]): 新增文本
+            steps (List[PlanStep]): 已产生的步骤（会被修改）
+            on_input (Callable[[str], None]): 每解析出一个单词时调用
+            start (float): 请求开始时间（perf_counter）
+        """
+        if not delta:
+            return
+        for data in parser.feed(delta):
+            try:
+                step = PlanStep.from_fast(data) if self.mode == 'fast' else PlanStep.from_verbose(data)
+            except PlanValidationError as e:
+                print(f"跳过不合法的步骤: {e}")
+                continue
+            if isinstance(image, Frame):
+                image.steps.append(step.to_dict())
+            if not steps:
+                print(f"首个步骤耗时: {(time.perf_counter() - start) * 1000:.0f}ms")
+            steps.append(step)
+            on_input(step.word)
+
+    def _finish_stream(self, image: Union[Frame, str], parser: StepStreamParser,
+                       steps: List[PlanStep], on_input: Callable[[str], None]) -> Optional[Plan]:
+        """流结束后完整解析一次，补上增量解析遗漏的步骤。
+
+        Args:
+            image (Union[Frame, str]): 截图帧
+            parser (StepStreamParser): 增量解析器
+            steps (List[PlanStep]): 已产生的步骤
+            on_input (Callable[[str], None]): 每解析出一个单词时调用
+
+        Returns:
+            Optional[Plan]: 计划（可以为空计划，表示当前无需输入），解析失败且没有流式输出任何步骤时返回 None
+        """
+        plan = self._parse_response(parser.buffer, image)
+        if plan is None:
+            # 完整解析失败时保留已经流式输出的步骤
+            return Plan(steps=list(steps), mode=self.mode) if steps else None
+        streamed = {step.word for step in steps}
+        for step in plan.steps:
+            if step.word not in streamed:
+                on_input(step.word)
+        return plan
+
+    def analyze_screenshot_stream(self, image: Union[Frame, str],
+                                  on_input: Callable[[str], None],
+                                  context: Optional[str] = None,
+                                  regions: Optional[Collection[str]] = None) -> Optional[Plan]:
+        """以流式模式分析游戏截图，每个步骤闭合时立即回调。
+
+        Args:
+            image (Union[Frame, str]): 内存中的截图帧，或图片的 URL
+            on_input (Callable[[str], None]): 每解析出一个单词时调用，通常直接加入输入队列
+            context (Optional[str]): 游戏状态增量，见 GameStateTracker.prompt_context
+            regions (Optional[Collection[str]]): 本帧有变化的区域，用于编译系统提示词
+
+        Returns:
+            Optional[Plan]: 游戏计划，如果分析失败则返回 None
+        """
+        image_url = self._resolve_image(image)
+        kwargs = self._request_kwargs(image_url, context, regions)
+
+        # 流式请求已开始输入后不能重复发送，只对建立连接设置截止时间和重试，不对冲
+        start = time.perf_counter()
+        try:
+            stream = self.requests.call(
+                lambda timeout: self.client.chat.completions.create(
+                    **kwargs, stream=True, stream_options={"include_usage": True}, timeout=timeout),
+                hedge=False)
+        except RequestFailed as e:
+            print(f"模型请求失败: {e}")
+            return None
+
+        parser = StepStreamParser()
+        steps: List[PlanStep] = []
+        first_token = None
+        usage = None
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta and first_token is None:
+                        first_token = time.perf_counter()
+                    self._handle_stream_delta(image, parser, delta, steps, on_input, start)
+        except Exception as e:
+            # 保留中断前已经输出的步骤
+            print(f"流式响应中断: {e}")
+            metrics.incr("stream_errors")
+
+        self._record_request(image, start, usage, first_token, stream=True)
+
+        return self._finish_stream(image, parser, steps, on_input)
+
+    async def analyze_screenshot_stream_async(self, image: Union[Frame, str],
+                                              on_input: Callable[[str], None],
+                                              context: Optional[str] = None,
+                                              regions: Optional[Collection[str]] = None) -> Optional[Plan]:
+        """以流式模式异步分析游戏截图，每个步骤闭合时立即回调。
+
+        Args:
+            image (Union[Frame, str]): 内存中的截图帧，或图片的 URL
+            on_input (Callable[[str], None]): 每解析出一个单词时调用
+            context (Optional[str]): 游戏状态增量，见 GameStateTracker.prompt_context
+            regions (Optional[Collection[str]]): 本帧有变化的区域，用于编译系统提示词
+
+        Returns:
+            Optional[Plan]: 游戏计划，如果分析失败则返回 None
+        """
+        image_url = self._resolve_image(image)
+        kwargs = self._request_kwargs(image_url, context, regions)
+
+        start = time.perf_counter()
+        try:
+            stream = await self.requests.call_async(
+                lambda timeout: self.async_client.chat.completions.create(
+                    **kwargs, stream=True, stream_options={"include_usage": True}, timeout=timeout),
+                hedge=False)
+        except RequestFailed as e:
+            print(f"模型请求失败: {e}")
+            return None
+
+        parser = StepStreamParser()
+        steps: List[PlanStep] = []
+        first_token = None
+        usage = None
+        try:
+            async for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if chunk.choices:
+                    delta = chunk.choices[0].delta.content
+                    if delta and first_token is None:
+                        first_token = time.perf_counter()
+                    self._handle_stream_delta(image, parser, delta, steps, on_input, start)
+        except Exception as e:
+            print(f"流式响应中断: {e}")
+            metrics.incr("stream_errors")
+
+        self._record_request(image, start, usage, first_token, stream=True)
+
+        return self._finish_stream(image, parser, steps, on_input)
+
+    def execute_plan(self, plan: Plan, engine: MacroEngine,
+                     frame_ts: Optional[float] = None) -> Plan:
         """
         执行操作计划
-        
+
+        计划中可识别的菜谱（披萨、面条、炸物、咖啡）编译为定时宏交给宏引擎，
+        由宏完成输入、等待烹饪和取出成品，不再为每一步调用视觉模型。
+
         Args:
-            plan (Dict): 操作计划
-            
+            plan (Plan): 操作计划
+            engine (MacroEngine): 宏引擎
+            frame_ts (Optional[float]): 产生计划的截图时间
+
         Returns:
-            bool: 是否执行成功
+            Plan: 宏之外仍需直接输入的步骤（上菜、收银、老鼠等）
         """
-        # TODO: 实现计划执行逻辑
-        return True 
\ No newline at end of file
+        owned = engine.run(compile_macros(plan), frame_ts)
+        if not owned:
+            return plan
+        return Plan(steps=[step for step in plan.steps if step.word not in owned],
+                    mode=plan.mode, description=plan.description, raw=plan.raw)
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+截图预处理
+介于截图和规划器之间，减小发送给视觉模型的数据量和图像 token：
+1. 可选裁剪到游戏区域（去掉标题栏、边框）
+2. 按目标尺寸等比缩小
+3. 可选减少颜色数（调色板 PNG 体积明显更小）
+4. 按帧选择 detail: low / high，并估算图像 token 数
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from PIL import Image
+
+# 图像细节级别：auto 由接口决定；adaptive 按帧在 low / high 之间选择
+DETAILS = ("auto", "low", "high", "adaptive")
+
+# detail=low 时模型看到的最大尺寸，不超过该尺寸的图像用 low 不会损失信息
+LOW_DETAIL_SIZE = 512
+
+
+def estimate_image_tokens(width: int, height: int, detail: str = "high") -> int:
+    """
+    估算一张图像的视觉输入 token 数（按 gpt-4o 的计费规则）
+
+    low 固定 85 token；high 先缩放到 2048x2048 以内、短边不超过 768，
+    再按 512x512 分块，每块 170 token，外加 85 token。
+
+    Args:
+        width (int): 图像宽度
+        height (int): 图像高度
+        detail (str): low / high / auto（auto 按 high 估算）
+
+    Returns:
+        int: token 数
+    """
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+
+def parse_crop(value: Optional[str]) -> Optional[Tuple[float, float, float, float]]:
+    """
+    解析裁剪区域
+
+    Args:
+        value (Optional[str]): "left,top,right,bottom"，取值 0~1，相对窗口宽高
+
+    Returns:
+        Optional[Tuple[float, float, float, float]]: 裁剪区域，未设置时返回 None
+    """
+    if not value:
+        return None
+    left, top, right, bottom = (float(part) for part in value.split(","))
+    if not (0 <= left < right <= 1 and 0 <= top < bottom <= 1):
+        raise ValueError(f"裁剪区域不合法: {value}")
+    return (left, top, right, bottom)
+
+
+@dataclass
+class PreprocessConfig:
+    """预处理配置"""
+
+    max_width: int = 0  # 缩放后的最大宽度，0 表示不缩放
+    max_height: int = 0  # 缩放后的最大高度，0 表示不缩放
+    colors: int = 0  # 调色板颜色数（2~256），0 表示不减色
+    detail: str = "auto"  # auto / low / high / adaptive
+    crop: Optional[Tuple[float, float, float, float]] = None  # 相对窗口的裁剪区域
+
+    @classmethod
+    def from_env(cls) -> "PreprocessConfig":
+        """
+        从环境变量读取配置：
+        FRAME_MAX_WIDTH、FRAME_MAX_HEIGHT、FRAME_COLORS、FRAME_DETAIL、FRAME_CROP
+
+        Returns:
+            PreprocessConfig: 配置
+        """
+        detail = os.getenv('FRAME_DETAIL', 'auto').lower()
+        if detail not in DETAILS:
+            raise ValueError(f"不支持的 detail: {detail}")
+        return cls(
+            max_width=int(os.getenv('FRAME_MAX_WIDTH', '0')),
+            max_height=int(os.getenv('FRAME_MAX_HEIGHT', '0')),
+            colors=int(os.getenv('FRAME_COLORS', '0')),
+            detail=detail,
+            crop=parse_crop(os.getenv('FRAME_CROP')),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        """是否需要改动图像"""
+        return bool(self.max_width or self.max_height or self.colors or self.crop)
+
+
+class Preprocessor:
+    """
+    截图预处理器
+
+    detail 为 adaptive 时按帧选择：图像不超过 LOW_DETAIL_SIZE 时用 low；
+    否则默认用 low，上一次 low 的计划解析失败或没有给出步骤时升级为 high，
+    high 连续成功若干次后再尝试回到 low。
+    """
+
+    def __init__(self, config: Optional[PreprocessConfig] = None, retry_low_after: int = 5):
+        """
+        初始化预处理器
+
+        Args:
+            config (Optional[PreprocessConfig]): 配置，默认读取环境变量
+            retry_low_after (int): 升级为 high 后连续成功多少次再尝试 low
+        """
+        self.config = config or PreprocessConfig.from_env()
+        self.retry_low_after = retry_low_after
+        self._high = False
+        self._high_successes = 0
+
+        # 统计
+        self.frames = 0
+        self.low_frames = 0
+        self.escalations = 0
+
+    def process(self, image: Image.Image) -> Image.Image:
+        """
+        裁剪、缩放、减色
+
+        Args:
+            image (Image.Image): 原始截图
+
+        Returns:
+            Image.Image: 处理后的图像（未启用任何处理时返回原图像）
+        """
+        config = self.config
+        if config.crop:
+            left, top, right, bottom = config.crop
+            image = image.crop((int(left * image.width), int(top * image.height),
+                                int(right * image.width), int(bottom * image.height)))
+
+        scale = 1.0
+        if config.max_width:
+            scale = min(scale, config.max_width / image.width)
+        if config.max_height:
+            scale = min(scale, config.max_height / image.height)
+        if scale < 1.0:
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            # 缩小时 reduce 先做整数倍降采样，再用 LANCZOS 保持文字边缘清晰
+            image = image.resize(size, Image.LANCZOS, reducing_gap=2.0)
+
+        if config.colors:
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            image = image.quantize(config.colors, method=Image.Quantize.FASTOCTREE)
+        return image
+
+    def choose_detail(self, width: int, height: int) -> str:
+        """
+        为一帧选择 detail
+
+        Args:
+            width (int): 处理后图像宽度
+            height (int): 处理后图像高度
+
+        Returns:
+            str: auto / low / high；配置为 adaptive 且图像较大时按最近的结果选择
+        """
+        self.frames += 1
+        detail = self.config.detail
+        if detail == "adaptive":
+            if max(width, height) <= LOW_DETAIL_SIZE:
+                detail = "low"
+            else:
+                detail = "high" if self._high else "low"
+        if detail == "low":
+            self.low_frames += 1
+        return detail
+
+    def report_result(self, detail: str, ok: bool) -> None:
+        """
+        反馈一帧的规划结果，用于 detail 自适应
+
+        Args:
+            detail (str): 该帧使用的 detail
+            ok (bool): 是否得到有效且有步骤的计划（低细节截图可能看不清单词，空计划也按失败处理）
+        """
+        if self.config.detail != "adaptive":
+            return
+        if detail == "low" and not ok:
+            if not self._high:
+                self.escalations += 1
+                print("低细节截图未得到有效计划，切换为 detail=high")
+            self._high = True
+            self._high_successes = 0
+        elif detail == "high" and ok:
+            self._high_successes += 1
+            if self._high_successes >= self.retry_low_after:
+                self._high = False
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: low 帧占比和升级次数
+        """
+        frames = max(self.frames, 1)
+        return (f"帧 {self.frames}, detail=low {self.low_frames} ({self.low_frames / frames:.0%}), "
+                f"升级为 high {self.escalations} 次")
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""
+规划器提示词编译
+主要功能：
+1. 把游戏规则拆分为模块（控制界面、屏幕结构、各食物区、顾客、收银、老鼠等）
+2. 按游戏阶段（菜单/开始/重试界面 与 营业中）和有活动的屏幕区域拼接最小的系统提示词
+3. 按 token 预算删除优先级低的模块
+4. 统计每次调用的系统提示词 token 数
+
+全部模块按顺序拼接得到的完整提示词与原来手写的提示词逐字节相同。
+"""
+
+import os
+from dataclasses import dataclass, field
+from typing import Any, Collection, Dict, FrozenSet, List, Optional, Tuple
+
+from metrics import metrics, percentiles
+from regions import SCREEN_REGIONS
+
+# 游戏阶段：menu 为开始/重试/结算等控制界面，service 为营业中；None 表示未知，使用完整提示词
+PHASES = ("menu", "service")
+
+# 控制界面的单词，计划只包含这些单词时认为处于菜单阶段
+CONTROL_WORDS = frozenset({"start", "retry", "done"})
+
+# 食物制作模块，加入任意一个时同时加入 food_header
+FOOD_MODULES = frozenset({"dessert", "coffee", "noodles", "fried", "pizza"})
+
+_encoding: Any = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    计算文本的 token 数
+
+    安装了 tiktoken 时使用 o200k_base 编码（gpt-4o）；否则粗略估算：
+    中文等非 ASCII 字符每个约 1 token，ASCII 字符约 4 个 1 token。
+
+    Args:
+        text (str): 文本
+
+    Returns:
+        int: token 数
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return (len(text) - ascii_chars) + (ascii_chars + 3) // 4
+
+
+@dataclass(frozen=True)
+class PromptModule:
+    """一段游戏规则"""
+
+    name: str
+    text: str  # 原文，包含段落分隔和结尾换行，依次拼接即为完整规则
+    phases: Tuple[str, ...]  # 适用的游戏阶段
+    regions: Tuple[str, ...] = ()  # 非空时只在这些区域有活动时加入，见 regions.SCREEN_REGIONS
+    priority: Optional[int] = None  # 超出预算时按优先级从低到高删除；None 表示不可删除
+
+
+# 各模式共用的段落分隔
+SECTION_SEPARATOR = "\n\n⸻\n\n"
+
+# 区域划分（两种模式共用）
+AREA_RULES = """🧭 区域判断说明（用于词分类）：
+
+返回的所有单词需按照位置归类为以下区域：
+
+区域名称    判断标准
+“customer”  顾客头像上方出现的高亮词，用于上菜
+“cashier”   屏幕中偏左收银台区域，靠近中部通道
+“coffee_machine”    咖啡机周围，通常伴随数字（如 0、1）
+“food_station”  食材区域（披萨、锅、油锅等）
+“mouse” 老鼠头顶的两字母高亮词
+“other” 无法归类或位置模糊"""
+
+# 详细模式：带推理过程，便于调试
+REASONING_RULES = """⛓️ 请使用 Chain-of-Thought 风格进行推理
+
+你必须分析当前状态后再执行动作。在每个 “steps” 项中加入 “reasoning” 字段，说明：
+• 为什么选择此操作
+• 为什么不是收银或其他词
+• 特别说明为什么不能输入某些高亮词（例如收银台、机器）"""
+
+VERBOSE_FORMAT = """每个 “steps” 项也需要给出 “area” 字段（取值同上）。
+若单词前面有字母是黄色的，在对应的 “words” 和 “steps” 项中加入 “yellow”: true。
+
+⸻
+
+✅ JSON 返回格式示例：
+
+{
+    “description”: “左上角有已完成的披萨；中央桌有一个顾客头顶显示高亮词 ‘rail’，但该词位于收银台，不是上菜词；咖啡机附近有 ‘coal’ 和 ‘thread’；没有老鼠；无客户头顶钞票图标；应开始制作订单。”,
+    “words”: [
+        { “text”: “rail”, “area”: “cashier” },
+        { “text”: “coal”, “area”: “coffee_machine” },
+        { “text”: “thread”, “area”: “coffee_machine” },
+        { “text”: “steel”, “area”: “food_station” }
+    ],
+    “cash”: “rail”,
+    “mouse”: false,
+    “order”: “披萨”,
+    “steps”: [
+        {
+        “action”: “制作咖啡”,
+        “input”: “thread”,
+        “area”: “coffee_machine”,
+        “reasoning”: “thread 位于咖啡机区域，当前咖啡数量为 1，可制作一杯；顾客头顶未出现高亮词，因此尚未可上菜；收银台上的 ‘rail’ 不是上菜词，也未到付款阶段。”
+        }
+    ]
+}"""
+
+# 快速模式：结构化输出，只返回需要输入的单词
+FAST_FORMAT = """⚡ 返回格式：
+只返回 JSON，不要描述和推理。“steps” 按输入顺序列出现在应该输入的单词，每项包含：
+• “word”：要输入的高亮单词（原样输入，区分大小写）
+• “area”：单词所在区域（取值同上）
+• “priority”：“rat”（老鼠）/ “yellow”（前缀有黄色字母）/ “serve”（上菜）/ “cook”（制作）/ “cashier”（收银）
+不要包含不能输入的单词（灰色词、尚未到付款阶段的收银词）。"""
+
+# 游戏规则模块，按完整提示词中的顺序排列，依次拼接即为完整的游戏规则
+RULE_MODULES: Tuple[PromptModule, ...] = (
+    # 开场白和第一条规则（所有阶段）
+    PromptModule("intro", """你是一个《The Chef’s Shift》游戏的智能助手，负责根据游戏截图识别状态并提供操作计划。
+
+⸻
+
+🎮 游戏规则与界面说明：
+1. 玩家完全通过打字来进行游戏，包括开始游戏、制作食物、处理订单、收款等。所有操作都依赖输入屏幕上显示的单词。单词可能包含大小写字母和特殊字符（如 -、?、! 等）。
+""",
+                 PHASES, priority=None),
+    # 菜单界面的控制单词
+    PromptModule("controls", """2. 游戏控制界面通过打字如 start、retry、done 来进行控制。
+""",
+                 ("menu",), priority=None),
+    # 高亮单词的通用规则
+    PromptModule("core", """3. 玩家需要打的单词只与屏幕显示内容相关，不与食物名称或动作名称相关。
+4. 只有高亮显示的单词可以输入：深棕色底、白色字体。灰色或其他样式的单词不可输入。
+5. 每种食物有特定的制作步骤，输入指定位置的单词即可完成对应步骤。
+""",
+                 PHASES, priority=None),
+    # 角色和屏幕结构说明
+    PromptModule("layout", """6. 玩家控制的是厨师，厨师穿着白色厨师服、红色围裙、戴着厨师帽。
+7. 屏幕结构说明：
+• 左上：为成品区，放置准备好的食物（带编号）
+• 中上偏左：甜品区，输入单词即完成
+• 中上偏中：咖啡机，右侧显示咖啡及其当前可用数量
+• 中偏左：收银台（烤炉和咖啡机之间）
+• 左下：炸物区（左侧原料 → 右侧油锅）
+• 下方：面条区（左侧食材 → 右侧锅）
+• 左侧边：披萨区（自下而上放料，顶部为烤箱）
+• 屏幕右、中、右上方：顾客桌位，靠近中央偏上有中央桌
+• 相对位置：咖啡区位于面条区上方，收银台位于烤炉和甜品区下方，甜品区和中央桌靠窗，甜品区位于中央桌左侧
+""",
+                 ("service",), priority=1),
+    # 食物制作说明的标题，加入任一食物模块时自动加入
+    PromptModule("food_header", """
+⸻
+
+👨‍🍳 食物制作说明：
+""",
+                 (), priority=None),
+    PromptModule("dessert", """• 甜品区：输入甜品区的单词即可制作甜品，立即放入左上角的成品区
+""",
+                 ("service",), regions=("dessert",), priority=3),
+    PromptModule("coffee", """• 咖啡区：
+- 咖啡机右侧是制作好的咖啡
+- 制作好的咖啡上方的数字（0/1/2）表示当前库存数量
+- 输入咖啡机上的单词可以制作咖啡，库存会增加
+- 有顾客点咖啡时，输入制作好的咖啡上方的单词（即咖啡种类，不是咖啡机），可以将其放入成品区
+- 有库存可以满足客户的时候不需要制作咖啡，只需将其放入成品区
+""",
+                 ("service",), regions=("coffee",), priority=3),
+    PromptModule("noodles", """• 面条区：先输入左侧的面条食材单词，然后输入右侧锅上的单词烹饪
+- 烹饪完毕后再次输入锅的单词，即可将成品放入左上角成品区
+""",
+                 ("service",), regions=("noodles",), priority=3),
+    PromptModule("fried", """• 炸物区：先输入原料区单词，再输入炸锅上的单词进行烹饪
+- 炸好之后再次输入炸锅单词即可放入成品区
+""",
+                 ("service",), regions=("fryer",), priority=3),
+    PromptModule("pizza", """• 披萨区：从下往上依次选择四种食材输入，最后输入烤炉上的单词烘烤
+- 烤好后再次输入烤炉单词将披萨放入成品区
+""",
+                 ("service",), regions=("pizza",), priority=3),
+    # 顾客服务流程（服务阶段必需）
+    PromptModule("customers", """
+⸻
+
+👥 顾客服务流程：分为“堂食顾客”与“打包顾客”两类
+
+🍽️ 堂食顾客（坐在桌边）
+• 顾客固定坐在桌子旁，面对桌子（屏幕右侧或中央）
+• 订单图标（食物）和后续高亮单词显示在顾客面对的桌子上方，而不是顾客头上
+• 服务流程：
+1. 顾客桌上方出现食物图标 → 表示下单（不可输入）
+2. 食物制作完成后，桌子上方出现高亮词 → 输入该词完成上菜
+3. 上菜完成后，顾客离开桌子，前往收银台排队
+4. 顾客头顶出现钞票图标 → 可以输入收银台上的高亮单词完成付款
+
+🛍️ 打包顾客（站在收银台前）
+• 直接出现在收银台前，通常是独立角色
+• 订单图标和高亮词都显示在其头顶上方
+• 服务流程：
+1. 顾客头顶显示食物图标 → 表示下单（不可输入）
+2. 食物准备好后，顾客头顶出现高亮词 → 输入该词完成交付
+3. 顾客头顶出现钞票图标 → 可以输入收银台高亮词完成付款
+
+🚫 特别注意
+• 顾客头上方显示高亮词的 → 打包顾客的上菜词
+• 桌子上方显示高亮词的 → 堂食顾客的上菜词
+• 收银台上的高亮词始终存在，但只能在客户头顶显示钞票图标时才能输入
+• 所有单词都显示在物品或者顾客正上方，如果有很大的左右偏移，不能认为在上方
+• 甜品有三种、咖啡有两种、面食和炸物各有两种，需要仔细鉴别客户下单的菜品和厨房制作区的菜品和成品区的菜品
+• 注意区分高亮词和灰色的词。只有高亮词可以输入
+• 注意有些高亮词前面有字母是黄色的，优先输入这个词，再进行别的动作
+""",
+                 ("service",), priority=None),
+    PromptModule("cashier", """
+⸻
+
+⚠️ 收银规则（必须严格遵守）：
+• 收银台的单词始终是高亮的
+• 只有当顾客头顶出现钞票图标时，才可以输入收银台单词
+• 若收银台前顾客仍显示食物图标或高亮词，则尚未进入付款阶段，不可收银！
+""",
+                 ("service",), regions=("cashier", "tables", "center_table"), priority=4),
+    PromptModule("rats", """
+⸻
+
+🐭 老鼠机制：
+• 红地毯区域可能出现老鼠
+• 老鼠头顶显示一个高亮的两字母单词，输入该词可击退老鼠
+• 有老鼠时优先击退老鼠""",
+                 ("service",), regions=("carpet",), priority=5),
+)
+
+
+def assemble(modules: Collection[PromptModule], mode: str) -> str:
+    """
+    拼接系统提示词：游戏规则 + 区域划分 + 返回格式
+
+    Args:
+        modules (Collection[PromptModule]): 游戏规则模块（按 RULE_MODULES 中的顺序）
+        mode (str): fast / verbose
+
+    Returns:
+        str: 系统提示词
+    """
+    rules = "".join(module.text for module in modules).rstrip("\n")
+    if mode == 'fast':
+        return rules + SECTION_SEPARATOR + AREA_RULES + SECTION_SEPARATOR + FAST_FORMAT
+    return (rules + SECTION_SEPARATOR + REASONING_RULES + SECTION_SEPARATOR + AREA_RULES
+            + "\n\n" + VERBOSE_FORMAT)
+
+
+def monolithic_prompt(mode: str) -> str:
+    """
+    完整的系统提示词（包含全部规则模块）
+
+    Args:
+        mode (str): fast / verbose
+
+    Returns:
+        str: 系统提示词
+    """
+    return assemble(RULE_MODULES, mode)
+
+
+@dataclass
+class CompiledPrompt:
+    """一次编译的结果"""
+
+    text: str
+    modules: List[str]  # 包含的规则模块名
+    tokens: int
+    phase: Optional[str]  # None 表示使用完整提示词
+    over_budget: bool = False
+    dropped: List[str] = field(default_factory=list)  # 因预算删除的模块
+
+    def describe(self) -> str:
+        """生成日志用的简短描述"""
+        phase = self.phase or "完整"
+        text = f"{self.tokens} token（{phase}: {', '.join(self.modules)}）"
+        if self.dropped:
+            text += f"，超出预算删除 {self.dropped}"
+        return text
+
+
+class PromptCompiler:
+    """
+    系统提示词编译器
+
+    阶段由最近的计划推断：只包含控制单词时为 menu，否则为 service；
+    启动时以及画面大面积变化（切换界面）时阶段未知，使用完整提示词。
+    相同阶段和模块组合编译出的提示词逐字节相同，仍可命中提示词缓存。
+    """
+
+    def __init__(self, mode: str, enabled: Optional[bool] = None,
+                 budget: Optional[int] = None, transition_ratio: float = 0.5):
+        """
+        初始化编译器
+
+        Args:
+            mode (str): fast / verbose
+            enabled (Optional[bool]): 是否按阶段和区域裁剪，默认读取 PROMPT_COMPILER；
+                关闭时每次返回完整提示词（仍统计 token）
+            budget (Optional[int]): 系统提示词的 token 预算，0 表示不限制，默认读取 PROMPT_TOKEN_BUDGET
+            transition_ratio (float): 变化区域占全部区域的比例达到该值时视为切换界面
+        """
+        if enabled is None:
+            enabled = os.getenv('PROMPT_COMPILER', '0').lower() in ('1', 'true', 'yes')
+        self.mode = mode
+        self.enabled = enabled
+        self.budget = budget if budget is not None else int(os.getenv('PROMPT_TOKEN_BUDGET', '0'))
+        self.transition_ratio = transition_ratio
+        self.phase: Optional[str] = None
+        self._cache: Dict[Tuple[Optional[str], FrozenSet[str]], CompiledPrompt] = {}
+        self.monolithic_tokens = count_tokens(monolithic_prompt(mode))
+
+        # 统计
+        self.tokens: List[int] = []
+        self.phase_calls: Dict[str, int] = {}
+        self.over_budget = 0
+
+    def select(self, phase: Optional[str], regions: Optional[Collection[str]] = None) -> List[PromptModule]:
+        """
+        选择规则模块
+
+        Args:
+            phase (Optional[str]): 游戏阶段，None 时选择全部模块
+            regions (Optional[Collection[str]]): 有活动的区域，None 时不按区域过滤
+
+        Returns:
+            List[PromptModule]: 按 RULE_MODULES 顺序排列的模块
+        """
+        if phase is None:
+            return list(RULE_MODULES)
+        active = set(regions) if regions is not None else None
+        names = set()
+        for module in RULE_MODULES:
+            if phase not in module.phases:
+                continue
+            if module.regions and active is not None and not active.intersection(module.regions):
+                continue
+            names.add(module.name)
+        if names & FOOD_MODULES:
+            names.add("food_header")
+        return [module for module in RULE_MODULES if module.name in names]
+
+    def _fit_budget(self, modules: List[PromptModule], phase: Optional[str]) -> CompiledPrompt:
+        """按预算删除优先级最低的模块，直到不超过预算或没有可删除的模块"""
+        dropped: List[str] = []
+        while True:
+            text = assemble(modules, self.mode)
+            tokens = count_tokens(text)
+            if not self.budget or tokens <= self.budget:
+                break
+            optional = [module for module in modules if module.priority is not None]
+            if not optional:
+                break
+            victim = min(optional, key=lambda module: module.priority)
+            modules = [module for module in modules if module is not victim]
+            dropped.append(victim.name)
+            if victim.name in FOOD_MODULES and not any(module.name in FOOD_MODULES for module in modules):
+                modules = [module for module in modules if module.name != "food_header"]
+        return CompiledPrompt(text=text, modules=[module.name for module in modules], tokens=tokens,
+                              phase=phase, over_budget=bool(self.budget) and tokens > self.budget,
+                              dropped=dropped)
+
+    def compile(self, regions: Optional[Collection[str]] = None, record: bool = True) -> CompiledPrompt:
+        """
+        编译本次调用的系统提示词
+
+        Args:
+            regions (Optional[Collection[str]]): 本帧有变化的区域，None 表示未知
+            record (bool): 是否计入统计（预热请求不计入）
+
+        Returns:
+            CompiledPrompt: 编译结果
+        """
+        phase = self.phase if self.enabled else None
+        if regions is not None and len(regions) >= self.transition_ratio * len(SCREEN_REGIONS):
+            # 大面积变化通常是切换界面，阶段未知
+            phase = None
+        modules = self.select(phase, regions)
+        key = (phase, frozenset(module.name for module in modules))
+        compiled = self._cache.get(key)
+        if compiled is None:
+            compiled = self._cache[key] = self._fit_budget(modules, phase)
+            if compiled.over_budget:
+                print(f"系统提示词 {compiled.tokens} token 超出预算 {self.budget}（必需模块无法删除）")
+        if record:
+            self.tokens.append(compiled.tokens)
+            label = phase or "full"
+            self.phase_calls[label] = self.phase_calls.get(label, 0) + 1
+            self.over_budget += compiled.over_budget
+            metrics.incr("prompt_tokens_system", compiled.tokens)
+            metrics.gauge("prompt_tokens_last", compiled.tokens)
+        return compiled
+
+    def observe_plan(self, words: Collection[str]) -> None:
+        """
+        根据计划中的单词更新游戏阶段
+
+        Args:
+            words (Collection[str]): 计划中要输入的单词
+        """
+        if not words:
+            return
+        self.phase = "menu" if all(word.lower() in CONTROL_WORDS for word in words) else "service"
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        统计数据
+
+        Returns:
+            Dict[str, Any]: 调用次数、每次调用 token 数的分布（mean/p50/p95 等，单位 token）、
+                完整提示词 token 数、按阶段的调用次数
+        """
+        return {
+            "calls": len(self.tokens),
+            "tokens": percentiles(self.tokens, scale=1.0),
+            "monolithic_tokens": self.monolithic_tokens,
+            "phases": dict(self.phase_calls),
+            "over_budget": self.over_budget,
+        }
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 平均 token、相对完整提示词的节省比例和各阶段调用次数
+        """
+        if not self.tokens:
+            return f"暂无调用，完整提示词 {self.monolithic_tokens} token"
+        mean = sum(self.tokens) / len(self.tokens)
+        saved = 1 - mean / self.monolithic_tokens if self.monolithic_tokens else 0.0
+        return (
+            f"调用 {len(self.tokens)}, 系统提示词平均 {mean:.0f} token "
+            f"(完整 {self.monolithic_tokens}, 节省 {saved:.0%}), 阶段 {self.phase_calls}, "
+            f"超出预算 {self.over_budget} 次"
+        )
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+菜谱宏引擎
+主要功能：
+1. 把计划中可识别的菜谱编译为定时宏：
+   - 披萨：自下而上四种食材 → 烤炉 → 等待烘烤 → 再次输入烤炉
+   - 面条 / 炸物：食材 → 锅 / 油锅 → 等待烹饪 → 再次输入锅 / 油锅
+   - 咖啡：咖啡机 → 等待制作 → 取咖啡
+2. 宏按阶段提交单词，收到键盘执行器的输入确认后开始计时，到时提交下一阶段，
+   整道菜只需要一次视觉模型调用
+3. 某个阶段的单词在超时前没有输入（被取消、过期或窗口丢失）即视为前提条件失败，
+   取消该宏并要求重新规划
+4. 宏执行期间，只发生在相关工位区域的画面变化不再触发模型调用
+"""
+
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Set
+
+from game_state import COOK_SECONDS, PICKUP_KEYWORDS, cooker_stations
+from plan import Plan, PlanStep
+
+if TYPE_CHECKING:  # 避免规划器因导入宏而依赖 pyautogui
+    from keyboard_executor import KeyboardExecutor
+
+# 每种菜谱在工位上需要的食材数量
+INGREDIENT_COUNT: Dict[str, int] = {
+    "pizza": 4,
+    "noodles": 1,
+    "fryer": 1,
+}
+
+# 咖啡机制作一杯咖啡的时间（秒）
+COFFEE_SECONDS = 3.0
+
+# 宏执行期间画面会发生变化的屏幕区域（见 regions.SCREEN_REGIONS）
+STATION_REGIONS: Dict[str, tuple] = {
+    "pizza": ("pizza", "finished"),
+    "noodles": ("noodles", "finished"),
+    "fryer": ("fryer", "finished"),
+    "coffee": ("coffee", "finished"),
+}
+
+
+@dataclass
+class MacroStage:
+    """宏的一个阶段：输入一组单词，全部输入后等待一段时间"""
+
+    words: List[str]
+    wait: float = 0.0
+
+
+@dataclass
+class Macro:
+    """一道菜的定时宏"""
+
+    station: str
+    stages: List[MacroStage]
+    frame_ts: float = 0.0  # 产生计划的截图时间，之后已输入的单词不再重复输入
+    index: int = 0  # 当前阶段
+    pending: Set[str] = field(default_factory=set)  # 当前阶段尚未确认输入的单词
+    ready_at: Optional[float] = None  # 当前阶段全部输入后，可进入下一阶段的时间（time.time）
+    deadline: float = 0.0  # 当前阶段必须完成输入的时间
+
+    @property
+    def words(self) -> Set[str]:
+        """宏涉及的全部单词"""
+        return {word for stage in self.stages for word in stage.words}
+
+    @property
+    def stage(self) -> MacroStage:
+        return self.stages[self.index]
+
+
+def _food_station_macro(station: str, steps: Sequence[PlanStep]) -> Optional[Macro]:
+    """
+    编译披萨 / 面条 / 炸物的宏
+
+    Args:
+        station (str): 工位名
+        steps (Sequence[PlanStep]): 计划中制作区的步骤（按顺序）
+
+    Returns:
+        Optional[Macro]: 宏，步骤不足时返回 None
+    """
+    count = INGREDIENT_COUNT[station]
+    words: List[str] = []
+    for step in steps:
+        if step.word not in words:
+            words.append(step.word)
+    if len(words) < count + 1:
+        return None
+    ingredients, cooker = words[:count], words[count]
+    return Macro(station=station, stages=[
+        MacroStage(ingredients + [cooker], wait=COOK_SECONDS[station]),
+        MacroStage([cooker]),
+    ])
+
+
+def _coffee_macro(steps: Sequence[PlanStep]) -> Optional[Macro]:
+    """
+    编译咖啡的宏：咖啡机 → 等待 → 取咖啡
+
+    Args:
+        steps (Sequence[PlanStep]): 计划中咖啡区的步骤
+
+    Returns:
+        Optional[Macro]: 宏，计划中没有同时包含制作和取货时返回 None
+    """
+    make = [step.word for step in steps if not any(k in step.action for k in PICKUP_KEYWORDS)]
+    pickup = [step.word for step in steps if any(k in step.action for k in PICKUP_KEYWORDS)]
+    if not make or not pickup:
+        return None
+    return Macro(station="coffee", stages=[
+        MacroStage([make[0]], wait=COFFEE_SECONDS),
+        MacroStage([pickup[0]]),
+    ])
+
+
+def compile_macros(plan: Plan) -> List[Macro]:
+    """
+    把计划中可识别的菜谱编译为宏
+
+    工位由步骤的动作描述或订单判断，只有详细模式的计划带这些信息。
+
+    Args:
+        plan (Plan): 计划
+
+    Returns:
+        List[Macro]: 宏列表，每个工位最多一个
+    """
+    food_steps = [step for step in plan.steps if step.area == "food_station"]
+    coffee_steps = [step for step in plan.steps if step.area == "coffee_machine" and step.action]
+
+    macros = []
+    if food_steps:
+        stations = set(cooker_stations(food_steps).values())
+        order = plan.raw.get("order") or ""
+        if len(stations) != 1:
+            # 动作描述不足以判断时根据订单判断
+            stations = {name for name, keywords in (("pizza", ("披萨",)), ("noodles", ("面",)),
+                                                    ("fryer", ("炸", "薯条", "鸡")))
+                        if any(keyword in order for keyword in keywords)}
+        if len(stations) == 1:
+            macro = _food_station_macro(stations.pop(), food_steps)
+            if macro:
+                macros.append(macro)
+    if coffee_steps:
+        macro = _coffee_macro(coffee_steps)
+        if macro:
+            macros.append(macro)
+    return macros
+
+
+class MacroEngine:
+    """
+    在后台线程中推进定时宏
+
+    单词通过键盘执行器输入，输入确认来自执行器的 typed_callbacks。
+    """
+
+    def __init__(self, executor: "KeyboardExecutor", stage_timeout: Optional[float] = None):
+        """
+        初始化宏引擎
+
+        Args:
+            executor (KeyboardExecutor): 键盘执行器
+            stage_timeout (Optional[float]): 每个阶段提交后必须完成输入的时间（秒），
+                默认读取 MACRO_STAGE_TIMEOUT
+        """
+        self.executor = executor
+        self.stage_timeout = stage_timeout if stage_timeout is not None else float(os.getenv('MACRO_STAGE_TIMEOUT', '8'))
+        self.active: Dict[str, Macro] = {}  # 工位 -> 正在执行的宏
+        self.replan_needed = False  # 有宏失败，下一帧需要调用模型
+
+        self._typed: Dict[str, float] = {}  # 单词 -> 最近一次输入时间
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        executor.typed_callbacks.append(self._on_typed)
+
+        # 统计
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.words_submitted = 0
+        self.analyses_skipped = 0
+
+    def start(self) -> None:
+        """启动后台线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止后台线程"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+        print(f"[宏] {self.report()}")
+
+    def run(self, macros: Iterable[Macro], frame_ts: Optional[float] = None) -> Set[str]:
+        """
+        启动宏，工位上已有宏在执行时跳过
+
+        Args:
+            macros (Iterable[Macro]): 编译好的宏
+            frame_ts (Optional[float]): 产生计划的截图时间
+
+        Returns:
+            Set[str]: 由宏负责输入的单词
+        """
+        owned: Set[str] = set()
+        with self._cond:
+            self.replan_needed = False
+            for macro in macros:
+                current = self.active.get(macro.station)
+                if current is not None:
+                    # 工位忙：计划中的这些单词仍由当前的宏负责
+                    owned |= macro.words & current.words
+                    continue
+                macro.frame_ts = frame_ts or time.time()
+                self.active[macro.station] = macro
+                self.started += 1
+                owned |= macro.words
+                print(f"开始执行{macro.station}宏: {' → '.join('+'.join(s.words) for s in macro.stages)}")
+                self._submit(macro)
+            self._cond.notify()
+        return owned
+
+    def _submit(self, macro: Macro) -> None:
+        """
+        提交宏的当前阶段（调用方持有锁）
+
+        截图之后已经输入或已在队列中的单词（例如流式规划已提交）不再重复提交。
+
+        Args:
+            macro (Macro): 宏
+        """
+        stage = macro.stage
+        since = macro.frame_ts if macro.index == 0 else macro.ready_at or 0.0
+        macro.pending = {word for word in stage.words if self._typed.get(word, 0.0) <= since}
+        macro.ready_at = None
+        macro.deadline = time.time() + self.stage_timeout
+        words = [word for word in stage.words
+                 if word in macro.pending and not self.executor.scheduler.pending(word)]
+        if words:
+            self.executor.add_words(words, priorities={word: "cook" for word in words})
+            self.words_submitted += len(words)
+        if not macro.pending:
+            macro.ready_at = time.time() + stage.wait
+
+    def _on_typed(self, word: str) -> None:
+        """键盘线程回调：记录输入确认"""
+        now = time.time()
+        with self._cond:
+            self._typed[word] = now
+            for macro in self.active.values():
+                if word in macro.pending:
+                    macro.pending.discard(word)
+                    if not macro.pending:
+                        macro.ready_at = now + macro.stage.wait
+            self._cond.notify()
+
+    def _worker(self) -> None:
+        """推进宏：到时提交下一阶段，超时的宏取消"""
+        with self._cond:
+            while self._running:
+                now = time.time()
+                wake = now + 1.0
+                for station, macro in list(self.active.items()):
+                    if macro.pending:
+                        if now > macro.deadline:
+                            del self.active[station]
+                            self.failed += 1
+                            self.replan_needed = True
+                            print(f"{station}宏失败：{sorted(macro.pending)} 未在 {self.stage_timeout:.0f}s 内输入，需要重新规划")
+                            continue
+                        wake = min(wake, macro.deadline)
+                    elif macro.ready_at is not None:
+                        if now < macro.ready_at:
+                            wake = min(wake, macro.ready_at)
+                            continue
+                        macro.index += 1
+                        if macro.index >= len(macro.stages):
+                            del self.active[station]
+                            self.completed += 1
+                            print(f"{station}宏完成")
+                            continue
+                        self._submit(macro)
+                        wake = now
+                self._cond.wait(max(0.0, wake - time.time()))
+
+    def owns(self, word: str) -> bool:
+        """单词是否由正在执行的宏负责"""
+        with self._cond:
+            return any(word in macro.words for macro in self.active.values())
+
+    def active_words(self) -> Set[str]:
+        """正在执行的宏涉及的全部单词"""
+        with self._cond:
+            return {word for macro in self.active.values() for word in macro.words}
+
+    def explains(self, changed_regions: Optional[Sequence[str]]) -> bool:
+        """
+        判断画面变化是否都由正在执行的宏引起，是则不需要调用模型
+
+        Args:
+            changed_regions (Optional[Sequence[str]]): 变化的区域
+
+        Returns:
+            bool: 是否可以跳过本帧分析
+        """
+        with self._cond:
+            if self.replan_needed or not self.active or not changed_regions:
+                return False
+            expected = {region for station in self.active for region in STATION_REGIONS[station]}
+            if set(changed_regions) <= expected:
+                self.analyses_skipped += 1
+                return True
+            return False
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 宏的启动、完成、失败次数以及节省的模型调用
+        """
+        return (
+            f"启动 {self.started}, 完成 {self.completed}, 失败 {self.failed}, "
+            f"提交单词 {self.words_submitted}, 节省模型调用 {self.analyses_skipped}"
+        )
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+游戏屏幕区域定义
+按规划器系统提示词中描述的屏幕结构划分区域，坐标为相对窗口的比例，
+供变化检测、单词检测等模块裁剪使用。
+"""
+
+from typing import Dict, Tuple
+
+# 区域名 -> (left, top, right, bottom)，取值 0~1，相对窗口宽高
+# 与 prompts.py 中 layout 模块的“屏幕结构说明”对应，可按实际分辨率微调
+SCREEN_REGIONS: Dict[str, Tuple[float, float, float, float]] = {
+    "finished": (0.00, 0.00, 0.22, 0.22),      # 左上：成品区
+    "dessert": (0.22, 0.00, 0.38, 0.25),       # 中上偏左：甜品区
+    "coffee": (0.38, 0.00, 0.55, 0.30),        # 中上偏中：咖啡机及库存
+    "center_table": (0.45, 0.15, 0.65, 0.40),  # 靠近中央偏上：中央桌
+    "cashier": (0.22, 0.25, 0.45, 0.55),       # 中偏左：收银台
+    "pizza": (0.00, 0.22, 0.14, 0.75),         # 左侧边：披萨区（顶部为烤箱）
+    "fryer": (0.00, 0.75, 0.35, 1.00),         # 左下：炸物区
+    "noodles": (0.35, 0.70, 0.65, 1.00),       # 下方：面条区
+    "tables": (0.65, 0.00, 1.00, 1.00),        # 右、中、右上：顾客桌位
+    "carpet": (0.14, 0.55, 0.65, 0.75),        # 红地毯区域：老鼠出没
+}
+
+# 计划步骤的 area（见 plan.AREAS）-> 单词可能出现的屏幕区域
+AREA_REGIONS: Dict[str, Tuple[str, ...]] = {
+    "customer": ("tables", "center_table", "cashier"),
+    "cashier": ("cashier",),
+    "coffee_machine": ("coffee",),
+    "food_station": ("dessert", "coffee", "pizza", "fryer", "noodles"),
+    "mouse": ("carpet",),
+}
+
+
+def region_box(name: str, width: int, height: int) -> Tuple[int, int, int, int]:
+    """
+    计算区域的像素坐标
+
+    Args:
+        name (str): 区域名
+        width (int): 图像宽度
+        height (int): 图像高度
+
+    Returns:
+        Tuple[int, int, int, int]: (left, top, right, bottom) 像素坐标
+    """
+    left, top, right, bottom = SCREEN_REGIONS[name]
+    return (
+        int(left * width),
+        int(top * height),
+        max(int(left * width) + 1, int(right * width)),
+        max(int(top * height) + 1, int(bottom * height)),
+    )
+
+
+def locate_region(x: float, y: float) -> str:
+    """
+    根据相对坐标判断所在区域
+
+    Args:
+        x (float): 相对横坐标（0~1）
+        y (float): 相对纵坐标（0~1）
+
+    Returns:
+        str: 区域名，不在任何区域内时返回 "other"
+    """
+    for name, (left, top, right, bottom) in SCREEN_REGIONS.items():
+        if left <= x < right and top <= y < bottom:
+            return name
+    return "other"
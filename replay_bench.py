@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+离线回放基准测试
+
+把录制的游戏截图按顺序回放，经过真实的 GameWindow → GamePlanner → 键盘执行器流水线，
+每个环节都可以替换为本地替身：
+- 画面来源：ReplaySource 从目录读取截图，或从 SAVE_SCREENSHOTS 写入的截图归档读取
+- 模型接口：mock_openai 本地服务，可配置延迟和预置计划
+- 键盘输出：NullKeyboard 只计数不发送按键
+
+输出每个阶段以及端到端的 p50/p95/p99 和吞吐量（JSON），便于跟踪性能回归。
+
+用法:
+    python replay_bench.py <截图目录> [--ticks 50] [--latency 1.0] [--jitter 0.2]
+                           [--stream] [--mode fast|verbose] [--token-latency 0.01] [--plans plans.json] [--real-api] [--output result.json]
+                           [--trace trace.jsonl]
+                           [--cascade gpt-4o-mini --model gpt-4o-mini:0.4:0.8 --model gpt-4o:1.5:1.0 --verify-rate 1.0]
+
+--cascade 使用快慢模型级联：指定的快速模型先给出计划，PLANNER_MODEL（默认 gpt-4o）在后台确认；
+--model 为模拟服务中的每个模型设置延迟和准确率，结果中的 cascade 字段给出不一致率和各层延迟。
+
+--tail-rate/--tail-latency/--error-rate 在模拟服务中注入长尾延迟和 500 错误；
+--hedge-compare 分别关闭和开启对冲请求各运行一次，输出两者的每轮延迟 p99。
+--warmup 在第一帧之前预热规划器（建立连接、缓存提示词前缀）；使用模拟服务时结果中的 mock 字段
+给出服务端收到的请求数和 TCP 连接数。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from archive import ArchiveReader, is_archive
+from metrics import metrics, percentiles
+from mock_openai import MockConfig, load_plans, parse_model_profiles, start_mock_server
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+
+class ReplaySource:
+    """
+    回放目录中的截图，作为 GameWindow 的画面来源
+    """
+
+    def __init__(self, frame_dir: Path, loop: bool = True, preload: bool = True):
+        """
+        初始化回放源
+
+        Args:
+            frame_dir (Path): 截图目录，或 SAVE_SCREENSHOTS 写入的截图归档目录
+            loop (bool): 播放完后是否从头循环
+            preload (bool): 是否预先解码全部截图，排除磁盘读取和解码的影响
+        """
+        # 截图归档通过 mmap 按帧读取，不必逐个打开文件
+        self.archive: Optional[ArchiveReader] = ArchiveReader(frame_dir) if is_archive(frame_dir) else None
+        if self.archive:
+            self.paths = []
+            count = len(self.archive)
+        else:
+            self.paths = sorted(p for p in frame_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+            count = len(self.paths)
+        if not count:
+            raise ValueError(f"目录中没有截图: {frame_dir}")
+        self.count = count
+        self.loop = loop
+        self.images: Optional[List[Image.Image]] = None
+        if preload:
+            self.images = [self._read(index) for index in range(count)]
+        self.index = 0
+
+    @staticmethod
+    def _load(path: Path) -> Image.Image:
+        image = Image.open(path).convert("RGB")
+        image.load()
+        return image
+
+    def _read(self, index: int) -> Image.Image:
+        return self.archive.image(index) if self.archive else self._load(self.paths[index])
+
+    def __call__(self) -> Optional[Image.Image]:
+        if self.index >= self.count:
+            if not self.loop:
+                return None
+            self.index = 0
+        index = self.index
+        self.index += 1
+        return self.images[index] if self.images else self._read(index)
+
+
+class NullKeyboard:
+    """
+    不发送按键的键盘输出，只统计按键数，可模拟每个按键的耗时
+    """
+
+    def __init__(self, key_delay: float = 0.0):
+        """
+        初始化
+
+        Args:
+            key_delay (float): 模拟每次按键的耗时（秒）
+        """
+        self.key_delay = key_delay
+        self.keys = 0
+
+    def __call__(self, text: str, interval: float) -> None:
+        self.keys += len(text)
+        if self.key_delay:
+            time.sleep(self.key_delay * len(text))
+
+
+def run_benchmark(frame_dir: Path, ticks: int, stream: bool = False,
+                  key_delay: float = 0.0, mode: Optional[str] = None,
+                  cascade_model: Optional[str] = None, verify_rate: float = 1.0,
+                  hedge: Optional[bool] = None, warmup: bool = False) -> Dict[str, Any]:
+    """
+    运行回放基准
+
+    Args:
+        frame_dir (Path): 截图目录
+        ticks (int): 回放的帧数
+        stream (bool): 是否使用流式规划
+        key_delay (float): 模拟每次按键的耗时（秒）
+        mode (Optional[str]): 规划模式 fast / verbose，默认读取 PLANNER_MODE
+        cascade_model (Optional[str]): 级联的快速模型，设置后每帧先由它规划，再由 PLANNER_MODEL 确认
+        verify_rate (float): 级联时由强模型确认的帧比例
+        hedge (Optional[bool]): 是否发出对冲请求，默认读取 REQUEST_HEDGE
+        warmup (bool): 第一帧之前是否预热规划器
+
+    Returns:
+        Dict[str, Any]: 各阶段分位数和吞吐量
+    """
+    # 在环境变量设置完成后再导入，保证规划器指向本地服务
+    from game_window import GameWindow
+    from cascade import CascadePlanner
+    from planner import GamePlanner
+    from resilience import ResilientCaller
+
+    keyboard = NullKeyboard(key_delay)
+    window = GameWindow(frame_source=ReplaySource(frame_dir), keyboard_writer=keyboard,
+                        use_imgur=False, save_screenshots=False)
+    # 每次运行使用新的请求执行器，对冲阈值从头学习
+    planner = GamePlanner(mode, requests=ResilientCaller("bench", hedge=hedge, seed=0))
+    cascade = None
+    if cascade_model:
+        fast = GamePlanner(mode, cascade_model, requests=ResilientCaller("bench-fast", hedge=hedge, seed=0))
+        cascade = CascadePlanner(window.executor, fast=fast, strong=planner, verify_rate=verify_rate, seed=0)
+    if warmup:
+        planner.warm_up()
+        if cascade:
+            cascade.fast.warm_up()
+    window.start_keyboard_thread()
+
+    stages: Dict[str, List[float]] = {
+        name: [] for name in ("capture", "encode", "inference", "parse", "typing", "end_to_end")
+    }
+    words = 0
+    failures = 0
+    started = time.perf_counter()
+    try:
+        for generation in range(1, ticks + 1):
+            tick_start = time.perf_counter()
+            frame = window.take_screenshot()
+            if not frame:
+                failures += 1
+                continue
+            captured = time.perf_counter()
+
+            window.mark_plan_start(frame.captured_at)
+            if cascade:
+                plan = cascade.analyze_screenshot(frame, generation=generation)
+            elif stream:
+                plan = planner.analyze_screenshot_stream(
+                    frame, lambda word: window.add_input_words([word], frame, generation, supersede=False))
+            else:
+                plan = planner.analyze_screenshot(frame)
+            planned = time.perf_counter()
+            if plan is None:
+                failures += 1
+                continue
+            if stream:
+                window.supersede_input_words(plan.inputs, generation)
+            else:
+                window.add_input_words(plan.inputs, frame, generation, priorities=plan.priorities)
+            if cascade:
+                cascade.commit(generation)
+            window.executor.wait_idle(timeout=30)
+            if cascade:
+                # 下一帧之前等待强模型确认，使纠正作用于本帧
+                cascade.wait(timeout=30)
+                window.executor.wait_idle(timeout=30)
+            finished = time.perf_counter()
+
+            inference = frame.timings.get("inference", 0.0)
+            stages["capture"].append(frame.timings.get("capture", 0.0))
+            stages["encode"].append(frame.timings.get("encode", 0.0))
+            stages["inference"].append(inference)
+            stages["parse"].append(max(0.0, planned - captured - inference))
+            stages["typing"].append(finished - planned)
+            stages["end_to_end"].append(finished - tick_start)
+            words += len(plan.steps)
+    finally:
+        elapsed = time.perf_counter() - started
+        window.stop_keyboard_thread()
+        if cascade:
+            cascade.close()
+
+    result_stages = {name: percentiles(values) for name, values in stages.items()}
+    result_stages["queue_wait"] = percentiles(window.executor.queue_waits)
+    result_stages["first_keystroke"] = percentiles(window.executor.first_keystroke_latencies)
+    snapshot = metrics.snapshot()
+    if "model_ttft" in snapshot["histograms"]:
+        result_stages["ttft"] = snapshot["histograms"]["model_ttft"]
+    completed = len(stages["end_to_end"])
+    result = {
+        "stages_ms": result_stages,
+        "throughput": {
+            "ticks": completed,
+            "failures": failures,
+            "elapsed_s": elapsed,
+            "ticks_per_s": completed / elapsed if elapsed else 0.0,
+            "words": words,
+            "words_per_s": words / elapsed if elapsed else 0.0,
+            "keys": keyboard.keys,
+        },
+        "counters": snapshot["counters"],
+        "requests": planner.requests.summary(),
+    }
+    if cascade:
+        result["cascade"] = cascade.summary()
+    return result
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="离线回放基准测试")
+    parser.add_argument("frames", help="录制的截图目录")
+    parser.add_argument("--ticks", type=int, default=50, help="回放的帧数")
+    parser.add_argument("--latency", type=float, default=1.0, help="模拟模型的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="模拟模型的延迟抖动（秒）")
+    parser.add_argument("--plans", help="模拟模型返回的预置计划 JSON 文件")
+    parser.add_argument("--stream", action="store_true", help="使用流式规划")
+    parser.add_argument("--mode", choices=("fast", "verbose"), help="规划模式，默认读取 PLANNER_MODE")
+    parser.add_argument("--token-latency", type=float, default=0.0,
+                        help="模拟模型每个输出 token 的耗时（秒），使延迟随输出长度变化")
+    parser.add_argument("--key-delay", type=float, default=0.0, help="模拟每次按键的耗时（秒）")
+    parser.add_argument("--cascade", metavar="FAST_MODEL", help="快慢模型级联，指定快速模型")
+    parser.add_argument("--verify-rate", type=float, default=1.0, help="级联时由强模型确认的帧比例")
+    parser.add_argument("--model", action="append",
+                        help="模拟服务中的模型：名称:延迟:准确率[:抖动]，可重复指定")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="模拟请求落入长尾的概率")
+    parser.add_argument("--tail-latency", type=float, default=0.0, help="模拟长尾请求额外的延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模拟返回 500 错误的概率")
+    parser.add_argument("--hedge-compare", action="store_true", help="分别关闭和开启对冲各运行一次并对比 p99")
+    parser.add_argument("--warmup", action="store_true", help="第一帧之前预热规划器")
+    parser.add_argument("--real-api", action="store_true", help="使用真实 OpenAI 接口而不是本地模拟服务")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--trace", help="把每个阶段的追踪事件写入 JSONL 文件")
+    parser.add_argument("--verbose", action="store_true", help="保留流水线日志输出")
+    args = parser.parse_args()
+
+    try:
+        config = {"ticks": args.ticks, "stream": args.stream, "mode": args.mode, "real_api": args.real_api,
+                  "cascade": args.cascade, "verify_rate": args.verify_rate}
+        mock = None
+        server = None
+        if not args.real_api:
+            mock = MockConfig(load_plans(args.plans), args.latency, args.jitter, seed=0,
+                              token_latency=args.token_latency, models=parse_model_profiles(args.model),
+                              plan_by_image=bool(args.cascade), tail_rate=args.tail_rate,
+                              tail_latency=args.tail_latency, error_rate=args.error_rate)
+            server = start_mock_server(mock)
+            os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+            os.environ.setdefault("OPENAI_API_KEY", "mock")
+            config.update({"latency_s": args.latency, "jitter_s": args.jitter,
+                           "token_latency_s": args.token_latency, "tail_rate": args.tail_rate,
+                           "tail_latency_s": args.tail_latency, "error_rate": args.error_rate})
+        # 回放时截图只保存在内存中，也不启用后台采集
+        os.environ["CAPTURE_FPS"] = "0"
+
+        if args.trace:
+            metrics.open_trace(args.trace)
+
+        log = None if args.verbose else io.StringIO()
+        with contextlib.redirect_stdout(log) if log else contextlib.nullcontext():
+            if args.hedge_compare:
+                result = {}
+                for name, hedge in (("unhedged", False), ("hedged", True)):
+                    # 两次运行使用相同的模拟延迟序列
+                    metrics.reset()
+                    if mock:
+                        mock.random = random.Random(0)
+                    result[name] = run_benchmark(Path(args.frames), args.ticks, args.stream, args.key_delay,
+                                                 args.mode, args.cascade, args.verify_rate, hedge, args.warmup)
+                result["tick_p99_ms"] = {name: result[name]["stages_ms"]["end_to_end"].get("p99", 0.0)
+                                         for name in ("unhedged", "hedged")}
+            else:
+                result = run_benchmark(Path(args.frames), args.ticks, args.stream, args.key_delay, args.mode,
+                                       args.cascade, args.verify_rate, warmup=args.warmup)
+        result["config"] = config
+        if mock:
+            result["mock"] = {"requests": mock.requests, "connections": mock.connections}
+        if args.hedge_compare:
+            p99 = result["tick_p99_ms"]
+            print(f"每轮延迟 p99: 不对冲 {p99['unhedged']:.0f}ms, 对冲 {p99['hedged']:.0f}ms", file=sys.stderr)
+        metrics.close()
+        if server:
+            server.shutdown()
+
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.output:
+            Path(args.output).write_text(output, encoding="utf-8")
+            print(f"结果已写入: {args.output}")
+        else:
+            print(output)
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
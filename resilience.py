@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+模型请求的容错层
+主要功能：
+1. 每次请求设置截止时间，超时视为失败
+2. 请求超过最近学习到的 p95 延迟仍未返回时发出一份对冲请求，取先返回的结果
+3. 超时、连接错误、限流（429）和服务端错误（5xx）后按指数退避 + 随机抖动重试，其余错误立即放弃
+4. 可重试的错误连续达到阈值时熔断，熔断期间不再请求模型，智能体退化为只执行本地操作
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from metrics import RollingHistogram, metrics
+
+T = TypeVar("T")
+
+
+class RequestFailed(Exception):
+    """重试后仍然失败，或熔断期间拒绝的请求"""
+
+
+class CircuitOpenError(RequestFailed):
+    """熔断期间拒绝的请求"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    错误是否值得重试并计入熔断
+
+    超时、连接错误、限流（429）和服务端错误（5xx）是暂时的；其余错误（如 400 参数错误、
+    401 认证失败）重试也不会成功，也不说明接口不可用。
+
+    Args:
+        error (BaseException): 请求抛出的异常
+
+    Returns:
+        bool: 是否可重试
+    """
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    # 包括客户端自身的异常类型（如 openai.APITimeoutError、openai.APIConnectionError）
+    name = type(error).__name__
+    if "Timeout" in name or "Connection" in name:
+        return True
+    status = getattr(error, "status_code", None)
+    return isinstance(status, int) and (status == 429 or status >= 500)
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    closed：正常请求；连续失败 failure_threshold 次后进入 open。
+    open：拒绝请求，reset_timeout 秒后进入 half_open。
+    half_open：放行探测请求，成功后回到 closed，失败则重新 open。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        初始化熔断器
+
+        Args:
+            failure_threshold (int): 连续失败多少次后熔断
+            reset_timeout (float): 熔断多久后放行探测请求（秒）
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._lock = threading.Lock()
+
+    def available(self) -> bool:
+        """
+        当前是否允许请求模型
+
+        Returns:
+            bool: closed / half_open 时为 True；open 且已到探测时间时转为 half_open 并返回 True
+        """
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                print("模型接口熔断到期，放行探测请求")
+            return self.state != "open"
+
+    def record_success(self) -> None:
+        """记录一次成功的请求"""
+        with self._lock:
+            if self.state != "closed":
+                print("模型接口恢复，关闭熔断")
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        """记录一次失败的请求"""
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.opens += 1
+                metrics.incr("circuit_opens")
+                print(f"模型接口连续失败 {self.failures} 次，熔断 {self.reset_timeout:.0f}s，仅执行本地操作")
+
+
+class ResilientCaller:
+    """
+    带截止时间、对冲、重试和熔断的请求执行器
+
+    请求函数接收本次尝试剩余的超时时间（秒），应把它传给客户端（如 OpenAI 的 timeout 参数），
+    使被放弃的同步请求也能按时结束。
+    """
+
+    def __init__(self, name: str = "model",
+                 timeout: Optional[float] = None,
+                 retries: Optional[int] = None,
+                 hedge: Optional[bool] = None,
+                 hedge_quantile: float = 0.95,
+                 min_hedge_delay: float = 0.2,
+                 min_samples: int = 10,
+                 backoff: float = 0.2,
+                 max_backoff: float = 2.0,
+                 breaker: Optional[CircuitBreaker] = None,
+                 seed: Optional[int] = None):
+        """
+        初始化请求执行器
+
+        Args:
+            name (str): 名称，用于日志和统计
+            timeout (Optional[float]): 单次尝试的截止时间（秒），默认读取 REQUEST_TIMEOUT（10）
+            retries (Optional[int]): 失败后的重试次数，默认读取 REQUEST_RETRIES（2）
+            hedge (Optional[bool]): 是否发出对冲请求，默认读取 REQUEST_HEDGE（1）
+            hedge_quantile (float): 对冲阈值使用的延迟分位数
+            min_hedge_delay (float): 对冲等待的下限（秒）
+            min_samples (int): 学习到多少个成功延迟后才开始对冲
+            backoff (float): 重试退避的基数（秒）
+            max_backoff (float): 重试退避的上限（秒）
+            breaker (Optional[CircuitBreaker]): 熔断器，默认按 BREAKER_FAILURES、BREAKER_RESET 创建
+            seed (Optional[int]): 退避抖动的随机种子
+        """
+        self.name = name
+        self.timeout = timeout if timeout is not None else float(os.getenv('REQUEST_TIMEOUT', '10'))
+        self.retries = retries if retries is not None else int(os.getenv('REQUEST_RETRIES', '2'))
+        if hedge is None:
+            hedge = os.getenv('REQUEST_HEDGE', '1').lower() in ('1', 'true', 'yes')
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker(int(os.getenv('BREAKER_FAILURES', '5')),
+                                                 float(os.getenv('BREAKER_RESET', '30')))
+        self.latencies = RollingHistogram(256)
+        self._random = random.Random(seed)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+        # 统计
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.retried = 0
+        self.timeouts = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        对冲前等待的时间
+
+        Returns:
+            Optional[float]: 学习到的延迟分位数（不低于 min_hedge_delay）；
+                未开启对冲或样本不足时返回 None
+        """
+        if not self.hedge or self.latencies.count < self.min_samples:
+            return None
+        return max(self.min_hedge_delay, self.latencies.quantile(self.hedge_quantile))
+
+    def retry_delay(self, attempt: int) -> float:
+        """
+        第 attempt 次重试前的退避时间：指数增长的上限内均匀随机（full jitter）
+
+        Args:
+            attempt (int): 重试序号，从 1 开始
+
+        Returns:
+            float: 退避时间（秒）
+        """
+        ceiling = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        with self._lock:
+            return self._random.uniform(0, ceiling)
+
+    def _before_attempt(self, attempt: int) -> float:
+        """检查熔断并计算本次尝试前的退避时间"""
+        if not self.breaker.available():
+            self.rejected += 1
+            metrics.incr("requests_rejected")
+            raise CircuitOpenError(f"{self.name} 接口熔断中")
+        if attempt == 0:
+            self.requests += 1
+            return 0.0
+        self.retried += 1
+        metrics.incr("request_retries")
+        return self.retry_delay(attempt)
+
+    def _after_attempt(self, start: float, error: Optional[BaseException], attempt: int,
+                       learn: bool = True) -> None:
+        """记录一次尝试的结果，learn 为 False 时不计入对冲阈值（如流式请求只到首个响应）"""
+        if error is None:
+            if learn:
+                self.latencies.observe(time.perf_counter() - start)
+            self.breaker.record_success()
+            return
+        # 包括客户端自身的超时异常（如 openai.APITimeoutError）
+        if isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in type(error).__name__:
+            self.timeouts += 1
+            metrics.incr("request_timeouts")
+        metrics.incr("request_errors")
+        print(f"{self.name} 请求失败（第 {attempt + 1} 次）: {error!r}")
+        self.breaker.record_failure()
+
+    def _give_up(self, error: BaseException, attempt: int) -> RequestFailed:
+        """不可重试的错误：不重试，也不计入熔断"""
+        self.failed += 1
+        metrics.incr("request_errors")
+        metrics.incr("requests_failed")
+        print(f"{self.name} 请求失败（第 {attempt + 1} 次，不可重试）: {error!r}")
+        return RequestFailed(f"{self.name} 请求失败: {error!r}")
+
+    def _fail(self, error: Optional[BaseException]) -> RequestFailed:
+        self.failed += 1
+        metrics.incr("requests_failed")
+        return RequestFailed(f"{self.name} 请求在 {self.retries + 1} 次尝试后失败: {error!r}")
+
+    def call(self, request: Callable[[float], T], hedge: bool = True) -> T:
+        """
+        同步执行请求
+
+        Args:
+            request (Callable[[float], T]): 请求函数，参数为超时时间（秒）
+            hedge (bool): 本次调用是否允许对冲（流式请求等不适合重复发送的调用传 False）
+
+        Returns:
+            T: 请求结果
+
+        Raises:
+            RequestFailed: 重试后仍然失败、不可重试的错误，或熔断中（CircuitOpenError）
+        """
+        error: Optional[BaseException] = None
+        for attempt in range(self.retries + 1):
+            time.sleep(self._before_attempt(attempt))
+            start = time.perf_counter()
+            try:
+                result = self._attempt(request, hedge)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise self._give_up(e, attempt) from e
+                error = e
+                self._after_attempt(start, e, attempt)
+                continue
+            self._after_attempt(start, None, attempt, hedge)
+            return result
+        raise self._fail(error)
+
+    def _attempt(self, request: Callable[[float], T], hedge: bool) -> T:
+        """一次尝试：超过对冲阈值时发出第二份请求，在截止时间内取先成功的结果"""
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix=f"{self.name}-request")
+        start = time.perf_counter()
+        futures: List[Future] = [self._pool.submit(request, self.timeout)]
+        delay = self.hedge_delay() if hedge else None
+        if delay is not None and delay < self.timeout:
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                self.hedged += 1
+                metrics.incr("requests_hedged")
+                futures.append(self._pool.submit(request, self.timeout - delay))
+
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            remaining = self.timeout - (time.perf_counter() - start)
+            done, pending = wait(pending, timeout=max(0.0, remaining), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"超过 {self.timeout:.1f}s 未返回")
+            for future in done:
+                if future.exception() is None:
+                    if len(futures) > 1 and future is futures[1]:
+                        self.hedge_wins += 1
+                        metrics.incr("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def call_async(self, request: Callable[[float], Awaitable[T]], hedge: bool = True) -> T:
+        """
+        异步执行请求，被放弃的请求会被取消
+
+        Args:
+            request (Callable[[float], Awaitable[T]]): 请求协程函数，参数为超时时间（秒）
+            hedge (bool): 本次调用是否允许对冲
+
+        Returns:
+            T: 请求结果
+
+        Raises:
+            RequestFailed: 重试后仍然失败、不可重试的错误，或熔断中（CircuitOpenError）
+        """
+        error: Optional[BaseException] = None
+        for attempt in range(self.retries + 1):
+            await asyncio.sleep(self._before_attempt(attempt))
+            start = time.perf_counter()
+            try:
+                result = await self._attempt_async(request, hedge)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise self._give_up(e, attempt) from e
+                error = e
+                self._after_attempt(start, e, attempt)
+                continue
+            self._after_attempt(start, None, attempt, hedge)
+            return result
+        raise self._fail(error)
+
+    async def _attempt_async(self, request: Callable[[float], Awaitable[T]], hedge: bool) -> T:
+        """异步的一次尝试"""
+        start = time.perf_counter()
+        tasks = [asyncio.ensure_future(request(self.timeout))]
+        try:
+            delay = self.hedge_delay() if hedge else None
+            if delay is not None and delay < self.timeout:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self.hedged += 1
+                    metrics.incr("requests_hedged")
+                    tasks.append(asyncio.ensure_future(request(self.timeout - delay)))
+
+            pending = set(tasks)
+            error: Optional[BaseException] = None
+            while pending:
+                remaining = self.timeout - (time.perf_counter() - start)
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, remaining),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise TimeoutError(f"超过 {self.timeout:.1f}s 未返回")
+                for task in done:
+                    if task.exception() is None:
+                        if len(tasks) > 1 and task is tasks[1]:
+                            self.hedge_wins += 1
+                            metrics.incr("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        统计数据
+
+        Returns:
+            Dict[str, Any]: 请求、对冲、重试、超时、失败、熔断次数和当前对冲阈值（毫秒）
+        """
+        delay = self.hedge_delay()
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "retried": self.retried,
+            "timeouts": self.timeouts,
+            "failed": self.failed,
+            "circuit_opens": self.breaker.opens,
+            "rejected": self.rejected,
+            "hedge_delay_ms": delay * 1000 if delay is not None else None,
+        }
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 请求、对冲、重试、超时、失败和熔断次数，以及当前的对冲阈值
+        """
+        delay = self.hedge_delay()
+        threshold = f"{delay * 1000:.0f}ms" if delay is not None else "-"
+        return (
+            f"{self.name}: 请求 {self.requests}, 对冲 {self.hedged} (胜出 {self.hedge_wins}), "
+            f"重试 {self.retried}, 超时 {self.timeouts}, 失败 {self.failed}, "
+            f"熔断 {self.breaker.opens} 次 (拒绝 {self.rejected}), 对冲阈值 {threshold}"
+        )
+
+
+# 按模型共享的请求执行器：每轮新建的 GamePlanner 也共享延迟分布和熔断状态
+_callers: Dict[str, ResilientCaller] = {}
+_callers_lock = threading.Lock()
+
+
+def get_caller(model: Optional[str] = None) -> ResilientCaller:
+    """
+    获取模型对应的共享请求执行器
+
+    Args:
+        model (Optional[str]): 模型名，默认读取 PLANNER_MODEL（gpt-4o）
+
+    Returns:
+        ResilientCaller: 请求执行器
+    """
+    model = model or os.getenv('PLANNER_MODEL', 'gpt-4o')
+    with _callers_lock:
+        caller = _callers.get(model)
+        if caller is None:
+            caller = _callers[model] = ResilientCaller(model)
+        return caller
+
+
+def callers() -> List[ResilientCaller]:
+    """
+    已创建的全部共享请求执行器
+
+    Returns:
+        List[ResilientCaller]: 请求执行器列表
+    """
+    with _callers_lock:
+        return list(_callers.values())
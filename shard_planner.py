@@ -0,0 +1,505 @@
+#!/usr/bin/env python3
+"""
+按区域分片的并发规划器
+主要功能：
+1. 按 regions.SCREEN_REGIONS 把截图裁剪为若干分片（顾客与收银、饮品与甜品、制作区、老鼠）
+2. 每个分片使用简短的区域专用提示词和小图，并发调用模型
+3. 只分析画面发生变化的分片，与未变化分片上一次的结果合并为完整的计划
+4. 顾客分片给出当前订单，供下一帧的制作区、饮品分片判断要做什么
+"""
+
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from frame import Frame, encode_image
+from input_scheduler import PRIORITY_ORDER
+from metrics import metrics
+from plan import Plan, PlanStep, PlanValidationError
+from planner import GamePlanner
+from preprocess import LOW_DETAIL_SIZE
+from regions import region_box
+
+# 所有分片共用的说明
+SHARD_HEADER = """你是《The Chef’s Shift》游戏的智能助手。玩家通过输入屏幕上的高亮单词进行操作：
+• 只有深棕色底、白色字体的高亮单词可以输入，灰色或其他样式的单词不可输入
+• 单词原样输入，区分大小写，可能包含 -、?、! 等字符
+• 单词显示在物品或者顾客正上方，如果有很大的左右偏移，不能认为在上方
+• 若单词前面有字母是黄色的，priority 为 “yellow”，优先输入
+
+下面只给出截图中的部分区域（每张图前标明区域名），只根据这些区域判断。"""
+
+# 所有分片共用的返回格式说明
+SHARD_FOOTER = """⚡ 返回格式：
+只返回 JSON，不要描述和推理。“steps” 按输入顺序列出现在应该输入的单词，每项包含 “word”、“area”、“priority”。
+不要包含不能输入的单词。没有需要输入的单词时返回空的 “steps”。"""
+
+
+@dataclass(frozen=True)
+class Shard:
+    """一个分片：若干屏幕区域和对应的提示词"""
+
+    name: str
+    regions: Tuple[str, ...]  # 区域名，见 regions.SCREEN_REGIONS
+    areas: Tuple[str, ...]  # 允许返回的计划区域，见 plan.AREAS
+    rules: str  # 区域专用规则
+    needs_order: bool = False  # 是否需要当前订单
+    reports_order: bool = False  # 是否返回当前订单
+
+    @property
+    def prompt(self) -> str:
+        """分片的系统提示词"""
+        return f"{SHARD_HEADER}\n\n⸻\n\n{self.rules}\n\n⸻\n\n{SHARD_FOOTER}"
+
+    @property
+    def response_format(self) -> Dict[str, Any]:
+        """分片的结构化输出格式：area 只允许本分片的区域，顾客分片额外返回 order"""
+        properties: Dict[str, Any] = {
+            "steps": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "word": {"type": "string"},
+                        "area": {"type": "string", "enum": list(self.areas)},
+                        "priority": {"type": "string", "enum": list(PRIORITY_ORDER)},
+                    },
+                    "required": ["word", "area", "priority"],
+                    "additionalProperties": False,
+                },
+            },
+        }
+        if self.reports_order:
+            properties["order"] = {"type": "string"}
+        schema = {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties),
+            "additionalProperties": False,
+        }
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": f"chef_shard_{self.name}", "strict": True, "schema": schema},
+        }
+
+
+SHARDS: Tuple[Shard, ...] = (
+    Shard(
+        name="service",
+        regions=("tables", "center_table", "cashier"),
+        areas=("customer", "cashier", "other"),
+        reports_order=True,
+        rules="""🍽️ 顾客桌位与收银台：
+• 堂食顾客坐在桌边，订单图标和上菜词显示在顾客面对的桌子上方；打包顾客站在收银台前，订单图标和上菜词显示在其头顶
+• 只显示食物图标（不可输入）表示已下单、尚未上菜；出现高亮词时输入该词上菜（area “customer”，priority “serve”）
+• 收银台上的高亮词始终存在，只有收银台前的顾客头顶出现钞票图标时才可以输入（area “cashier”，priority “cashier”）
+• 收银台前的顾客仍显示食物图标或高亮词时，尚未进入付款阶段，不可收银
+• “order” 填写所有仍在等待上菜的菜品（如 “披萨、拿铁”），没有时为空字符串""",
+    ),
+    Shard(
+        name="drinks",
+        regions=("coffee", "dessert"),
+        areas=("coffee_machine", "food_station", "other"),
+        needs_order=True,
+        rules="""☕ 咖啡机与甜品区：
+• 咖啡机右侧是制作好的咖啡，上方的数字（0/1/2）表示库存
+• 输入咖啡机上的单词制作一杯咖啡（area “coffee_machine”，priority “cook”）
+• 订单中有咖啡时，输入制作好的咖啡上方的单词（即咖啡种类，不是咖啡机）放入成品区；有库存时不需要再制作
+• 甜品区：输入甜品上的单词即可制作甜品并放入成品区（area “food_station”，priority “cook”）
+• 只处理当前订单中的饮品和甜品；甜品有三种、咖啡有两种，需要和订单仔细核对""",
+    ),
+    Shard(
+        name="kitchen",
+        regions=("finished", "pizza", "fryer", "noodles"),
+        areas=("food_station", "other"),
+        needs_order=True,
+        rules="""🍳 制作区（成品区中是已经做好的菜品）：
+• 面条区：先输入左侧食材单词，再输入右侧锅上的单词烹饪；煮好后再次输入锅的单词放入成品区
+• 炸物区：先输入原料单词，再输入油锅上的单词；炸好后再次输入油锅单词放入成品区
+• 披萨区：自下而上依次输入四种食材，最后输入顶部烤炉上的单词烘烤；烤好后再次输入烤炉单词放入成品区
+• 只制作当前订单中、成品区还没有的菜品；面食和炸物各有两种，需要和订单仔细核对
+• 单词的 area 为 “food_station”，priority 为 “cook”""",
+    ),
+    Shard(
+        name="mouse",
+        regions=("carpet",),
+        areas=("mouse",),
+        rules="""🐭 红地毯区域：
+• 可能出现老鼠，老鼠头顶显示一个高亮的两字母单词，输入该词击退老鼠（area “mouse”，priority “rat”）
+• 没有老鼠时返回空的 “steps”""",
+    ),
+)
+
+
+def parse_shard_response(shard: Shard, content: Optional[str]) -> Plan:
+    """
+    严格解析一个分片的响应
+
+    Args:
+        shard (Shard): 分片
+        content (Optional[str]): 模型返回的文本，拒绝回答时为 None
+
+    Returns:
+        Plan: 分片的计划，顾客分片的 raw 中包含 order
+
+    Raises:
+        PlanValidationError: 不是合法 JSON 或不符合分片的 Schema
+    """
+    if content is None:
+        raise PlanValidationError("模型未返回内容")
+    try:
+        data = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise PlanValidationError(f"JSON 解析错误: {e}") from e
+    expected = {"steps", "order"} if shard.reports_order else {"steps"}
+    if not isinstance(data, dict) or set(data) != expected:
+        raise PlanValidationError(f"分片 {shard.name} 的字段不符合 Schema")
+    if not isinstance(data["steps"], list):
+        raise PlanValidationError("steps 必须是数组")
+    if shard.reports_order and not isinstance(data["order"], str):
+        raise PlanValidationError("order 必须是字符串")
+    steps = [PlanStep.from_fast(step) for step in data["steps"]]
+    for step in steps:
+        if step.area not in shard.areas:
+            raise PlanValidationError(f"分片 {shard.name} 不应返回区域 {step.area}")
+    return Plan(steps=steps, mode="fast", raw=data)
+
+
+def merge_plans(results: Dict[str, Plan], order: Optional[str] = None) -> Plan:
+    """
+    合并各分片的计划
+
+    单词去重后按优先级稳定排序，同一优先级内保持分片和模型给出的顺序。
+
+    Args:
+        results (Dict[str, Plan]): 分片名 -> 计划
+        order (Optional[str]): 当前订单
+
+    Returns:
+        Plan: 合并后的计划，raw 中保留各分片的原始结果
+    """
+    steps: List[PlanStep] = []
+    seen = set()
+    for shard in SHARDS:
+        plan = results.get(shard.name)
+        if plan is None:
+            continue
+        for step in plan.steps:
+            if step.word not in seen:
+                seen.add(step.word)
+                steps.append(step)
+    steps.sort(key=lambda step: PRIORITY_ORDER.get(step.priority, len(PRIORITY_ORDER)))
+    raw: Dict[str, Any] = {
+        "steps": [{"word": step.word, "area": step.area, "priority": step.priority} for step in steps],
+        "shards": {name: plan.raw for name, plan in results.items()},
+    }
+    if order is not None:
+        raw["order"] = order
+    return Plan(steps=steps, mode="fast", raw=raw)
+
+
+class ShardedPlanner:
+    """
+    按区域分片的并发规划器
+
+    复用 GamePlanner 的客户端和模型配置。不支持流式输出：每个分片的输出很短，
+    分片并发本身已经缩短了首个单词的等待时间。
+    """
+
+    def __init__(self, planner: Optional[GamePlanner] = None,
+                 shards: Sequence[Shard] = SHARDS, max_tokens: int = 150):
+        """
+        初始化分片规划器
+
+        Args:
+            planner (Optional[GamePlanner]): 提供客户端和模型配置的规划器
+            shards (Sequence[Shard]): 分片定义
+            max_tokens (int): 每个分片的最大输出 token 数
+        """
+        self.planner = planner or GamePlanner()
+        self.shards = tuple(shards)
+        self.max_tokens = max_tokens
+        self.order: Optional[str] = None  # 最近一次顾客分片给出的订单
+        self._order_changed = False
+        self.last_shards: List[str] = []  # 最近一帧分析的分片
+        # 每个分片最近一次的计划（已输入的单词会被移除），未分析的分片沿用它
+        self.latest: Dict[str, Plan] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=len(self.shards), thread_name_prefix="shard")
+
+        # 统计
+        self.frames = 0
+        self.shard_calls = 0
+        self.shards_skipped = 0
+        self.shard_failures = 0
+
+    def select_shards(self, changed_regions: Optional[Sequence[str]] = None) -> List[Shard]:
+        """
+        选择本帧需要分析的分片
+
+        Args:
+            changed_regions (Optional[Sequence[str]]): 变化的区域，None 表示全部分析
+
+        Returns:
+            List[Shard]: 区域有变化，或依赖的订单刚发生变化的分片
+        """
+        if changed_regions is None:
+            return list(self.shards)
+        changed = set(changed_regions)
+        selected = [shard for shard in self.shards
+                    if changed.intersection(shard.regions) or (shard.needs_order and self._order_changed)]
+        self.shards_skipped += len(self.shards) - len(selected)
+        return selected
+
+    def _shard_messages(self, shard: Shard, frame: Frame,
+                        context: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        构造分片的消息：每个区域一张裁剪后的小图
+
+        Args:
+            shard (Shard): 分片
+            frame (Frame): 截图帧（使用未编码的原始图像裁剪）
+            context (Optional[str]): 游戏状态增量
+
+        Returns:
+            List[Dict[str, Any]]: chat.completions 消息列表
+        """
+        image = frame.get_image()
+        image_format = frame.mime_type.split("/")[-1]
+        text = "请给出这些区域中现在需要输入的单词。"
+        if shard.needs_order:
+            text = f"当前订单：{self.order or '未知'}\n{text}"
+        if context:
+            text = f"上一轮以来的已知状态变化：{context}\n{text}"
+        content: List[Dict[str, Any]] = [{"type": "text", "text": text}]
+        for region in shard.regions:
+            crop = image.crop(region_box(region, image.width, image.height))
+            data, mime_type = encode_image(crop, image_format)
+            crop_frame = Frame(data=data, mime_type=mime_type, width=crop.width, height=crop.height)
+            image_url = {"url": crop_frame.to_data_url()}
+            detail = frame.detail
+            if detail == "auto" and max(crop.size) <= LOW_DETAIL_SIZE:
+                # 小图用 low 不损失信息，每张只计 85 token
+                detail = "low"
+            if detail != "auto":
+                image_url["detail"] = detail
+            content.append({"type": "text", "text": f"区域 {region}："})
+            content.append({"type": "image_url", "image_url": image_url})
+        return [
+            {"role": "system", "content": shard.prompt},
+            {"role": "user", "content": content},
+        ]
+
+    def _request_kwargs(self, shard: Shard, frame: Frame, context: Optional[str] = None) -> Dict[str, Any]:
+        """
+        构造分片的 chat.completions 请求参数
+
+        Args:
+            shard (Shard): 分片
+            frame (Frame): 截图帧
+            context (Optional[str]): 游戏状态增量
+
+        Returns:
+            Dict[str, Any]: 请求参数
+        """
+        return {
+            "model": self.planner.model,
+            "messages": self._shard_messages(shard, frame, context),
+            "max_tokens": self.max_tokens,
+            "temperature": 0,
+            "response_format": shard.response_format,
+        }
+
+    def _handle_response(self, shard: Shard, response: Any, start: float) -> Optional[Plan]:
+        """
+        记录分片请求的耗时和 token 用量，并解析响应
+
+        Args:
+            shard (Shard): 分片
+            response: chat.completions 响应
+            start (float): 请求开始时间（perf_counter）
+
+        Returns:
+            Optional[Plan]: 分片的计划，解析失败时返回 None
+        """
+        elapsed = time.perf_counter() - start
+        metrics.observe("model_request", elapsed, model=self.planner.model, mode="shard", shard=shard.name)
+        metrics.incr("model_requests")
+        metrics.incr("shard_requests")
+        if response.usage is not None:
+            metrics.incr("tokens_prompt", response.usage.prompt_tokens or 0)
+            metrics.incr("tokens_completion", response.usage.completion_tokens or 0)
+        self.shard_calls += 1
+        content = response.choices[0].message.content
+        try:
+            with metrics.span("json_parse", chars=len(content or ""), mode="shard"):
+                plan = parse_shard_response(shard, content)
+        except PlanValidationError as e:
+            print(f"分片 {shard.name} 计划格式错误: {e}")
+            metrics.incr("parse_errors")
+            self.shard_failures += 1
+            return None
+        print(f"分片 {shard.name} ({elapsed * 1000:.0f}ms): {plan.inputs}")
+        return plan
+
+    def _request_shard(self, shard: Shard, frame: Frame, context: Optional[str] = None) -> Optional[Plan]:
+        """同步请求一个分片（在线程池中执行）"""
+        kwargs = self._request_kwargs(shard, frame, context)
+        start = time.perf_counter()
+        try:
+            # 分片请求的延迟分布与整图请求不同，不参与对冲，只使用截止时间、重试和熔断
+            response = self.planner.requests.call(
+                lambda timeout: self.planner.client.chat.completions.create(**kwargs, timeout=timeout),
+                hedge=False)
+        except Exception as e:
+            print(f"分片 {shard.name} 请求失败: {e}")
+            self.shard_failures += 1
+            return None
+        return self._handle_response(shard, response, start)
+
+    async def _request_shard_async(self, shard: Shard, frame: Frame,
+                                   context: Optional[str] = None) -> Optional[Plan]:
+        """异步请求一个分片"""
+        kwargs = self._request_kwargs(shard, frame, context)
+        start = time.perf_counter()
+        try:
+            response = await self.planner.requests.call_async(
+                lambda timeout: self.planner.async_client.chat.completions.create(**kwargs, timeout=timeout),
+                hedge=False)
+        except Exception as e:
+            print(f"分片 {shard.name} 请求失败: {e}")
+            self.shard_failures += 1
+            return None
+        return self._handle_response(shard, response, start)
+
+    def _phases(self, shards: List[Shard]) -> List[List[Shard]]:
+        """
+        安排请求顺序：订单未知时先请求顾客分片，其余分片并发
+
+        Args:
+            shards (List[Shard]): 本帧需要分析的分片
+
+        Returns:
+            List[List[Shard]]: 依次执行的分片组，组内并发
+        """
+        if self.order is None and any(s.reports_order for s in shards) and any(s.needs_order for s in shards):
+            return [[s for s in shards if s.reports_order], [s for s in shards if not s.reports_order]]
+        return [shards]
+
+    def record_typed(self, word: str) -> None:
+        """
+        单词输入完成的回调（注册到 KeyboardExecutor.typed_callbacks），从各分片保存的计划中移除
+
+        Args:
+            word (str): 输入完成的单词
+        """
+        with self._lock:
+            for name, plan in self.latest.items():
+                if word in plan.inputs:
+                    self.latest[name] = replace(plan, steps=[step for step in plan.steps if step.word != word])
+
+    def _finish(self, frame: Frame, results: Dict[str, Plan], start: float,
+                previous_order: Optional[str]) -> Optional[Plan]:
+        """
+        合并分片结果，把计划记录在帧上
+
+        本帧分析的分片使用新结果，其余分片沿用上一次的结果，
+        这样计划（以及按新计划代数取消旧单词、写入计划缓存）覆盖整个画面，而不只是变化的分片。
+
+        Args:
+            frame (Frame): 截图帧
+            results (Dict[str, Plan]): 成功的分片结果
+            start (float): 开始时间（perf_counter）
+            previous_order (Optional[str]): 本帧之前的订单，订单变化时下一帧重新分析依赖订单的分片
+
+        Returns:
+            Optional[Plan]: 合并后的计划，本帧分析的分片全部失败时返回 None
+        """
+        frame.timings["inference"] = time.perf_counter() - start
+        self._order_changed = self.order != previous_order
+        if not results:
+            return None
+        with self._lock:
+            self.latest.update(results)
+            plan = merge_plans(dict(self.latest), self.order)
+        frame.plan = plan.raw
+        frame.steps = [step.to_dict() for step in plan.steps]
+        print(f"分片合并: {plan.inputs}")
+        return plan
+
+    def analyze_screenshot(self, frame: Frame, context: Optional[str] = None,
+                           changed_regions: Optional[Sequence[str]] = None) -> Optional[Plan]:
+        """
+        并发分析各分片并合并为一个计划
+
+        Args:
+            frame (Frame): 截图帧
+            context (Optional[str]): 游戏状态增量，见 GameStateTracker.prompt_context
+            changed_regions (Optional[Sequence[str]]): 变化的区域，只分析相关分片；None 表示全部分析
+
+        Returns:
+            Optional[Plan]: 合并后的计划，如果全部分片失败则返回 None
+        """
+        self.frames += 1
+        start = time.perf_counter()
+        previous_order = self.order
+        results: Dict[str, Plan] = {}
+        selected = self.select_shards(changed_regions)
+        self.last_shards = [shard.name for shard in selected]
+        for phase in self._phases(selected):
+            futures = {shard.name: self._pool.submit(self._request_shard, shard, frame, context)
+                       for shard in phase}
+            for name, future in futures.items():
+                plan = future.result()
+                if plan is not None:
+                    results[name] = plan
+                    if plan.raw.get("order") is not None:
+                        self.order = plan.raw["order"]
+        return self._finish(frame, results, start, previous_order)
+
+    async def analyze_screenshot_async(self, frame: Frame, context: Optional[str] = None,
+                                       changed_regions: Optional[Sequence[str]] = None) -> Optional[Plan]:
+        """
+        异步并发分析各分片并合并为一个计划
+
+        Args:
+            frame (Frame): 截图帧
+            context (Optional[str]): 游戏状态增量
+            changed_regions (Optional[Sequence[str]]): 变化的区域，None 表示全部分析
+
+        Returns:
+            Optional[Plan]: 合并后的计划，如果全部分片失败则返回 None
+        """
+        self.frames += 1
+        start = time.perf_counter()
+        previous_order = self.order
+        results: Dict[str, Plan] = {}
+        selected = self.select_shards(changed_regions)
+        self.last_shards = [shard.name for shard in selected]
+        for phase in self._phases(selected):
+            plans = await asyncio.gather(*(self._request_shard_async(shard, frame, context)
+                                           for shard in phase))
+            for shard, plan in zip(phase, plans):
+                if plan is not None:
+                    results[shard.name] = plan
+                    if plan.raw.get("order") is not None:
+                        self.order = plan.raw["order"]
+        return self._finish(frame, results, start, previous_order)
+
+    def close(self) -> None:
+        """关闭线程池"""
+        self._pool.shutdown(wait=False)
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 帧数、分片请求数、跳过和失败的分片数
+        """
+        return (f"帧 {self.frames}, 分片请求 {self.shard_calls}, "
+                f"跳过未变化分片 {self.shards_skipped}, 失败 {self.shard_failures}")
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+模拟班次吞吐基准
+
+在 simulator.ShiftSimulator 上批量运行班次，统计每分钟上菜数、错过的订单和每道菜的按键数：
+- oracle：离散事件模式，不受真实时间限制。每轮取标准答案计划，按给定的模型延迟、按键间隔
+  和截图间隔推进模拟时钟后逐键输入，单核上十几秒即可跑完上千个三分钟的班次，用于评估延迟和输入节奏的上限
+- agent：闭环运行真实的智能体（GameWindow → AsyncAgentRunner → GamePlanner → 键盘执行器），
+  画面由模拟器渲染，按键送回模拟器，模型接口为 mock_openai（返回当前局面的标准答案）
+
+用法:
+    python sim_bench.py [--policy oracle|agent] [--shifts 1000] [--shift-seconds 180]
+                        [--latency 1.5] [--jitter 0.3] [--key-interval 0.03] [--plan-interval 0.5]
+                        [--drop-rate 0.02] [--speed 4] [--mode fast|verbose] [--per-shift] [--output result.json]
+
+agent 模式下模拟时钟按 --speed 倍速运行，模拟服务的延迟按倍速缩短；
+智能体自身的计时（按键间隔、宏等待、截图间隔）仍按真实时间，倍速越高这些环节在模拟时间中越慢。
+配合 --drop-rate 与 VERIFY_INPUT=1 可以对比输入后校验对吞吐的影响。
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from metrics import percentiles
+from mock_openai import MockConfig, start_mock_server
+from plan import Plan
+from simulator import ShiftSimulator, SimClock, SimConfig
+
+# 汇总分位数的指标
+SUMMARY_KEYS = ("dishes_per_min", "missed_orders", "keys_per_dish", "wrong_keys", "mean_serve_s")
+
+
+def run_oracle_shift(config: SimConfig, seed: int, latency: float, jitter: float,
+                     key_interval: float, plan_interval: float) -> Dict[str, Any]:
+    """
+    以离散事件方式运行一个班次：截图 → 等待模型延迟 → 逐键输入标准答案计划
+
+    Args:
+        config (SimConfig): 班次参数
+        seed (int): 随机种子
+        latency (float): 模型平均延迟（模拟秒）
+        jitter (float): 延迟的均匀抖动幅度（模拟秒）
+        key_interval (float): 按键间隔（模拟秒）
+        plan_interval (float): 输入完成到下一次截图的间隔（模拟秒）
+
+    Returns:
+        Dict[str, Any]: 班次统计
+    """
+    sim = ShiftSimulator(config, SimClock(speed=0), seed=seed)
+    rng = random.Random(seed)
+    while not sim.shift_over:
+        # 计划基于截图时刻的局面，输入时局面可能已经变化
+        plan = Plan.from_verbose(sim.oracle_plan())
+        sim.clock.advance(max(0.0, latency + rng.uniform(-jitter, jitter)))
+        for word in plan.inputs:
+            for letter in word:
+                sim.keyboard(letter)
+                sim.clock.advance(key_interval)
+        sim.clock.advance(plan_interval)
+    return sim.summary()
+
+
+async def run_agent_shifts(configs: List[SimConfig], seeds: List[int], speed: float,
+                           mock: MockConfig, mode: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    闭环运行真实的智能体，所有班次在同一个事件循环中依次运行
+
+    Args:
+        configs (List[SimConfig]): 每个班次的参数
+        seeds (List[int]): 每个班次的随机种子
+        speed (float): 模拟时钟倍速
+        mock (MockConfig): 模拟服务配置，每个班次把 plan_source 指向当前模拟器
+        mode (Optional[str]): 规划模式 fast / verbose，默认读取 PLANNER_MODE
+
+    Returns:
+        List[Dict[str, Any]]: 每个班次的统计
+    """
+    # 在环境变量设置完成后再导入，保证规划器指向本地服务
+    from game_window import GameWindow
+    from multi_agent import build_runner
+    from planner import GamePlanner
+
+    # 规划器整个运行期间复用
+    planner = GamePlanner(mode)
+    results = []
+    for config, seed in zip(configs, seeds):
+        sim = ShiftSimulator(config, SimClock(speed), seed=seed)
+        mock.plan_source = sim.oracle_plan
+        window = GameWindow(frame_source=sim.render, keyboard_writer=sim.keyboard, use_imgur=False,
+                            save_screenshots=False, probe_source=sim.render)
+        runner = build_runner(window, planner)
+        window.start_keyboard_thread()
+        task = asyncio.create_task(runner.run())
+        try:
+            while not sim.shift_over and not task.done():
+                await asyncio.wait({task}, timeout=0.2)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            if runner.macros:
+                runner.macros.stop()
+            if runner.verifier:
+                runner.verifier.stop()
+            window.stop_keyboard_thread()
+        summary = sim.summary()
+        summary["first_keystroke_ms"] = percentiles(window.executor.first_keystroke_latencies)
+        if runner.verifier:
+            summary["verify"] = {"checks": runner.verifier.checks, "accepted": runner.verifier.accepted,
+                                 "retyped": runner.verifier.retyped, "recovered": runner.verifier.recovered,
+                                 "dropped": runner.verifier.dropped,
+                                 "unverifiable": runner.verifier.unverifiable}
+        results.append(summary)
+    return results
+
+
+def aggregate(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    汇总多个班次
+
+    Args:
+        results (List[Dict[str, Any]]): 每个班次的统计
+
+    Returns:
+        Dict[str, Any]: 主要指标的分布（mean/p50/p95 等，原始单位）和各计数的总和
+    """
+    totals = {key: sum(result[key] for result in results)
+              for key in ("orders", "served", "missed_orders", "paid", "unpaid", "rats", "rats_repelled",
+                          "keys", "wrong_keys", "wasted_words")}
+    verified = [result["verify"] for result in results if "verify" in result]
+    if verified:
+        totals["verify"] = {key: sum(item[key] for item in verified) for key in verified[0]}
+    return {
+        "shifts": len(results),
+        "distribution": {key: percentiles([result[key] for result in results], scale=1.0)
+                         for key in SUMMARY_KEYS},
+        "totals": totals,
+        "keys_per_dish": totals["keys"] / totals["served"] if totals["served"] else 0.0,
+        "missed_rate": totals["missed_orders"] / totals["orders"] if totals["orders"] else 0.0,
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="模拟班次吞吐基准")
+    parser.add_argument("--policy", choices=("oracle", "agent"), default="oracle", help="驱动模拟器的方式")
+    parser.add_argument("--shifts", type=int, default=1000, help="班次数")
+    parser.add_argument("--shift-seconds", type=float, default=180.0, help="每个班次的长度（模拟秒）")
+    parser.add_argument("--seed", type=int, default=0, help="第一个班次的随机种子")
+    parser.add_argument("--latency", type=float, default=1.5, help="模型平均延迟（模拟秒）")
+    parser.add_argument("--jitter", type=float, default=0.3, help="模型延迟抖动（模拟秒）")
+    parser.add_argument("--key-interval", type=float, default=0.03, help="oracle：按键间隔（模拟秒）")
+    parser.add_argument("--plan-interval", type=float, default=0.5, help="oracle：输入完成到下一次截图的间隔（模拟秒）")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="按键被游戏漏掉的概率")
+    parser.add_argument("--speed", type=float, default=4.0, help="agent：模拟时钟倍速")
+    parser.add_argument("--mode", choices=("fast", "verbose"), help="agent：规划模式，默认读取 PLANNER_MODE")
+    parser.add_argument("--per-shift", action="store_true", help="结果中包含每个班次的统计")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--verbose", action="store_true", help="保留智能体日志输出")
+    args = parser.parse_args()
+
+    try:
+        config = SimConfig(shift_seconds=args.shift_seconds, key_drop_rate=args.drop_rate)
+        seeds = list(range(args.seed, args.seed + args.shifts))
+        started = time.perf_counter()
+        if args.policy == "oracle":
+            results = [run_oracle_shift(config, seed, args.latency, args.jitter, args.key_interval,
+                                        args.plan_interval) for seed in seeds]
+        else:
+            mock = MockConfig(latency=args.latency / args.speed, jitter=args.jitter / args.speed, seed=args.seed)
+            server = start_mock_server(mock)
+            os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+            os.environ.setdefault("OPENAI_API_KEY", "mock")
+            # 画面由模拟器渲染，不启用后台采集，也不预热
+            os.environ["CAPTURE_FPS"] = "0"
+            os.environ.setdefault("PLANNER_WARMUP", "0")
+            log = None if args.verbose else io.StringIO()
+            with contextlib.redirect_stdout(log) if log else contextlib.nullcontext():
+                results = asyncio.run(run_agent_shifts([config] * args.shifts, seeds, args.speed, mock, args.mode))
+            server.shutdown()
+        elapsed = time.perf_counter() - started
+
+        result = aggregate(results)
+        result["wall_seconds"] = elapsed
+        result["config"] = vars(args)
+        if args.per_shift:
+            result["per_shift"] = results
+        dishes = result["distribution"]["dishes_per_min"]
+        print(f"{len(results)} 个班次（{elapsed:.1f}s）: 每分钟上菜 {dishes.get('mean', 0):.2f} "
+              f"(p50 {dishes.get('p50', 0):.2f}), "
+              f"错过订单率 {result['missed_rate']:.1%}, 每道菜按键 {result['keys_per_dish']:.1f}",
+              file=sys.stderr)
+
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.output:
+            Path(args.output).write_text(output, encoding="utf-8")
+            print(f"结果已写入: {args.output}", file=sys.stderr)
+        else:
+            print(output)
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
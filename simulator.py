@@ -0,0 +1,766 @@
+#!/usr/bin/env python3
+"""
+Chef's Shift 无界面模拟器
+主要功能：
+1. 按系统提示词中的游戏规则模拟一个班次：堂食/打包顾客、收银、咖啡库存、甜品、面条/炸物/披萨菜谱、老鼠
+2. 按 regions.SCREEN_REGIONS 的布局渲染画面（深棕底白字的高亮单词），作为 GameWindow 的 frame_source
+3. 作为 GameWindow 的 keyboard_writer 接收按键，按键逐个匹配屏幕上的高亮单词
+4. 可加速的时钟：按倍速跟随真实时间，或由调用方推进（离散事件，不受真实时间限制）
+5. 给出当前局面的标准答案计划（详细模式格式），可由 mock_openai 作为模型回复返回
+6. 统计每分钟上菜数、错过的订单、每道菜的按键数等
+"""
+
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+from game_state import COFFEE_CAPACITY, COOK_SECONDS
+from recipes import COFFEE_SECONDS, INGREDIENT_COUNT
+from regions import SCREEN_REGIONS
+
+# 菜品 -> 制作区
+DISHES: Dict[str, str] = {
+    "cake": "dessert",
+    "pie": "dessert",
+    "pudding": "dessert",
+    "espresso": "coffee",
+    "latte": "coffee",
+    "ramen": "noodles",
+    "udon": "noodles",
+    "fries": "fryer",
+    "wings": "fryer",
+    "pizza": "pizza",
+}
+
+# 订单中的菜品名，关键词与 recipes.compile_macros 按订单判断工位时一致
+DISH_NAMES: Dict[str, str] = {
+    "cake": "蛋糕",
+    "pie": "派",
+    "pudding": "布丁",
+    "espresso": "浓缩咖啡",
+    "latte": "拿铁咖啡",
+    "ramen": "拉面",
+    "udon": "乌冬面",
+    "fries": "薯条",
+    "wings": "炸鸡翅",
+    "pizza": "披萨",
+}
+
+# 屏幕上的高亮单词（工位、上菜、收银）
+WORDS: Tuple[str, ...] = (
+    "amber", "anchor", "apron", "arrow", "badge", "banjo", "basil", "beacon", "birch", "blanket",
+    "bolt", "brick", "bucket", "cabin", "candle", "canvas", "carbon", "cedar", "chalk", "cliff",
+    "clover", "coal", "comet", "copper", "coral", "cotton", "crane", "crystal", "dagger", "delta",
+    "denim", "dune", "eagle", "ember", "fabric", "falcon", "fern", "fiddle", "flint", "forest",
+    "fossil", "garnet", "ginger", "glacier", "granite", "gravel", "harbor", "hazel", "helmet", "hollow",
+    "island", "ivory", "jacket", "jasper", "jungle", "kettle", "kernel", "ladder", "lantern", "lemon",
+    "linen", "lizard", "locket", "magnet", "maple", "marble", "meadow", "mirror", "mortar", "nectar",
+    "nickel", "nutmeg", "oasis", "olive", "onyx", "orbit", "paddle", "pebble", "pepper", "pillar",
+    "planet", "plume", "quartz", "quiver", "radish", "rail", "raven", "ribbon", "river", "rocket",
+    "saddle", "salmon", "shadow", "silver", "socket", "spruce", "steel", "stone", "summit", "tablet",
+    "thread", "thunder", "timber", "tulip", "tundra", "umber", "valley", "velvet", "violet", "walnut",
+    "willow", "winter", "yarrow", "zephyr",
+)
+
+# 老鼠头顶的两字母单词
+RAT_WORDS: Tuple[str, ...] = (
+    "ox", "up", "go", "at", "by", "do", "he", "if", "in", "it",
+    "me", "my", "no", "of", "on", "or", "so", "to", "us", "we",
+)
+
+# 高亮单词的样式，与 word_detector.WordDetector 的默认底色一致
+HIGHLIGHT_BACKGROUND = (74, 44, 30)
+HIGHLIGHT_TEXT = (255, 255, 255)
+GRAY_BACKGROUND = (128, 128, 128)
+GRAY_TEXT = (190, 190, 190)
+
+# 顾客桌位：(区域, 区域内相对横坐标, 相对纵坐标)
+SEATS: Tuple[Tuple[str, float, float], ...] = (
+    ("tables", 0.5, 0.2),
+    ("tables", 0.5, 0.5),
+    ("tables", 0.5, 0.8),
+    ("center_table", 0.5, 0.6),
+)
+
+
+def _text_box(draw: ImageDraw.ImageDraw, x: int, y: int, text: str,
+              font: Any) -> Tuple[Tuple[int, int], Tuple[int, int, int, int]]:
+    """计算以 (x, y) 为中心的文字位置和外框（Pillow 10.0 的位图字体不支持 anchor）"""
+    left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+    origin = (x - (right - left) // 2 - left, y - (bottom - top) // 2 - top)
+    return origin, (x - (right - left) // 2, y - (bottom - top) // 2,
+                    x + (right - left + 1) // 2, y + (bottom - top + 1) // 2)
+
+
+class SimClock:
+    """
+    模拟器时钟
+
+    speed > 0 时按倍速跟随真实时间（闭环驱动真实的智能体）；
+    speed 为 0 时只由 advance 推进（离散事件模式，用于大批量班次）。
+    """
+
+    def __init__(self, speed: float = 1.0):
+        """
+        初始化时钟
+
+        Args:
+            speed (float): 相对真实时间的倍速，0 表示只由 advance 推进
+        """
+        self.speed = speed
+        self._offset = 0.0
+        self._wall_start = time.perf_counter()
+
+    def now(self) -> float:
+        """当前模拟时间（秒，从 0 开始）"""
+        elapsed = (time.perf_counter() - self._wall_start) * self.speed if self.speed else 0.0
+        return self._offset + elapsed
+
+    def advance(self, seconds: float) -> None:
+        """
+        把模拟时间向前推进
+
+        Args:
+            seconds (float): 推进的秒数
+        """
+        self._offset += max(0.0, seconds)
+
+
+@dataclass
+class SimConfig:
+    """班次参数（时间均为模拟秒）"""
+
+    shift_seconds: float = 180.0  # 班次长度
+    spawn_interval: Tuple[float, float] = (5.0, 10.0)  # 顾客到达间隔的均匀分布范围
+    takeaway_rate: float = 0.3  # 打包顾客的比例
+    patience: float = 45.0  # 下单后等待上菜的耐心，超时即错过订单
+    pay_patience: float = 20.0  # 进入付款阶段后等待收银的耐心
+    walk_seconds: float = 2.0  # 堂食顾客用餐后走到收银台的时间
+    rat_interval: float = 30.0  # 老鼠出现的平均间隔
+    rat_timeout: float = 8.0  # 老鼠未被击退时偷走一份成品并离开
+    finished_slots: int = 4  # 成品区容量
+    key_drop_rate: float = 0.0  # 按键被游戏漏掉的概率，用于测试输入校验
+    menu: Tuple[str, ...] = tuple(DISHES)
+
+
+@dataclass
+class Customer:
+    """一位顾客"""
+
+    id: int
+    dish: str
+    kind: str  # table / takeaway
+    word: str  # 上菜词
+    ordered_at: float
+    deadline: float  # 当前阶段的耐心截止时间
+    state: str = "waiting"  # waiting（等待上菜）/ walking（走向收银台）/ paying（头顶钞票图标）
+    seat: Optional[int] = None  # 堂食桌位，见 SEATS
+    arrive_at: float = 0.0  # 走到收银台的时间
+
+
+@dataclass
+class Cooker:
+    """面条锅 / 油锅 / 披萨烤炉"""
+
+    station: str  # noodles / fryer / pizza
+    word: str  # 锅、油锅或烤炉上的单词
+    ingredients: List[str]  # 食材单词；面条和炸物每种菜一个，披萨为自下而上的四种食材
+    dishes: List[str]  # 面条和炸物：与 ingredients 一一对应的菜品；披萨：["pizza"]
+    state: str = "empty"  # empty / loaded / cooking / done
+    loaded: int = 0  # 已放入的食材数
+    dish: Optional[str] = None  # 锅中的菜品
+    until: float = 0.0  # 烹饪完成时间
+
+
+@dataclass
+class Rat:
+    """红地毯上的老鼠"""
+
+    word: str
+    x: float  # 地毯区域内的相对横坐标
+    deadline: float
+
+
+@dataclass
+class Target:
+    """屏幕上的一个单词"""
+
+    word: str
+    region: str  # 所在屏幕区域，见 regions.SCREEN_REGIONS
+    position: Tuple[float, float]  # 区域内的相对坐标
+    area: str  # 计划中的区域分类：customer / cashier / coffee_machine / food_station / mouse
+    active: bool  # 是否高亮（可输入）
+    action: Callable[[], bool]  # 输入完成后执行，返回是否生效
+
+
+@dataclass
+class ShiftStats:
+    """班次统计"""
+
+    orders: int = 0
+    served: int = 0
+    missed_orders: int = 0  # 等待上菜超时离开
+    paid: int = 0
+    unpaid: int = 0  # 付款阶段超时离开
+    dishes_made: int = 0  # 放入成品区的菜品数
+    dishes_stolen: int = 0  # 被老鼠偷走的成品
+    rats: int = 0
+    rats_repelled: int = 0
+    keys: int = 0
+    wrong_keys: int = 0  # 不能延续任何高亮单词的按键
+    dropped_keys: int = 0  # 被漏掉的按键（key_drop_rate）
+    words: int = 0  # 生效的单词
+    wasted_words: int = 0  # 输入完成但没有效果的单词（如未到付款阶段的收银词）
+    serve_times: List[float] = field(default_factory=list)  # 下单到上菜的时间
+
+
+class ShiftSimulator:
+    """
+    一个班次的游戏模拟
+
+    线程安全：渲染（采集线程）、按键（键盘线程）和标准答案（模拟模型服务）可以并发调用。
+    所有状态只在被访问时按模拟时钟推进。
+    """
+
+    def __init__(self, config: Optional[SimConfig] = None, clock: Optional[SimClock] = None,
+                 seed: Optional[int] = None, size: Tuple[int, int] = (960, 540)):
+        """
+        初始化模拟器
+
+        Args:
+            config (Optional[SimConfig]): 班次参数
+            clock (Optional[SimClock]): 时钟，默认按真实时间
+            seed (Optional[int]): 随机种子
+            size (Tuple[int, int]): 渲染画面的尺寸
+        """
+        self.config = config or SimConfig()
+        self.clock = clock or SimClock()
+        self.random = random.Random(seed)
+        # 丢键使用独立的随机数，开关丢键不影响顾客和老鼠的出现顺序
+        self._drop_random = random.Random(seed)
+        self.size = size
+        self._lock = threading.RLock()
+        self._words: set = set()
+        self.stats = ShiftStats()
+        self.start = self.clock.now()
+
+        # 班次内固定的工位单词
+        self.dessert_words = {dish: self._word() for dish, station in DISHES.items() if station == "dessert"}
+        self.coffee_machine = self._word()
+        self.coffee_words = {dish: self._word() for dish, station in DISHES.items() if station == "coffee"}
+        self.coffee_stock = 0
+        self.brewing_until: Optional[float] = None
+        self.cookers: Dict[str, Cooker] = {}
+        for station in ("noodles", "fryer"):
+            dishes = [dish for dish, name in DISHES.items() if name == station]
+            self.cookers[station] = Cooker(station, self._word(), [self._word() for _ in dishes], dishes)
+        self.cookers["pizza"] = Cooker("pizza", self._word(),
+                                       [self._word() for _ in range(INGREDIENT_COUNT["pizza"])], ["pizza"])
+        self.cashier_word = self._word()
+
+        self.finished: List[str] = []
+        self.customers: List[Customer] = []
+        self.cashier_queue: List[Customer] = []  # 收银台前的顾客（打包顾客和走来付款的堂食顾客）
+        self.rat: Optional[Rat] = None
+        self._buffer = ""
+        self._next_id = 0
+        self._next_customer = self.start + 1.0
+        self._next_rat = self.start + self.random.expovariate(1 / self.config.rat_interval)
+
+    # ------------------------------------------------------------------ 状态推进
+
+    def _word(self, pool: Tuple[str, ...] = WORDS) -> str:
+        """取一个屏幕上没有的单词，且与现有单词互不为前缀（否则较短的单词会提前匹配）"""
+        def free(word: str) -> bool:
+            return not any(word.startswith(used) or used.startswith(word) for used in self._words)
+
+        # 屏幕上的单词远少于词库，先随机抽取几次，抽不到再全量筛选
+        for _ in range(8):
+            word = self.random.choice(pool)
+            if free(word):
+                break
+        else:
+            word = self.random.choice([word for word in pool if free(word)])
+        self._words.add(word)
+        return word
+
+    @property
+    def end(self) -> float:
+        """班次结束时间"""
+        return self.start + self.config.shift_seconds
+
+    @property
+    def shift_over(self) -> bool:
+        """班次是否已结束"""
+        return self.clock.now() >= self.end
+
+    def _spawn(self, now: float) -> None:
+        """新顾客下单：优先坐空桌，没有空桌或按比例为打包顾客"""
+        dish = self.random.choice(self.config.menu)
+        free = [index for index in range(len(SEATS))
+                if not any(customer.seat == index for customer in self.customers)]
+        takeaway = not free or self.random.random() < self.config.takeaway_rate
+        customer = Customer(id=self._next_id, dish=dish, kind="takeaway" if takeaway else "table",
+                            word=self._word(), ordered_at=now, deadline=now + self.config.patience,
+                            seat=None if takeaway else self.random.choice(free))
+        self._next_id += 1
+        self.customers.append(customer)
+        if takeaway:
+            self.cashier_queue.append(customer)
+        self.stats.orders += 1
+
+    def _leave(self, customer: Customer) -> None:
+        self.customers.remove(customer)
+        if customer in self.cashier_queue:
+            self.cashier_queue.remove(customer)
+        self._words.discard(customer.word)
+
+    def _update(self) -> float:
+        """按模拟时钟推进到当前时间，返回当前时间"""
+        now = self.clock.now()
+        while self._next_customer <= min(now, self.end):
+            self._spawn(self._next_customer)
+            self._next_customer += self.random.uniform(*self.config.spawn_interval)
+
+        for cooker in self.cookers.values():
+            if cooker.state == "cooking" and cooker.until <= now:
+                cooker.state = "done"
+        if self.brewing_until is not None and self.brewing_until <= now:
+            self.coffee_stock += 1
+            self.brewing_until = None
+
+        for customer in list(self.customers):
+            if customer.state == "walking" and customer.arrive_at <= now:
+                customer.state = "paying"
+                customer.deadline = customer.arrive_at + self.config.pay_patience
+                self.cashier_queue.append(customer)
+            elif customer.deadline <= now and customer.state in ("waiting", "paying"):
+                if customer.state == "waiting":
+                    self.stats.missed_orders += 1
+                else:
+                    self.stats.unpaid += 1
+                self._leave(customer)
+
+        if self.rat and self.rat.deadline <= now:
+            # 老鼠没有被击退：偷走一份成品
+            if self.finished:
+                self.finished.pop(0)
+                self.stats.dishes_stolen += 1
+            self._words.discard(self.rat.word)
+            self.rat = None
+        if self.rat is None and self._next_rat <= min(now, self.end):
+            self.rat = Rat(self._word(RAT_WORDS), self.random.uniform(0.1, 0.9),
+                           self._next_rat + self.config.rat_timeout)
+            self.stats.rats += 1
+            self._next_rat += self.random.expovariate(1 / self.config.rat_interval)
+        return now
+
+    # ------------------------------------------------------------------ 单词和动作
+
+    def _finish(self, dish: str) -> bool:
+        """把菜品放入成品区"""
+        if len(self.finished) >= self.config.finished_slots:
+            return False
+        self.finished.append(dish)
+        self.stats.dishes_made += 1
+        return True
+
+    def _reroll(self, words: Dict[str, str], dish: str) -> None:
+        """与游戏相同，甜品和咖啡的单词使用后换成新词（先取新词，保证与旧词不同）"""
+        word = self._word()
+        self._words.discard(words[dish])
+        words[dish] = word
+
+    def _make_dessert(self, dish: str) -> bool:
+        if not self._finish(dish):
+            return False
+        self._reroll(self.dessert_words, dish)
+        return True
+
+    def _room(self) -> bool:
+        return len(self.finished) < self.config.finished_slots
+
+    def _load(self, cooker: Cooker, index: int) -> bool:
+        if cooker.station == "pizza":
+            cooker.loaded += 1
+            cooker.dish = "pizza"
+        else:
+            cooker.loaded = 1
+            cooker.dish = cooker.dishes[index]
+        if cooker.loaded >= INGREDIENT_COUNT[cooker.station]:
+            cooker.state = "loaded"
+        return True
+
+    def _use_cooker(self, cooker: Cooker, now: float) -> bool:
+        if cooker.state == "loaded":
+            cooker.state = "cooking"
+            cooker.until = now + COOK_SECONDS[cooker.station]
+            return True
+        if cooker.state == "done" and self._finish(cooker.dish):
+            cooker.state, cooker.loaded, cooker.dish = "empty", 0, None
+            return True
+        return False
+
+    def _brew(self, now: float) -> bool:
+        if self.brewing_until is not None or self.coffee_stock >= COFFEE_CAPACITY:
+            return False
+        self.brewing_until = now + COFFEE_SECONDS
+        return True
+
+    def _pick_coffee(self, dish: str) -> bool:
+        if self.coffee_stock <= 0 or not self._finish(dish):
+            return False
+        self.coffee_stock -= 1
+        self._reroll(self.coffee_words, dish)
+        return True
+
+    def _serve(self, customer: Customer, now: float) -> bool:
+        if customer.dish not in self.finished:
+            return False
+        self.finished.remove(customer.dish)
+        self.stats.served += 1
+        self.stats.serve_times.append(now - customer.ordered_at)
+        self._words.discard(customer.word)
+        if customer.kind == "table":
+            customer.state = "walking"
+            customer.seat = None
+            customer.arrive_at = now + self.config.walk_seconds
+        else:
+            customer.state = "paying"
+            customer.deadline = now + self.config.pay_patience
+        return True
+
+    def _pay(self) -> bool:
+        if not self.cashier_queue or self.cashier_queue[0].state != "paying":
+            return False
+        self.stats.paid += 1
+        self._leave(self.cashier_queue[0])
+        return True
+
+    def _repel(self) -> bool:
+        self._words.discard(self.rat.word)
+        self.rat = None
+        self.stats.rats_repelled += 1
+        return True
+
+    def _targets(self, now: float) -> List[Target]:
+        """当前屏幕上的全部单词"""
+        room = self._room()
+        targets = []
+        for index, (dish, word) in enumerate(self.dessert_words.items()):
+            targets.append(Target(word, "dessert", (0.5, 0.25 + 0.25 * index), "food_station", room,
+                                  lambda dish=dish: self._make_dessert(dish)))
+        targets.append(Target(self.coffee_machine, "coffee", (0.3, 0.6), "coffee_machine",
+                              self.brewing_until is None and self.coffee_stock < COFFEE_CAPACITY,
+                              lambda: self._brew(now)))
+        for index, (dish, word) in enumerate(self.coffee_words.items()):
+            targets.append(Target(word, "coffee", (0.75, 0.45 + 0.3 * index), "coffee_machine",
+                                  self.coffee_stock > 0 and room, lambda dish=dish: self._pick_coffee(dish)))
+
+        for cooker in self.cookers.values():
+            if cooker.station == "pizza":
+                # 自下而上放料，只有下一种食材是高亮的
+                for index, word in enumerate(cooker.ingredients):
+                    targets.append(Target(word, "pizza", (0.5, 0.85 - 0.15 * index), "food_station",
+                                          cooker.state == "empty" and cooker.loaded == index,
+                                          lambda cooker=cooker, index=index: self._load(cooker, index)))
+                position = (0.5, 0.12)
+            else:
+                for index, word in enumerate(cooker.ingredients):
+                    targets.append(Target(word, cooker.station, (0.2, 0.3 + 0.4 * index), "food_station",
+                                          cooker.state == "empty",
+                                          lambda cooker=cooker, index=index: self._load(cooker, index)))
+                position = (0.7, 0.5)
+            active = cooker.state == "loaded" or (cooker.state == "done" and room)
+            targets.append(Target(cooker.word, cooker.station, position, "food_station", active,
+                                  lambda cooker=cooker: self._use_cooker(cooker, now)))
+
+        # 收银台的单词始终高亮，只有顾客头顶出现钞票图标时输入才生效
+        targets.append(Target(self.cashier_word, "cashier", (0.5, 0.55), "cashier", True, self._pay))
+        for customer in self.customers:
+            if customer.state != "waiting":
+                continue
+            if customer.kind == "table":
+                region, x, y = SEATS[customer.seat]
+                position = (x, y - 0.12)
+            elif self.cashier_queue and self.cashier_queue[0] is customer:
+                region, position = "cashier", (0.5, 0.12)
+            else:
+                continue  # 排在后面的打包顾客
+            targets.append(Target(customer.word, region, position, "customer",
+                                  customer.dish in self.finished,
+                                  lambda customer=customer: self._serve(customer, now)))
+        if self.rat:
+            targets.append(Target(self.rat.word, "carpet", (self.rat.x, 0.5), "mouse", True, self._repel))
+        return targets
+
+    def keyboard(self, text: str, interval: float = 0.0) -> None:
+        """
+        接收按键（GameWindow 的 keyboard_writer）
+
+        与游戏相同，按键逐个匹配屏幕上的高亮单词：能延续某个单词的前缀时继续，
+        否则视为按错，从当前按键重新开始匹配；完整匹配一个单词时执行它的动作。
+        退格键（"\\b"）删除已输入的最后一个字母。
+
+        Args:
+            text (str): 按键（键盘执行器每次传入一个字母）
+            interval (float): 按键间隔，模拟器不使用
+        """
+        with self._lock:
+            now = self._update()
+            for letter in text:
+                self.stats.keys += 1
+                if letter == "\b":
+                    self._buffer = self._buffer[:-1]
+                    continue
+                if self.config.key_drop_rate and self._drop_random.random() < self.config.key_drop_rate:
+                    self.stats.dropped_keys += 1
+                    continue
+                targets = {target.word: target for target in self._targets(now) if target.active}
+                candidate = self._buffer + letter
+                if any(word.startswith(candidate) for word in targets):
+                    self._buffer = candidate
+                else:
+                    self.stats.wrong_keys += 1
+                    self._buffer = letter if any(word.startswith(letter) for word in targets) else ""
+                target = targets.get(self._buffer)
+                if target:
+                    self._buffer = ""
+                    if target.action():
+                        self.stats.words += 1
+                    else:
+                        self.stats.wasted_words += 1
+
+    # ------------------------------------------------------------------ 画面
+
+    def render(self) -> Image.Image:
+        """
+        渲染当前画面（GameWindow 的 frame_source）
+
+        Returns:
+            Image.Image: RGB 图像
+        """
+        with self._lock:
+            now = self._update()
+            targets = self._targets(now)
+            finished = list(self.finished)
+            customers = list(self.customers)
+            queue = list(self.cashier_queue)
+            stock = self.coffee_stock
+            cookers = {name: (cooker.state, cooker.until) for name, cooker in self.cookers.items()}
+
+        width, height = self.size
+        image = Image.new("RGB", self.size, (196, 178, 150))
+        draw = ImageDraw.Draw(image)
+        font = ImageFont.load_default()
+
+        def box(region: str) -> Tuple[int, int, int, int]:
+            left, top, right, bottom = SCREEN_REGIONS[region]
+            return int(left * width), int(top * height), int(right * width), int(bottom * height)
+
+        def point(region: str, x: float, y: float) -> Tuple[int, int]:
+            left, top, right, bottom = box(region)
+            return int(left + (right - left) * x), int(top + (bottom - top) * y)
+
+        # 区域底色
+        colors = {"finished": (170, 160, 140), "dessert": (210, 190, 200), "coffee": (150, 120, 100),
+                  "cashier": (180, 150, 110), "pizza": (170, 140, 120), "fryer": (150, 150, 150),
+                  "noodles": (140, 150, 160), "carpet": (150, 30, 35)}
+        for region, color in colors.items():
+            draw.rectangle(box(region), fill=color)
+
+        # 成品区：菜品名（灰字，不可输入）
+        for index, dish in enumerate(finished):
+            x, y = point("finished", 0.1, 0.15 + 0.2 * index)
+            draw.text((x, y), f"{index + 1}. {dish}", fill=(60, 60, 60), font=font)
+
+        # 咖啡库存数字和烹饪进度
+        x, y = point("coffee", 0.75, 0.2)
+        origin, _ = _text_box(draw, x, y, str(stock), font)
+        draw.text(origin, str(stock), fill=(255, 230, 120), font=font)
+        for name, (state, until) in cookers.items():
+            x, y = point(name, 0.7, 0.5) if name != "pizza" else point(name, 0.5, 0.12)
+            if state == "cooking":
+                progress = 1 - max(0.0, until - now) / COOK_SECONDS[name]
+                draw.rectangle((x - 20, y + 12, x - 20 + int(40 * progress), y + 16), fill=(230, 120, 40))
+            elif state == "done":
+                draw.ellipse((x + 26, y - 4, x + 34, y + 4), fill=(60, 200, 60))
+
+        # 顾客：桌位和收银台前的队伍，头顶为订单图标或钞票图标
+        for index, (region, sx, sy) in enumerate(SEATS):
+            x, y = point(region, sx, sy)
+            draw.rectangle((x - 30, y - 6, x + 30, y + 10), fill=(150, 110, 70))
+        for customer in customers:
+            if customer.kind == "table" and customer.seat is not None:
+                region, sx, sy = SEATS[customer.seat]
+                x, y = point(region, sx + 0.25, sy)
+                draw.ellipse((x - 8, y - 8, x + 8, y + 8), fill=(240, 200, 160))
+                if customer.dish not in finished:
+                    ox, oy = point(region, sx, sy - 0.12)
+                    draw.rectangle((ox - 10, oy - 8, ox + 10, oy + 8), fill=(250, 250, 230))
+                    origin, _ = _text_box(draw, ox, oy, customer.dish[0].upper(), font)
+                    draw.text(origin, customer.dish[0].upper(), fill=(90, 90, 90), font=font)
+        for position, customer in enumerate(queue):
+            x, y = point("cashier", 0.5 + 0.12 * position, 0.3)
+            draw.ellipse((x - 8, y - 8, x + 8, y + 8), fill=(240, 200, 160))
+            if position == 0 and customer.state == "paying":
+                draw.rectangle((x - 10, y - 26, x + 10, y - 14), fill=(60, 160, 60))
+            elif position == 0 and customer.dish not in finished:
+                draw.rectangle((x - 10, y - 30, x + 10, y - 14), fill=(250, 250, 230))
+                origin, _ = _text_box(draw, x, y - 22, customer.dish[0].upper(), font)
+                draw.text(origin, customer.dish[0].upper(), fill=(90, 90, 90), font=font)
+
+        # 单词：高亮为深棕底白字，不可输入的为灰色
+        for target in targets:
+            x, y = point(target.region, *target.position)
+            origin, (left, top, right, bottom) = _text_box(draw, x, y, target.word, font)
+            background, text = ((HIGHLIGHT_BACKGROUND, HIGHLIGHT_TEXT) if target.active
+                                else (GRAY_BACKGROUND, GRAY_TEXT))
+            draw.rectangle((left - 5, top - 4, right + 6, bottom + 4), fill=background)
+            # 默认字体较细，错开 1 像素再画一次加粗，接近游戏中的粗体字
+            for dx in (0, 1):
+                draw.text((origin[0] + dx, origin[1]), target.word, fill=text, font=font)
+
+        remaining = max(0.0, self.end - now)
+        clock = f"{int(remaining) // 60}:{int(remaining) % 60:02d}"
+        draw.text((width - 8 - int(draw.textlength(clock, font=font)), 8), clock, fill=(40, 40, 40), font=font)
+        return image
+
+    # ------------------------------------------------------------------ 标准答案
+
+    def oracle_plan(self) -> Dict[str, Any]:
+        """
+        当前局面的标准答案计划（详细模式格式，见 prompts.VERBOSE_FORMAT）
+
+        依次为：击退老鼠、收银、上菜、取出已完成的菜、为还没有着落的订单开始制作。
+
+        Returns:
+            Dict[str, Any]: 计划
+        """
+        with self._lock:
+            now = self._update()
+            targets = {target.word: target for target in self._targets(now)}
+            steps: List[Dict[str, str]] = []
+
+            def add(action: str, word: str, reasoning: str) -> None:
+                steps.append({"action": action, "input": word, "area": targets[word].area,
+                              "reasoning": reasoning})
+
+            if self.rat:
+                add("击退老鼠", self.rat.word, "有老鼠时优先击退。")
+            if self.cashier_queue and self.cashier_queue[0].state == "paying":
+                add("收银", self.cashier_word, "收银台前的顾客头顶出现钞票图标。")
+
+            # 成品区剩余空位：上菜会腾出空位，放入成品的动作占用空位
+            room = self.config.finished_slots - len(self.finished)
+            available = list(self.finished)
+            waiting = sorted((customer for customer in self.customers if customer.state == "waiting"),
+                             key=lambda customer: customer.deadline)
+            unserved = []
+            for customer in waiting:
+                if customer.word in targets and customer.dish in available:
+                    available.remove(customer.dish)
+                    room += 1
+                    add("上菜", customer.word, "订单的菜品已在成品区。")
+                else:
+                    unserved.append(customer.dish)
+
+            # 已做好或正在做的菜抵扣未上菜的订单
+            for dish in available:
+                if dish in unserved:
+                    unserved.remove(dish)
+            for cooker in self.cookers.values():
+                if cooker.dish in unserved:
+                    unserved.remove(cooker.dish)
+                if cooker.state == "done" and room > 0:
+                    room -= 1
+                    add(f"取出{DISH_NAMES[cooker.dish]}，放入成品区", cooker.word, "烹饪已完成。")
+                elif cooker.state == "loaded":
+                    add("烘烤披萨" if cooker.station == "pizza" else "开始烹饪" + DISH_NAMES[cooker.dish],
+                        cooker.word, "食材已放好。")
+            stock = self.coffee_stock
+            brewing = self.brewing_until is not None
+            for dish in list(unserved):
+                if DISHES[dish] != "coffee":
+                    continue
+                unserved.remove(dish)
+                if stock > 0 and room > 0:
+                    stock -= 1
+                    room -= 1
+                    add(f"取{DISH_NAMES[dish]}", self.coffee_words[dish], "咖啡有库存，直接放入成品区。")
+                elif stock == 0 and not brewing:
+                    brewing = True
+                    add("制作咖啡", self.coffee_machine, "咖啡库存为 0，需要先制作。")
+
+            started = set()
+            for dish in unserved:
+                station = DISHES[dish]
+                if station == "dessert":
+                    if room > 0:
+                        room -= 1
+                        add(f"制作{DISH_NAMES[dish]}", self.dessert_words[dish], "甜品输入即完成。")
+                    continue
+                cooker = self.cookers[station]
+                if cooker.state != "empty" or station in started:
+                    continue
+                started.add(station)
+                if station == "pizza":
+                    for word in cooker.ingredients[cooker.loaded:]:
+                        add("放披萨食材", word, "披萨自下而上放入四种食材。")
+                    add("烘烤披萨", cooker.word, "食材放齐后放入烤炉。")
+                else:
+                    action = "放面条食材" if station == "noodles" else "放炸物原料"
+                    add(action, cooker.ingredients[cooker.dishes.index(dish)], f"订单需要{DISH_NAMES[dish]}。")
+                    add("煮面" if station == "noodles" else "放入油锅炸", cooker.word, "食材放入后开始烹饪。")
+
+            orders = [DISH_NAMES[customer.dish] for customer in waiting]
+            return {
+                "description": f"等待上菜 {len(waiting)} 位，成品区 {len(self.finished)} 份，"
+                               f"咖啡库存 {self.coffee_stock}；{'有' if self.rat else '没有'}老鼠。",
+                "words": [{"text": word, "area": target.area} for word, target in targets.items()
+                          if target.active],
+                "cash": self.cashier_word,
+                "mouse": self.rat is not None,
+                "order": "、".join(orders),
+                "steps": steps,
+            }
+
+    # ------------------------------------------------------------------ 统计
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        班次统计
+
+        Returns:
+            Dict[str, Any]: 订单、上菜、错过的订单、付款、老鼠、按键数，以及每分钟上菜数和每道菜的按键数
+        """
+        with self._lock:
+            now = self._update()
+            stats = self.stats
+            elapsed = max(1e-9, min(now, self.end) - self.start)
+            waits = stats.serve_times
+            return {
+                "sim_seconds": elapsed,
+                "orders": stats.orders,
+                "served": stats.served,
+                "missed_orders": stats.missed_orders,
+                "open_orders": sum(customer.state == "waiting" for customer in self.customers),
+                "paid": stats.paid,
+                "unpaid": stats.unpaid,
+                "dishes_made": stats.dishes_made,
+                "dishes_stolen": stats.dishes_stolen,
+                "rats": stats.rats,
+                "rats_repelled": stats.rats_repelled,
+                "keys": stats.keys,
+                "wrong_keys": stats.wrong_keys,
+                "dropped_keys": stats.dropped_keys,
+                "words": stats.words,
+                "wasted_words": stats.wasted_words,
+                "dishes_per_min": stats.served / (elapsed / 60),
+                "keys_per_dish": stats.keys / stats.served if stats.served else 0.0,
+                "mean_serve_s": sum(waits) / len(waits) if waits else 0.0,
+            }
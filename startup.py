@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+启动耗时统计
+主要功能：
+1. 从本模块被导入（入口脚本的第一个导入）开始，按阶段记录启动耗时
+2. 启动完成时输出各阶段和总耗时，并写入性能指标（startup_<阶段>）
+"""
+
+import time
+from typing import Dict, Optional
+
+from metrics import metrics
+
+# 入口脚本最先导入本模块，近似为进程开始执行 Python 代码的时刻
+PROCESS_START = time.perf_counter()
+
+
+class StartupTimer:
+    """
+    启动阶段计时器
+
+    每次 mark 记录上一次 mark（或进程开始）到现在的耗时。
+    """
+
+    def __init__(self, origin: Optional[float] = None):
+        """
+        初始化计时器
+
+        Args:
+            origin (Optional[float]): 计时起点（time.perf_counter），默认为 PROCESS_START
+        """
+        self.origin = origin if origin is not None else PROCESS_START
+        self.last = self.origin
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> float:
+        """
+        结束一个阶段
+
+        Args:
+            phase (str): 阶段名，如 imports、window、planner、warmup
+
+        Returns:
+            float: 该阶段耗时（秒）
+        """
+        now = time.perf_counter()
+        elapsed = now - self.last
+        self.phases[phase] = self.phases.get(phase, 0.0) + elapsed
+        self.last = now
+        return elapsed
+
+    @property
+    def total(self) -> float:
+        """从起点到最后一次 mark 的总耗时（秒）"""
+        return self.last - self.origin
+
+    def finish(self) -> str:
+        """
+        启动完成：写入性能指标并生成统计信息
+
+        Returns:
+            str: 形如 "imports=210ms window=3ms planner=1ms warmup=180ms total=394ms"
+        """
+        for phase, seconds in self.phases.items():
+            metrics.observe(f"startup_{phase}", seconds)
+        metrics.observe("startup", self.total)
+        parts = [f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in self.phases.items()]
+        parts.append(f"total={self.total * 1000:.0f}ms")
+        return " ".join(parts)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+增量 JSON 解析器
+在模型流式输出的过程中解析计划 JSON，每当 steps 数组中的一个对象闭合时
+立即返回该步骤，键盘线程可以在其余内容仍在生成时开始输入第一个单词。
+"""
+
+import json
+from typing import Dict, List, Optional
+
+
+class StepStreamParser:
+    """
+    流式计划解析器
+
+    逐字符跟踪字符串/转义状态和括号嵌套，只在顶层对象的 "steps" 数组中
+    截取每个步骤对象，其他字段（description、words 等）只做括号匹配不解析。
+    """
+
+    def __init__(self, key: str = "steps"):
+        """
+        初始化解析器
+
+        Args:
+            key (str): 需要增量解析的数组字段名
+        """
+        self.key = key
+        self.buffer = ""
+        self._pos = 0
+        self._started = False  # 是否已遇到第一个 '{'
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._array_depth: Optional[int] = None  # steps 数组所在的嵌套深度
+        self._item_start: Optional[int] = None
+        self.steps: List[Dict] = []
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """
+        输入一段新的模型输出
+
+        Args:
+            chunk (str): 新增的文本
+
+        Returns:
+            List[Dict]: 本次新闭合的步骤对象
+        """
+        self.buffer += chunk
+        completed = []
+        buffer = self.buffer
+        for index in range(self._pos, len(buffer)):
+            ch = buffer[index]
+            if not self._started:
+                # 跳过 JSON 之前的文字或 ```json 标记
+                if ch != "{":
+                    continue
+                self._started = True
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = buffer[self._string_start:index]
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = index + 1
+            elif ch in "{[":
+                if (ch == "[" and self._array_depth is None and len(self._stack) == 1
+                        and self._last_string == self.key):
+                    self._array_depth = len(self._stack) + 1
+                self._stack.append(ch)
+                if (ch == "{" and self._array_depth is not None
+                        and len(self._stack) == self._array_depth + 1):
+                    self._item_start = index
+            elif ch in "}]":
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if self._array_depth is not None:
+                    if ch == "}" and self._item_start is not None and len(self._stack) == self._array_depth:
+                        item = self._decode(buffer[self._item_start:index + 1])
+                        self._item_start = None
+                        if item is not None:
+                            self.steps.append(item)
+                            completed.append(item)
+                    elif ch == "]" and len(self._stack) == self._array_depth - 1:
+                        # steps 数组已结束，后续同名字段不再解析
+                        self._array_depth = -1
+        self._pos = len(buffer)
+        return completed
+
+    @staticmethod
+    def _decode(text: str) -> Optional[Dict]:
+        """
+        解析单个步骤对象
+
+        Args:
+            text (str): 步骤对象的 JSON 文本
+
+        Returns:
+            Optional[Dict]: 步骤对象，解析失败时返回 None
+        """
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError as e:
+            print(f"步骤 JSON 解析错误: {e}")
+            return None
+        return item if isinstance(item, dict) else None
@@ -20,13 +20,13 @@ def main():
         
         # 分析截图
         for image_url in image_urls:
-            inputs = planner.analyze_screenshot(image_url)
-            if not inputs:
+            plan = planner.analyze_screenshot(image_url)
+            if plan is None:
                 print("分析截图失败")
                 continue
 
             print("\n分析结果:")
-            print(inputs)
+            print(plan.inputs)
             print("-" * 80)
             print("\n")
         
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+输入后校验
+主要功能：
+1. 计划入队时登记要校验的单词（area、优先级），不调用模型
+2. 单词开始输入前保存当前画面，在其中定位单词框（OCR 文字匹配，或步骤 area 对应区域内的高亮单词框）
+3. 输入完成后只从最新采集的一帧中裁剪这些单词框，确认高亮消失或内容变化
+4. 未生效的单词立即重新输入，超过重试次数则放弃，等待下一次规划
+5. 把结果反馈给键盘执行器的自适应按键间隔，统计校验成功率和节省的模型往返次数
+"""
+
+import os
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from keyboard_executor import KeyboardExecutor
+from metrics import metrics
+from plan import PlanStep
+from regions import AREA_REGIONS
+from word_detector import WordBox, WordDetector
+
+# 校验用的画面来源：返回 (采集时间 time.time, RGB 像素)，无画面时返回 None
+FrameProbe = Callable[[], Optional[Tuple[float, np.ndarray]]]
+
+# 收银台单词始终高亮，输入生效时变化的是顾客头顶的钞票图标，单词框本身不变
+SKIP_REGIONS = {"cashier"}
+
+
+@dataclass
+class Expectation:
+    """一个待校验的单词"""
+
+    word: str
+    area: str
+    priority: Optional[str]
+    created_at: float = field(default_factory=time.time)
+    attempts: int = 0  # 已校验失败的次数
+    before: Optional[np.ndarray] = None  # 开始输入前的画面（拷贝）
+
+
+class WordVerifier:
+    """
+    输入后校验器
+
+    计划中的单词在规划截图里往往还没有高亮（例如放完食材后才亮起的锅），
+    因此单词框在开始输入前的画面中定位。键盘线程只负责拷贝这一帧，
+    检测和比较都在校验线程中进行：等待一帧采集时间晚于输入完成 + settle 的画面，
+    与输入前逐框比较。区域内有多个候选框且没有 OCR 时，任一候选框高亮消失或内容变化即视为生效，
+    前后两帧相隔很短，变化基本都来自刚输入的单词。
+    """
+
+    def __init__(self, executor: KeyboardExecutor, probe: FrameProbe,
+                 detector: Optional[WordDetector] = None,
+                 settle: Optional[float] = None,
+                 timeout: float = 1.0,
+                 max_retries: Optional[int] = None,
+                 diff_threshold: float = 12.0,
+                 max_age: float = 10.0):
+        """
+        初始化校验器
+
+        Args:
+            executor (KeyboardExecutor): 键盘执行器，用于重新输入和反馈输入结果
+            probe (FrameProbe): 获取最新画面的函数，通常为 GameWindow.sample_frame
+            detector (Optional[WordDetector]): 单词检测器，默认新建
+            settle (Optional[float]): 输入完成后等待游戏响应的时间（秒），默认读取 VERIFY_SETTLE
+            timeout (float): 等待新画面的最长时间（秒），超时记为无法校验
+            max_retries (Optional[int]): 未生效时最多重新输入的次数，默认读取 VERIFY_RETRIES
+            diff_threshold (float): 单词框像素平均差异超过该值视为内容变化（0~255）
+            max_age (float): 登记后超过该时间仍未输入的单词不再校验（秒）
+        """
+        self.executor = executor
+        self.probe = probe
+        self.detector = detector or WordDetector()
+        self.settle = settle if settle is not None else float(os.getenv('VERIFY_SETTLE', '0.15'))
+        self.timeout = timeout
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('VERIFY_RETRIES', '1'))
+        self.diff_threshold = diff_threshold
+        self.max_age = max_age
+
+        self._expected: Dict[str, Expectation] = {}
+        self._lock = threading.Lock()
+        self._checks: "queue.Queue[Optional[Tuple[Expectation, float]]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+        # 统计
+        self.registered = 0
+        self.checks = 0
+        self.accepted = 0
+        self.failed = 0
+        self.retyped = 0
+        self.recovered = 0  # 重新输入后生效，每次相当于省下一次模型往返
+        self.dropped = 0
+        self.unverifiable = 0
+        self.check_seconds = 0.0
+
+    def start(self) -> None:
+        """启动校验线程，并在键盘执行器上登记开始输入和输入完成回调"""
+        if self._thread and self._thread.is_alive():
+            return
+        if self.on_typed not in self.executor.typed_callbacks:
+            self.executor.start_callbacks.append(self.on_start)
+            self.executor.typed_callbacks.append(self.on_typed)
+        self._thread = threading.Thread(target=self._worker, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止校验线程"""
+        if self.on_typed in self.executor.typed_callbacks:
+            self.executor.start_callbacks.remove(self.on_start)
+            self.executor.typed_callbacks.remove(self.on_typed)
+        if self._thread:
+            self._checks.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def expect(self, steps: Sequence[PlanStep]) -> None:
+        """
+        登记即将入队的单词（需在单词入队之前调用）
+
+        Args:
+            steps (Sequence[PlanStep]): 计划步骤，area 用于在没有 OCR 时定位单词框
+        """
+        now = time.time()
+        with self._lock:
+            for word, expectation in list(self._expected.items()):
+                if now - expectation.created_at > self.max_age:
+                    del self._expected[word]
+            for step in steps:
+                if step.priority == "cashier" or step.area in SKIP_REGIONS:
+                    continue
+                previous = self._expected.get(step.word)
+                self._expected[step.word] = Expectation(step.word, step.area, step.priority,
+                                                        attempts=previous.attempts if previous else 0)
+                self.registered += 1
+
+    def on_start(self, word: str) -> None:
+        """
+        键盘执行器开始输入回调：保存当前画面作为参照（在键盘线程中执行，只做一次拷贝）
+
+        Args:
+            word (str): 即将输入的单词
+        """
+        with self._lock:
+            expectation = self._expected.get(word)
+        if expectation is None:
+            return
+        sample = self.probe()
+        # 环形缓冲中的帧会被覆盖，需要拷贝
+        expectation.before = np.array(sample[1]) if sample else None
+
+    def on_typed(self, word: str) -> None:
+        """
+        键盘执行器输入完成回调（在键盘线程中执行，只入队）
+
+        Args:
+            word (str): 已输入的单词
+        """
+        with self._lock:
+            expectation = self._expected.get(word)
+        if expectation is not None:
+            self._checks.put((expectation, time.time()))
+
+    def _worker(self) -> None:
+        """校验工作线程，按输入顺序逐个校验"""
+        while True:
+            item = self._checks.get()
+            if item is None:
+                break
+            try:
+                self._check(*item)
+            except Exception as e:
+                print(f"输入校验错误: {e}")
+
+    def _locate(self, expectation: Expectation, pixels: np.ndarray) -> List[WordBox]:
+        """在输入前的画面中找出单词的候选框"""
+        boxes = self.detector.detect(pixels)
+        candidates = [box for box in boxes if box.text == expectation.word]
+        if not candidates:
+            regions = AREA_REGIONS.get(expectation.area, ())
+            candidates = [box for box in boxes if box.region in regions and box.text is None]
+        return [box for box in candidates if box.region not in SKIP_REGIONS]
+
+    def _check(self, expectation: Expectation, typed_at: float) -> None:
+        """等待输入完成后的新画面，判断单词是否生效并处理结果"""
+        word = expectation.word
+        before = expectation.before
+        start = time.perf_counter()
+        boxes = self._locate(expectation, before) if before is not None else []
+        self.check_seconds += time.perf_counter() - start
+        if not boxes:
+            self.unverifiable += 1
+            self._forget(expectation)
+            return
+
+        sample = None
+        deadline = typed_at + self.settle + self.timeout
+        while time.time() < deadline:
+            sample = self.probe()
+            if sample and sample[0] >= typed_at + self.settle:
+                break
+            sample = None
+            time.sleep(0.01)
+        if sample is None:
+            self.unverifiable += 1
+            self._forget(expectation)
+            return
+
+        start = time.perf_counter()
+        ok = any(self._changed(self._crop(sample[1], box), self._crop(before, box)) for box in boxes)
+        self.check_seconds += time.perf_counter() - start
+        self.checks += 1
+        self.executor.report_result(word, ok)
+        metrics.incr("verify_accepted" if ok else "verify_failed")
+
+        if ok:
+            self.accepted += 1
+            if expectation.attempts:
+                self.recovered += 1
+            self._forget(expectation)
+            return
+
+        self.failed += 1
+        expectation.attempts += 1
+        if expectation.attempts > self.max_retries:
+            self.dropped += 1
+            self._forget(expectation)
+            print(f"单词 {word} 多次输入未生效，放弃，等待下一次规划")
+            return
+        self.retyped += 1
+        print(f"单词 {word} 未生效，重新输入")
+        priorities = {word: expectation.priority} if expectation.priority else None
+        self.executor.add_words([word], generation=self.executor.scheduler.generation, priorities=priorities)
+
+    def _forget(self, expectation: Expectation) -> None:
+        """校验结束，移除单词的登记（已被新计划重新登记时保留）"""
+        with self._lock:
+            if self._expected.get(expectation.word) is expectation:
+                del self._expected[expectation.word]
+
+    def _crop(self, pixels: np.ndarray, box: WordBox) -> np.ndarray:
+        """按检测步长裁剪单词框"""
+        step = self.detector.step
+        return pixels[box.top:box.bottom:step, box.left:box.right:step]
+
+    def _highlight(self, crop: np.ndarray) -> float:
+        """单词框中高亮底色像素的占比"""
+        distance = np.abs(crop.astype(np.int16) - self.detector.background)
+        return float(np.all(distance <= self.detector.tolerance, axis=-1).mean())
+
+    def _changed(self, crop: np.ndarray, reference: np.ndarray) -> bool:
+        """
+        判断单词框是否表明输入已生效
+
+        高亮底色明显减少（单词消失或变灰）即生效；否则内容需要变化，
+        且框内不能残留黄色字母（只输入了前缀时游戏会把已输入的字母标黄）。
+        """
+        if crop.shape != reference.shape or not crop.size:
+            # 窗口尺寸变化，无法比较，按生效处理，交给下一次规划
+            return True
+        if self._highlight(crop) < self._highlight(reference) * 0.5:
+            return True
+        if np.abs(crop.astype(np.int16) - reference).mean() <= self.diff_threshold:
+            return False
+        yellow = (crop[..., 0] >= 200) & (crop[..., 1] >= 160) & (crop[..., 2] <= 110)
+        return not yellow.any()
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 校验次数、成功率、重新输入和放弃次数、节省的模型往返次数
+        """
+        rate = self.accepted / self.checks if self.checks else 0.0
+        return (
+            f"登记 {self.registered}, 校验 {self.checks}, 成功率 {rate:.1%}, "
+            f"重新输入 {self.retyped} (生效 {self.recovered}), 放弃 {self.dropped}, "
+            f"无法校验 {self.unverifiable}, 节省模型往返 {self.recovered}, "
+            f"校验耗时 {self.check_seconds * 1000:.0f}ms"
+        )
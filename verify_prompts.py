@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+编译提示词回归验证
+
+对录制的每一帧分别用完整提示词和编译后的最小提示词（按阶段、变化区域和 token 预算裁剪）调用规划器，
+以完整提示词的计划为基准，输出编译提示词计划的单词召回率、精确率、区域一致率，
+以及两者每次调用的系统提示词 token 和总输入 token。
+
+用法:
+    python verify_prompts.py <截图目录> [--mode fast|verbose] [--changes] [--budget 1200]
+                             [--latency 1.0] [--jitter 0.2] [--plans plans.json] [--real-api]
+                             [--output result.json]
+
+--changes 时按帧变化检测得到变化区域，编译提示词只包含这些区域的规则模块。
+
+默认使用 mock_openai 本地服务：模拟服务不读提示词，两种方式每帧返回同一个预置计划，
+只用于检查流程和 token 变化；--real-api 时才能比较提示词裁剪对计划的影响。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from PIL import Image
+
+from frame import Frame, encode_image
+from metrics import metrics
+from mock_openai import DEFAULT_PLANS, MockConfig, load_plans, start_mock_server
+from verify_sharding import IMAGE_SUFFIXES, compare_plans
+
+
+def run_verification(frame_dir: Path, mode: str, mock: Optional[MockConfig] = None,
+                     use_changes: bool = False, budget: int = 0) -> Dict[str, Any]:
+    """
+    逐帧比较完整提示词和编译提示词
+
+    Args:
+        frame_dir (Path): 截图目录
+        mode (str): 规划模式 fast / verbose
+        mock (Optional[MockConfig]): 本地模拟服务配置，设置时每帧固定返回同一个计划
+        use_changes (bool): 是否按帧变化检测选择区域模块
+        budget (int): 编译提示词的 token 预算，0 表示不限制
+
+    Returns:
+        Dict[str, Any]: 逐帧结果和汇总
+    """
+    # 在环境变量设置完成后再导入，保证规划器指向本地服务
+    from change_detector import FrameChangeDetector
+    from planner import GamePlanner
+    from prompts import PromptCompiler
+
+    paths = sorted(p for p in frame_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        raise ValueError(f"目录中没有截图: {frame_dir}")
+    plans = list(mock.plans) if mock else []
+
+    planners = {"monolithic": GamePlanner(mode), "compiled": GamePlanner(mode)}
+    planners["monolithic"].prompts = PromptCompiler(mode, enabled=False)
+    planners["compiled"].prompts = PromptCompiler(mode, enabled=True, budget=budget)
+    detector = FrameChangeDetector() if use_changes else None
+    frames: List[Dict[str, Any]] = []
+    tokens = {name: 0 for name in planners}
+    for index, path in enumerate(paths):
+        image = Image.open(path).convert("RGB")
+        image.load()
+        data, mime_type = encode_image(image, "png")
+        frame = Frame(data=data, mime_type=mime_type, width=image.width, height=image.height, image=image)
+        regions = detector.check(frame).changed_regions if detector else None
+
+        results = {}
+        for name, planner in planners.items():
+            if mock:
+                # 两种提示词看到同一个预置计划
+                mock.plans = [plans[index % len(plans)]]
+            before = metrics.counters.get("tokens_prompt", 0)
+            results[name] = planner.analyze_screenshot(replace(frame, timings={}), regions=regions)
+            tokens[name] += metrics.counters.get("tokens_prompt", 0) - before
+
+        comparison = compare_plans(results["monolithic"], results["compiled"])
+        comparison["frame"] = path.name
+        comparison["regions"] = sorted(regions) if regions is not None else None
+        comparison["system_tokens"] = {name: planner.prompts.tokens[-1] for name, planner in planners.items()}
+        frames.append(comparison)
+
+    common = sum(item["common"] for item in frames)
+    expected = sum(len(item["single"]) for item in frames)
+    produced = sum(len(item["sharded"]) for item in frames)
+    return {
+        "frames": frames,
+        "summary": {
+            "frames": len(frames),
+            "recall": common / expected if expected else 1.0,
+            "precision": common / produced if produced else 1.0,
+            "area_agreement": sum(item["area_match"] for item in frames) / common if common else 1.0,
+            "exact_frames": sum(not item["missing"] and not item["extra"] for item in frames),
+            "prompt_tokens_per_call": {name: value / len(frames) for name, value in tokens.items()},
+            "system_prompt": {name: planner.prompts.summary() for name, planner in planners.items()},
+        },
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="编译提示词回归验证")
+    parser.add_argument("frames", help="录制的截图目录")
+    parser.add_argument("--mode", choices=("fast", "verbose"), default="fast", help="规划模式")
+    parser.add_argument("--changes", action="store_true", help="按帧变化检测只包含变化区域的规则模块")
+    parser.add_argument("--budget", type=int, default=0, help="编译提示词的 token 预算，0 表示不限制")
+    parser.add_argument("--latency", type=float, default=1.0, help="模拟模型的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="模拟模型的延迟抖动（秒）")
+    parser.add_argument("--plans", help="模拟模型返回的预置计划 JSON 文件，按帧顺序对应")
+    parser.add_argument("--real-api", action="store_true", help="使用真实 OpenAI 接口而不是本地模拟服务")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--verbose", action="store_true", help="保留规划器日志输出")
+    args = parser.parse_args()
+
+    try:
+        mock = server = None
+        if not args.real_api:
+            mock = MockConfig(load_plans(args.plans) or DEFAULT_PLANS, args.latency, args.jitter, seed=0)
+            server = start_mock_server(mock)
+            os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+            os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+        log = None if args.verbose else io.StringIO()
+        with contextlib.redirect_stdout(log) if log else contextlib.nullcontext():
+            result = run_verification(Path(args.frames), args.mode, mock, args.changes, args.budget)
+        if server:
+            server.shutdown()
+
+        summary = result["summary"]
+        system = summary["system_prompt"]
+        print(f"单词召回率 {summary['recall']:.0%}, 精确率 {summary['precision']:.0%}, "
+              f"区域一致 {summary['area_agreement']:.0%}, 完全一致帧 {summary['exact_frames']}/{summary['frames']}",
+              file=sys.stderr)
+        print(f"系统提示词平均 token: 完整 {system['monolithic']['tokens'].get('mean', 0):.0f}, "
+              f"编译 {system['compiled']['tokens'].get('mean', 0):.0f}; "
+              f"每次调用输入 token: 完整 {summary['prompt_tokens_per_call']['monolithic']:.0f}, "
+              f"编译 {summary['prompt_tokens_per_call']['compiled']:.0f}", file=sys.stderr)
+
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.output:
+            Path(args.output).write_text(output, encoding="utf-8")
+            print(f"结果已写入: {args.output}", file=sys.stderr)
+        else:
+            print(output)
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+分片规划验证
+
+对录制的每一帧分别用单次整图调用（GamePlanner）和区域分片并发调用（ShardedPlanner）分析，
+以单次调用的结果为基准，输出分片合并结果的单词召回率、精确率、区域一致率，
+以及两种方式的墙钟延迟和 token 用量。
+
+用法:
+    python verify_sharding.py <截图目录> [--mode fast|verbose] [--changes] [--latency 1.0] [--jitter 0.2]
+                              [--token-latency 0.01] [--plans plans.json] [--real-api] [--output result.json]
+
+--changes 时按帧变化检测只分析变化的分片，只与单次调用中属于这些分片区域的单词比较。
+
+默认使用 mock_openai 本地服务：每帧固定返回同一个预置计划，分片请求只返回本分片区域的步骤，
+用于验证合并逻辑和延迟、token 的变化；--real-api 时比较真实模型的两种调用方式。
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+from dataclasses import replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from PIL import Image
+
+from frame import Frame, encode_image
+from metrics import metrics, percentiles
+from mock_openai import DEFAULT_PLANS, MockConfig, load_plans, start_mock_server
+from plan import Plan
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp"}
+
+
+def compare_plans(single: Optional[Plan], sharded: Optional[Plan],
+                  areas: Optional[Set[str]] = None) -> Dict[str, Any]:
+    """
+    以单次调用的计划为基准比较分片合并的计划
+
+    Args:
+        single (Optional[Plan]): 单次整图调用的计划
+        sharded (Optional[Plan]): 分片合并的计划
+        areas (Optional[Set[str]]): 只比较单次调用中这些区域的单词，None 表示全部
+
+    Returns:
+        Dict[str, Any]: 共同单词数、缺失和多出的单词、区域一致的单词数
+    """
+    single_areas = {step.word: step.area for step in single.steps
+                    if areas is None or step.area in areas} if single is not None else {}
+    sharded_areas = {step.word: step.area for step in sharded.steps} if sharded is not None else {}
+    common = set(single_areas) & set(sharded_areas)
+    return {
+        "single": sorted(single_areas),
+        "sharded": sorted(sharded_areas),
+        "common": len(common),
+        "missing": sorted(set(single_areas) - common),
+        "extra": sorted(set(sharded_areas) - common),
+        "area_match": sum(single_areas[word] == sharded_areas[word] for word in common),
+    }
+
+
+def run_verification(frame_dir: Path, mode: str, mock: Optional[MockConfig] = None,
+                     use_changes: bool = False) -> Dict[str, Any]:
+    """
+    逐帧比较单次调用和分片调用
+
+    Args:
+        frame_dir (Path): 截图目录
+        mode (str): 单次调用的规划模式 fast / verbose
+        mock (Optional[MockConfig]): 本地模拟服务配置，设置时每帧固定返回同一个计划
+        use_changes (bool): 是否按帧变化检测跳过未变化的分片
+
+    Returns:
+        Dict[str, Any]: 逐帧结果和汇总
+    """
+    # 在环境变量设置完成后再导入，保证规划器指向本地服务
+    from change_detector import FrameChangeDetector
+    from planner import GamePlanner
+    from shard_planner import SHARDS, ShardedPlanner
+
+    paths = sorted(p for p in frame_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not paths:
+        raise ValueError(f"目录中没有截图: {frame_dir}")
+    plans = list(mock.plans) if mock else []
+
+    planner = GamePlanner(mode)
+    sharded = ShardedPlanner(GamePlanner(mode))
+    detector = FrameChangeDetector() if use_changes else None
+    frames: List[Dict[str, Any]] = []
+    latencies: Dict[str, List[float]] = {"single": [], "sharded": []}
+    tokens = {"single": 0, "sharded": 0}
+    try:
+        for index, path in enumerate(paths):
+            image = Image.open(path).convert("RGB")
+            image.load()
+            data, mime_type = encode_image(image, "png")
+            frame = Frame(data=data, mime_type=mime_type, width=image.width, height=image.height, image=image)
+            changed_regions = detector.check(frame).changed_regions if detector else None
+
+            results = {}
+            for name in ("single", "sharded"):
+                if mock:
+                    # 两种调用方式看到同一个预置计划
+                    mock.plans = [plans[index % len(plans)]]
+                before = metrics.counters.get("tokens_prompt", 0)
+                start = time.perf_counter()
+                if name == "single":
+                    results[name] = planner.analyze_screenshot(replace(frame, timings={}))
+                else:
+                    results[name] = sharded.analyze_screenshot(replace(frame, timings={}),
+                                                               changed_regions=changed_regions)
+                latencies[name].append(time.perf_counter() - start)
+                tokens[name] += metrics.counters.get("tokens_prompt", 0) - before
+
+            selected = [shard for shard in SHARDS if shard.name in sharded.last_shards]
+            areas = {area for shard in selected for area in shard.areas}
+            comparison = compare_plans(results["single"], results["sharded"],
+                                       areas if changed_regions is not None else None)
+            comparison["frame"] = path.name
+            comparison["shards"] = [shard.name for shard in selected]
+            comparison["single_ms"] = round(latencies["single"][-1] * 1000, 1)
+            comparison["sharded_ms"] = round(latencies["sharded"][-1] * 1000, 1)
+            frames.append(comparison)
+    finally:
+        sharded.close()
+
+    common = sum(item["common"] for item in frames)
+    single_words = sum(len(item["single"]) for item in frames)
+    sharded_words = sum(len(item["sharded"]) for item in frames)
+    return {
+        "frames": frames,
+        "summary": {
+            "frames": len(frames),
+            "recall": common / single_words if single_words else 1.0,
+            "precision": common / sharded_words if sharded_words else 1.0,
+            "area_agreement": sum(item["area_match"] for item in frames) / common if common else 1.0,
+            "exact_frames": sum(not item["missing"] and not item["extra"] for item in frames),
+            "single_ms": percentiles(latencies["single"]),
+            "sharded_ms": percentiles(latencies["sharded"]),
+            "prompt_tokens_per_frame": {name: value / len(frames) for name, value in tokens.items()},
+            "shards": sharded.report(),
+        },
+    }
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="分片规划验证")
+    parser.add_argument("frames", help="录制的截图目录")
+    parser.add_argument("--mode", choices=("fast", "verbose"), default="fast", help="单次调用的规划模式")
+    parser.add_argument("--changes", action="store_true", help="按帧变化检测只分析变化的分片")
+    parser.add_argument("--latency", type=float, default=1.0, help="模拟模型的平均延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.2, help="模拟模型的延迟抖动（秒）")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="模拟模型每个输出 token 的耗时（秒）")
+    parser.add_argument("--plans", help="模拟模型返回的预置计划 JSON 文件，按帧顺序对应")
+    parser.add_argument("--real-api", action="store_true", help="使用真实 OpenAI 接口而不是本地模拟服务")
+    parser.add_argument("--output", help="结果 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--verbose", action="store_true", help="保留规划器日志输出")
+    args = parser.parse_args()
+
+    try:
+        mock = server = None
+        if not args.real_api:
+            mock = MockConfig(load_plans(args.plans) or DEFAULT_PLANS, args.latency, args.jitter, seed=0,
+                              token_latency=args.token_latency)
+            server = start_mock_server(mock)
+            os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{server.server_port}/v1"
+            os.environ.setdefault("OPENAI_API_KEY", "mock")
+
+        log = None if args.verbose else io.StringIO()
+        with contextlib.redirect_stdout(log) if log else contextlib.nullcontext():
+            result = run_verification(Path(args.frames), args.mode, mock, args.changes)
+        if server:
+            server.shutdown()
+
+        summary = result["summary"]
+        print(f"单词召回率 {summary['recall']:.0%}, 精确率 {summary['precision']:.0%}, "
+              f"区域一致 {summary['area_agreement']:.0%}, 完全一致帧 {summary['exact_frames']}/{summary['frames']}",
+              file=sys.stderr)
+        print(f"延迟 p50: 单次 {summary['single_ms'].get('p50', 0):.0f}ms, "
+              f"分片 {summary['sharded_ms'].get('p50', 0):.0f}ms; "
+              f"每帧输入 token: 单次 {summary['prompt_tokens_per_frame']['single']:.0f}, "
+              f"分片 {summary['prompt_tokens_per_frame']['sharded']:.0f}", file=sys.stderr)
+
+        output = json.dumps(result, ensure_ascii=False, indent=2)
+        if args.output:
+            Path(args.output).write_text(output, encoding="utf-8")
+            print(f"结果已写入: {args.output}", file=sys.stderr)
+        else:
+            print(output)
+
+    except KeyboardInterrupt:
+        print("\n程序已终止")
+        sys.exit(0)
+    except Exception as e:
+        print(f"发生错误: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+游戏窗口查找缓存
+主要功能：
+1. 按标题查找窗口一次后缓存句柄，不再每次扫描全部窗口标题
+2. 窗口关闭、移动、缩放时失效：优先使用 pywinctl 的 watchdog 事件，不可用时按 TTL 重新校验
+3. 窗口位置和尺寸缓存到下一次失效，后台采集每帧不再查询窗口服务器
+4. 未找到窗口时短时间内不重复查找，可用窗口列表只在第一次未找到时打印
+"""
+
+import os
+import threading
+import time
+from typing import Any, Callable, List, Optional, Tuple
+
+from metrics import metrics
+
+# 按标题查找窗口的函数：返回标题完全相同的窗口列表
+WindowFinder = Callable[[str], List[Any]]
+
+
+def pywinctl_finder(title: str) -> List[Any]:
+    """
+    使用 pywinctl 按标题查找窗口（首次调用时才导入 pywinctl）
+
+    Args:
+        title (str): 窗口标题
+
+    Returns:
+        List[Any]: 标题完全相同的窗口
+    """
+    import pywinctl as pwc
+    return pwc.getWindowsWithTitle(title)
+
+
+def pywinctl_titles() -> List[str]:
+    """列出当前所有窗口标题，仅用于未找到窗口时的提示"""
+    import pywinctl as pwc
+    return pwc.getAllTitles()
+
+
+class WindowCache:
+    """
+    窗口句柄和几何信息缓存
+
+    键盘线程和采集线程都会调用，查找和失效由锁保护。
+    """
+
+    def __init__(self, title: str,
+                 ttl: Optional[float] = None,
+                 miss_ttl: float = 0.5,
+                 watch: Optional[bool] = None,
+                 finder: WindowFinder = pywinctl_finder,
+                 list_titles: Callable[[], List[str]] = pywinctl_titles):
+        """
+        初始化窗口缓存
+
+        Args:
+            title (str): 窗口标题
+            ttl (Optional[float]): 没有 watchdog 事件时，句柄和几何信息重新校验的间隔（秒），默认读取 WINDOW_CACHE_TTL
+            miss_ttl (float): 未找到窗口后多久再重新查找（秒）
+            watch (Optional[bool]): 是否订阅 pywinctl watchdog 的关闭/移动/缩放事件，默认读取 WINDOW_WATCHDOG
+            finder (WindowFinder): 按标题查找窗口的函数
+            list_titles (Callable[[], List[str]]): 列出所有窗口标题的函数
+        """
+        self.title = title
+        self.ttl = ttl if ttl is not None else float(os.getenv('WINDOW_CACHE_TTL', '1.0'))
+        self.miss_ttl = miss_ttl
+        if watch is None:
+            watch = os.getenv('WINDOW_WATCHDOG', '1').lower() in ('1', 'true', 'yes')
+        self.watch = watch
+        self.finder = finder
+        self.list_titles = list_titles
+
+        self._lock = threading.Lock()
+        self._window: Optional[Any] = None
+        self._checked_at = 0.0
+        self._geometry: Optional[Tuple[int, int, int, int]] = None
+        self._geometry_at = 0.0
+        self._watching = False
+        self._retry_at = 0.0
+        self._missed = False
+        self._listed = False
+
+        # 统计
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.geometry_reads = 0
+
+    def get(self) -> Optional[Any]:
+        """
+        获取窗口句柄
+
+        Returns:
+            Optional[Any]: 窗口对象，未找到时返回 None
+        """
+        window = self._window
+        now = time.monotonic()
+        if window is not None and (self._watching or now - self._checked_at < self.ttl):
+            self.hits += 1
+            return window
+        with self._lock:
+            window = self._window
+            if window is not None:
+                if self._alive(window):
+                    self._checked_at = now
+                    self.hits += 1
+                    return window
+                self._invalidate("窗口已关闭")
+            if now < self._retry_at:
+                return None
+            return self._lookup(now)
+
+    def geometry(self) -> Optional[Tuple[int, int, int, int]]:
+        """
+        获取窗口几何信息，缓存到窗口移动、缩放（watchdog 事件）或 TTL 到期
+
+        Returns:
+            Optional[Tuple[int, int, int, int]]: (left, top, width, height)，未找到窗口时返回 None
+        """
+        window = self.get()
+        if window is None:
+            return None
+        geometry = self._geometry
+        if geometry is not None and (self._watching or time.monotonic() - self._geometry_at < self.ttl):
+            return geometry
+        left, top = window.topleft
+        width, height = window.size
+        geometry = (int(left), int(top), int(width), int(height))
+        self.geometry_reads += 1
+        self._geometry, self._geometry_at = geometry, time.monotonic()
+        return geometry
+
+    def invalidate(self, reason: Optional[str] = None) -> None:
+        """
+        丢弃缓存的窗口句柄和几何信息，下次使用时重新查找
+
+        Args:
+            reason (Optional[str]): 失效原因，用于日志
+        """
+        with self._lock:
+            self._invalidate(reason)
+
+    def invalidate_geometry(self) -> None:
+        """窗口移动或缩放后丢弃缓存的几何信息"""
+        self._geometry = None
+
+    def close(self) -> None:
+        """停止 watchdog"""
+        with self._lock:
+            self._stop_watch(self._window)
+
+    def _lookup(self, now: float) -> Optional[Any]:
+        """按标题查找窗口（持有锁时调用）"""
+        self.lookups += 1
+        with metrics.span("window_lookup"):
+            try:
+                windows = self.finder(self.title)
+            except Exception as e:
+                print(f"获取窗口失败: {e}")
+                windows = []
+        if not windows:
+            self.misses += 1
+            self._retry_at = now + self.miss_ttl
+            if not self._missed:
+                print(f"未找到标题为 '{self.title}' 的窗口")
+                if not self._listed:
+                    self._listed = True
+                    try:
+                        titles = self.list_titles()
+                        print("当前可用窗口:")
+                        for title in titles:
+                            print(f"- {title}")
+                    except Exception:
+                        pass
+            self._missed = True
+            return None
+
+        window = windows[0]
+        print(f"找到游戏窗口: {self.title}")
+        self._missed = False
+        self._window = window
+        self._checked_at = now
+        self._geometry = None
+        if self.watch:
+            self._start_watch(window)
+        return window
+
+    def _alive(self, window: Any) -> bool:
+        """窗口是否仍然存在且标题未变"""
+        try:
+            alive = getattr(window, "isAlive", True)
+            return bool(alive) and getattr(window, "title", self.title) == self.title
+        except Exception:
+            return False
+
+    def _start_watch(self, window: Any) -> None:
+        """订阅窗口的关闭、移动和缩放事件，pywinctl 版本不支持时退回 TTL"""
+        watchdog = getattr(window, "watchdog", None)
+        if watchdog is None:
+            return
+        try:
+            watchdog.start(isAliveCB=self._on_alive, movedCB=self._on_changed,
+                           resizedCB=self._on_changed, changedTitleCB=self._on_title)
+            self._watching = True
+        except Exception as e:
+            print(f"窗口事件订阅失败，改为定时校验: {e}")
+            self._watching = False
+
+    def _stop_watch(self, window: Any) -> None:
+        if self._watching and window is not None:
+            try:
+                window.watchdog.stop()
+            except Exception:
+                pass
+        self._watching = False
+
+    def _on_alive(self, alive: bool) -> None:
+        if not alive:
+            # watchdog 线程中回调，不能在这里停止 watchdog 本身，只标记失效
+            self._watching = False
+            self._window = None
+            self._geometry = None
+            self.invalidations += 1
+            metrics.incr("window_invalidated")
+            print("游戏窗口已关闭，重新查找")
+
+    def _on_changed(self, _value: Any) -> None:
+        self._geometry = None
+
+    def _on_title(self, title: str) -> None:
+        if title != self.title:
+            self._on_alive(False)
+
+    def _invalidate(self, reason: Optional[str]) -> None:
+        """丢弃缓存（持有锁时调用）"""
+        if self._window is None:
+            return
+        self._stop_watch(self._window)
+        self._window = None
+        self._geometry = None
+        self._retry_at = 0.0
+        self.invalidations += 1
+        metrics.incr("window_invalidated")
+        if reason:
+            print(f"{reason}，重新查找游戏窗口")
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 查找、命中、未找到、失效次数和几何信息读取次数
+        """
+        mode = "事件" if self._watching else f"TTL {self.ttl:.1f}s"
+        return (
+            f"查找 {self.lookups}, 命中 {self.hits}, 未找到 {self.misses}, 失效 {self.invalidations}, "
+            f"几何读取 {self.geometry_reads} ({mode})"
+        )
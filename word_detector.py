@@ -0,0 +1,395 @@
+#!/usr/bin/env python3
+"""
+本地高亮单词检测器
+主要功能：
+1. 用 NumPy 向量化颜色掩码找出“深棕色底、白色字体”的高亮单词框
+2. 基于行程编码的连通域标记，得到每个单词框及其所在屏幕区域
+3. 可选的本地 OCR（pytesseract），识别单词框中的文字
+4. 简单场景（老鼠单词、收银、咖啡取货）直接在本地给出输入，无需调用视觉模型
+   （快速路径依赖 OCR 读出单词，未安装 pytesseract 时不可用）
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from frame import Frame
+from plan import Plan, PlanStep
+from regions import locate_region, region_box
+
+try:
+    import pytesseract
+except ImportError:  # OCR 为可选依赖
+    pytesseract = None
+
+# 本地快速路径需要 OCR 读出单词，否则无法给出任何输入
+OCR_AVAILABLE = pytesseract is not None
+
+
+@dataclass
+class WordBox:
+    """一个高亮单词框"""
+
+    left: int
+    top: int
+    right: int
+    bottom: int
+    region: str  # 所在屏幕区域，见 regions.SCREEN_REGIONS
+    text: Optional[str] = None  # OCR 结果，未识别时为 None
+    fill: float = 0.0  # 框内深棕色像素占比
+
+    @property
+    def width(self) -> int:
+        return self.right - self.left
+
+    @property
+    def height(self) -> int:
+        return self.bottom - self.top
+
+    @property
+    def center(self) -> Tuple[float, float]:
+        return ((self.left + self.right) / 2, (self.top + self.bottom) / 2)
+
+    def iou(self, other: "WordBox") -> float:
+        """
+        计算与另一个框的交并比
+
+        Args:
+            other (WordBox): 另一个单词框
+
+        Returns:
+            float: 交并比（0~1）
+        """
+        left = max(self.left, other.left)
+        top = max(self.top, other.top)
+        right = min(self.right, other.right)
+        bottom = min(self.bottom, other.bottom)
+        inter = max(0, right - left) * max(0, bottom - top)
+        union = self.width * self.height + other.width * other.height - inter
+        return inter / union if union else 0.0
+
+
+def label_runs(mask: np.ndarray) -> List[Tuple[int, int, int, int, int]]:
+    """
+    对二值掩码做 4 连通域标记
+
+    每行的前景行程用 NumPy 一次性提取，再用并查集合并相邻行中重叠的行程，
+    Python 循环只发生在行程级别而不是像素级别。
+
+    Args:
+        mask (np.ndarray): 二值掩码，形状 (高, 宽)
+
+    Returns:
+        List[Tuple[int, int, int, int, int]]: 每个连通域的 (left, top, right, bottom, 像素数)
+    """
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(edges == 1)
+    _, ends = np.nonzero(edges == -1)
+    count = len(rows)
+    if count == 0:
+        return []
+
+    parent = list(range(count))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    # 每一行的行程区间 [row_first[r], row_first[r + 1])
+    row_first = np.searchsorted(rows, np.arange(height + 1))
+    for row in range(1, height):
+        a, a_end = row_first[row - 1], row_first[row]
+        b, b_end = row_first[row], row_first[row + 1]
+        # 双指针扫描上下两行的行程
+        while a < a_end and b < b_end:
+            if starts[a] < ends[b] and starts[b] < ends[a]:
+                root_a, root_b = find(a), find(b)
+                if root_a != root_b:
+                    parent[root_b] = root_a
+            if ends[a] < ends[b]:
+                a += 1
+            else:
+                b += 1
+
+    components: Dict[int, List[int]] = {}
+    for i in range(count):
+        root = find(i)
+        box = components.get(root)
+        length = int(ends[i] - starts[i])
+        if box is None:
+            components[root] = [int(starts[i]), int(rows[i]), int(ends[i]), int(rows[i]) + 1, length]
+        else:
+            box[0] = min(box[0], int(starts[i]))
+            box[2] = max(box[2], int(ends[i]))
+            box[3] = int(rows[i]) + 1
+            box[4] += length
+    return [tuple(box) for box in components.values()]
+
+
+class WordDetector:
+    """
+    高亮单词检测器
+
+    高亮单词的视觉样式固定：深棕色底、白色字体。先按颜色生成掩码，
+    再做连通域标记，最后按尺寸、形状和框内白色像素比例过滤。
+    """
+
+    def __init__(self, background: Tuple[int, int, int] = (74, 44, 30),
+                 tolerance: int = 28,
+                 text_threshold: int = 200,
+                 step: int = 2,
+                 min_size: Tuple[int, int] = (14, 10),
+                 use_ocr: Optional[bool] = None):
+        """
+        初始化检测器
+
+        Args:
+            background (Tuple[int, int, int]): 高亮底色 RGB
+            tolerance (int): 每个通道允许的颜色偏差
+            text_threshold (int): 白色文字的最低亮度
+            step (int): 掩码下采样步长，越大越快
+            min_size (Tuple[int, int]): 单词框的最小 (宽, 高)，原图像素
+            use_ocr (Optional[bool]): 是否使用 OCR，默认在安装了 pytesseract 时启用
+        """
+        self.background = np.array(background, dtype=np.int16)
+        self.tolerance = tolerance
+        self.text_threshold = text_threshold
+        self.step = step
+        self.min_size = min_size
+        self.use_ocr = pytesseract is not None if use_ocr is None else use_ocr
+
+    def detect(self, image: Union[Image.Image, np.ndarray]) -> List[WordBox]:
+        """
+        检测图像中的高亮单词框
+
+        Args:
+            image (Union[Image.Image, np.ndarray]): 游戏窗口截图，或 (高, 宽, 3) 的 RGB 数组
+
+        Returns:
+            List[WordBox]: 单词框列表，按从上到下、从左到右排序
+        """
+        pixels = image if isinstance(image, np.ndarray) else np.asarray(image.convert("RGB"))
+        height, width, _ = pixels.shape
+        # 先跨步采样再转换类型，只为小数组分配内存
+        sampled = pixels[::self.step, ::self.step].astype(np.int16)
+
+        mask = np.all(np.abs(sampled - self.background) <= self.tolerance, axis=-1)
+        white = np.all(sampled >= self.text_threshold, axis=-1)
+
+        boxes = []
+        min_width, min_height = self.min_size
+        for left, top, right, bottom, area in label_runs(mask):
+            box_w, box_h = right - left, bottom - top
+            if box_w * self.step < min_width or box_h * self.step < min_height:
+                continue
+            # 单词框是横向的矩形
+            if box_w < box_h:
+                continue
+            box_area = box_w * box_h
+            # 框内需要有白色文字
+            text_ratio = white[top:bottom, left:right].sum() / box_area
+            if text_ratio < 0.03 or area + text_ratio * box_area < 0.6 * box_area:
+                continue
+
+            x0, y0 = left * self.step, top * self.step
+            x1, y1 = min(width, right * self.step), min(height, bottom * self.step)
+            region = locate_region((x0 + x1) / 2 / width, (y0 + y1) / 2 / height)
+            boxes.append(WordBox(x0, y0, x1, y1, region, fill=area / box_area))
+
+        boxes.sort(key=lambda b: (b.top, b.left))
+        if self.use_ocr:
+            for box in boxes:
+                box.text = self.read_text(image, box)
+        return boxes
+
+    def read_text(self, image: Union[Image.Image, np.ndarray], box: WordBox) -> Optional[str]:
+        """
+        用 OCR 识别单词框中的文字
+
+        Args:
+            image (Union[Image.Image, np.ndarray]): 游戏窗口截图
+            box (WordBox): 单词框
+
+        Returns:
+            Optional[str]: 识别出的单词，失败时返回 None
+        """
+        if pytesseract is None:
+            return None
+        if isinstance(image, np.ndarray):
+            crop = Image.fromarray(image[box.top:box.bottom, box.left:box.right]).convert("L")
+        else:
+            crop = image.crop((box.left, box.top, box.right, box.bottom)).convert("L")
+        # 白字转为白底黑字，放大后识别更稳定
+        pixels = np.asarray(crop)
+        binary = np.where(pixels >= self.text_threshold, 0, 255).astype(np.uint8)
+        scaled = Image.fromarray(binary).resize((crop.width * 3, crop.height * 3), Image.NEAREST)
+        try:
+            text = pytesseract.image_to_string(scaled, config="--psm 7").strip()
+        except Exception as e:
+            print(f"OCR 失败: {e}")
+            return None
+        text = "".join(ch for ch in text if not ch.isspace())
+        return text or None
+
+
+@dataclass
+class LocalPlan:
+    """本地快速路径给出的计划"""
+
+    inputs: List[str] = field(default_factory=list)  # 可以直接输入的单词
+    priorities: Dict[str, str] = field(default_factory=dict)  # 单词 -> 优先级类别
+    needs_llm: bool = True  # 是否仍需调用视觉模型
+    boxes: List[WordBox] = field(default_factory=list)  # 检测到的单词框
+
+
+class LocalFastPath:
+    """
+    视觉模型之前的本地快速路径
+
+    只处理不需要理解订单的简单场景：
+    - 老鼠：红地毯区域出现两字母单词，总是优先输入
+    - 收银：只有收银台区域变化、且检测到顾客头顶的钞票图标时，输入收银台单词
+    - 咖啡取货：只有咖啡区变化、且上一次模型计划中的取咖啡单词已出现并且尚未输入时输入
+    其余情况仍交给视觉模型。单词文字来自 OCR，未启用 OCR 时每一帧都交给视觉模型。
+    """
+
+    # 这些区域的变化可以由快速路径在本地处理
+    SIMPLE_REGIONS = {"carpet", "cashier", "coffee"}
+
+    def __init__(self, detector: Optional[WordDetector] = None,
+                 bill_color: Tuple[int, int, int] = (60, 160, 60),
+                 bill_tolerance: int = 30,
+                 bill_min_pixels: int = 40):
+        """
+        初始化快速路径
+
+        Args:
+            detector (Optional[WordDetector]): 单词检测器
+            bill_color (Tuple[int, int, int]): 钞票图标的 RGB，可按实际游戏调整
+            bill_tolerance (int): 每个通道允许的颜色偏差
+            bill_min_pixels (int): 收银台区域内至少有多少个钞票颜色的像素才算出现钞票图标
+        """
+        self.detector = detector or WordDetector()
+        self.bill_color = np.array(bill_color, dtype=np.int16)
+        self.bill_tolerance = bill_tolerance
+        self.bill_min_pixels = bill_min_pixels
+        self.coffee_pickups: Set[str] = set()  # 上一次模型计划中尚未输入的取咖啡单词
+
+        # 统计
+        self.frames = 0
+        self.local_only = 0
+        self.local_words = 0
+
+    def remember_plan(self, plan: Plan) -> None:
+        """
+        记录最近一次视觉模型计划中的取咖啡单词，用于判断咖啡取货
+
+        Args:
+            plan (Plan): 模型计划
+        """
+        self.coffee_pickups = {step.word for step in plan.steps if self._is_coffee_pickup(step)}
+
+    def record_typed(self, word: str) -> None:
+        """
+        单词输入完成的回调（注册到 KeyboardExecutor.typed_callbacks），已输入的取咖啡单词不再重复输入
+
+        Args:
+            word (str): 输入完成的单词
+        """
+        self.coffee_pickups.discard(word)
+
+    @staticmethod
+    def _is_coffee_pickup(step: PlanStep) -> bool:
+        """咖啡机区域的取货步骤：详细模式按动作判断，快速模式按优先级（制作咖啡为 cook）判断"""
+        if step.area != "coffee_machine":
+            return False
+        if step.action:
+            return "取" in step.action
+        return step.priority == "serve"
+
+    def has_bill_icon(self, pixels: np.ndarray) -> bool:
+        """
+        收银台区域是否出现钞票图标（顾客可以结账）
+
+        Args:
+            pixels (np.ndarray): (高, 宽, 3) 的 RGB 数组
+
+        Returns:
+            bool: 是否出现钞票图标
+        """
+        height, width, _ = pixels.shape
+        left, top, right, bottom = region_box("cashier", width, height)
+        crop = pixels[top:bottom:2, left:right:2].astype(np.int16)
+        mask = np.all(np.abs(crop - self.bill_color) <= self.bill_tolerance, axis=-1)
+        # 下采样 2 倍，像素数按面积折算
+        return int(mask.sum()) * 4 >= self.bill_min_pixels
+
+    def plan(self, frame: Frame, changed_regions: Optional[Sequence[str]] = None) -> LocalPlan:
+        """
+        在本地为一帧生成计划
+
+        Args:
+            frame (Frame): 截图帧
+            changed_regions (Optional[Sequence[str]]): 变化检测给出的变化区域，未知时为 None
+
+        Returns:
+            LocalPlan: 本地计划
+        """
+        self.frames += 1
+        image = frame.pixels if frame.pixels is not None else np.asarray(frame.get_image().convert("RGB"))
+        boxes = self.detector.detect(image)
+        result = LocalPlan(boxes=boxes)
+
+        # 老鼠单词：任何情况下都优先输入
+        for box in boxes:
+            if box.region == "carpet" and box.text and len(box.text) == 2:
+                result.inputs.append(box.text)
+                result.priorities[box.text] = "rat"
+
+        changed = set(changed_regions) if changed_regions is not None else None
+        if changed and changed <= self.SIMPLE_REGIONS:
+            # 只有简单区域发生变化，无需调用模型
+            result.needs_llm = False
+            if "cashier" in changed:
+                # 收银台单词始终高亮，只有顾客头顶出现钞票图标时才能输入
+                cashier = [box for box in boxes if box.region == "cashier" and box.text]
+                if cashier and self.has_bill_icon(image):
+                    result.inputs.append(cashier[0].text)
+                    result.priorities[cashier[0].text] = "cashier"
+                else:
+                    result.needs_llm = True
+            if "coffee" in changed:
+                pickup = [box.text for box in boxes
+                          if box.region == "coffee" and box.text in self.coffee_pickups]
+                if pickup:
+                    # 已交给执行器，后续帧不再重复给出
+                    self.coffee_pickups.difference_update(pickup)
+                    result.inputs.extend(pickup)
+                    result.priorities.update({word: "serve" for word in pickup})
+                else:
+                    result.needs_llm = True
+
+        self.local_words += len(result.inputs)
+        if not result.needs_llm:
+            self.local_only += 1
+        return result
+
+    def report(self) -> str:
+        """
+        生成统计信息
+
+        Returns:
+            str: 本地处理帧数和单词数
+        """
+        frames = max(self.frames, 1)
+        return (
+            f"帧 {self.frames}, 仅本地处理 {self.local_only} ({self.local_only / frames:.0%}), "
+            f"本地输入单词 {self.local_words}, OCR {'开启' if self.detector.use_ocr else '关闭'}"
+        )